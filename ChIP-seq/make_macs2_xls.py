@@ -48,7 +48,7 @@ import profile
 # Module metadata
 #######################################################################
 
-__version__ = '0.4.0'
+__version__ = '0.4.1'
 
 #######################################################################
 # Class definitions
@@ -245,7 +245,7 @@ class MacsXLS:
             # No command line? Check for 'abs_summit' column
             return 'abs_summit' not in self.columns
 
-    def sort_on(self,column,reverse=True):
+    def sort_on(self,column,reverse=True,buffer_size=None):
         """Sort data on specified column
 
         Sorts the data in-place, by the specified column.
@@ -262,10 +262,14 @@ class MacsXLS:
           reverse: if True (default) then sort in descending
             order (i.e. largest to smallest). Otherwise sort in
             ascending order.
+          buffer_size: if set then use an external merge sort
+            which holds at most this many lines in memory at a
+            time (see TabFile.sort)
 
         """
         # Sort the data
-        self.__data.sort(lambda line: line[column],reverse=reverse)
+        self.__data.sort(lambda line: line[column],reverse=reverse,
+                         buffer_size=buffer_size)
         # Update the 'order' column
         self.update_order()
 
@@ -649,6 +653,17 @@ class TestMacsXLSForMacs2010_20131216(unittest.TestCase):
         for line,value in zip(macsxls.data,(56.00,31.00,29.00,21.00,18.00)):
             self.assertEqual(line['pileup'],value)
 
+    def test_sort_on_columns_external_sort(self):
+        """Check external sorting for MACS2.0.10.20131216 data
+
+        """
+        macsxls = MacsXLS(fp=cStringIO.StringIO(MACS2010_20131216_data))
+        macsxls.sort_on("pileup",buffer_size=2)
+        for line,value in zip(macsxls.data,(56.00,31.00,29.00,21.00,18.00)):
+            self.assertEqual(line['pileup'],value)
+        for i in range(0,5):
+            self.assertEqual(macsxls.data[i]['order'],i+1)
+
 class TestMacsXLSForMacs2010_20131216_broad(unittest.TestCase):
     def test_load_macs2_xls_file(self):
         """Load data from MACS2.0.10.20131216 (--broad option)
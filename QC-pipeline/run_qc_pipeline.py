@@ -278,12 +278,16 @@ if __name__ == "__main__":
             logging.error("Unknown input type: '%s'" % options.input_type)
             sys.exit(1)
         # Add jobs to pipeline runner (up to limit of max_total_jobs)
+        # as a single array job for this directory
+        group = os.path.basename(data_dir)
+        args_list = []
+        labels = []
         for data in run_data:
-            if options.max_total_jobs > 0 and pipeline.nWaiting() == options.max_total_jobs:
+            if options.max_total_jobs > 0 and \
+               pipeline.nWaiting() + len(args_list) == options.max_total_jobs:
                 print "Maximum number of jobs queued (%d)" % options.max_total_jobs
                 break
-            label = os.path.splitext(os.path.basename(data[0]))[0]
-            group = os.path.basename(data_dir)
+            labels.append(os.path.splitext(os.path.basename(data[0]))[0])
             # Set up argument list for script
             args = []
             if script_args:
@@ -291,7 +295,10 @@ if __name__ == "__main__":
                     args.append(arg)
             for arg in data:
                 args.append(arg)
-            pipeline.queueJob(data_dir,script,args,label=label,group=group)
+            args_list.append(args)
+        if args_list:
+            pipeline.queueJobArray(data_dir,script,args_list,labels=labels,
+                                   group=group)
     # Run the pipeline
     pipeline.run()
 
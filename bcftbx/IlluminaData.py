@@ -28,6 +28,11 @@ import platforms
 import utils
 import TabFile
 import cStringIO
+try:
+    import numpy
+except ImportError:
+    # No numpy module
+    numpy = None
 
 #######################################################################
 # Module constants
@@ -2089,6 +2094,161 @@ class SampleSheetSample(object):
         self._predict_no_lane_splitting = no_lane_splitting
         self._predict_for_lanes = lanes
 
+class SampleSheetBarcodes(object):
+    """
+    Class to analyse the index sequences in a sample sheet
+
+    Groups the index sequences from a sample sheet by lane
+    and computes the pairwise Hamming distances between the
+    (normalised) barcodes within each lane, which indicates
+    how many mismatches can safely be allowed when
+    demultiplexing.
+
+    Example usage:
+
+    >>> barcodes = SampleSheetBarcodes(sample_sheet_file="SampleSheet.csv")
+    >>> for lane in barcodes.lanes:
+    ...    print lane,barcodes.min_distance(lane)
+
+    If the sample sheet doesn't define lanes then all the
+    samples are assigned to a single lane 'None'. Samples
+    without an index sequence are ignored.
+
+    """
+    def __init__(self,sample_sheet=None,sample_sheet_file=None):
+        """
+        Create a new SampleSheetBarcodes instance
+
+        Arguments:
+          sample_sheet (SampleSheet): a SampleSheet instance to
+            analyse (if None then must provide a file via the
+            `sample_sheet_file` argument; if both are provided
+            then `sample_sheet` takes precedence)
+          sample_sheet_file (str): path to a sample sheet file, if
+            `sample_sheet` argument is None
+
+        """
+        self._sample_ids = {}
+        self._barcodes = {}
+        self._distances = {}
+        if sample_sheet is None:
+            sample_sheet = SampleSheet(sample_sheet_file)
+        for line in sample_sheet:
+            index_seq = samplesheet_index_sequence(line)
+            if index_seq is None:
+                continue
+            if sample_sheet.has_lanes:
+                lane = line['Lane']
+            else:
+                lane = None
+            if lane not in self._barcodes:
+                self._sample_ids[lane] = []
+                self._barcodes[lane] = []
+            self._sample_ids[lane].append(
+                str(line[sample_sheet.sample_id_column]))
+            self._barcodes[lane].append(normalise_barcode(index_seq))
+
+    @property
+    def lanes(self):
+        """
+        Return sorted list of lanes with indexed samples
+
+        """
+        return sorted(self._barcodes.keys())
+
+    def sample_ids(self,lane=None):
+        """
+        Return list of sample IDs for a lane
+
+        The sample IDs are in the same order as the
+        corresponding barcodes returned by the 'barcodes'
+        method.
+
+        """
+        return self._sample_ids[lane]
+
+    def barcodes(self,lane=None):
+        """
+        Return list of normalised barcodes for a lane
+
+        """
+        return self._barcodes[lane]
+
+    def distance_matrix(self,lane=None):
+        """
+        Return the pairwise Hamming distance matrix for a lane
+
+        The matrix is computed on the first call and cached
+        thereafter; see the 'barcode_distance_matrix' function
+        for details.
+
+        """
+        if lane not in self._distances:
+            self._distances[lane] = barcode_distance_matrix(
+                self._barcodes[lane])
+        return self._distances[lane]
+
+    def min_distance(self,lane=None):
+        """
+        Return the minimum distance between barcodes in a lane
+
+        Returns None if there are fewer than two barcodes in
+        the lane.
+
+        """
+        barcodes = self._barcodes[lane]
+        n = len(barcodes)
+        if n < 2:
+            return None
+        distances = self.distance_matrix(lane)
+        if numpy is not None:
+            return int(distances[numpy.triu_indices(n,1)].min())
+        return min([min(distances[i][i+1:]) for i in xrange(n-1)])
+
+    def max_mismatches(self,lane=None):
+        """
+        Return the maximum number of mismatches that are safe
+
+        This is the largest number of mismatches which still
+        guarantees that a read can only be assigned to one
+        barcode in the lane, i.e. (min_distance-1)/2.
+
+        Returns None if there are fewer than two barcodes in
+        the lane.
+
+        """
+        min_distance = self.min_distance(lane)
+        if min_distance is None:
+            return None
+        return max(min_distance-1,0)/2
+
+    def collisions(self,lane=None,max_distance=0):
+        """
+        Return pairs of barcodes which are too similar
+
+        Arguments:
+          lane (int): lane to examine
+          max_distance (int): report pairs of barcodes which
+            are within this distance of each other (default
+            is zero i.e. only report identical barcodes)
+
+        Returns:
+          List: list of tuples of the form (sample_id1,
+            barcode1,sample_id2,barcode2,distance).
+
+        """
+        sample_ids = self._sample_ids[lane]
+        barcodes = self._barcodes[lane]
+        n = len(barcodes)
+        distances = self.distance_matrix(lane)
+        if numpy is not None:
+            pairs = numpy.argwhere(numpy.triu(distances <= max_distance,1))
+        else:
+            pairs = [(i,j) for i in xrange(n) for j in xrange(i+1,n)
+                     if distances[i][j] <= max_distance]
+        return [(sample_ids[i],barcodes[i],sample_ids[j],barcodes[j],
+                 int(distances[i][j])) for i,j in pairs]
+
 class IlluminaFastq:
     """Class for extracting information about Fastq files
 
@@ -2642,6 +2802,64 @@ def normalise_barcode(seq):
     """
     return str(seq).upper().replace('-','').replace('+','')
 
+def barcode_distance_matrix(barcodes):
+    """
+    Return the pairwise Hamming distances between barcodes
+
+    Barcodes of different lengths are compared over the
+    length of the shorter barcode.
+
+    If NumPy is available then the distances are computed
+    by vectorised comparison of the encoded barcodes (one
+    position at a time, to keep memory use to a single
+    N*N matrix) and returned as an N*N NumPy integer array;
+    otherwise they are computed in pure Python and returned
+    as a list of lists. In either case the distance between
+    barcodes i and j is given by matrix[i][j].
+
+    Arguments:
+      barcodes (list): list of barcode sequences
+
+    Returns:
+      Matrix of integer distances.
+
+    """
+    n = len(barcodes)
+    if numpy is None:
+        distances = [[0]*n for i in xrange(n)]
+        for i in xrange(n):
+            seq1 = barcodes[i]
+            for j in xrange(i+1,n):
+                d = 0
+                for b1,b2 in zip(seq1,barcodes[j]):
+                    if b1 != b2:
+                        d += 1
+                distances[i][j] = distances[j][i] = d
+        return distances
+    if n == 0:
+        return numpy.zeros((0,0),dtype=numpy.uint8)
+    # Encode as an N*L array of bytes, padding with zeroes
+    length = max([len(seq) for seq in barcodes])
+    encoded = numpy.frombuffer(''.join([str(seq).ljust(length,'\0')
+                                        for seq in barcodes]),
+                               dtype=numpy.uint8).reshape(n,length)
+    padded = (min([len(seq) for seq in barcodes]) != length)
+    # Use the smallest integer type that can hold the distances
+    if length < 256:
+        distances = numpy.zeros((n,n),dtype=numpy.uint8)
+    else:
+        distances = numpy.zeros((n,n),dtype=numpy.uint16)
+    mismatch = numpy.empty((n,n),dtype=numpy.bool_)
+    for pos in xrange(length):
+        col = encoded[:,pos]
+        numpy.not_equal(col[:,None],col[None,:],out=mismatch)
+        if padded:
+            present = (col != 0)
+            mismatch &= present[:,None]
+            mismatch &= present[None,:]
+        distances += mismatch
+    return distances
+
 def cmp_sample_names(s1,s2):
     """
     Compare two sample names and return integer depending on the outcome
@@ -27,6 +27,15 @@ methods to check on and control the job.
 
 The runner's 'list' method returns a list of running job ids.
 
+The 'wait_for_completion' method can be used to block until a job
+finishes: the SimpleJobRunner is notified as soon as each job exits,
+whereas other runners simply wait for the specified timeout.
+
+The GEJobRunner can also submit a set of commands as a single Grid
+Engine array job using its 'run_array' method; this returns an id
+for each task in the array, of the form '<job_id>.<task_id>', which
+can be used in the same way as the id for any other job.
+
 Simple usage example:
 
 >>> # Create a JobRunner instance
@@ -42,15 +51,20 @@ Simple usage example:
 
 """
 
-__version__ = "1.1.2"
+__version__ = "1.6.0"
 
 #######################################################################
 # Import modules that this module depends on
 #######################################################################
 import os
+import errno
 import logging
 import subprocess
 import time
+import tempfile
+import pipes
+import threading
+import Queue
 try:
     import drmaa
 except ImportError:
@@ -87,6 +101,9 @@ class BaseJobRunner:
 
       errorState: indicates if running job is in an "error state"
       isRunning : checks if a specific job is running
+      wait_for_completion: waits for the next job to finish
+      poll_exit_status: returns the exit status for a job if it's
+                   available, without waiting
 
     if the default implementations are not sufficient.
     """
@@ -155,6 +172,48 @@ class BaseJobRunner:
         """
         return None
 
+    def poll_exit_status(self,job_id):
+        """Return the exit status code for the command if available
+
+        Like 'exit_status', except that it returns immediately
+        with None if the exit status isn't available yet (for
+        example while waiting for the job accounting to be
+        updated), rather than waiting for it.
+
+        The default implementation simply calls 'exit_status'.
+        """
+        return self.exit_status(job_id)
+
+    def has_exit_status(self,job_id):
+        """Check if the exit status for a finished job is known
+
+        Returns True if 'exit_status' would return without
+        waiting for a job which has finished (including where
+        the runner has given up trying to get the exit status,
+        in which case it is None), False otherwise.
+
+        The default implementation always returns True.
+        """
+        return True
+
+    def wait_for_completion(self,timeout):
+        """Wait for a job to complete
+
+        Blocks until a job managed by the runner finishes, or
+        until 'timeout' seconds have passed, and returns the id
+        of the finished job (or None if none finished).
+
+        The default implementation doesn't track job completion
+        and simply waits for the timeout period before returning
+        None; subclasses which are notified when jobs finish can
+        override it to return early.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+        """
+        time.sleep(timeout)
+        return None
+
     @property
     def log_dir(self):
         """Return the current log directory setting
@@ -174,9 +233,15 @@ class BaseJobRunner:
 class SimpleJobRunner(BaseJobRunner):
     """Class implementing job runner for local system
 
-    SimpleJobRunner starts jobs as processes on a local system;
-    the status of jobs is determined using the Linux 'ps eu'
-    command, and jobs are terminated using 'kill -9'.
+    SimpleJobRunner starts jobs as processes on a local system,
+    and jobs are terminated using 'kill'.
+
+    Each job has a watcher thread which waits for the process to
+    exit and records its exit status, so the runner is notified
+    as soon as a job finishes rather than having to poll every
+    process. Finished jobs are picked up the next time that the
+    runner is queried (e.g. via 'list' or 'isRunning'), and can
+    also be waited for using 'wait_for_completion'.
     """
 
     def __init__(self,log_dir=None,join_logs=False):
@@ -204,6 +269,13 @@ class SimpleJobRunner(BaseJobRunner):
         self.__err_files = {}
         self.__exit_status = {}
         self.__job_popen = {}
+        # Jobs which have exited but not yet been collected,
+        # and watcher threads for running jobs
+        self.__lock = threading.Lock()
+        self.__exited = {}
+        self.__watchers = {}
+        # Queue of ids for completed jobs
+        self.__completed = Queue.Queue()
 
     def __repr__(self):
         return 'SimpleJobRunner'
@@ -252,13 +324,23 @@ class SimpleJobRunner(BaseJobRunner):
             err = subprocess.STDOUT
         # Start the subprocess
         p = subprocess.Popen(cmd,cwd=cwd,stdout=log,stderr=err)
+        # Child has its own copies of the log file handles
+        log.close()
+        if not self.__join_logs:
+            err.close()
         # Capture the job id from the output
         job_id = str(p.pid)
         logging.debug("RunScript: done - job id = %s" % job_id)
         # Do internal house keeping
         self.__job_list.append(job_id)
         self.__log_files[job_id] = lognames[0]
-        self.__job_popen[job_id] = p
+        with self.__lock:
+            self.__job_popen[job_id] = p
+        # Start a thread to wait for the job to exit
+        watcher = threading.Thread(target=self.__watch,args=(job_id,p))
+        watcher.daemon = True
+        self.__watchers[job_id] = watcher
+        watcher.start()
         if not self.__join_logs:
             self.__err_files[job_id] = lognames[1]
         else:
@@ -282,9 +364,22 @@ class SimpleJobRunner(BaseJobRunner):
             return False
         # Attempt to terminate
         logging.debug("KillJob: deleting job")
-        p = self.__job_popen[job_id]
-        p.terminate()
-        p.wait()
+        with self.__lock:
+            # Don't try to kill jobs which have already exited
+            self.__collect_exited()
+            p = self.__job_popen.get(job_id)
+            watcher = self.__watchers.get(job_id)
+        if p is not None:
+            try:
+                p.terminate()
+            except OSError, ex:
+                # Job may have exited since the check above
+                if ex.errno != errno.ESRCH:
+                    raise
+                logging.debug("KillJob: job %s already exited" % job_id)
+        if watcher is not None:
+            # Wait for the watcher to register that the job exited
+            watcher.join()
         if job_id not in self.list():
             logging.debug("KillJob: deleted job %s" % job_id)
             return True
@@ -310,25 +405,45 @@ class SimpleJobRunner(BaseJobRunner):
     def list(self):
         """Return a list of running job_ids
         """
-        job_ids = []
-        for job_id in [jid for jid in self.__job_popen]:
-            p = self.__job_popen[job_id]
-            status = p.poll()
-            if status is None:
-                job_ids.append(job_id)
-            else:
-                logging.debug("Job id %s: finished (%s)" % (job_id,
-                                                            status))
-                self.__exit_status[job_id] = status
-                del(self.__job_popen[job_id])
-        return job_ids
+        with self.__lock:
+            self.__collect_exited()
+            return self.__job_popen.keys()
+
+    def isRunning(self,job_id):
+        """Check if a job is running
+
+        Returns True if job is still running, False if not
+        """
+        with self.__lock:
+            self.__collect_exited()
+            return job_id in self.__job_popen
+
+    def wait_for_completion(self,timeout):
+        """Wait for a job to complete
+
+        Blocks until a job finishes, or until 'timeout' seconds
+        have passed. Each finished job is reported once, in the
+        order that they finished.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          Id of the finished job, or None if no job finished
+          within the timeout period.
+        """
+        try:
+            return self.__completed.get(timeout=timeout)
+        except Queue.Empty:
+            return None
 
     def exit_status(self,job_id):
         """Return exit status from command run by a job
         """
-        if job_id in self.__job_popen:
-            # Job exists but still running
-            return None
+        with self.__lock:
+            if job_id in self.__job_popen:
+                # Job exists but still running
+                return None
         # Look for return code
         try:
             return self.__exit_status[job_id]
@@ -336,6 +451,31 @@ class SimpleJobRunner(BaseJobRunner):
             logging.error("Don't know anything about job %s" % job_id)
             return None
 
+    def __watch(self,job_id,p):
+        """Internal: wait for a job to exit and record its status
+
+        Runs in a separate thread for each job.
+        """
+        status = p.wait()
+        with self.__lock:
+            self.__exited[job_id] = status
+            del(self.__watchers[job_id])
+        self.__completed.put(job_id)
+
+    def __collect_exited(self):
+        """Internal: update the lists of running and finished jobs
+
+        Moves jobs which have exited since the last update from
+        the running to the finished jobs. Must be called with the
+        lock held.
+        """
+        for job_id in self.__exited:
+            status = self.__exited[job_id]
+            logging.debug("Job id %s: finished (%s)" % (job_id,status))
+            self.__exit_status[job_id] = status
+            del(self.__job_popen[job_id])
+        self.__exited.clear()
+
     def __assign_log_files(self,name,working_dir):
         """Internal: return log file names for stdout and stderr
 
@@ -363,10 +503,32 @@ class GEJobRunner(BaseJobRunner):
 
     Additionally the runner can be configured for a specific GE
     queue on initialisation.
+
+    The output from 'qstat' is cached and shared between all the
+    status queries ('list', 'isRunning', 'errorState' etc), and
+    is only refreshed if it is older than the 'qstat_interval'
+    (or if jobs have been submitted or deleted since), so that
+    checking on many jobs doesn't run many 'qstat' commands.
+
+    Similarly exit statuses are fetched from the accounting data
+    for all recently finished jobs at once, using a single 'qacct'
+    command (see 'poll_exit_status').
+
+    Sets of related commands can be submitted as a single array
+    job using the 'run_array' method.
+
+    Jobs can be held until other jobs have finished by specifying
+    the ids of those jobs via the 'wait_for' argument of 'run' and
+    'run_array' (which uses the 'qsub -hold_jid' option).
     """
 
+    # State codes for jobs which are 'r' (=running), or 'S'
+    # (=suspended), or 'qw'(=queued, waiting), or 'hqw' (=on hold,
+    # waiting), or 't' (=transferring)
+    __RUNNING_STATES = ('r','S','qw','hqw','t')
+
     def __init__(self,queue=None,log_dir=None,ge_extra_args=None,
-                 poll_interval=1.0,timeout=30.0):
+                 poll_interval=1.0,timeout=30.0,qstat_interval=None):
         """Create a new GEJobRunner instance
 
         Arguments:
@@ -377,6 +539,9 @@ class GEJobRunner(BaseJobRunner):
             to acquire qacct information (default 1s)
           timeout: maximum length of time to wait before giving up when
             polling Grid Engine (default 30s)
+          qstat_interval: maximum age (in seconds) of the cached 'qstat'
+            output before it is refreshed (defaults to the poll_interval;
+            set to zero to run 'qstat' for every query)
         """
         self.__queue = queue
         # Directory for log files
@@ -385,10 +550,25 @@ class GEJobRunner(BaseJobRunner):
         self.__names = {}
         self.__log_dirs = {}
         self.__exit_status = {}
+        # Number of tasks for each array job
+        self.__arrays = {}
+        # Argument files and task scripts for array jobs
+        self.__array_files = {}
         self.__ge_extra_args = ge_extra_args
         # Polling intervals and timeout periods (seconds)
         self.__ge_poll_interval = poll_interval
         self.__ge_timeout = timeout
+        # Cached qstat output
+        if qstat_interval is None:
+            qstat_interval = poll_interval
+        self.__qstat_interval = qstat_interval
+        self.__qstat_jobs = None
+        self.__qstat_time = None
+        # Submission times for jobs and finished jobs waiting for
+        # accounting information
+        self.__submit_times = {}
+        self.__qacct_pending = {}
+        self.__qacct_time = None
 
     def __repr__(self):
         name = 'GEJobRunner'
@@ -413,7 +593,7 @@ class GEJobRunner(BaseJobRunner):
         """
         return self.__ge_extra_args
 
-    def run(self,name,working_dir,script,args):
+    def run(self,name,working_dir,script,args,wait_for=None):
         """Submit a script or command to the cluster via 'qsub'
 
         Arguments:
@@ -421,6 +601,8 @@ class GEJobRunner(BaseJobRunner):
           working_dir: Directory to run the job in
           script: Script file to run
           args: List of arguments to supply to the script
+          wait_for: (optional) list of job ids; if supplied then
+            the job is held until all these jobs have finished
 
         Returns:
           Job id for submitted job, or 'None' if job failed to
@@ -434,71 +616,119 @@ class GEJobRunner(BaseJobRunner):
         logging.debug("Working_dir: %s" % working_dir)
         logging.debug("Script     : %s" % script)
         logging.debug("Arguments  : %s" % str(args))
+        logging.debug("Wait for   : %s" % wait_for)
         # Build command to be submitted
         cmd_args = [script]
         cmd_args.extend(args)
         cmd = ' '.join(cmd_args)
         # Build qsub command to submit it
-        qsub = ['qsub','-b','y','-V','-N',name]
-        if self.__queue:
-            qsub.extend(('-q',self.__queue))
-        if self.log_dir:
-            qsub.extend(('-o',self.log_dir,'-e',self.log_dir))
-        if not working_dir:
-            qsub.append('-cwd')
-        else:
-            qsub.extend(('-wd',working_dir))
-        if self.__ge_extra_args:
-            qsub.extend(self.__ge_extra_args)
+        qsub = self.__qsub_command(name,working_dir,wait_for)
         qsub.append(cmd)
-        logging.debug("QsubScript: qsub command: %s" % qsub)
-        # Run the qsub job in the current directory
-        cwd = os.getcwd()
-        # Check that this exists
-        logging.debug("QsubScript: executing in %s" % cwd)
-        if not os.path.exists(cwd):
-            logging.error("QsubScript: cwd doesn't exist!")
-            return None
-        p = subprocess.Popen(qsub,cwd=cwd,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        p.wait()
-        # Check stderr
-        error = p.stderr.read().strip()
-        if error:
-            # Just echo error message as a warning
-            logging.warning("QsubScript: '%s'" % error)
-        # Capture the job id from the output
-        job_id = None
-        for line in p.stdout:
-            if line.startswith('Your job'):
-                job_id = line.split()[2]
-        logging.debug("QsubScript: done - job id = %s" % job_id)
+        job_id = self.__submit(qsub)
         # Store name and log dir against job id
         if job_id is not None:
-            self.__names[job_id] = name
-            if self.log_dir is None:
-                self.__log_dirs[job_id] = working_dir
-            else:
-                self.__log_dirs[job_id] = self.log_dir
+            self.__store_job(job_id,name,working_dir)
         # Return the job id
         return job_id
 
+    def run_array(self,name,working_dir,script,args_list,wait_for=None):
+        """Submit a set of commands to the cluster as an array job
+
+        Each item in 'args_list' is a list of arguments to supply
+        to the script for one task. The commands are written to a
+        task-indexed argument file (one command per line) and a
+        single 'qsub -t 1-N' job is submitted, with each task
+        running the command on the line matching its task index.
+
+        The argument file and the script which runs the commands
+        are written to the log directory (or to the working
+        directory if no log directory is set), and are removed
+        once none of the tasks are reported by qstat.
+
+        Arguments:
+          name: Name to give the array job
+          working_dir: Directory to run the tasks in
+          script: Script file to run
+          args_list: List of argument lists, one for each task
+          wait_for: (optional) list of job ids; if supplied then
+            the tasks are held until all these jobs have finished
+
+        Returns:
+          List of ids for the tasks in the submitted job (of the
+          form '<job_id>.<task_id>', in the same order as the
+          'args_list'), or 'None' if the job failed to start.
+        """
+        logging.debug("GEJobRunner: submitting array job")
+        logging.debug("Name       : %s" % name)
+        logging.debug("Tasks      : %d" % len(args_list))
+        if not args_list:
+            return []
+        # Write the task-indexed argument file
+        dirn = self.log_dir
+        if dirn is None:
+            dirn = working_dir
+        if not dirn:
+            dirn = os.getcwd()
+        fd,args_file = tempfile.mkstemp(prefix="%s." % name,suffix=".args",
+                                        dir=dirn)
+        fp = os.fdopen(fd,'w')
+        for args in args_list:
+            cmd_args = [script]
+            cmd_args.extend(args)
+            fp.write("%s\n" % ' '.join(cmd_args))
+        fp.close()
+        # Write the script to run the command for each task
+        fd,task_script = tempfile.mkstemp(prefix="%s." % name,suffix=".sh",
+                                          dir=dirn)
+        fp = os.fdopen(fd,'w')
+        fp.write("#!/bin/bash\n"
+                 "eval \"$(sed -n \"${SGE_TASK_ID}p\" %s)\"\n" %
+                 pipes.quote(args_file))
+        fp.close()
+        # Build qsub command to submit it
+        qsub = self.__qsub_command(name,working_dir,wait_for)
+        qsub.extend(('-t',"1-%d" % len(args_list)))
+        qsub.append("/bin/bash %s" % pipes.quote(task_script))
+        job_id = self.__submit(qsub)
+        if job_id is None:
+            self.__remove_files((args_file,task_script))
+            return None
+        # Output is e.g. "Your job-array 12345.1-4:1 ..."
+        job_id = job_id.split('.')[0]
+        self.__arrays[job_id] = len(args_list)
+        self.__array_files[job_id] = (args_file,task_script)
+        # Store name and log dir against each task
+        task_ids = []
+        for i in range(1,len(args_list)+1):
+            task_id = "%s.%d" % (job_id,i)
+            self.__store_job(task_id,name,working_dir)
+            task_ids.append(task_id)
+        return task_ids
+
     def terminate(self,job_id):
         """Remove a job from the GE queue using 'qdel'
+
+        If 'job_id' is the id of a task from an array job then
+        only that task is removed.
         """
         logging.debug("QdelJob: deleting job")
-        qdel=('qdel',job_id)
+        if self.__is_task(job_id):
+            qdel=('qdel',job_id.split('.')[0],'-t',job_id.split('.')[1])
+        else:
+            qdel=('qdel',job_id)
         p = subprocess.Popen(qdel,stdout=subprocess.PIPE)
         p.wait()
         message = p.stdout.read()
         logging.debug("qdel: %s" % message)
+        self.__invalidate_qstat()
         return True
 
     def logFile(self,job_id):
         """Return the log file name for a job
 
-        The name should be '<name>.o<job_id>'
+        The name should be '<name>.o<job_id>' (which is also the
+        name for tasks in array jobs, as their ids are of the form
+        '<job_id>.<task_id>')
         """
         log_file = "%s.o%s" % (self.__names[job_id],job_id)
         if self.__log_dirs[job_id] is not None:
@@ -530,33 +760,40 @@ class GEJobRunner(BaseJobRunner):
         Returns the queue as reported by qstat, or None if
         not found.
         """
-        jobs = self.__run_qstat()
-        for job_data in jobs:
-            # Id is first item, Queue is 8th item for each job
-            if job_data[0] == job_id:
-                try:
-                    return job_data[7]
-                except Exception:
-                    return None
-        # No match
-        return None
+        try:
+            # Queue is 8th item for each job
+            return self.__qstat()[job_id][7]
+        except (KeyError,IndexError):
+            # No match
+            return None
 
     def list(self):
         """Get list of job ids in the queue.
         """
-        jobs = self.__run_qstat()
+        jobs = self.__qstat()
         # Process the output to get job ids
         job_ids = []
-        for job_data in jobs:
-            # Check for state being 'r' (=running), or 'S' (=suspended),
-            # or 'qw'(=queued, waiting), or 't' (=transferring)
-            if job_data[4] in ('r','S','qw','t'):
-                # Id is first item for each job
-                job_ids.append(job_data[0])
+        for job_id in jobs:
+            if jobs[job_id][4] in self.__RUNNING_STATES:
+                job_ids.append(job_id)
         return job_ids
 
+    def isRunning(self,job_id):
+        """Check if a job is running
+
+        Returns True if job is still running, False if not
+        """
+        try:
+            return self.__qstat()[job_id][4] in self.__RUNNING_STATES
+        except KeyError:
+            return False
+
     def exit_status(self,job_id):
         """Return exit status from command run by a job
+
+        If the job has finished but the accounting information
+        isn't available yet then waits for it (up to the timeout
+        period); use 'poll_exit_status' to avoid waiting.
         """
         if job_id in self.__exit_status:
             # Return cached exit status
@@ -570,29 +807,181 @@ class GEJobRunner(BaseJobRunner):
         # information periodically
         # Therefore we will retry retrieval based on the polling
         # interval and timeout period defined on initialisation
-        job_info = self.__run_qacct(job_id)
+        self.__qacct_pending.setdefault(job_id,time.time())
         retries = 0
-        while not job_info and \
-              (retries*self.__ge_poll_interval) < self.__ge_timeout:
+        while True:
+            self.__update_exit_statuses(force=True)
+            if job_id in self.__exit_status:
+                break
             time.sleep(self.__ge_poll_interval)
-            job_info = self.__run_qacct(job_id)
             retries += 1
         logging.debug("qacct: %s (%s retries), returned %s" %
-                      (job_id,retries,job_info))
-        # Check if we have qacct info after multiple attempts
-        if not job_info:
-            logging.warning("No qacct info for job %s after %d attempts "
-                            "(timeout %ss)" %
-                            (job_id,retries,self.__ge_timeout))
+                      (job_id,retries,self.__exit_status[job_id]))
+        return self.__exit_status[job_id]
+
+    def poll_exit_status(self,job_id):
+        """Return exit status from command run by a job if available
+
+        Returns None if the job is still running or if the
+        accounting information isn't available yet, without
+        waiting.
+
+        The accounting information is fetched for all the
+        finished jobs which are waiting for it using a single
+        'qacct' command, which is run at most once per polling
+        interval.
+        """
+        if job_id in self.__exit_status:
+            # Return cached exit status
+            return self.__exit_status[job_id]
+        if self.isRunning(job_id):
+            # Return None if job is still running
             return None
-        # Extract, store and return exit status
-        try:
-            exit_status = int(job_info['exit_status'])
-            self.__exit_status[job_id] = exit_status
-            return exit_status
-        except KeyError:
-            logging.error("No exit_status returned for job %s" % job_id)
+        self.__qacct_pending.setdefault(job_id,time.time())
+        self.__update_exit_statuses()
+        return self.__exit_status.get(job_id)
+
+    def has_exit_status(self,job_id):
+        """Check if the exit status for a finished job is known
+
+        Returns True once the accounting information for the
+        job has been fetched (or the runner has given up waiting
+        for it), False otherwise.
+        """
+        return job_id in self.__exit_status
+
+    def __qsub_command(self,name,working_dir,wait_for=None):
+        """Internal: build the qsub command line for submitting a job
+
+        Returns a list with the 'qsub' command and the options for
+        the job name, queue, log directory, working directory, jobs
+        to wait for and any extra arguments; the command to run
+        should be appended.
+
+        Tasks in 'wait_for' are replaced by the id of the array job
+        they belong to (i.e. the job waits for the whole array).
+        """
+        qsub = ['qsub','-b','y','-V','-N',name]
+        if self.__queue:
+            qsub.extend(('-q',self.__queue))
+        if self.log_dir:
+            qsub.extend(('-o',self.log_dir,'-e',self.log_dir))
+        if not working_dir:
+            qsub.append('-cwd')
+        else:
+            qsub.extend(('-wd',working_dir))
+        if wait_for:
+            hold_job_ids = []
+            for job_id in wait_for:
+                if self.__is_task(job_id):
+                    job_id = job_id.split('.')[0]
+                if job_id not in hold_job_ids:
+                    hold_job_ids.append(job_id)
+            qsub.extend(('-hold_jid',','.join(hold_job_ids)))
+        if self.__ge_extra_args:
+            qsub.extend(self.__ge_extra_args)
+        return qsub
+
+    def __submit(self,qsub):
+        """Internal: run qsub and return the job id
+
+        Returns the job id reported by qsub, or None if the job
+        wasn't submitted.
+        """
+        logging.debug("QsubScript: qsub command: %s" % qsub)
+        # Run the qsub job in the current directory
+        cwd = os.getcwd()
+        # Check that this exists
+        logging.debug("QsubScript: executing in %s" % cwd)
+        if not os.path.exists(cwd):
+            logging.error("QsubScript: cwd doesn't exist!")
             return None
+        p = subprocess.Popen(qsub,cwd=cwd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        p.wait()
+        # Check stderr
+        error = p.stderr.read().strip()
+        if error:
+            # Just echo error message as a warning
+            logging.warning("QsubScript: '%s'" % error)
+        # Capture the job id from the output
+        job_id = None
+        for line in p.stdout:
+            if line.startswith('Your job'):
+                job_id = line.split()[2]
+        logging.debug("QsubScript: done - job id = %s" % job_id)
+        # New job won't be in the cached qstat output
+        self.__invalidate_qstat()
+        return job_id
+
+    def __store_job(self,job_id,name,working_dir):
+        """Internal: store name, log dir etc against a job id
+        """
+        self.__names[job_id] = name
+        self.__submit_times[job_id] = time.time()
+        if self.log_dir is None:
+            self.__log_dirs[job_id] = working_dir
+        else:
+            self.__log_dirs[job_id] = self.log_dir
+
+    def __is_task(self,job_id):
+        """Internal: check if job id is for a task in an array job
+        """
+        return job_id.split('.')[0] in self.__arrays
+
+    def __qstat(self):
+        """Internal: return cached qstat data as a dictionary
+
+        Returns a dictionary where the keys are job ids and the
+        values are the lists of data items returned by qstat for
+        each job (see '__run_qstat'). Tasks in array jobs have
+        keys of the form '<job_id>.<task_id>'.
+
+        The data are cached and 'qstat' is only run again if the
+        cached data are older than the qstat interval.
+        """
+        now = time.time()
+        if self.__qstat_jobs is None or \
+           (now - self.__qstat_time) >= self.__qstat_interval:
+            jobs = {}
+            for job_data in self.__run_qstat():
+                # Id is first item for each job
+                job_id = job_data[0]
+                if job_id in self.__arrays:
+                    # Task id is the last item for array jobs
+                    job_id = "%s.%s" % (job_id,job_data[-1])
+                jobs.setdefault(job_id,job_data)
+            self.__qstat_jobs = jobs
+            self.__qstat_time = now
+            # Jobs which have disappeared have finished, so will
+            # need accounting information
+            for job_id in self.__submit_times:
+                if job_id not in jobs and job_id not in self.__exit_status:
+                    self.__qacct_pending.setdefault(job_id,now)
+            # Remove the files for array jobs with no remaining tasks
+            for job_id in self.__array_files.keys():
+                n_tasks = self.__arrays[job_id]
+                if not [i for i in range(1,n_tasks+1)
+                        if "%s.%d" % (job_id,i) in jobs]:
+                    self.__remove_files(self.__array_files[job_id])
+                    del(self.__array_files[job_id])
+        return self.__qstat_jobs
+
+    def __remove_files(self,files):
+        """Internal: remove files, logging any which can't be removed
+        """
+        for f in files:
+            try:
+                os.remove(f)
+            except OSError,ex:
+                logging.warning("GEJobRunner: failed to remove %s: %s" %
+                                (f,ex))
+
+    def __invalidate_qstat(self):
+        """Internal: force qstat to be run for the next query
+        """
+        self.__qstat_jobs = None
 
     def __run_qstat(self):
         """Internal: run qstat and return data as a list of lists
@@ -601,12 +990,16 @@ class GEJobRunner(BaseJobRunner):
         list where each item is the data for a job in the form of
         another list, with the items in this list being the data
         returned by qstat.
+
+        Tasks in array jobs are reported individually (i.e. with
+        one line per task).
         """
         try:
             cmd = ['qstat','-u',os.getlogin()]
         except OSError:
             # os.getlogin() not guaranteed to work in all environments?
             cmd = ['qstat']
+        cmd.extend(('-g','d'))
         # Run the qstat
         p = subprocess.Popen(cmd,stdout=subprocess.PIPE)
         p.wait()
@@ -627,6 +1020,86 @@ class GEJobRunner(BaseJobRunner):
                 pass
         return jobs
 
+    def __update_exit_statuses(self,force=False):
+        """Internal: fetch exit statuses for finished jobs
+
+        Runs 'qacct' once to get the accounting information for
+        all the finished jobs which are waiting for it, and stores
+        the exit statuses for those that are found. Jobs which are
+        still missing after the timeout period are given an exit
+        status of None.
+
+        Unless 'force' is True, 'qacct' isn't run if it was
+        already run within the polling interval.
+        """
+        if not self.__qacct_pending:
+            return
+        now = time.time()
+        if not force and self.__qacct_time is not None and \
+           (now - self.__qacct_time) < self.__ge_poll_interval:
+            return
+        self.__qacct_time = now
+        # Fetch the records for all the jobs submitted since the
+        # earliest pending job
+        begin = min([self.__submit_times.get(job_id,now)
+                     for job_id in self.__qacct_pending])
+        records = self.__run_qacct_all(begin)
+        if records is None:
+            # Fall back to fetching records for each job
+            records = [self.__run_qacct(job_id)
+                       for job_id in self.__qacct_pending]
+        for job_info in records:
+            if not job_info:
+                continue
+            job_id = job_info.get('jobnumber')
+            if job_id in self.__arrays:
+                job_id = "%s.%s" % (job_id,job_info.get('taskid'))
+            if job_id not in self.__qacct_pending:
+                continue
+            del(self.__qacct_pending[job_id])
+            try:
+                self.__exit_status[job_id] = int(job_info['exit_status'])
+            except KeyError:
+                logging.error("No exit_status returned for job %s" % job_id)
+                self.__exit_status[job_id] = None
+        # Give up on jobs which have waited too long
+        for job_id in self.__qacct_pending.keys():
+            if (now - self.__qacct_pending[job_id]) >= self.__ge_timeout:
+                logging.warning("No qacct info for job %s (timeout %ss)" %
+                                (job_id,self.__ge_timeout))
+                del(self.__qacct_pending[job_id])
+                self.__exit_status[job_id] = None
+
+    def __run_qacct_all(self,begin):
+        """Internal: run qacct for all jobs started after a specified time
+
+        Runs 'qacct -j' to get the accounting information for all
+        jobs for the current user which started after 'begin' (in
+        seconds since the epoch), and returns a list of dictionaries
+        (see '__run_qacct'), one for each job.
+
+        Returns None if 'qacct' reported an error.
+        """
+        # Allow for clock differences between hosts
+        begin = time.strftime("%Y%m%d%H%M",time.localtime(begin-60))
+        cmd = ['qacct','-b',begin]
+        try:
+            cmd.extend(('-o',os.getlogin()))
+        except OSError:
+            # os.getlogin() not guaranteed to work in all environments?
+            pass
+        cmd.append('-j')
+        # Run the qacct command
+        p = subprocess.Popen(cmd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        stdout,stderr = p.communicate()
+        if p.returncode != 0 or stderr.startswith("error:"):
+            logging.debug("Unable to get qacct info for all jobs: %s" %
+                          stderr.strip())
+            return None
+        return parse_qacct_output(stdout)
+
     def __run_qacct(self,job_id):
         """Internal: run qacct and return data as a dictionary
 
@@ -655,7 +1128,11 @@ class GEJobRunner(BaseJobRunner):
         that no information is available at all.
 
         """
-        cmd = ['qacct','-j',"%s" % job_id]
+        if self.__is_task(job_id):
+            cmd = ['qacct','-j',job_id.split('.')[0],
+                   '-t',job_id.split('.')[1]]
+        else:
+            cmd = ['qacct','-j',"%s" % job_id]
         # Run the qacct command
         p = subprocess.Popen(cmd,
                              stdout=subprocess.PIPE,
@@ -669,36 +1146,10 @@ class GEJobRunner(BaseJobRunner):
                           % job_id)
             return None
         # Process the output
-        qacct_dict = {}
-        # Typical output is:
-        # qname        serial.q
-        # hostname     node015.prv.cluster
-        # group        users
-        # owner        pjb
-        # jobname      copy.MH
-        # jobnumber    9859
-        # taskid       undefined
-        # account      sge
-        # priority     0
-        # qsub_time    Thu Aug 18 11:28:50 2016
-        # start_time   Thu Aug 18 11:28:50 2016
-        # end_time     Thu Aug 18 12:27:09 2016
-        # granted_pe   NONE
-        # slots        1
-        # failed       0
-        # exit_status  0
-        # ...
-        # i.e. key-value pairs, one pair per line
-        for line in p.stdout:
-            try:
-                i = line.index(" ")
-                key = line[:i].strip()
-                value = line[i:].strip()
-                qacct_dict[key] = value
-            except ValueError:
-                # Skip this line
-                pass
-        return qacct_dict
+        records = parse_qacct_output(p.stdout.read())
+        if not records:
+            return {}
+        return records[-1]
 
     def __job_state_code(self,job_id):
         """Internal: get the state code for the specified job id
@@ -706,13 +1157,12 @@ class GEJobRunner(BaseJobRunner):
         Will be one of the GE job state codes, or an empty
         string if the job id isn't found.
         """
-        jobs = self.__run_qstat()
-        for job_data in jobs:
-            if job_data[0] == job_id:
-                # State code is index 4
-                return job_data[4]
-        # Job not found
-        return ''
+        try:
+            # State code is index 4
+            return self.__qstat()[job_id][4]
+        except KeyError:
+            # Job not found
+            return ''
 
 class DRMAAJobRunner(BaseJobRunner):
     """Class implementing job runner using DRMAA
@@ -845,6 +1295,61 @@ class DRMAAJobRunner(BaseJobRunner):
 # Functions
 #######################################################################
 
+def parse_qacct_output(output):
+    """Parse the output from the Grid Engine 'qacct -j' command
+
+    Typical output is:
+
+    ==============================================================
+    qname        serial.q
+    hostname     node015.prv.cluster
+    group        users
+    owner        pjb
+    jobname      copy.MH
+    jobnumber    9859
+    taskid       undefined
+    account      sge
+    priority     0
+    qsub_time    Thu Aug 18 11:28:50 2016
+    start_time   Thu Aug 18 11:28:50 2016
+    end_time     Thu Aug 18 12:27:09 2016
+    granted_pe   NONE
+    slots        1
+    failed       0
+    exit_status  0
+    ...
+
+    i.e. key-value pairs, one pair per line, with a separator
+    line of '=' characters before the data for each job.
+
+    Arguments:
+      output: text output from 'qacct'
+
+    Returns:
+      List of dictionaries, one for each job record, e.g.
+      [{ 'qname': 'serial.q', 'exit_status': '0', ... }, ...]
+    """
+    records = []
+    qacct_dict = {}
+    for line in output.split('\n'):
+        if line.startswith('====='):
+            # Start of a new record
+            if qacct_dict:
+                records.append(qacct_dict)
+            qacct_dict = {}
+            continue
+        try:
+            i = line.index(" ")
+            key = line[:i].strip()
+            value = line[i:].strip()
+            qacct_dict[key] = value
+        except ValueError:
+            # Skip this line
+            pass
+    if qacct_dict:
+        records.append(qacct_dict)
+    return records
+
 def fetch_runner(definition):
     """Return job runner instance based on a definition string
 
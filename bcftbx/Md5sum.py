@@ -37,13 +37,45 @@ There is also a high-level class 'Md5Checker' which implements various
 class methods for running MD5 checks across all files in a directory, and
 a wrapper class 'Md5Reporter' which
 
+The 'compute_md5sums', 'md5cmp_dirs' and 'verify_md5sums' methods of
+'Md5Checker' can optionally compute the checksums in a pool of threads
+(via the 'workers' argument), which can give significant speed-ups on
+parallel filesystems (as hashlib releases the GIL while hashing).
+
+MD5 sums can also be stored in a persistent 'Md5sumCache', keyed on the
+device, inode, size and modification time of each file, so that files
+which haven't changed since they were last checksummed only need to be
+stat'ed rather than read again.
+
+Multiple digests (e.g. MD5, SHA-256 and CRC32) can be computed for a file
+in a single pass using the 'checksums' function; 'Md5Checker' also has
+'compute_checksums' and 'verify_checksums' methods to generate and verify
+multi-column checksum manifests, which have the form:
+
+# md5 sha256 crc32
+<md5>  <sha256>  <crc32>  <path/to/file>
+...
+
+For very large files a block manifest can be used instead, which records
+a checksum for each fixed-size block of the file as well as the checksum
+and size of the whole file (see 'Md5Checker.compute_block_checksums').
+The blocks of a single file can then be verified in parallel, and failures
+identify the byte ranges that are corrupted (see
+'Md5Checker.verify_block_checksums'). Block manifests have the form:
+
+# blocks md5 67108864
+file  <md5>  <size>  <path/to/file>
+block  <offset>  <length>  <md5>
+block  <offset>  <length>  <md5>
+...
+
 """
 
 #######################################################################
 # Module metadata
 #######################################################################
 
-__version__ = "1.1.0"
+__version__ = "1.2.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -51,7 +83,19 @@ __version__ = "1.1.0"
 
 import sys
 import os
+import stat
 import logging
+import collections
+import datetime
+import json
+import Queue
+import sqlite3
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+from bcftbx.utils import format_file_size
+from bcftbx.utils import scandir_walk
 try:
     # Preferentially use hashlib module
     import hashlib
@@ -65,6 +109,15 @@ except ImportError:
 
 BLOCKSIZE = 1024*1024
 
+# Maximum number of queued tasks per worker thread
+MAX_PENDING_PER_WORKER = 4
+
+# Default algorithms for checksum manifests
+DEFAULT_ALGORITHMS = ('md5',)
+
+# Default block size for block manifests
+DEFAULT_MANIFEST_BLOCK_SIZE = 64*1024*1024
+
 #######################################################################
 # Classes
 #######################################################################
@@ -90,9 +143,12 @@ class Md5Checker:
     # Class constants representing link handling
     FOLLOW_LINKS=0
     IGNORE_LINKS=1
+    # Class constants representing file comparison methods
+    COMPARE_MD5=0
+    COMPARE_BYTES=1
 
     @classmethod
-    def walk(self,dirn,links=FOLLOW_LINKS):
+    def walk(self,dirn,links=FOLLOW_LINKS,workers=1):
         """Traverse all files found in a directory structure
 
         Given a directory, traverses the structure underneath (including
@@ -107,23 +163,29 @@ class Md5Checker:
         IGNORE_LINKS: symbolic links to files are ignored; links to
                       directories are not followed.
 
+        The traversal uses the 'scandir_walk' function, so the
+        type of each entry is determined from the directory listing
+        without additional 'stat' calls where possible.
+
         Arguments:
           dirn: name of the top-level directory
           links: (optional) specify how symbolic links are handled
+          workers: (optional) number of threads to use for listing
+            directories (default is 1 i.e. no threading)
 
         Returns:
           Yields the name and full path for each file under 'dirn'.
           
         """
-        for d in os.walk(dirn):
-            if os.path.islink(d[0]) and links != self.FOLLOW_LINKS:
+        skip_top = (os.path.islink(dirn) and links != self.FOLLOW_LINKS)
+        for dirpath,dirs,files in scandir_walk(dirn,workers=workers):
+            if skip_top and dirpath == dirn:
                 continue
-            for f in d[2]:
-                path = os.path.join(d[0],f)
-                if os.path.islink(path) and links != self.FOLLOW_LINKS:
+            for f in files:
+                if f.is_symlink() and links != self.FOLLOW_LINKS:
                     continue
                 else:
-                    yield os.path.normpath(path)
+                    yield os.path.normpath(f.path)
 
     @classmethod
     def md5_walk(self,dirn,links=FOLLOW_LINKS):
@@ -149,7 +211,7 @@ class Md5Checker:
             yield (os.path.relpath(f,dirn),md5sum(f))
 
     @classmethod
-    def md5cmp_files(self,f1,f2):
+    def md5cmp_files(self,f1,f2,cache=None):
         """Compares the MD5 sums of two files 
 
         Given two file names, attempts to compute and compare their
@@ -164,19 +226,32 @@ class Md5Checker:
         Note that if either file is a link then MD5 sums will be
         computed for the link target(s), if they exist and can be
         accessed.
+
+        If both files are regular files with different sizes then
+        MD5_FAILED is returned immediately, without computing the
+        MD5 sums.
         
         Arguments:
           f1: name and path for reference file
           f2: name and path for file to be checked
+          cache: (optional) Md5sumCache instance to look up and
+            store MD5 sums
 
         Returns:
           Md5Checker constant representing the outcome of the
           comparison.
 
         """
+        if cache is not None:
+            md5 = cache.md5sum
+        else:
+            md5 = md5sum
+        # Compare sizes first
+        if regular_file_sizes_differ(f1,f2):
+            return self.MD5_FAILED
         # Compute and compare MD5 sums
         try:
-            if md5sum(f1) == md5sum(f2):
+            if md5(f1) == md5(f2):
                 status = self.MD5_OK
             else:
                 status = self.MD5_FAILED
@@ -187,7 +262,81 @@ class Md5Checker:
         return status
 
     @classmethod
-    def md5cmp_dirs(self,d1,d2,links=FOLLOW_LINKS):
+    def cmp_files(self,f1,f2):
+        """Compares the contents of two files
+
+        Given two file names, compares their contents directly without
+        computing MD5 sums: if both are regular files with different
+        sizes then they are reported as different straight away;
+        otherwise the files are read block by block in parallel and
+        the comparison stops at the first block that differs.
+
+        This is much faster than 'md5cmp_files' when files differ,
+        and avoids the overhead of computing digests when only
+        equality is needed.
+
+        If the contents match then returns MD5_OK, if they don't match
+        then returns MD5_FAILED.
+
+        If one or both files cannot be read then returns MD5_ERROR.
+
+        Arguments:
+          f1: name and path for reference file
+          f2: name and path for file to be checked
+
+        Returns:
+          Md5Checker constant representing the outcome of the
+          comparison.
+
+        """
+        return self.cmp_files_n_bytes(f1,f2)[0]
+
+    @classmethod
+    def cmp_files_n_bytes(self,f1,f2):
+        """Compares the contents of two files and counts bytes read
+
+        Compares the files in the same way as 'cmp_files', and also
+        returns the total number of bytes that were read from the
+        two files (which may be less than their combined size if
+        the comparison stopped early).
+
+        Arguments:
+          f1: name and path for reference file
+          f2: name and path for file to be checked
+
+        Returns:
+          Tuple (status,n_bytes) where status is the Md5Checker
+          constant representing the outcome of the comparison.
+
+        """
+        if regular_file_sizes_differ(f1,f2):
+            return (self.MD5_FAILED,0)
+        n_bytes = 0
+        try:
+            fp1 = open(f1,'rb')
+            try:
+                fp2 = open(f2,'rb')
+                try:
+                    while True:
+                        block1 = fp1.read(BLOCKSIZE)
+                        block2 = fp2.read(BLOCKSIZE)
+                        n_bytes += len(block1) + len(block2)
+                        if block1 != block2:
+                            return (self.MD5_FAILED,n_bytes)
+                        if not block1:
+                            return (self.MD5_OK,n_bytes)
+                finally:
+                    fp2.close()
+            finally:
+                fp1.close()
+        except IOError, ex:
+            # Error accessing one or both files
+            logging.error("%s: error while comparing files: '%s'" % (f1,ex))
+            return (self.MD5_ERROR,n_bytes)
+
+    @classmethod
+    def md5cmp_dirs(self,d1,d2,links=FOLLOW_LINKS,workers=1,ordered=True,
+                    cache=None,compare=COMPARE_MD5,stats=None):
         """Compares the contents of one directory with another using MD5 sums
 
         Given two directory names 'd1' and 'd2', compares the MD5 sum of
@@ -212,10 +361,31 @@ class Md5Checker:
                       is a symbolic link, and links to directories are
                       not followed.
 
+        How the files are compared depends on the setting of the
+        'compare' option:
+
+        COMPARE_MD5:   (default) MD5 sums are computed and compared
+                       (see 'md5cmp_files').
+        COMPARE_BYTES: the file sizes and then contents are compared
+                       directly, stopping at the first difference
+                       (see 'cmp_files'); MD5_FAILED is yielded for
+                       files that differ.
+
         Arguments:
           d1: 'reference' directory
           d2: 'target' directory to be compared with the reference
           links: (optional) specify how symbolic links are handled.
+          workers: (optional) number of threads to use for computing
+            the MD5 sums (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the files are found, otherwise
+            they are yielded as soon as they are available (only has an
+            effect if 'workers' is more than 1)
+          cache: (optional) Md5sumCache instance to look up and
+            store MD5 sums (ignored if 'compare' is COMPARE_BYTES)
+          compare: (optional) specify how files are compared
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
 
         Returns:
           Yields a tuple (f,status) where f is the relative path of the
@@ -223,23 +393,39 @@ class Md5Checker:
           representing the outcome of the comparison.
 
         """
-        for f1 in self.walk(d1,links=links):
+        def cmp_file(f1):
             f2 = os.path.join(d2,os.path.relpath(f1,d1))
+            start = time.time()
+            n_bytes = 0
             if not os.path.exists(f2):
                 result = self.MISSING_TARGET
             else:
                 try:
-                    result = self.md5cmp_files(f1,f2)
+                    if compare == self.COMPARE_BYTES:
+                        result,n_bytes = self.cmp_files_n_bytes(f1,f2)
+                    else:
+                        if stats is not None:
+                            # Must be checked before the cache is updated
+                            n_bytes = bytes_to_read(f1,f2,cache=cache)
+                        result = self.md5cmp_files(f1,f2,cache=cache)
                 except Exception,ex:
                     logging.debug("Failed to compute one or both checksums:")
                     logging.debug("Reference file: %s" % f1)
                     logging.debug("Target file   : %s" % f2)
                     logging.debug("Exception     : %s" % ex)
                     result = self.MD5_ERROR
-            yield (os.path.relpath(f1,d1),result)
+            if stats is not None:
+                stats.record(n_bytes,time.time()-start)
+            return (os.path.relpath(f1,d1),result)
+        for result in imap_threaded(cmp_file,
+                                    self.walk(d1,links=links,
+                                              workers=workers),
+                                    workers=workers,ordered=ordered):
+            yield result
 
     @classmethod
-    def compute_md5sums(self,d,links=FOLLOW_LINKS):
+    def compute_md5sums(self,d,links=FOLLOW_LINKS,workers=1,ordered=True,
+                        cache=None,stats=None):
         """Calculate MD5 sums for all files in directory
 
         Given a directory, traverses the structure underneath (including
@@ -252,21 +438,45 @@ class Md5Checker:
         Arguments:
           dirn: name of the top-level directory
           links: (optional) specify how symbolic links are handled
+          workers: (optional) number of threads to use for computing
+            the MD5 sums (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the files are found, otherwise
+            they are yielded as soon as they are available (only has an
+            effect if 'workers' is more than 1)
+          cache: (optional) Md5sumCache instance to look up and
+            store MD5 sums
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
 
         Returns:
           Yields a tuple (f,md5) where f is the path of a file relative to
           the top-level directory, and md5 is the calculated MD5 sum.
 
         """
-        for f in self.walk(d,links=links):
+        if cache is not None:
+            md5 = cache.md5sum
+        else:
+            md5 = md5sum
+        def compute_md5(f):
             try:
-                md5 = md5sum(f)
-                yield (os.path.relpath(f,d),md5)
+                return (os.path.relpath(f,d),md5(f))
             except IOError,ex:
                 logging.error("md5sum: %s: %s" % (f,ex))
+                return None
+        if stats is not None:
+            compute_md5 = stats.wrap(
+                compute_md5,size=lambda f: bytes_to_read(f,cache=cache))
+        for result in imap_threaded(compute_md5,
+                                    self.walk(d,links=links,
+                                              workers=workers),
+                                    workers=workers,ordered=ordered):
+            if result is not None:
+                yield result
 
     @classmethod
-    def verify_md5sums(self,filen=None,fp=None):
+    def verify_md5sums(self,filen=None,fp=None,workers=1,ordered=True,
+                       cache=None,skip=None,stats=None):
         """Verify md5sums from a file
 
         Given a file (or a file-like object opened for reading), reads
@@ -293,6 +503,19 @@ class Md5Checker:
         Arguments:
           filen: name of the file containing md5sum output
           fp   : file-like object opened for reading, with md5sum output
+          workers: (optional) number of threads to use for computing
+            the MD5 sums (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the lines in the file, otherwise
+            they are yielded as soon as they are available (only has an
+            effect if 'workers' is more than 1)
+          cache: (optional) Md5sumCache instance to look up and
+            store MD5 sums
+          skip: (optional) collection of file paths (as they appear
+            in the file) which should not be verified, for example
+            those already recorded in an Md5CheckJournal
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
 
         Returns:
           Yields a tuple (f,status) where f is the path of the file being
@@ -304,16 +527,26 @@ class Md5Checker:
             filen=None
         else:
             fp = open(filen,'rU')
-        for line in fp:
-            items = line.strip().split()
-            if len(items) < 2:
-                raise IndexError,"Bad MD5 sum line: %s" % line.rstrip('\n')
-            chksum = items[0]
-            f = line[len(chksum):].strip()
+        if cache is not None:
+            md5 = cache.md5sum
+        else:
+            md5 = md5sum
+        def read_md5sums():
+            for line in fp:
+                items = line.strip().split()
+                if len(items) < 2:
+                    raise IndexError,"Bad MD5 sum line: %s" % line.rstrip('\n')
+                chksum = items[0]
+                f = line[len(chksum):].strip()
+                if skip is not None and f in skip:
+                    continue
+                yield (f,chksum)
+        def verify_md5sum(entry):
+            f,chksum = entry
             try:
                 if not os.path.exists(f):
                     status = self.MISSING_TARGET
-                elif md5sum(f) == chksum:
+                elif md5(f) == chksum:
                     status = self.MD5_OK
                 else:
                     status = self.MD5_FAILED
@@ -321,7 +554,307 @@ class Md5Checker:
                 # Error accessing file
                 logging.error("%s: error while generating MD5 sum: '%s'" % (f,ex))
                 status = self.MD5_ERROR
-            yield (f,status)
+            return (f,status)
+        if stats is not None:
+            verify_md5sum = stats.wrap(
+                verify_md5sum,
+                size=lambda entry: bytes_to_read(entry[0],cache=cache))
+        for result in imap_threaded(verify_md5sum,read_md5sums(),
+                                    workers=workers,ordered=ordered):
+            yield result
+
+    @classmethod
+    def compute_checksums(self,d,algorithms=DEFAULT_ALGORITHMS,
+                          links=FOLLOW_LINKS,workers=1,ordered=True,
+                          stats=None):
+        """Calculate multiple checksums for all files in directory
+
+        Given a directory, traverses the structure underneath (including
+        subdirectories) and yields the path and checksums for each file
+        that is found. Each file is read only once regardless of the
+        number of checksum algorithms (see the 'checksums' function).
+
+        The 'links' option determines how symbolic links are handled, see
+        the 'walk' function for details.
+
+        Arguments:
+          d: name of the top-level directory
+          algorithms: (optional) list of checksum algorithms (e.g.
+            'md5','sha256','crc32'; default is just 'md5')
+          links: (optional) specify how symbolic links are handled
+          workers: (optional) number of threads to use for computing
+            the checksums (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the files are found, otherwise
+            they are yielded as soon as they are available (only has an
+            effect if 'workers' is more than 1)
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
+
+        Returns:
+          Yields a tuple (f,digests) where f is the path of a file
+          relative to the top-level directory, and digests is a tuple
+          of the checksums in the same order as 'algorithms'.
+
+        """
+        def compute_digests(f):
+            try:
+                digests = checksums(f,algorithms)
+                return (os.path.relpath(f,d),
+                        tuple([digests[a] for a in algorithms]))
+            except IOError,ex:
+                logging.error("checksums: %s: %s" % (f,ex))
+                return None
+        if stats is not None:
+            compute_digests = stats.wrap(compute_digests,size=bytes_to_read)
+        for result in imap_threaded(compute_digests,
+                                    self.walk(d,links=links,
+                                              workers=workers),
+                                    workers=workers,ordered=ordered):
+            if result is not None:
+                yield result
+
+    @classmethod
+    def verify_checksums(self,filen=None,fp=None,algorithms=None,
+                         workers=1,ordered=True,skip=None,stats=None):
+        """Verify checksums from a manifest file
+
+        Given a manifest file (or a file-like object opened for
+        reading) with one or more checksum columns (see
+        'read_manifest'), verifies the checksums for each file
+        listed against the file located on the file system, and
+        yields the result as an Md5checker constant for each file
+        i.e.:
+
+        MD5_OK:     if all the checksums match;
+        MD5_FAILED: if any of the checksums differ.
+
+        If the file cannot be found then it yields MISSING_TARGET; if
+        there is a problem computing the checksums then it yields
+        MD5_ERROR.
+
+        Each file is only read once, regardless of the number of
+        algorithms being verified.
+
+        Arguments:
+          filen: name of the manifest file
+          fp   : file-like object opened for reading, with manifest
+          algorithms: (optional) subset of the algorithms in the
+            manifest to verify (default is to verify all of them)
+          workers: (optional) number of threads to use for computing
+            the checksums (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the lines in the file, otherwise
+            they are yielded as soon as they are available (only has an
+            effect if 'workers' is more than 1)
+          skip: (optional) collection of file paths (as they appear
+            in the file) which should not be verified, for example
+            those already recorded in an Md5CheckJournal
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
+
+        Returns:
+          Yields a tuple (f,status) where f is the path of the file being
+          verified (as it appears in the file), and status is the Md5Checker
+          constant representing the outcome.
+
+        """
+        if fp is None:
+            fp = open(filen,'rU')
+        def read_entries():
+            for f,digests in read_manifest(fp):
+                if skip is not None and f in skip:
+                    continue
+                if algorithms is not None:
+                    try:
+                        digests = dict([(a,digests[a]) for a in algorithms])
+                    except KeyError,ex:
+                        raise KeyError("Algorithm %s not in manifest" % ex)
+                yield (f,digests)
+        def verify_entry(entry):
+            f,digests = entry
+            try:
+                if not os.path.exists(f):
+                    status = self.MISSING_TARGET
+                elif checksums(f,digests.keys()) == digests:
+                    status = self.MD5_OK
+                else:
+                    status = self.MD5_FAILED
+            except IOError, ex:
+                # Error accessing file
+                logging.error("%s: error while generating checksums: '%s'" %
+                              (f,ex))
+                status = self.MD5_ERROR
+            return (f,status)
+        if stats is not None:
+            verify_entry = stats.wrap(
+                verify_entry,size=lambda entry: bytes_to_read(entry[0]))
+        for result in imap_threaded(verify_entry,read_entries(),
+                                    workers=workers,ordered=ordered):
+            yield result
+
+    @classmethod
+    def compute_block_checksums(self,files,
+                                block_size=DEFAULT_MANIFEST_BLOCK_SIZE,
+                                algorithm='md5',workers=1,ordered=True,
+                                stats=None):
+        """Calculate whole-file and per-block checksums for files
+
+        For each file, computes the checksum for the whole file
+        along with the checksums for each successive block of
+        'block_size' bytes, reading the file only once (see the
+        'block_checksums' function). The results can be written
+        to a block manifest using the 'block_manifest_header' and
+        'block_manifest_lines' functions.
+
+        Arguments:
+          files: list or iterable of file names
+          block_size: (optional) size of each block in bytes
+          algorithm: (optional) checksum algorithm (default 'md5')
+          workers: (optional) number of threads to use (files are
+            processed in parallel; default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the input files
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
+
+        Returns:
+          Yields a tuple (f,chksum,size,blocks) where f is the file
+          name, chksum and size are the checksum and size of the
+          whole file, and blocks is a list of (offset,length,chksum)
+          tuples. Files which can't be read are logged and skipped.
+
+        """
+        def compute_blocks(f):
+            try:
+                chksum,size,blocks = block_checksums(f,block_size,algorithm)
+                return (f,chksum,size,blocks)
+            except IOError,ex:
+                logging.error("block_checksums: %s: %s" % (f,ex))
+                return None
+        if stats is not None:
+            compute_blocks = stats.wrap(compute_blocks,size=bytes_to_read)
+        for result in imap_threaded(compute_blocks,files,
+                                    workers=workers,ordered=ordered):
+            if result is not None:
+                yield result
+
+    @classmethod
+    def verify_block_checksums(self,filen=None,fp=None,workers=1,ordered=True,
+                               skip=None,stats=None):
+        """Verify the blocks of files listed in a block manifest
+
+        Given a block manifest file (or a file-like object opened
+        for reading, see 'read_block_manifest'), verifies the
+        checksum of each block of each listed file, and the
+        checksum for each whole file. Blocks are verified
+        independently so those from the same file can be checked
+        in parallel by multiple threads (the whole-file checksum
+        is verified as a separate task, so each file is read
+        twice).
+
+        The results are yielded for each byte range as an Md5Checker
+        constant:
+
+        MD5_OK:     if the block checksum matches;
+        MD5_FAILED: if the block checksum differs (including where
+                    the file is now shorter than the block).
+
+        If the file is longer than the size recorded in the manifest
+        then the extra bytes are also reported as MD5_FAILED; if the
+        file cannot be found then MISSING_TARGET is yielded for the
+        whole file, and MD5_ERROR if a block can't be read.
+
+        The result of checking the whole-file checksum is yielded
+        after the blocks for each file, with the start and end of
+        the range set to None.
+
+        Files whose names appear in 'skip' are not verified at all
+        (i.e. the results for missing files and whole-file checks,
+        which aren't associated with any block, can be skipped).
+
+        Arguments:
+          filen: name of the block manifest file
+          fp   : file-like object opened for reading, with manifest
+          workers: (optional) number of threads to use for verifying
+            the blocks (default is 1 i.e. no threading)
+          ordered: (optional) if True (the default) then results are
+            yielded in the same order as the blocks in the manifest,
+            otherwise they are yielded as soon as they are available
+            (only has an effect if 'workers' is more than 1)
+          skip: (optional) collection of block names (as generated
+            by the 'block_name' function) for byte ranges which
+            should not be verified, and/or file names for files
+            which should not be verified
+          stats: (optional) Md5Stats instance to record the number
+            of files and bytes processed, and the time taken
+
+        Returns:
+          Yields a tuple (f,start,end,status) where f is the path of
+          the file (as it appears in the manifest), start and end
+          are the byte offsets of the range checked (end being one
+          past the last byte, and both None for the whole-file
+          check), and status is the Md5Checker constant representing
+          the outcome.
+
+        """
+        if fp is None:
+            fp = open(filen,'rU')
+        def read_blocks():
+            for f,algorithm,chksum,size,blocks in read_block_manifest(fp):
+                if skip is not None and f in skip:
+                    continue
+                try:
+                    actual_size = os.path.getsize(f)
+                except OSError:
+                    yield (f,0,size,None,None)
+                    continue
+                if actual_size > size:
+                    blocks = blocks + [(size,actual_size-size,None)]
+                for offset,length,block_chksum in blocks:
+                    if skip is not None and \
+                       block_name(f,offset,offset+length) in skip:
+                        continue
+                    if block_chksum is None:
+                        yield (f,offset,length,None,None)
+                    else:
+                        yield (f,offset,length,algorithm,block_chksum)
+                # Check the whole file
+                yield (f,None,actual_size,algorithm,chksum)
+        def verify_block(block):
+            f,offset,length,algorithm,chksum = block
+            if offset is None:
+                try:
+                    if checksums(f,(algorithm,))[algorithm] == chksum:
+                        status = self.MD5_OK
+                    else:
+                        status = self.MD5_FAILED
+                except IOError,ex:
+                    logging.error("%s: error while checking file: '%s'"
+                                  % (f,ex))
+                    status = self.MD5_ERROR
+                return (f,None,None,status)
+            if algorithm is None:
+                if not os.path.exists(f):
+                    status = self.MISSING_TARGET
+                else:
+                    status = self.MD5_FAILED
+            else:
+                try:
+                    if block_checksum(f,offset,length,algorithm) == chksum:
+                        status = self.MD5_OK
+                    else:
+                        status = self.MD5_FAILED
+                except IOError,ex:
+                    logging.error("%s: error while checking block %d-%d: "
+                                  "'%s'" % (f,offset,offset+length,ex))
+                    status = self.MD5_ERROR
+            return (f,offset,offset+length,status)
+        if stats is not None:
+            verify_block = stats.wrap(verify_block,size=lambda block: block[2])
+        for result in imap_threaded(verify_block,read_blocks(),
+                                    workers=workers,ordered=ordered):
+            yield result
 
 class Md5CheckReporter:
     """Provides a generic reporting class for Md5Checker methods
@@ -353,7 +886,8 @@ class Md5CheckReporter:
                (MD5 ERROR)
 
     """
-    def __init__(self,results=None,verbose=False,fp=sys.stdout):
+    def __init__(self,results=None,verbose=False,fp=sys.stdout,journal=None,
+                 stats=None):
         """Create a new Md5CheckReporter instance
 
         Arguments:
@@ -363,6 +897,14 @@ class Md5CheckReporter:
             otherwise only report failures (default)
           fp: specify a file-like object to write messages to. Must
             already be opened for writing (defaults to sys.stdout)
+          journal: (optional) Md5CheckJournal instance; results
+            already in the journal are merged with the new results,
+            and new results are recorded in the journal. Entries
+            already in the journal should be excluded from 'results'
+            (e.g. by using the 'skip' argument when verifying)
+          stats: (optional) Md5Stats instance; if supplied then the
+            summary also reports the volume of data processed and
+            the throughput
 
         """
         self._verbose = verbose
@@ -371,6 +913,12 @@ class Md5CheckReporter:
         self._md5_failed = []
         self._md5_error = []
         self._missing_target = []
+        self._journal = None
+        self._stats = stats
+        if journal is not None:
+            for f,status in journal.results():
+                self.add_result(f,status)
+            self._journal = journal
         if results is not None:
             for result in results:
                 self.add_result(result[0],result[1])
@@ -416,6 +964,9 @@ class Md5CheckReporter:
         nature of the failure (e.g. MD5 sums didn't match,
         target was missing etc).
 
+        If the reporter was created with a journal then the
+        result is also recorded in the journal.
+
         """
         self._n_files += 1
         if status == Md5Checker.MD5_OK:
@@ -436,6 +987,8 @@ class Md5CheckReporter:
                 # Unrecognised code
                 raise Exception, "Unrecognised status: '%s'" % status
             self._fp.write("%s: %s\n" % (f,status_msg))
+        if self._journal is not None:
+            self._journal.record(f,status)
 
     def summary(self):
         """Write a summary of the results
@@ -450,6 +1003,12 @@ class Md5CheckReporter:
         self._fp.write("\t%d failed\n" % self.n_failed)
         self._fp.write("\t%d not found\n" % self.n_missing)
         self._fp.write("\t%d 'bad' files (MD5 computation errors)\n" % self.n_errors)
+        if self._stats is not None:
+            self._fp.write("\t%s processed in %.1fs (%s/s, %.1f files/s)\n" %
+                           (format_file_size(self._stats.n_bytes),
+                            self._stats.elapsed,
+                            format_file_size(self._stats.bytes_per_second),
+                            self._stats.files_per_second))
 
     @property
     def status(self):
@@ -464,10 +1023,1065 @@ class Md5CheckReporter:
         else:
             return 1
 
+class Md5CheckJournal:
+    """Journal of completed checks, for resuming interrupted verifications
+
+    Records the results of checks (i.e. a name and an Md5Checker
+    status code) in a file as they are completed, so that a long
+    running verification can be resumed if it is interrupted. The
+    journal is flushed and fsync'ed to disk periodically (every
+    'sync_interval' results or 'sync_time' seconds, whichever comes
+    first) and when it is closed.
+
+    Typical usage:
+
+    >>> journal = Md5CheckJournal('checksums.journal',resume=True)
+    >>> results = Md5Checker.verify_md5sums(
+    ...     'checksums',skip=frozenset(journal.completed))
+    >>> r = Md5CheckReporter(results,journal=journal)
+    >>> journal.close()
+
+    The reporter merges the results from the journal with those
+    of the new checks, and records the new results in the journal.
+    Note that 'completed' is updated as results are recorded, so
+    a copy should be used to skip entries (otherwise entries
+    which appear more than once would be skipped).
+
+    The journal format is one line per result, consisting of the
+    status code and the name separated by a tab. A partial last
+    line (e.g. from a process killed while writing) is discarded
+    when the journal is resumed.
+
+    """
+    def __init__(self,filen,resume=True,sync_interval=1000,sync_time=30.0):
+        """Create a new Md5CheckJournal instance
+
+        Arguments:
+          filen: name of the journal file
+          resume: (optional) if True (the default) then load the
+            results from an existing journal and append new results;
+            otherwise any existing journal is overwritten
+          sync_interval: (optional) maximum number of results to
+            record before syncing the journal to disk
+          sync_time: (optional) maximum number of seconds between
+            syncs of the journal to disk
+
+        """
+        self._filen = os.path.abspath(filen)
+        self._sync_interval = sync_interval
+        self._sync_time = sync_time
+        self._results = []
+        self._completed = set()
+        self._n_unsynced = 0
+        self._last_sync = time.time()
+        if resume and os.path.exists(self._filen):
+            self._load()
+            self._fp = open(self._filen,'a')
+        else:
+            self._fp = open(self._filen,'w')
+
+    def _load(self):
+        """Internal: load results from an existing journal
+
+        Any partial last line is truncated from the file.
+
+        """
+        offset = 0
+        fp = open(self._filen,'rb')
+        for line in fp:
+            if not line.endswith('\n'):
+                # Partially written entry
+                break
+            try:
+                status,name = line.rstrip('\n').split('\t',1)
+                status = int(status)
+            except ValueError:
+                raise ValueError("%s: bad journal line: %s" %
+                                 (self._filen,line.rstrip('\n')))
+            self._results.append((name,status))
+            self._completed.add(name)
+            offset += len(line)
+        fp.close()
+        if offset != os.path.getsize(self._filen):
+            logging.warning("%s: discarding partial entry at end of "
+                            "journal" % self._filen)
+            fp = open(self._filen,'r+b')
+            fp.truncate(offset)
+            fp.close()
+
+    @property
+    def filen(self):
+        """Full path of the journal file
+        """
+        return self._filen
+
+    @property
+    def completed(self):
+        """Set of names with results in the journal
+        """
+        return self._completed
+
+    def results(self):
+        """Return the results loaded from an existing journal
+
+        Returns:
+          List of (name,status) tuples.
+
+        """
+        return list(self._results)
+
+    def record(self,name,status):
+        """Record a result in the journal
+
+        Arguments:
+          name: name (e.g. file path) that was checked
+          status: Md5Checker status code for the check
+
+        """
+        self._fp.write("%d\t%s\n" % (status,name))
+        self._completed.add(name)
+        self._n_unsynced += 1
+        if self._n_unsynced >= self._sync_interval or \
+           (time.time() - self._last_sync) >= self._sync_time:
+            self.sync()
+
+    def sync(self):
+        """Flush the journal and sync it to disk
+        """
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._n_unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        """Sync and close the journal file
+        """
+        if self._fp is not None:
+            self.sync()
+            self._fp.close()
+            self._fp = None
+
+class Md5Stats:
+    """Collect throughput statistics for checksum operations
+
+    Records the number of files and bytes processed, and the time
+    spent processing them, both overall and for each worker thread,
+    so that it's possible to see how fast files are being read and
+    whether adding workers improves throughput.
+
+    Typical usage:
+
+    >>> stats = Md5Stats(progress=sys.stderr)
+    >>> stats.start()
+    >>> for f,chksum in Md5Checker.compute_md5sums(d,workers=4,
+    ...                                            stats=stats):
+    ...    print "%s  %s" % (chksum,f)
+    >>> stats.stop()
+    >>> stats.dump('stats.json')
+
+    If a 'progress' stream is supplied then 'start' launches a
+    background thread which writes a progress line to the stream
+    every 'interval' seconds (this continues to report if workers
+    stall). If the total number of files or bytes is known then
+    the progress line includes an estimate of the time remaining.
+
+    The Md5Checker methods accept an Md5Stats instance via their
+    'stats' argument; alternatively use the 'wrap' method to
+    instrument an arbitrary function, or 'record' to add results
+    directly.
+
+    """
+    def __init__(self,total_files=None,total_bytes=None,progress=None,
+                 interval=10.0):
+        """Create a new Md5Stats instance
+
+        Arguments:
+          total_files: (optional) total number of files expected
+            (used to estimate the time remaining)
+          total_bytes: (optional) total number of bytes expected
+            (used in preference to 'total_files' to estimate the
+            time remaining)
+          progress: (optional) file-like object to write progress
+            lines to (e.g. sys.stderr)
+          interval: (optional) number of seconds between progress
+            lines (default 10)
+
+        """
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self._progress = progress
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._n_files = 0
+        self._n_bytes = 0
+        self._workers = {}
+        self._start_time = time.time()
+        self._end_time = None
+        self._progress_thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start (or restart) the clock and the progress reporting
+        """
+        self._start_time = time.time()
+        self._end_time = None
+        if self._progress is not None and self._progress_thread is None:
+            self._stop_event.clear()
+            self._progress_thread = threading.Thread(
+                target=self._report_progress)
+            self._progress_thread.daemon = True
+            self._progress_thread.start()
+
+    def stop(self):
+        """Stop the clock and the progress reporting
+
+        If progress reporting is enabled then a final progress
+        line is written.
+
+        """
+        self._end_time = time.time()
+        if self._progress_thread is not None:
+            self._stop_event.set()
+            self._progress_thread.join()
+            self._progress_thread = None
+            self._write_progress()
+
+    def _report_progress(self):
+        """Internal: write progress lines until stopped
+        """
+        while not self._stop_event.wait(self._interval):
+            self._write_progress()
+
+    def _write_progress(self):
+        """Internal: write a progress line to the progress stream
+        """
+        self._progress.write("%s\n" % self.progress_line())
+        self._progress.flush()
+
+    def record(self,n_bytes,elapsed=0.0,worker=None):
+        """Record a processed file
+
+        Arguments:
+          n_bytes: number of bytes processed for the file
+          elapsed: (optional) time in seconds spent processing
+            the file
+          worker: (optional) name of the worker which processed
+            the file (defaults to the name of the current thread)
+
+        """
+        if worker is None:
+            worker = threading.current_thread().name
+        with self._lock:
+            self._n_files += 1
+            self._n_bytes += n_bytes
+            try:
+                counts = self._workers[worker]
+            except KeyError:
+                counts = [0,0,0.0]
+                self._workers[worker] = counts
+            counts[0] += 1
+            counts[1] += n_bytes
+            counts[2] += elapsed
+
+    def wrap(self,func,size=None):
+        """Return an instrumented version of a function
+
+        The returned function calls 'func' with the same argument,
+        and records the time taken and the number of bytes
+        processed for the worker thread that called it.
+
+        Arguments:
+          func: function taking a single argument
+          size: (optional) function which returns the number of
+            bytes processed when 'func' is called with the same
+            argument (e.g. os.path.getsize); if it raises an OSError
+            then zero bytes are recorded
+
+        Returns:
+          Instrumented function.
+
+        """
+        def instrumented(item):
+            n_bytes = 0
+            if size is not None:
+                try:
+                    n_bytes = size(item)
+                except OSError:
+                    pass
+            start = time.time()
+            try:
+                return func(item)
+            finally:
+                self.record(n_bytes,time.time()-start)
+        return instrumented
+
+    @property
+    def n_files(self):
+        """Number of files processed
+        """
+        return self._n_files
+
+    @property
+    def n_bytes(self):
+        """Number of bytes processed
+        """
+        return self._n_bytes
+
+    @property
+    def elapsed(self):
+        """Elapsed wall clock time in seconds
+        """
+        if self._end_time is not None:
+            return self._end_time - self._start_time
+        return time.time() - self._start_time
+
+    @property
+    def bytes_per_second(self):
+        """Overall throughput in bytes per second
+        """
+        elapsed = self.elapsed
+        if elapsed > 0:
+            return self._n_bytes/elapsed
+        return 0.0
+
+    @property
+    def files_per_second(self):
+        """Overall throughput in files per second
+        """
+        elapsed = self.elapsed
+        if elapsed > 0:
+            return self._n_files/elapsed
+        return 0.0
+
+    @property
+    def eta(self):
+        """Estimated number of seconds remaining
+
+        Estimated from 'total_bytes' if set, otherwise from
+        'total_files'; returns None if neither is set or if no
+        progress has been made yet.
+
+        """
+        if self.total_bytes is not None and self._n_bytes:
+            return max(self.total_bytes-self._n_bytes,0)/ \
+                self.bytes_per_second
+        if self.total_files is not None and self._n_files:
+            return max(self.total_files-self._n_files,0)/ \
+                self.files_per_second
+        return None
+
+    def workers(self):
+        """Return the statistics for each worker
+
+        Returns:
+          Dictionary where keys are worker names and values are
+          dictionaries with 'n_files', 'n_bytes', 'busy_time' (time
+          in seconds spent processing files) and 'bytes_per_second'
+          (bytes processed per second of busy time).
+
+        """
+        with self._lock:
+            workers = {}
+            for worker in self._workers:
+                n_files,n_bytes,busy_time = self._workers[worker]
+                if busy_time > 0:
+                    bps = n_bytes/busy_time
+                else:
+                    bps = 0.0
+                workers[worker] = { 'n_files': n_files,
+                                    'n_bytes': n_bytes,
+                                    'busy_time': busy_time,
+                                    'bytes_per_second': bps }
+            return workers
+
+    def progress_line(self):
+        """Return a single line summarising progress
+
+        For example:
+
+        '[progress] 120 files, 3.4G (254.1M/s, 12.3 files/s), ETA 0:01:23'
+
+        """
+        line = "[progress] %d files, %s (%s/s, %.1f files/s)" % \
+               (self._n_files,
+                format_file_size(self._n_bytes),
+                format_file_size(self.bytes_per_second),
+                self.files_per_second)
+        eta = self.eta
+        if eta is not None:
+            line += ", ETA %s" % datetime.timedelta(seconds=int(eta))
+        return line
+
+    def report(self):
+        """Return the statistics as a dictionary
+
+        The dictionary has the overall counts and throughput,
+        and the statistics for each worker (see 'workers').
+
+        """
+        return { 'n_files': self._n_files,
+                 'n_bytes': self._n_bytes,
+                 'elapsed': self.elapsed,
+                 'bytes_per_second': self.bytes_per_second,
+                 'files_per_second': self.files_per_second,
+                 'workers': self.workers() }
+
+    def dump(self,filen=None,fp=None):
+        """Write the statistics as JSON
+
+        Arguments:
+          filen: name of file to write to
+          fp: file-like object to write to (used instead of
+            'filen' if supplied)
+
+        """
+        if fp is None:
+            fp = open(filen,'w')
+            json.dump(self.report(),fp,indent=2,sort_keys=True)
+            fp.close()
+        else:
+            json.dump(self.report(),fp,indent=2,sort_keys=True)
+
+class Md5sumCache:
+    """Persistent cache of MD5 sums for files
+
+    Stores MD5 sums in an SQLite database file, keyed on the device
+    and inode of each file along with its size and modification
+    time (in nanoseconds, where the platform provides them).
+
+    Typical usage:
+
+    >>> cache = Md5sumCache("checksums.db")
+    >>> cache.md5sum("myfile.txt")
+    ... eacc9c036025f0e64fb724cacaadd8b4
+    >>> cache.close()
+
+    The 'md5sum' method can be used as a drop-in replacement for
+    the 'md5sum' function: if the file's device, inode, size and
+    modification time match a stored entry then the stored MD5 sum
+    is returned without reading the file; otherwise the MD5 sum is
+    computed and the cache updated.
+
+    If the cache is created with 'trust=False' then stored MD5 sums
+    are never used, but the cache is still updated with the newly
+    computed values (i.e. it is refreshed).
+
+    New MD5 sums are held in memory and written to the database
+    in a single short transaction every 'commit_interval' updates
+    (and when the cache is committed or closed), so that several
+    processes can share the same database file without holding
+    its write lock for long.
+
+    Instances can be shared between threads. For a multiprocessing
+    Pool, open a separate instance in each worker process (e.g.
+    using the Pool 'initializer') and close it when the worker
+    finishes. Instances can also be pickled, in which case each
+    copy opens its own connection to the database and commits
+    every update (as copies are not explicitly closed).
+
+    """
+    def __init__(self,filen,trust=True,commit_interval=1000):
+        """Create a new Md5sumCache instance
+
+        Arguments:
+          filen: path to the SQLite database file (will be created
+            if it doesn't already exist)
+          trust: (optional) if True (the default) then use stored
+            MD5 sums for unchanged files; if False then always
+            recompute (and update the stored values)
+          commit_interval: (optional) number of updates to make
+            before committing them to the database file (default
+            1000)
+
+        """
+        self._filen = filen
+        self._trust = trust
+        self._commit_interval = commit_interval
+        self._open()
+
+    def _open(self):
+        """Internal: connect to the database and create table
+        """
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._conn = sqlite3.connect(self._filen,
+                                     timeout=60,
+                                     check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS md5sums "
+                           "(dev INTEGER, ino INTEGER, size INTEGER, "
+                           "mtime_ns INTEGER, md5 TEXT, path TEXT, "
+                           "PRIMARY KEY (dev,ino))")
+        self._conn.commit()
+
+    def __getstate__(self):
+        return { '_filen': self._filen,
+                 '_trust': self._trust,
+                 '_commit_interval': self._commit_interval }
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._commit_interval = 1
+        self._open()
+
+    @property
+    def filen(self):
+        """Path to the SQLite database file
+        """
+        return self._filen
+
+    @property
+    def trust(self):
+        """Whether stored MD5 sums are used
+        """
+        return self._trust
+
+    @staticmethod
+    def key(st):
+        """Return the cache key from the 'stat' info for a file
+
+        Returns a tuple (dev,ino,size,mtime_ns).
+
+        """
+        try:
+            mtime_ns = st.st_mtime_ns
+        except AttributeError:
+            mtime_ns = int(st.st_mtime*1000000000)
+        return (st.st_dev,st.st_ino,st.st_size,mtime_ns)
+
+    def lookup(self,f,st=None):
+        """Return the stored MD5 sum for a file
+
+        Returns the stored MD5 sum for the file, or None if the
+        file isn't in the cache or has changed since its MD5
+        sum was stored. (Stored sums are returned regardless of
+        the 'trust' setting.)
+
+        Arguments:
+          f: path to the file
+          st: (optional) result of 'os.stat' on the file (if
+            not supplied then the file will be stat'ed)
+
+        """
+        if st is None:
+            st = os.stat(f)
+        dev,ino,size,mtime_ns = self.key(st)
+        with self._lock:
+            try:
+                row = self._pending[(dev,ino)][2:]
+            except KeyError:
+                row = self._conn.execute("SELECT size,mtime_ns,md5 "
+                                         "FROM md5sums "
+                                         "WHERE dev=? AND ino=?",
+                                         (dev,ino)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        return str(row[2])
+
+    def store(self,f,chksum,st=None):
+        """Store the MD5 sum for a file
+
+        Arguments:
+          f: path to the file
+          chksum: MD5 sum for the file
+          st: (optional) result of 'os.stat' on the file at the
+            time that the MD5 sum was computed (if not supplied
+            then the file will be stat'ed)
+
+        """
+        if st is None:
+            st = os.stat(f)
+        dev,ino,size,mtime_ns = self.key(st)
+        with self._lock:
+            self._pending[(dev,ino)] = (dev,ino,size,mtime_ns,chksum,
+                                        os.path.abspath(f))
+            if len(self._pending) >= self._commit_interval:
+                self._write_pending()
+
+    def _write_pending(self):
+        """Internal: write and commit the pending MD5 sums
+
+        Must be called with the lock held.
+        """
+        if self._pending:
+            self._conn.executemany("INSERT OR REPLACE INTO md5sums "
+                                   "(dev,ino,size,mtime_ns,md5,path) "
+                                   "VALUES (?,?,?,?,?,?)",
+                                   self._pending.values())
+            self._pending = {}
+        self._conn.commit()
+
+    def md5sum(self,f):
+        """Return the MD5 sum for a file, using the cache
+
+        If the cache is trusted and has an up-to-date MD5 sum
+        for the file then this is returned; otherwise the MD5 sum
+        is computed and stored (unless the file changed while
+        the sum was being computed).
+
+        Raises IOError/OSError if the file cannot be accessed.
+
+        Arguments:
+          f: path to the file
+
+        """
+        try:
+            st = os.stat(f)
+        except OSError,ex:
+            raise IOError(ex.errno,ex.strerror,f)
+        if self._trust:
+            chksum = self.lookup(f,st)
+            if chksum is not None:
+                return chksum
+        chksum = md5sum(f)
+        if self.key(os.stat(f)) == self.key(st):
+            self.store(f,chksum,st)
+        return chksum
+
+    def commit(self):
+        """Commit outstanding updates to the database file
+        """
+        with self._lock:
+            self._write_pending()
+
+    def close(self):
+        """Commit outstanding updates and close the database
+        """
+        self.commit()
+        self._conn.close()
+
 #######################################################################
 # Functions
 #######################################################################
 
+def imap_threaded(func,items,workers=1,ordered=True):
+    """Apply a function to a sequence of items using a pool of threads
+
+    Iterates over 'items' and yields the result of 'func' for each
+    one. If 'workers' is greater than 1 then the function calls are
+    distributed across that number of threads; the number of
+    items waiting to be processed is limited to a small multiple
+    of the number of workers, so that memory use doesn't grow
+    with the number of items.
+
+    Exceptions raised by 'func' are re-raised in the calling
+    thread when the corresponding result is reached.
+
+    Arguments:
+      func: function to apply, which takes a single item as
+        its argument
+      items: iterable yielding items to process
+      workers: number of threads to use (default is 1 i.e. items
+        are processed serially without any threads)
+      ordered: if True (the default) then results are yielded in
+        the same order as the items; otherwise they are yielded in
+        the order that they become available
+
+    Returns:
+      Yields the result of 'func' for each item.
+
+    """
+    if workers is None or workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    max_pending = workers*MAX_PENDING_PER_WORKER
+    pool = ThreadPool(workers)
+    try:
+        if ordered:
+            pending = collections.deque()
+            for item in items:
+                pending.append(pool.apply_async(_call_safely,(func,item)))
+                if len(pending) >= max_pending:
+                    yield _return_or_raise(pending.popleft().get())
+            while pending:
+                yield _return_or_raise(pending.popleft().get())
+        else:
+            done = Queue.Queue()
+            npending = 0
+            for item in items:
+                pool.apply_async(_call_safely,(func,item),callback=done.put)
+                npending += 1
+                if npending >= max_pending:
+                    npending -= 1
+                    yield _return_or_raise(done.get())
+            while npending:
+                npending -= 1
+                yield _return_or_raise(done.get())
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def _call_safely(func,item):
+    """Internal: call function and return success flag with result
+
+    Returns a tuple (True,result) if the call succeeded, or
+    (False,exc_info) if it raised an exception.
+
+    """
+    try:
+        return (True,func(item))
+    except Exception:
+        return (False,sys.exc_info())
+
+def _return_or_raise(outcome):
+    """Internal: return result from '_call_safely', or re-raise exception
+
+    """
+    ok,result = outcome
+    if ok:
+        return result
+    raise result[0],result[1],result[2]
+
+def regular_file_sizes_differ(f1,f2):
+    """Check if two regular files have different sizes
+
+    Returns True only if both paths can be stat'ed, both are
+    regular files (after following symbolic links) and their
+    sizes differ; otherwise returns False.
+
+    """
+    try:
+        st1 = os.stat(f1)
+        st2 = os.stat(f2)
+    except OSError:
+        return False
+    return (stat.S_ISREG(st1.st_mode) and stat.S_ISREG(st2.st_mode) and
+            st1.st_size != st2.st_size)
+
+def bytes_to_read(f1,f2=None,cache=None):
+    """Return the number of bytes read to checksum or compare files
+
+    Returns the size of 'f1' (or the combined size of 'f1' and
+    'f2' if both are given), excluding any file whose MD5 sum
+    will be taken from the cache. If 'f1' and 'f2' are regular
+    files with different sizes then they are not read and zero
+    is returned; zero is also returned if a file can't be
+    stat'ed.
+
+    Arguments:
+      f1: name and path for (reference) file
+      f2: (optional) name and path for file to be compared
+        with 'f1'
+      cache: (optional) Md5sumCache instance which will be used
+        to look up MD5 sums
+
+    """
+    if f2 is None:
+        files = (f1,)
+    else:
+        files = (f1,f2)
+    try:
+        sts = [os.stat(f) for f in files]
+    except OSError:
+        return 0
+    if len(sts) == 2 and \
+       stat.S_ISREG(sts[0].st_mode) and stat.S_ISREG(sts[1].st_mode) and \
+       sts[0].st_size != sts[1].st_size:
+        return 0
+    n_bytes = 0
+    for f,st in zip(files,sts):
+        if cache is not None and cache.trust and \
+           cache.lookup(f,st) is not None:
+            continue
+        n_bytes += st.st_size
+    return n_bytes
+
+def new_digest(algorithm):
+    """Return a new digest object for the named algorithm
+
+    The returned object has 'update' and 'hexdigest' methods,
+    as for the objects from the hashlib module.
+
+    Arguments:
+      algorithm: name of the algorithm; can be any algorithm
+        supported by hashlib (e.g. 'md5', 'sha1', 'sha256'),
+        or 'crc32'
+
+    Raises ValueError if the algorithm is not supported.
+
+    """
+    algorithm = str(algorithm).lower()
+    if algorithm == 'crc32':
+        return Crc32()
+    return hashlib.new(algorithm)
+
+class Crc32:
+    """Digest-like wrapper for CRC32 checksums
+
+    Provides 'update' and 'hexdigest' methods for computing
+    the CRC32 checksum via zlib, so that it can be used in
+    the same way as the digest objects from hashlib.
+
+    """
+    name = 'crc32'
+    def __init__(self):
+        self._crc = 0
+    def update(self,data):
+        self._crc = zlib.crc32(data,self._crc)
+    def hexdigest(self):
+        return "%08x" % (self._crc & 0xffffffff)
+
+def checksums(f,algorithms=DEFAULT_ALGORITHMS):
+    """Return multiple checksums for a file or stream in a single pass
+
+    Each block read from the file is fed to a digest object for
+    each of the requested algorithms, so the file is only read
+    once regardless of how many checksums are computed.
+
+    Arguments:
+      f: name of the file to generate the checksums from, or
+        a file-like object opened for reading in binary mode
+      algorithms: list of algorithm names (see 'new_digest';
+        default is just 'md5')
+
+    Returns:
+      Dictionary with algorithm names as keys and hex digest
+      strings as values.
+
+    """
+    digests = dict([(str(a).lower(),new_digest(a)) for a in algorithms])
+    updates = [d.update for d in digests.values()]
+    try:
+        fp = open(f,"rb")
+    except TypeError:
+        fp = f
+    try:
+        for block in iter(lambda: fp.read(BLOCKSIZE), ''):
+            for update in updates:
+                update(block)
+    finally:
+        if fp is not f:
+            fp.close()
+    return dict([(a,digests[a].hexdigest()) for a in digests])
+
+def manifest_header(algorithms):
+    """Return the header line for a checksum manifest
+
+    For example:
+
+    >>> manifest_header(('md5','sha256'))
+    '# md5 sha256'
+
+    """
+    return "# %s" % ' '.join([str(a).lower() for a in algorithms])
+
+def manifest_line(f,digests):
+    """Return a line for a checksum manifest
+
+    Arguments:
+      f: path of the file
+      digests: list of checksums for the file, in the same
+        order as the algorithms in the manifest header
+
+    """
+    return "%s  %s" % ('  '.join(digests),f)
+
+def read_manifest(fp):
+    """Iterate over the entries in a checksum manifest
+
+    Manifests consist of an optional header line listing the
+    checksum algorithms (see 'manifest_header'), followed by one
+    line per file with the checksums in the same order followed
+    by the file path. If there is no header then the manifest is
+    assumed to be in the format output by the 'md5sum' program
+    (i.e. a single MD5 sum column).
+
+    Arguments:
+      fp: file-like object opened for reading
+
+    Returns:
+      Yields tuples (f,digests) where f is the file path and
+      digests is a dictionary with algorithm names as keys and
+      the corresponding checksums as values.
+
+    """
+    algorithms = None
+    for line in fp:
+        if algorithms is None:
+            if line.startswith('#'):
+                algorithms = line[1:].lower().split()
+                continue
+            algorithms = list(DEFAULT_ALGORITHMS)
+        if not line.strip():
+            continue
+        items = line.strip().split()
+        if len(items) < len(algorithms)+1:
+            raise IndexError,"Bad checksum line: %s" % line.rstrip('\n')
+        f = line.strip()
+        digests = {}
+        for a in algorithms:
+            chksum = f.split()[0]
+            digests[a] = chksum
+            f = f[len(chksum):].strip()
+        yield (f,digests)
+
+def block_checksums(f,block_size=DEFAULT_MANIFEST_BLOCK_SIZE,
+                    algorithm='md5'):
+    """Return whole-file and per-block checksums for a file
+
+    The file is read once, with each chunk being fed both to
+    the digest for the whole file and to the digest for the
+    current block.
+
+    Arguments:
+      f: name of the file to generate the checksums from
+      block_size: size of each block in bytes
+      algorithm: checksum algorithm (see 'new_digest'; default
+        is 'md5')
+
+    Returns:
+      Tuple (chksum,size,blocks) where chksum and size are the
+      checksum and size of the whole file, and blocks is a list
+      of (offset,length,chksum) tuples for each block.
+
+    """
+    if block_size < 1:
+        raise ValueError("Block size must be a positive integer")
+    whole = new_digest(algorithm)
+    blocks = []
+    size = 0
+    fp = open(f,'rb')
+    try:
+        while True:
+            block = new_digest(algorithm)
+            length = 0
+            while length < block_size:
+                data = fp.read(min(BLOCKSIZE,block_size-length))
+                if not data:
+                    break
+                whole.update(data)
+                block.update(data)
+                length += len(data)
+            if not length:
+                break
+            blocks.append((size,length,block.hexdigest()))
+            size += length
+    finally:
+        fp.close()
+    return (whole.hexdigest(),size,blocks)
+
+def block_checksum(f,offset,length,algorithm='md5'):
+    """Return the checksum for a range of bytes in a file
+
+    Arguments:
+      f: name of the file
+      offset: offset of the first byte in the range
+      length: number of bytes in the range
+      algorithm: checksum algorithm (see 'new_digest'; default
+        is 'md5')
+
+    Returns:
+      Checksum for the byte range (if the file ends before the
+      end of the range then the checksum is for the bytes that
+      are available).
+
+    """
+    chksum = new_digest(algorithm)
+    fp = open(f,'rb')
+    try:
+        fp.seek(offset)
+        while length > 0:
+            data = fp.read(min(BLOCKSIZE,length))
+            if not data:
+                break
+            chksum.update(data)
+            length -= len(data)
+    finally:
+        fp.close()
+    return chksum.hexdigest()
+
+def block_name(f,start,end):
+    """Return a name identifying a byte range within a file
+
+    For example:
+
+    >>> block_name('big.bam',0,1024)
+    'big.bam[0-1024]'
+
+    """
+    return "%s[%d-%d]" % (f,start,end)
+
+def block_manifest_header(algorithm,block_size):
+    """Return the header line for a block manifest
+
+    For example:
+
+    >>> block_manifest_header('md5',1024)
+    '# blocks md5 1024'
+
+    """
+    return "# blocks %s %d" % (str(algorithm).lower(),block_size)
+
+def block_manifest_lines(f,chksum,size,blocks):
+    """Return the lines for a file in a block manifest
+
+    Arguments:
+      f: path of the file
+      chksum: checksum for the whole file
+      size: size of the file in bytes
+      blocks: list of (offset,length,chksum) tuples for
+        each block of the file
+
+    Returns:
+      List of lines (without trailing newlines).
+
+    """
+    lines = ["file  %s  %d  %s" % (chksum,size,f)]
+    for offset,length,block_chksum in blocks:
+        lines.append("block  %d  %d  %s" % (offset,length,block_chksum))
+    return lines
+
+def read_block_manifest(fp):
+    """Iterate over the files in a block manifest
+
+    Block manifests consist of a header line giving the checksum
+    algorithm and block size (see 'block_manifest_header'), then
+    for each file a 'file' line with the checksum, size and path
+    of the whole file, followed by one 'block' line for each block
+    (see 'block_manifest_lines').
+
+    Arguments:
+      fp: file-like object opened for reading
+
+    Returns:
+      Yields tuples (f,algorithm,chksum,size,blocks) where f is the
+      file path, chksum and size are for the whole file, and blocks
+      is a list of (offset,length,chksum) tuples.
+
+    Raises ValueError if the manifest is not correctly formatted.
+
+    """
+    algorithm = None
+    entry = None
+    for line in fp:
+        if algorithm is None:
+            items = line.split()
+            if len(items) != 4 or items[:2] != ['#','blocks']:
+                raise ValueError("Bad block manifest header: %s" %
+                                 line.rstrip('\n'))
+            algorithm = items[2].lower()
+            continue
+        if not line.strip():
+            continue
+        items = line.strip().split(None,3)
+        try:
+            if items[0] == 'file':
+                if entry is not None:
+                    yield entry
+                entry = (items[3],algorithm,items[1],int(items[2]),[])
+            elif items[0] == 'block' and entry is not None:
+                entry[4].append((int(items[1]),int(items[2]),items[3]))
+            else:
+                raise ValueError
+        except (IndexError,ValueError):
+            raise ValueError("Bad block manifest line: %s" %
+                             line.rstrip('\n'))
+    if entry is not None:
+        yield entry
+
 def hexify(s):
     """Return the hex representation of a string
 
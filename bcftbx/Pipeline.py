@@ -16,6 +16,8 @@ The essential classes are:
 
 * Job: wrapper for setting up, submitting and monitoring running
   scripts
+* JobArray: wrapper for submitting a set of jobs as a single array
+  job
 * PipelineRunner: queue and run script multiple times on standard set
   of inputs
 * SolidPipelineRunner: subclass of PipelineRunner specifically for
@@ -41,13 +43,24 @@ system. So typical usage might look like:
 >>> pipeline.queueJob(...)
 >>> pipeline.run()
 
+Sets of similar jobs can be queued using 'queueJobArray' instead, in
+which case they are submitted as a single array job if the JobRunner
+supports this (e.g. GEJobRunner).
+
+Jobs can also depend on other jobs or groups of jobs, so that multi-stage
+workflows can be run by a single pipeline:
+
+>>> fastq = pipeline.queueJob(...,group='solid2fastq')
+>>> qc = pipeline.queueJob(...,group='qc',depends_on=[fastq])
+>>> pipeline.queueJob(...,depends_on=['qc'])
+
 """
 
 #######################################################################
 # Module metadata
 #######################################################################
 
-__version__ = "0.1.3"
+__version__ = "0.5.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -59,13 +72,14 @@ import re
 import time
 import Queue
 import logging
+import inspect
 
 #######################################################################
 # Class definitions
 #######################################################################
 
 # Job: container for a script run
-class Job:
+class Job(object):
     """Wrapper class for setting up, submitting and monitoring running scripts
 
     Set up a job by creating a Job instance specifying the name, working directory,
@@ -93,6 +107,14 @@ class Job:
       end_time    The end time (seconds since the epoch)
       exit_status The exit code from the command that was run (integer, or None)
 
+    If the job is a task in an array job then 'job_array' is the JobArray
+    instance that it belongs to (otherwise it is None).
+
+    The exit status is fetched from the JobRunner without waiting when the
+    job finishes; if it isn't available at that point (e.g. because the
+    job accounting hasn't been updated yet) then it is fetched when the
+    'exit_status' property is first accessed.
+
     The Job class uses a JobRunner instance (which supplies the necessary methods for
     starting, stopping and monitoring) for low-level job interactions.
     """
@@ -125,8 +147,10 @@ class Job:
         self.terminated = False
         self.start_time = None
         self.end_time = None
-        self.exit_status = None
+        self.__exit_status = None
+        self.__exit_status_resolved = False
         self.home_dir = os.getcwd()
+        self.job_array = None
         self.__finished = False
         self.__runner = runner
         # Time interval to use when checking for job start (seconds)
@@ -136,14 +160,45 @@ class Job:
         # (seconds)
         self.__timeout = 3600
 
-    def start(self):
+    def start(self,wait_for=None):
         """Start the job running
 
+        Arguments:
+          wait_for: (optional) list of ids for jobs which must finish
+            before this job can run (passed to the JobRunner, which
+            must support this e.g. GEJobRunner)
+
+        Returns:
+          Id for job
+        """
+        if not self.submitted and not self.__finished:
+            if wait_for:
+                job_id = self.__runner.run(self.name,self.working_dir,
+                                           self.script,self.args,
+                                           wait_for=wait_for)
+            else:
+                job_id = self.__runner.run(self.name,self.working_dir,
+                                           self.script,self.args)
+            return self.attach(job_id)
+        return self.job_id
+
+    def attach(self,job_id):
+        """Monitor a job which has already been submitted
+
+        Used when the job was submitted by something other than
+        the 'start' method (for example as a task in an array job,
+        see JobArray): sets the job id and then waits for the job
+        to start, as for 'start'.
+
+        Arguments:
+          job_id: id for the job returned by the JobRunner (or
+            None if the submission failed)
+
         Returns:
           Id for job
         """
         if not self.submitted and not self.__finished:
-            self.job_id = self.__runner.run(self.name,self.working_dir,self.script,self.args)
+            self.job_id = job_id
             self.submitted = True
             self.start_time = time.time()
             if self.job_id is None:
@@ -153,8 +208,6 @@ class Job:
                 self.__finished = True
                 self.end_time = self.start_time
                 return self.job_id
-            self.submitted = True
-            self.start_time = time.time()
             self.log = self.__runner.logFile(self.job_id)
             # Wait for evidence that the job has started
             logging.debug("Waiting for job to start")
@@ -244,7 +297,51 @@ class Job:
             if not self.__runner.isRunning(self.job_id):
                 self.__finished = True
                 self.end_time = time.time()
-                self.exit_status = self.__runner.exit_status(self.job_id)
+                self.__poll_exit_status()
+        elif not self.__exit_status_resolved:
+            self.__poll_exit_status()
+
+    def __poll_exit_status(self):
+        """Internal: fetch the exit status if it's available
+
+        Doesn't wait if the exit status isn't available yet.
+        """
+        if self.job_id is None:
+            return
+        exit_status = self.__runner.poll_exit_status(self.job_id)
+        if exit_status is not None:
+            self.exit_status = exit_status
+        elif self.__runner.has_exit_status(self.job_id):
+            # Runner has given up on getting the exit status
+            self.__exit_status_resolved = True
+
+    def hasExitStatus(self):
+        """Check if the exit status can be read without waiting
+
+        Returns True if the job has finished and its exit status
+        has been fetched from the JobRunner, False otherwise.
+        """
+        return self.__finished and self.__exit_status_resolved
+
+    @property
+    def exit_status(self):
+        """Return the exit status for the job
+
+        If the job has finished but the exit status hasn't been
+        fetched yet, then waits for the JobRunner to supply it.
+        """
+        if self.__finished and not self.__exit_status_resolved and \
+           self.job_id is not None:
+            self.__exit_status = self.__runner.exit_status(self.job_id)
+            self.__exit_status_resolved = True
+        return self.__exit_status
+
+    @exit_status.setter
+    def exit_status(self,value):
+        """Set the exit status for the job
+        """
+        self.__exit_status = value
+        self.__exit_status_resolved = (value is not None)
 
     def wait(self):
         """Wait for job to complete
@@ -262,6 +359,84 @@ class Job:
         """
         return self.__runner
 
+class JobArray(object):
+    """Wrapper class for submitting a set of jobs as a single array job
+
+    Set up an array job by creating a JobArray instance specifying the
+    name, working directory, script file to execute, and a list of
+    argument lists (one for each task in the array).
+
+    A Job instance is created for each task (available via the 'tasks'
+    property). The array is submitted by invoking the 'start' method,
+    which uses the JobRunner's 'run_array' method to submit all the
+    tasks at once; thereafter each task can be monitored (and
+    terminated or restarted) individually via its Job instance.
+    """
+    def __init__(self,runner,name,dirn,script,args_list,labels=None,group=None):
+        """Create an instance of JobArray.
+
+        Arguments:
+          runner: a JobRunner instance supplying job control methods
+            (must implement 'run_array')
+          name: name to give the array job
+          dirn: directory to run the script in
+          script: script file to submit (see Job)
+          args_list: Python list of lists of arguments to supply to the
+            script, one for each task
+          labels: (optional) list of arbitrary strings to use as
+            identifiers for each task
+          group: (optional) arbitrary string to use as a 'group' identifier
+            for all the tasks
+        """
+        self.name = name
+        self.working_dir = dirn
+        self.script = script
+        self.group_label = group
+        self.start_time = None
+        self.__runner = runner
+        if labels is None:
+            labels = [None]*len(args_list)
+        self.tasks = []
+        for args,label in zip(args_list,labels):
+            task = Job(runner,name,dirn,script,args,label,group)
+            task.job_array = self
+            self.tasks.append(task)
+
+    def start(self,wait_for=None):
+        """Submit the array job
+
+        Arguments:
+          wait_for: (optional) list of ids for jobs which must finish
+            before the tasks can run (see Job.start)
+
+        Returns:
+          List of ids for the tasks
+        """
+        self.start_time = time.time()
+        args_list = [task.args for task in self.tasks]
+        if wait_for:
+            task_ids = self.__runner.run_array(self.name,self.working_dir,
+                                               self.script,args_list,
+                                               wait_for=wait_for)
+        else:
+            task_ids = self.__runner.run_array(self.name,self.working_dir,
+                                               self.script,args_list)
+        if task_ids is None:
+            # Failed to submit correctly
+            logging.warning("Array job submission failed")
+            task_ids = [None]*len(self.tasks)
+        for task,task_id in zip(self.tasks,task_ids):
+            task.attach(task_id)
+        return task_ids
+
+    def isRunning(self):
+        """Check if any of the tasks are still running
+        """
+        for task in self.tasks:
+            if task.isRunning():
+                return True
+        return False
+
 # PipelineRunner: class to set up and run multiple jobs
 class PipelineRunner:
     """Class to run and manage multiple concurrent jobs.
@@ -282,13 +457,28 @@ class PipelineRunner:
     jobs have been submitted and have completed; see the 'run' method for details of
     how to operate the pipeline in non-blocking mode.
 
+    Sets of similar jobs can also be queued with the 'queueJobArray' method; if
+    the JobRunner supports array jobs (e.g. GEJobRunner) then these are submitted
+    together as a single array job, which only takes up one of the concurrent job
+    slots, while the status of each task is still tracked and reported separately.
+
+    Jobs can depend on other jobs and on groups of jobs (see the 'depends_on'
+    argument of 'queueJob' and 'queueJobArray'): a job with dependencies is held
+    back until all the jobs it depends on have completed, while jobs without
+    outstanding dependencies are started as slots become free (so stages of a
+    workflow can overlap across different samples). Optionally the dependencies
+    can instead be handed to the job management system when the job is submitted
+    (see the 'hold_jobs' argument).
+
     The invoking subprogram can also specify functions that will be called when a job
     completes ('jobCompletionHandler'), and when a group completes
     ('groupCompletionHandler'). These can perform any specific actions that are required
     such as sending notification email, setting file ownerships and permissions etc.
+    The functions aren't called for a job until its exit status is available from the
+    JobRunner, so that reading it from the handler doesn't block the pipeline.
     """
     def __init__(self,runner,max_concurrent_jobs=4,poll_interval=30,jobCompletionHandler=None,
-                 groupCompletionHandler=None):
+                 groupCompletionHandler=None,hold_jobs=False):
         """Create new PipelineRunner instance.
 
         Arguments:
@@ -296,26 +486,48 @@ class PipelineRunner:
           max_concurrent_jobs: maximum number of jobs that the script will allow to run
             at one time (default = 4)
           poll_interval: time interval (in seconds) between checks on the queue status
-            (only used when pipeline is run in 'blocking' mode)
+            (only used when pipeline is run in 'blocking' mode); if the runner is
+            notified when jobs finish (e.g. SimpleJobRunner) then the pipeline is
+            also updated as soon as any job completes
+          hold_jobs: if True then jobs with dependencies are submitted as soon as the
+            jobs they depend on have been submitted, and the JobRunner is left to
+            hold them until those jobs have finished (e.g. using 'qsub -hold_jid'
+            for GEJobRunner); otherwise (the default) jobs are only submitted once
+            their dependencies have completed. Held jobs count towards the maximum
+            number of concurrent jobs. Only use with runners which support this
+            (i.e. those whose 'run' method takes a 'wait_for' argument, such as
+            GEJobRunner); an exception is raised otherwise.
         """
+        # Check the runner can hold jobs
+        if hold_jobs and 'wait_for' not in inspect.getargspec(runner.run)[0]:
+            raise Exception, "%s doesn't support holding jobs (hold_jobs=True)" \
+                % runner.__class__.__name__
         # Parameters
         self.__runner = runner
         self.max_concurrent_jobs = max_concurrent_jobs
         self.poll_interval = poll_interval
+        self.hold_jobs = hold_jobs
         # Groups
         self.groups = []
         self.njobs_in_group = {}
-        # Queue of jobs to run
+        # Queue of jobs which are ready to run
         self.jobs = Queue.Queue()
+        # Jobs waiting for their dependencies
+        self.blocked = []
+        self.__dependencies = {}
         # Subset that are currently running
         self.running = []
         # Subset that have completed
         self.completed = []
+        # Completed jobs which are waiting for their exit status
+        # before completion is reported to the callback functions
+        self.__unreported = []
         # Callback functions
         self.handle_job_completion = jobCompletionHandler
         self.handle_group_completion = groupCompletionHandler
 
-    def queueJob(self,working_dir,script,script_args,label=None,group=None):
+    def queueJob(self,working_dir,script,script_args,label=None,group=None,
+                 depends_on=None):
         """Add a job to the pipeline.
 
         The job will be queued and executed once the pipeline's 'run' method has been
@@ -329,23 +541,181 @@ class PipelineRunner:
           group: (optional) arbitrary string to use as a 'group' identifier;
             assign the same 'group' label to multiple jobs to indicate they're
             related
+          depends_on: (optional) list of Job instances and/or group labels; the
+            job won't be started until all these jobs (and all the jobs in these
+            groups) have completed (whether or not they were successful); jobs
+            must be queued for each group before the pipeline is run
+
+        Returns:
+          Job instance for the queued job.
         """
         job_name = os.path.splitext(os.path.basename(script))[0]+'.'+str(label)
+        self.__checkDependencies(group,depends_on)
+        self.__addToGroup(group)
+        job = Job(self.__runner,job_name,working_dir,script,script_args,
+                  label,group)
+        self.__queue(job,depends_on)
+        logging.debug("Added job: now %d jobs in pipeline" % self.nWaiting())
+        return job
+
+    def queueJobArray(self,working_dir,script,script_args_list,labels=None,group=None,
+                      depends_on=None):
+        """Add a set of jobs to the pipeline to run as a single array job
+
+        The jobs will be queued and submitted together once the pipeline's 'run'
+        method has been executed. The array only counts as one job towards the
+        maximum number of concurrent jobs, however each task is reported
+        individually when it completes (and counts towards its group).
+
+        If the JobRunner doesn't support array jobs then each job is queued
+        separately (as for 'queueJob').
+
+        Arguments:
+          working_dir: directory to run the jobs in
+          script: script file to run
+          script_args_list: list of argument lists to be supplied to the script at
+            run time, one for each job
+          labels: (optional) list of arbitrary strings to use as identifiers for
+            each job
+          group: (optional) arbitrary string to use as a 'group' identifier for
+            all the jobs
+          depends_on: (optional) list of Job instances and/or group labels that
+            all the jobs depend on (see 'queueJob')
+
+        Returns:
+          List of Job instances for the queued jobs.
+        """
+        if labels is None:
+            labels = [None]*len(script_args_list)
+        if not hasattr(self.__runner,'run_array'):
+            # Runner doesn't support arrays so queue individual jobs
+            jobs = []
+            for script_args,label in zip(script_args_list,labels):
+                jobs.append(self.queueJob(working_dir,script,script_args,
+                                          label=label,group=group,
+                                          depends_on=depends_on))
+            return jobs
+        job_name = os.path.splitext(os.path.basename(script))[0]+'.'+str(group)
+        self.__checkDependencies(group,depends_on)
+        self.__addToGroup(group,len(script_args_list))
+        job_array = JobArray(self.__runner,job_name,working_dir,script,
+                             script_args_list,labels,group)
+        self.__queue(job_array,depends_on)
+        logging.debug("Added job array: now %d jobs in pipeline" % self.nWaiting())
+        return job_array.tasks
+
+    def __queue(self,job,depends_on=None):
+        """Internal: add a Job or JobArray to the ready queue or blocked list
+        """
+        if depends_on:
+            self.__dependencies[job] = list(depends_on)
+            self.blocked.append(job)
+        else:
+            self.jobs.put(job)
+
+    def __checkDependencies(self,group,depends_on):
+        """Internal: check that dependencies can be satisfied
+
+        Raises an exception if a job depends on the group that it
+        belongs to (which would never complete).
+        """
+        if group is not None and depends_on and group in depends_on:
+            raise Exception, "Job in group '%s' can't depend on its own group" \
+                % group
+
+    def __checkGroupsExist(self):
+        """Internal: check that groups that jobs depend on have been queued
+
+        Raises an exception if a job depends on a group label which
+        doesn't have any jobs.
+        """
+        for job in self.blocked:
+            for dependency in self.__dependencies.get(job,[]):
+                if isinstance(dependency,basestring) and \
+                   dependency not in self.njobs_in_group:
+                    raise Exception, "Job depends on unknown group '%s'" \
+                        % dependency
+
+    def __waitingJobs(self):
+        """Internal: return list of jobs that haven't been started
+
+        Includes both the jobs that are ready to run and those that
+        are waiting for dependencies, with arrays expanded into their
+        tasks.
+        """
+        jobs = []
+        for job in list(self.jobs.queue) + self.blocked:
+            if isinstance(job,JobArray):
+                jobs.extend(job.tasks)
+            else:
+                jobs.append(job)
+        return jobs
+
+    def __isReady(self,job,completed,ncompleted_in_group,waiting_groups):
+        """Internal: check if the dependencies for a job are satisfied
+
+        If 'hold_jobs' is set then the job is ready once all the jobs
+        that it depends on have been submitted, otherwise once they
+        have all completed.
+
+        Arguments:
+          job: Job or JobArray to check
+          completed: set of completed jobs
+          ncompleted_in_group: dictionary with the number of completed
+            jobs for each group
+          waiting_groups: set of group labels for jobs which haven't
+            been started yet
+        """
+        for dependency in self.__dependencies.get(job,[]):
+            if isinstance(dependency,basestring):
+                # Dependency on a group
+                if dependency not in self.njobs_in_group:
+                    # No jobs in the group have been queued
+                    return False
+                if self.hold_jobs:
+                    if dependency in waiting_groups:
+                        return False
+                elif ncompleted_in_group.get(dependency,0) < \
+                     self.njobs_in_group.get(dependency,0):
+                    return False
+            elif self.hold_jobs:
+                if not dependency.submitted:
+                    return False
+            elif dependency not in completed:
+                return False
+        return True
+
+    def __holdJobIds(self,job):
+        """Internal: return ids for running jobs that a job depends on
+        """
+        job_ids = []
+        for dependency in self.__dependencies.get(job,[]):
+            if isinstance(dependency,basestring):
+                for check_job in self.running:
+                    if check_job.group_label == dependency:
+                        job_ids.append(check_job.job_id)
+            elif dependency in self.running:
+                job_ids.append(dependency.job_id)
+        return job_ids
+
+    def __addToGroup(self,group,njobs=1):
+        """Internal: update the number of jobs in a group
+        """
         if group:
             if group not in self.groups:
                 # New group label
                 self.groups.append(group)
-                self.njobs_in_group[group] = 1
+                self.njobs_in_group[group] = njobs
             else:
-                self.njobs_in_group[group] += 1
-        self.jobs.put(Job(self.__runner,job_name,working_dir,script,script_args,
-                          label,group))
-        logging.debug("Added job: now %d jobs in pipeline" % self.jobs.qsize())
+                self.njobs_in_group[group] += njobs
 
     def nWaiting(self):
         """Return the number of jobs still waiting to be started
+
+        Includes jobs waiting for their dependencies; each task in a
+        waiting array job is counted separately.
         """
-        return self.jobs.qsize()
+        return len(self.__waitingJobs())
 
     def nRunning(self):
         """Return the number of jobs currently running
@@ -357,6 +727,22 @@ class PipelineRunner:
         """
         return len(self.completed)
 
+    def __nSlotsInUse(self):
+        """Internal: return the number of concurrent job slots in use
+
+        Running tasks from the same array job only take up one slot
+        between them.
+        """
+        nslots = 0
+        arrays = []
+        for job in self.running:
+            if job.job_array is None:
+                nslots += 1
+            elif job.job_array not in arrays:
+                arrays.append(job.job_array)
+                nslots += 1
+        return nslots
+
     def isRunning(self):
         """Check whether the pipeline is still running
 
@@ -366,13 +752,16 @@ class PipelineRunner:
         # First update the pipeline status
         self.update()
         # Return the status
-        return (self.nWaiting() > 0 or self.nRunning() > 0)
+        return (self.nWaiting() > 0 or self.nRunning() > 0 or
+                len(self.__unreported) > 0)
 
     def run(self,blocking=True):
         """Execute the jobs in the pipeline
 
         Each job previously added to the pipeline by 'queueJob' will be
-        started and checked periodically for termination.
+        started (once any jobs it depends on have completed) and checked
+        periodically for termination. An exception is raised if a job
+        depends on a group which doesn't have any jobs queued.
 
         By default 'run' operates in 'blocking' mode, so it doesn't return
         until all jobs have been submitted and have finished executing.
@@ -390,6 +779,8 @@ class PipelineRunner:
         """
         logging.debug("PipelineRunner: started")
         logging.debug("Blocking mode : %s" % blocking)
+        # Check that dependencies on groups can be satisfied
+        self.__checkGroupsExist()
         # Report set up
         print "Initially %d jobs waiting, %d running, %d finished" % \
             (self.nWaiting(),self.nRunning(),self.nCompleted())
@@ -397,8 +788,9 @@ class PipelineRunner:
         self.update()
         if blocking:
             while self.isRunning():
-                # Pipeline is still executing so wait
-                time.sleep(self.poll_interval)
+                # Pipeline is still executing so wait for a job
+                # to finish (or for the poll interval to elapse)
+                self.__runner.wait_for_completion(self.poll_interval)
             # Pipeline has finished
             print "Pipeline completed"
 
@@ -406,7 +798,11 @@ class PipelineRunner:
         """Update the pipeline
 
         The 'update' method checks and updates the status of running jobs,
-        and submits any waiting jobs if space is available.
+        releases any jobs whose dependencies are now satisfied, and submits
+        waiting jobs if space is available.
+
+        Raises an exception if there are jobs waiting for dependencies
+        which can never be satisfied.
         """
         # Flag to report updated status
         updated_status = False
@@ -417,36 +813,73 @@ class PipelineRunner:
                 self.running.remove(job)
                 self.completed.append(job)
                 updated_status = True
+                self.__unreported.append(job)
                 print "Job has completed: %s: %s %s (%s)" % (
                     job.job_id,
                     job.name,
                     os.path.basename(job.working_dir),
                     time.asctime(time.localtime(job.end_time)))
-                # Invoke callback on job completion
-                if self.handle_job_completion:
-                    self.handle_job_completion(job)
-                # Check for completed group
-                if job.group_label is not None:
-                    jobs_in_group = []
-                    for check_job in self.completed:
-                        if check_job.group_label == job.group_label:
-                            jobs_in_group.append(check_job)
-                    if self.njobs_in_group[job.group_label] == len(jobs_in_group):
-                        # All jobs in group have completed
-                        print "Group '%s' has completed" % job.group_label
-                        # Invoke callback on group completion
-                        if self.handle_group_completion:
-                            self.handle_group_completion(job.group_label,jobs_in_group)
             else:
                 # Job is running, check it's not in an error state
                 if job.errorState():
                     # Terminate jobs in error state
                     logging.warning("Terminating job %s in error state" % job.job_id)
                     job.terminate()
+        # Report completed jobs once their exit status is available
+        for job in self.__unreported[:]:
+            if not job.hasExitStatus():
+                job.update()
+                if not job.hasExitStatus():
+                    # Check again on next update
+                    continue
+            self.__unreported.remove(job)
+            # Invoke callback on job completion
+            if self.handle_job_completion:
+                self.handle_job_completion(job)
+            # Check for completed group
+            if job.group_label is not None:
+                jobs_in_group = []
+                for check_job in self.completed:
+                    if check_job.group_label == job.group_label and \
+                       check_job not in self.__unreported:
+                        jobs_in_group.append(check_job)
+                if self.njobs_in_group[job.group_label] == len(jobs_in_group):
+                    # All jobs in group have completed
+                    print "Group '%s' has completed" % job.group_label
+                    # Invoke callback on group completion
+                    if self.handle_group_completion:
+                        self.handle_group_completion(job.group_label,jobs_in_group)
+        # Release jobs whose dependencies are satisfied
+        if self.blocked:
+            completed = set(self.completed)
+            ncompleted_in_group = {}
+            for job in self.completed:
+                if job.group_label is not None:
+                    ncompleted_in_group[job.group_label] = \
+                        ncompleted_in_group.get(job.group_label,0) + 1
+            waiting_groups = set([job.group_label for job in self.__waitingJobs()])
+            for job in self.blocked[:]:
+                if self.__isReady(job,completed,ncompleted_in_group,waiting_groups):
+                    self.blocked.remove(job)
+                    self.jobs.put(job)
         # Submit new jobs to GE queue
-        while not self.jobs.empty() and self.nRunning() < self.max_concurrent_jobs:
+        while not self.jobs.empty() and self.__nSlotsInUse() < self.max_concurrent_jobs:
             next_job = self.jobs.get()
-            next_job.start()
+            wait_for = None
+            if self.hold_jobs:
+                wait_for = self.__holdJobIds(next_job)
+            if isinstance(next_job,JobArray):
+                # Submit all the tasks in the array together
+                next_job.start(wait_for)
+                self.running.extend(next_job.tasks)
+                updated_status = True
+                print "Job array has started: %s %s (%d tasks) (%s)" % (
+                    next_job.name,
+                    os.path.basename(next_job.working_dir),
+                    len(next_job.tasks),
+                    time.asctime(time.localtime(next_job.start_time)))
+                continue
+            next_job.start(wait_for)
             self.running.append(next_job)
             updated_status = True
             print "Job has started: %s: %s %s (%s)" % (
@@ -454,8 +887,12 @@ class PipelineRunner:
                 next_job.name,
                 os.path.basename(next_job.working_dir),
                 time.asctime(time.localtime(next_job.start_time)))
-            if self.jobs.empty():
+            if self.jobs.empty() and not self.blocked:
                 logging.debug("PipelineRunner: all jobs now submitted")
+        # Check that blocked jobs can still run
+        if self.blocked and self.jobs.empty() and not self.running:
+            raise Exception, "%d jobs have dependencies which can't be satisfied" \
+                % len(self.blocked)
         # Report
         if updated_status:
             print "Currently %d jobs waiting, %d running, %d finished" % \
@@ -508,6 +945,7 @@ class PipelineRunner:
         # Empty the queue
         while not self.jobs.empty():
             self.jobs.get()
+        self.blocked = []
         # Terminate the running jobs
         for job in self.running:
             logging.debug("Terminating job %s" % job.job_id)
@@ -541,8 +979,7 @@ class SolidPipelineRunner(PipelineRunner):
     def addDir(self,dirn):
         logging.debug("Add dir: %s" % dirn)
         run_data = GetSolidDataFiles(dirn)
-        for data in run_data:
-            self.queueJob(dirn,self.script,data)
+        self.queueJobArray(dirn,self.script,run_data)
 
 #######################################################################
 # Module Functions
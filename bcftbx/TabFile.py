@@ -73,6 +73,17 @@ A list of the column names can be fetched using the 'header' method:
 
 >>> print data.headers()
 
+The column names for an individual line are available via its 'names'
+attribute. Note that this is an immutable tuple (a ColumnNames instance,
+which can be shared between lines) rather than a list, so it cannot be
+modified in place: use the 'appendColumn' method to add a named column
+to a line, and convert to a list first if a list is needed, e.g.
+
+>>> names = list(line.names) + ['extra']
+
+A list or tuple can still be assigned to 'names' (it is converted to a
+ColumnNames instance automatically).
+
 Use the 'str' built-in to get the line as a tab-delimited string:
 
 >>> str(line)
@@ -115,6 +126,18 @@ specific value:
 >>> data = TabFile('data.txt',column_names=['chr','start','end'])
 >>> chrom = data.lookup('chr','chrX')
 
+Lookups on multiple columns can be made by specifying a tuple of keys
+and a tuple of values:
+
+>>> chrom = data.lookup(('chr','start'),('chrX',123456))
+
+For repeated lookups on the same column(s), an index can be created
+using the 'create_index' method, after which lookups on those
+columns take constant time:
+
+>>> data.create_index('chr')
+>>> data.create_index(('chr','start'))
+
 Within a single data line the 'subset' method returns a list of values
 for a set of column indices or column names:
 
@@ -168,6 +191,43 @@ Again a lambda expression can be used instead:
 
 >>> data.computeColumn('midpoint',lambda line: line['stop'] - line['start'])
 
+For large files the 'transformColumnArray' and 'computeColumnArray'
+methods are much faster: the supplied function is called just once,
+with whole columns of values (as NumPy arrays, if NumPy is available,
+for columns of numbers; see the 'column' method), and should return
+all the new values at once:
+
+>>> data.transformColumnArray('start',lambda x: x+1)
+>>> data.computeColumnArray('midpoint',lambda start,stop: (start+stop)/2.0,
+...                         ('start','stop'))
+
+Joining and Grouping Data
+-------------------------
+
+The 'join' method combines the lines from two TabFiles which have
+matching values in one or more key columns, using a hash join:
+
+>>> genes = TabFile('genes.txt',first_line_is_header=True)
+>>> exprs = TabFile('exprs.txt',first_line_is_header=True)
+>>> joined = genes.join(exprs,on='gene_id')
+
+Left, right and outer joins are also possible using the 'how'
+argument e.g.
+
+>>> joined = genes.join(exprs,on='gene_id',how='left')
+
+The 'groupby' method returns a GroupBy object which can compute
+aggregated values for each distinct value in a column, returning
+a new TabFile:
+
+>>> stats = data.groupby('chr').aggregate(('start','count'),
+...                                       ('score','mean'),
+...                                       ('score',max,'best_score'))
+
+A TabFileIterator (see 'Streaming Data' below) can be supplied as
+the second TabFile in a join, and also has a 'groupby' method, so
+that large files can be joined and aggregated without loading them.
+
 Writing to File
 ---------------
 
@@ -178,6 +238,42 @@ Use the TabFile's 'write' method to output the content to a file:
 It's also possible to reorder the columns before writing out using
 the 'reorderColumns' method.
 
+Controlling Type Conversion
+---------------------------
+
+By default every value is converted to an integer or float (where
+possible) as the data is loaded. For large files where only some of
+the columns are used, the 'lazy' option stores the values as strings
+and converts each one the first time it's accessed:
+
+>>> data = TabFile('data.txt',lazy=True)
+
+Alternatively a schema can be supplied which specifies the type (or
+a conversion function) for some or all of the columns, or the column
+types can be inferred from the first lines of the file:
+
+>>> data = TabFile('data.txt',first_line_is_header=True,
+...                schema={ 'chr': str, 'start': int, 'end': int })
+>>> data = TabFile('data.txt',first_line_is_header=True,
+...                infer_schema=True)
+
+Values in 'str' columns are not converted at all, which makes loading
+much faster.
+
+Streaming Data
+--------------
+
+To process files which are too large to load into memory, the
+'iterate' method returns a TabFileIterator which reads the file one
+line at a time, yielding TabDataLine objects (the same handling of
+headers, comments and type conversions is applied as for TabFile):
+
+>>> lines = TabFile.iterate('data.txt',first_line_is_header=True)
+>>> print lines.header()
+>>> for line in lines:
+>>> ...    if line['start'] > 1000:
+>>> ...        fp.write("%s\n" % line)
+
 Specifying Delimiters
 ---------------------
 
@@ -187,13 +283,262 @@ TabFile object, for example for a comma-delimited file:
 
 >>> data = TabFile('data.txt',delimiter=',')
 
+Column-oriented Storage
+-----------------------
+
+For large tables the ColumnTabFile class offers the same interface as
+TabFile but stores the data by column rather than by line: columns
+where all the values are integers or floats are held as typed arrays,
+and all lines share a single header.
+
+>>> data = ColumnTabFile('data.txt',first_line_is_header=True)
+
+Lines fetched from a ColumnTabFile are lightweight views onto the
+underlying columns, and support the same operations as TabDataLine
+objects (for example getting and setting values by column name or
+index):
+
+>>> line = data[0]
+>>> line['start'] = 123
+
+Whole columns can be fetched as arrays using the 'column' method
+(these will be NumPy arrays if NumPy is available):
+
+>>> starts = data.column('start')
+
 """
 
-__version__ = "0.2.8"
+__version__ = "0.10.0"
 
 import logging
+import array
+import collections
+import itertools
+import operator
+import copy
+import heapq
+import tempfile
+import cPickle
+try:
+    import numpy
+except ImportError:
+    # No numpy module
+    numpy = None
+
+def _convert_to_type(value):
+    """Internal: convert a value to integer or float if possible
+
+    Used by TabDataLine and ColumnTabFile to coerce input values
+    into integers or floats if appropriate before storage.
+    """
+    converted = value
+    try:
+        # Try integer
+        converted = int(str(converted))
+    except ValueError:
+        # Not an integer, try float
+        try:
+            converted = float(str(converted))
+        except ValueError:
+            # Not a float, leave as input
+            pass
+    # Return value
+    return converted
+
+def _convert_to_int(value):
+    """Internal: convert a value to an integer
+
+    Values which can't be converted are passed to
+    _convert_to_type.
+    """
+    try:
+        return int(str(value))
+    except ValueError:
+        return _convert_to_type(value)
+
+def _convert_to_float(value):
+    """Internal: convert a value to a float
+
+    Values which can't be converted are passed to
+    _convert_to_type.
+    """
+    try:
+        return float(str(value))
+    except ValueError:
+        return _convert_to_type(value)
+
+# Conversion functions for types in schemas
+_SCHEMA_CONVERTERS = { int: _convert_to_int,
+                       float: _convert_to_float,
+                       str: str }
+
+# Number of lines of data used to infer column types
+SCHEMA_SAMPLE_SIZE = 1000
+
+def infer_column_types(rows):
+    """Infer the types of columns from a sample of data
+
+    Each column is assigned the type 'str' if most of the sampled
+    values are not numbers; otherwise it is assigned 'float' if any
+    of the values are floats, or 'int' if they are all integers.
+    Blank values are ignored, so that columns with occasional
+    missing or non-numeric values (e.g. 'NA') are still treated as
+    numeric.
+
+    Arguments:
+      rows: list of lists of string values for each line of
+        data in the sample
+
+    Returns:
+      List with int, float or str for each column.
+    """
+    types = []
+    for values in zip(*rows):
+        n_ints = 0
+        n_floats = 0
+        n_other = 0
+        for value in values:
+            if not value.strip():
+                continue
+            try:
+                int(value)
+                n_ints += 1
+                continue
+            except ValueError:
+                pass
+            try:
+                float(value)
+                n_floats += 1
+            except ValueError:
+                n_other += 1
+        if n_other > n_ints + n_floats:
+            types.append(str)
+        elif n_floats:
+            types.append(float)
+        else:
+            types.append(int)
+    return types
+
+def _schema_column_index(key,column_names):
+    """Internal: return the column index for a key in a schema
+
+    'key' can be a column name or an integer index; raises
+    KeyError if it is neither.
+    """
+    if key in column_names:
+        return list(column_names).index(key)
+    try:
+        return int(key)
+    except ValueError:
+        raise KeyError, "column '%s' not found" % key
+
+def make_converters(schema,column_names=(),convert=True):
+    """Return conversion functions for each column from a schema
+
+    The schema can either be a list with a type or conversion
+    function for each column in order, or a dictionary where the
+    keys are column names or indices and the values are types or
+    conversion functions, e.g.
+
+    >>> make_converters({ 'start': int, 'end': int, 'strand': str },
+    ...                 column_names=('chr','start','end','strand'))
+
+    The types int, float and str are converted to functions which
+    convert values to those types; values in int or float columns
+    which can't be converted are handled in the same way as the
+    default conversion. Any other callable is used as is.
+
+    Columns which don't appear in the schema use the default
+    conversion.
+
+    Arguments:
+      schema: list or dictionary specifying column types
+      column_names: (optional) list of column names, used to
+        resolve names in a dictionary schema
+      convert: (optional) if True (the default) then columns not
+        in the schema are converted to integer or float types as
+        appropriate; if False then they are converted to strings
+
+    Returns:
+      Tuple of conversion functions, one for each column.
+    """
+    if convert:
+        default = _convert_to_type
+    else:
+        default = str
+    if isinstance(schema,dict):
+        converters = [default]*len(column_names)
+        for key in schema:
+            i = _schema_column_index(key,column_names)
+            while len(converters) <= i:
+                converters.append(default)
+            converters[i] = schema[key]
+    else:
+        converters = list(schema)
+    return tuple([_SCHEMA_CONVERTERS.get(f,f) for f in converters])
+
+class ColumnNames(tuple):
+    """Class to store an immutable set of column names
+
+    ColumnNames behaves like a tuple of column names, but its
+    'index' method uses a precomputed mapping of names to column
+    positions, so finding the index of a named column takes
+    constant time. A single ColumnNames instance can be shared
+    between all the lines of data in a file.
+
+    Use the 'extended' method to get a ColumnNames instance with
+    an additional column name, e.g.
+
+        names = ColumnNames(('chr','start'))
+        new_names = names.extended('end')
+
+    Repeated calls to 'extended' with the same name return the
+    same instance, so lines which share names before a column is
+    added continue to share them afterwards.
+    """
+    def __new__(cls,names=()):
+        """Create a new ColumnNames instance
+
+        Arguments:
+          names: (optional) iterable with names for each column
+            in order
+        """
+        self = tuple.__new__(cls,names)
+        self._index = {}
+        for i,name in enumerate(self):
+            self._index.setdefault(name,i)
+        self._extended = {}
+        return self
+
+    def index(self,name):
+        """Return the column index for a name
+
+        If the name appears more than once then the index of the
+        first occurrence is returned. Raises ValueError if the name
+        isn't found.
+        """
+        try:
+            return self._index[name]
+        except (KeyError,TypeError):
+            raise ValueError, "'%s' is not in column names" % (name,)
 
-class TabDataLine:
+    def extended(self,name):
+        """Return ColumnNames with a name appended
+
+        Arguments:
+          name: column name to add
+        """
+        try:
+            return self._extended[name]
+        except KeyError:
+            names = ColumnNames(self + (name,))
+            self._extended[name] = names
+            return names
+
+# Empty set of column names
+_NO_COLUMN_NAMES = ColumnNames()
+
+class TabDataLine(object):
     """Class to store a line of data from a tab-delimited file
 
     Values can be accessed by integer index or by column names (if
@@ -225,41 +570,68 @@ class TabDataLine:
     Check if a line is empty:
 
         if not line: print "Blank line"
-    
+
+    Column names are stored as a ColumnNames instance (which is
+    shared if one is supplied on creation), so lookups by name
+    take constant time. The 'names' attribute is therefore a tuple
+    rather than a list; any sequence assigned to it is converted
+    to a ColumnNames instance.
     """
+    __slots__ = ('__names','__data','__convert','__converters','__pending',
+                 '__delimiter','__lineno')
+
     def __init__(self,line=None,column_names=None,delimiter='\t',lineno=None,
-                 convert=True):
+                 convert=True,lazy=False,converters=None):
         """Create a new TabFileLine object
 
         Arguments:
           line: (optional) Tab-delimited line with data values
           column_names: (optional) tuple or list of column names
-            to assign to each value.
+            to assign to each value, or a ColumnNames instance
+            (which will be shared rather than copied).
           delimiter: (optional) delimiter character (defaults to tab)
           lineno: (optional) Line number
           convert: if True then convert values to the appropriate
             types; if False then all values will be converted to
             strings.
+          lazy: (optional) if True then values from 'line' are
+            stored as strings and only converted (and the results
+            cached) when they are first accessed
+          converters: (optional) sequence of functions to use for
+            converting values in each column (see 'make_converters');
+            columns without a converter use the default conversion
         """
-        # Conversion function
-        if convert:
-            self.__convert = self.convert_to_type
-        else:
-            self.__convert = self.convert_to_str
+        # Conversion functions
+        self.__convert = bool(convert)
+        self.__converters = converters
+        self.__pending = 0
         # Data
-        self.data = []
         self.delimiter(delimiter)
         self.__lineno = None
         if line is not None:
-            for value in line.split(self.__delimiter):
-                self.data.append(self.__convert(value.rstrip('\n')))
+            values = line.split(self.__delimiter)
+            if lazy and convert:
+                # Defer conversion until values are accessed
+                values = [v.rstrip('\n') for v in values]
+                self.__pending = (1 << len(values)) - 1
+            elif converters:
+                n = len(converters)
+                data = [f(v.rstrip('\n'))
+                        for f,v in itertools.izip(converters,values)]
+                if len(values) > n:
+                    convert = self.__default_converter()
+                    data.extend([convert(v.rstrip('\n')) for v in values[n:]])
+                values = data
+            else:
+                convert = self.__default_converter()
+                values = [convert(v.rstrip('\n')) for v in values]
+            self.__data = values
+        else:
+            self.__data = []
         # Column names
-        self.names = []
-        if column_names:
-            for name in column_names:
-                self.names.append(name)
-            while len(self.data) < len(column_names):
-                self.data.append('')
+        self.names = column_names
+        while len(self.__data) < len(self.__names):
+            self.__data.append('')
         # Line number
         if lineno is not None:
             invalid_lineno = False
@@ -275,19 +647,50 @@ class TabDataLine:
                 raise ValueError,"invalid line number '%s'" % lineno
         self.__lineno = lineno
 
-    def __getitem__(self,key):
-        """Implement value = TabDataLine[key]
+    @property
+    def data(self):
+        """List of the data values in the line
 
-        'key' can be the name of a column or an integer index
-        (starting from zero). Column names are checked first.
+        For lazy lines, accessing this converts any values which
+        haven't already been converted.
+        """
+        if self.__pending:
+            for i in xrange(len(self.__data)):
+                if self.__pending & (1 << i):
+                    self.__data[i] = self.__converter(i)(self.__data[i])
+            self.__pending = 0
+        return self.__data
+
+    @data.setter
+    def data(self,values):
+        self.__data = values
+        self.__pending = 0
+
+    @property
+    def names(self):
+        """ColumnNames instance with the column names for the line
+        """
+        return self.__names
+
+    @names.setter
+    def names(self,column_names):
+        if isinstance(column_names,ColumnNames):
+            self.__names = column_names
+        elif column_names:
+            self.__names = ColumnNames(column_names)
+        else:
+            self.__names = _NO_COLUMN_NAMES
 
-        WARNING there is potential ambiguity if any column "names"
-        also happen to be integers. 
+    def __index(self,key):
+        """Internal: return the non-negative index for a key
+
+        'key' can be a column name or an integer index; raises
+        KeyError if it is neither, or IndexError if it is out of
+        range.
         """
         # See if key is a column name
         try:
-            i = self.names.index(key)
-            return self.data[i]
+            return self.__names.index(key)
         except ValueError:
             # Not a column name
             # See if it's an integer index
@@ -296,11 +699,44 @@ class TabDataLine:
             except ValueError:
                 # Not an integer
                 raise KeyError, "column '%s' not found" % key
-            try:
-                return self.data[i]
-            except IndexError:
+            n = len(self.__data)
+            if i < -n or i >= n:
                 # Integer but out of range
                 raise IndexError, "integer index out of range for '%s'" % key
+            if i < 0:
+                i += n
+            return i
+
+    def __default_converter(self):
+        """Internal: return the default conversion function
+        """
+        if self.__convert:
+            return self.convert_to_type
+        return self.convert_to_str
+
+    def __converter(self,i):
+        """Internal: return the conversion function for column i
+        """
+        try:
+            return self.__converters[i]
+        except (TypeError,IndexError):
+            return self.__default_converter()
+
+    def __getitem__(self,key):
+        """Implement value = TabDataLine[key]
+
+        'key' can be the name of a column or an integer index
+        (starting from zero). Column names are checked first.
+
+        WARNING there is potential ambiguity if any column "names"
+        also happen to be integers. 
+        """
+        i = self.__index(key)
+        if self.__pending & (1 << i):
+            # Convert on first access
+            self.__data[i] = self.__converter(i)(self.__data[i])
+            self.__pending &= ~(1 << i)
+        return self.__data[i]
 
     def __setitem__(self,key,value):
         """Implement TabDataLine[key] = value
@@ -311,31 +747,16 @@ class TabDataLine:
         WARNING there is potential ambiguity if any column "names"
         also happen to be integers. 
         """
+        i = self.__index(key)
         # Convert value to correct type
-        converted_value = self.__convert(value)
-        # See if key is a column name
-        try:
-            i = self.names.index(key)
-            self.data[i] = converted_value
-        except ValueError:
-            # Not a column name
-            # See if it's an integer index
-            try:
-                i = int(key)
-            except ValueError:
-                # Not an integer
-                raise KeyError, "column '%s' not found" % key
-            try:
-                self.data[i] = converted_value
-            except IndexError:
-                # Integer but out of range
-                raise IndexError, "integer index out of range for '%s'" % key
+        self.__data[i] = self.__converter(i)(value)
+        self.__pending &= ~(1 << i)
 
     def __len__(self):
-        return len(self.data)
+        return len(self.__data)
 
     def __nonzero__(self):
-        for item in self.data:
+        for item in self.__data:
             if str(item).strip(): return True
         return False
 
@@ -352,35 +773,24 @@ class TabDataLine:
         if appropriate before storage in the TabDataLine
         object.
         """
-        converted = value
-        try:
-            # Try integer
-            converted = int(str(converted))
-        except ValueError:
-            # Not an integer, try float
-            try:
-                converted = float(str(converted))
-            except ValueError:
-                # Not a float, leave as input
-                pass
-        # Return value
-        return converted
+        return _convert_to_type(value)
 
     def append(self,*values):
         """Append values to the data line
 
         Should only be used when creating new data lines.
         """
+        convert = self.__default_converter()
         for value in values:
-            self.data.append(self.__convert(value))
+            self.__data.append(convert(value))
 
     def appendColumn(self,key,value):
         """Append keyed values to the data line
 
         This adds a new value along with a header name (i.e. key)
         """
-        self.names.append(key)
-        self.data.append(self.__convert(value))
+        self.__names = self.__names.extended(key)
+        self.__data.append(self.__default_converter()(value))
 
     def subset(self,*keys):
         """Return a subset of data items
@@ -439,44 +849,622 @@ class TabDataLine:
         """
         return self.__lineno
 
+    def _copy(self,data,lineno):
+        """Internal: return a copy of the line with new values
+
+        The copy shares column names, delimiter and conversion
+        settings with the original line.
+
+        Arguments:
+          data: list of (already converted) values for the copy
+          lineno: line number for the copy
+        """
+        line = copy.copy(self)
+        line.data = data
+        line.__lineno = lineno
+        return line
+
     def __repr__(self):
         return self.__delimiter.join([str(x) for x in self.data])
 
-class TabFile:
-    """Class to get data from a tab-delimited file
+def _normalise_lookup_key(key,value):
+    """Internal: normalise keys and values for lookups
 
-    Loads data from the specified file into a data structure than can
-    then be queried on a per line and per item basis.
+    Lists of keys or values are converted to tuples, so they
+    can be used as keys in index dictionaries.
+    """
+    if isinstance(key,list):
+        key = tuple(key)
+    if isinstance(key,tuple) and isinstance(value,list):
+        value = tuple(value)
+    return (key,value)
 
-    Data lines are represented by data line objects which must be
-    TabDataLine-like.
+def _lookup_value(line,key):
+    """Internal: return the value(s) from a line for a lookup key
+
+    If 'key' is a tuple then a tuple of the corresponding
+    values is returned.
+    """
+    if isinstance(key,tuple):
+        return tuple([line[k] for k in key])
+    return line[key]
+
+# Default maximum number of lines to hold in memory when sorting
+SORT_BUFFER_SIZE = 100000
+
+# Number of lines to format before each write to file
+WRITE_BUFFER_SIZE = 10000
+
+class _ReverseKey(object):
+    """Internal: wrapper which reverses the ordering of sort keys
+    """
+    __slots__ = ('key',)
+
+    def __init__(self,key):
+        self.key = key
+
+    def __lt__(self,other):
+        return other.key < self.key
+
+    def __eq__(self,other):
+        return self.key == other.key
+
+    def __ne__(self,other):
+        return self.key != other.key
+
+def _write_sort_run(run,tmp_dir=None):
+    """Internal: write a sorted run of lines to a temporary file
+
+    Arguments:
+      run: sorted list of tuples (key,seq,line)
+      tmp_dir: (optional) directory to create the file in
+
+    Returns:
+      File object positioned at the start of the run.
+    """
+    fp = tempfile.TemporaryFile(dir=tmp_dir)
+    pickler = cPickle.Pickler(fp,cPickle.HIGHEST_PROTOCOL)
+    for key,seq,line in run:
+        pickler.clear_memo()
+        pickler.dump((key,seq,line.data,line.lineno()))
+    fp.seek(0)
+    return fp
+
+def _read_sort_run(fp,reverse=False):
+    """Internal: yield entries from a sorted run in a temporary file
+
+    Yields tuples (key,seq,data,lineno); if 'reverse' is True
+    then keys are wrapped so that they sort in reverse order.
+    """
+    unpickler = cPickle.Unpickler(fp)
+    while True:
+        try:
+            key,seq,data,lineno = unpickler.load()
+        except EOFError:
+            return
+        if reverse:
+            key = _ReverseKey(key)
+        yield (key,seq,data,lineno)
+
+def sort_lines(lines,sort_func,reverse=False,buffer_size=SORT_BUFFER_SIZE,
+               tmp_dir=None):
+    """Sort data lines which may not all fit into memory
+
+    Performs an external merge sort on an iterable of TabDataLine
+    objects (for example a TabFileIterator): lines are read in
+    batches of 'buffer_size', each batch is sorted and written to
+    a temporary file, and the sorted batches are then merged.
+
+    The sorted lines are yielded one at a time, and are the same
+    (and in the same order) as those produced by sorting all of
+    the lines in memory using TabFile.sort. If all the lines fit
+    into a single batch then no temporary files are used.
 
     Example usage:
 
-        data = TabFile(myfile)     # load initial data
+    >>> lines = TabFile.iterate('data.txt',first_line_is_header=True)
+    >>> for line in sort_lines(lines,lambda line: line['start']):
+    ...   fp.write("%s\n" % line)
+
+    Arguments:
+      lines: iterable yielding TabDataLine objects
+      sort_func: function object taking a data line object as
+        input and returning the value to sort on
+      reverse: (optional) if True then sort into descending order
+      buffer_size: (optional) maximum number of lines to sort in
+        memory at one time (defaults to SORT_BUFFER_SIZE)
+      tmp_dir: (optional) directory to write temporary files to
+    """
+    runs = []
+    batch = []
+    prototype = None
+    try:
+        for seq,line in enumerate(lines):
+            if prototype is None:
+                prototype = line
+            batch.append((sort_func(line),seq,line))
+            if len(batch) == buffer_size:
+                batch.sort(key=lambda x: x[0],reverse=reverse)
+                runs.append(_write_sort_run(batch,tmp_dir=tmp_dir))
+                batch = []
+        batch.sort(key=lambda x: x[0],reverse=reverse)
+        if not runs:
+            # All lines fitted into memory
+            for key,seq,line in batch:
+                yield line
+            return
+        if batch:
+            runs.append(_write_sort_run(batch,tmp_dir=tmp_dir))
+            batch = []
+        # Merge the sorted runs
+        for key,seq,data,lineno in heapq.merge(
+                *[_read_sort_run(fp,reverse=reverse) for fp in runs]):
+            yield prototype._copy(data,lineno)
+    finally:
+        for fp in runs:
+            fp.close()
+
+def _key_indices(key,header):
+    """Internal: return tuple of column indices for a join/group key
+
+    'key' can be a column name or index, or a tuple or list of
+    column names and/or indices. Raises KeyError if a named
+    column isn't in 'header'.
+    """
+    if not isinstance(key,(tuple,list)):
+        key = (key,)
+    indices = []
+    for k in key:
+        if isinstance(k,(int,long)):
+            indices.append(k)
+        else:
+            try:
+                indices.append(list(header).index(k))
+            except ValueError:
+                raise KeyError, "column '%s' not found" % k
+    return tuple(indices)
 
-        print '%s' % len(data)     # report number of lines of data
+def _key_from_data(data,indices):
+    """Internal: return the key value from a list of line values
 
-        print '%s' % data.header() # report header (i.e. column names)
+    A single value is returned for a single column, otherwise a
+    tuple of the values.
+    """
+    if len(indices) == 1:
+        return data[indices[0]]
+    return tuple([data[i] for i in indices])
 
-        for line in data:
-            ...                    # loop over lines of data
+def join_column_names(left_header,right_header,right_on,suffix='_2'):
+    """Return the column names for the result of a join
 
-        myline = data[0]           # fetch first line of data
+    The names are those of the left-hand table followed by those
+    of the right-hand table, omitting the right-hand key columns.
+    Right-hand names which clash with existing names have 'suffix'
+    appended.
+
+    If either table has no column names then an empty list is
+    returned.
+
+    Arguments:
+      left_header: list of column names for left-hand table
+      right_header: list of column names for right-hand table
+      right_on: right-hand key column(s) (see 'join_lines')
+      suffix: (optional) suffix to append to clashing names
+
+    Returns:
+      List of column names.
     """
-    def __init__(self,filen=None,fp=None,column_names=None,skip_first_line=False,
-                 first_line_is_header=False,tab_data_line=TabDataLine,
-                 delimiter='\t',convert=True):
-        """Create a new TabFile object
+    if not left_header or not right_header:
+        return []
+    right_key = _key_indices(right_on,right_header)
+    names = list(left_header)
+    for i,name in enumerate(right_header):
+        if i in right_key:
+            continue
+        if name in names:
+            name = "%s%s" % (name,suffix)
+        names.append(name)
+    return names
+
+def join_lines(left,right,on,how='inner',right_on=None,
+               left_header=None,right_header=None):
+    """Join two sets of data lines on matching key values
+
+    Performs a hash join: the lines from the smaller of the two
+    sides are loaded into a dictionary keyed on the join column(s),
+    and the lines from the other side are then matched against it,
+    so the join takes linear time.
+
+    For each match a list of values is yielded, consisting of the
+    values from the left-hand line followed by those from the
+    right-hand line (omitting the right-hand key columns).
+
+    'how' specifies the type of join:
+
+    - 'inner': only output lines with matches on both sides
+    - 'left': also output left-hand lines with no match (with
+      blank values for the right-hand columns)
+    - 'right': also output right-hand lines with no match (with
+      blank values for the left-hand columns, except for the
+      key columns)
+    - 'outer': output unmatched lines from both sides
+
+    Regardless of which side is hashed, matched lines are output
+    in the order of the left-hand lines (with multiple matches in
+    the order of the right-hand lines), followed by any unmatched
+    right-hand lines.
+
+    The lines on each side are only read once, so either side
+    can be a TabFileIterator: if one side doesn't support len()
+    then the other side is hashed (or the left-hand side, if
+    neither does).
+
+    Arguments:
+      left: iterable yielding data lines for the left-hand side
+      right: iterable yielding data lines for the right-hand side
+      on: column name or index (or tuple of names and/or indices)
+        to join on
+      how: (optional) type of join (default 'inner')
+      right_on: (optional) key column(s) in the right-hand lines,
+        if different from 'on'
+      left_header: (optional) column names for the left-hand lines
+      right_header: (optional) column names for the right-hand
+        lines
+
+    Returns:
+      Generator yielding lists of values.
+    """
+    if how not in ('inner','left','right','outer'):
+        raise ValueError, "unknown join type '%s'" % how
+    if right_on is None:
+        right_on = on
+    left_key = _key_indices(on,left_header or [])
+    right_key = _key_indices(right_on,right_header or [])
+    if len(left_key) != len(right_key):
+        raise ValueError, "join keys have different numbers of columns"
+    keep_left = how in ('left','outer')
+    keep_right = how in ('right','outer')
+    def right_values(data):
+        return [x for i,x in enumerate(data) if i not in right_key]
+    # Hash the smaller side; streamed (unsized) right-hand lines
+    # are never hashed
+    left_sized = hasattr(left,'__len__')
+    right_sized = hasattr(right,'__len__')
+    hash_right = right_sized and (not left_sized or len(right) <= len(left))
+    left_ncols = len(left_header or [])
+    right_ncols = len(right_header or [])
+    table = {}
+    unmatched_right = []
+    if hash_right:
+        # Build table from the right-hand lines
+        right_lines = []
+        for line in right:
+            data = line.data
+            right_ncols = max(right_ncols,len(data))
+            table.setdefault(_key_from_data(data,right_key),[]).append(data)
+            right_lines.append(data)
+        blank_right = ['']*(right_ncols-len(right_key))
+        # Probe with the left-hand lines
+        matched_keys = set()
+        for line in left:
+            data = line.data
+            left_ncols = max(left_ncols,len(data))
+            key = _key_from_data(data,left_key)
+            matches = table.get(key)
+            if matches:
+                matched_keys.add(key)
+                for right_data in matches:
+                    yield data + right_values(right_data)
+            elif keep_left:
+                yield data + blank_right
+        if keep_right:
+            for data in right_lines:
+                if _key_from_data(data,right_key) not in matched_keys:
+                    unmatched_right.append(data)
+    else:
+        # Build table from the left-hand lines
+        left_lines = []
+        for line in left:
+            data = line.data
+            left_ncols = max(left_ncols,len(data))
+            table.setdefault(_key_from_data(data,left_key),[]).append(
+                len(left_lines))
+            left_lines.append((data,[]))
+        # Probe with the right-hand lines
+        for line in right:
+            data = line.data
+            right_ncols = max(right_ncols,len(data))
+            idxs = table.get(_key_from_data(data,right_key))
+            if idxs:
+                for i in idxs:
+                    left_lines[i][1].append(data)
+            elif keep_right:
+                unmatched_right.append(data)
+        blank_right = ['']*(right_ncols-len(right_key))
+        for data,matches in left_lines:
+            if matches:
+                for right_data in matches:
+                    yield data + right_values(right_data)
+            elif keep_left:
+                yield data + blank_right
+    # Unmatched right-hand lines
+    for data in unmatched_right:
+        values = ['']*left_ncols
+        for i,j in zip(left_key,right_key):
+            values[i] = data[j]
+        yield values + right_values(data)
+
+class _Count:
+    """Internal: aggregator counting the lines in a group
+    """
+    def __init__(self):
+        self.n = 0
+    def add(self,value):
+        self.n += 1
+    def result(self):
+        return self.n
+
+class _Sum:
+    """Internal: aggregator summing the non-blank values in a group
+    """
+    def __init__(self):
+        self.total = 0
+    def add(self,value):
+        if value != '':
+            self.total += value
+    def result(self):
+        return self.total
+
+class _Mean:
+    """Internal: aggregator averaging the non-blank values in a group
+    """
+    def __init__(self):
+        self.total = 0.0
+        self.n = 0
+    def add(self,value):
+        if value != '':
+            self.total += value
+            self.n += 1
+    def result(self):
+        if self.n:
+            return self.total/self.n
+        return ''
+
+class _Min:
+    """Internal: aggregator finding the smallest non-blank value
+    """
+    def __init__(self):
+        self.value = None
+    def add(self,value):
+        if value != '' and (self.value is None or value < self.value):
+            self.value = value
+    def result(self):
+        if self.value is None:
+            return ''
+        return self.value
+
+class _Max(_Min):
+    """Internal: aggregator finding the largest non-blank value
+    """
+    def add(self,value):
+        if value != '' and (self.value is None or value > self.value):
+            self.value = value
 
-        If either of 'filen' or 'fp' arguments are given then the
-        TabFile object will be populated with data from the specified
-        file or stream. Otherwise an empty TabFile object is created.
+class _First:
+    """Internal: aggregator returning the first value in a group
+    """
+    def __init__(self):
+        self.value = None
+    def add(self,value):
+        if self.value is None:
+            self.value = value
+    def result(self):
+        return self.value
+
+class _Last(_First):
+    """Internal: aggregator returning the last value in a group
+    """
+    def add(self,value):
+        self.value = value
+
+class _Apply:
+    """Internal: aggregator applying a function to all group values
+    """
+    def __init__(self,func):
+        self.func = func
+        self.values = []
+    def add(self,value):
+        self.values.append(value)
+    def result(self):
+        return self.func(self.values)
+
+# Named aggregation functions for GroupBy.aggregate
+AGGREGATE_FUNCTIONS = { 'count': _Count,
+                        'sum': _Sum,
+                        'mean': _Mean,
+                        'min': _Min,
+                        'max': _Max,
+                        'first': _First,
+                        'last': _Last, }
+
+class GroupBy:
+    """Class for grouping data lines on the values in key column(s)
+
+    GroupBy objects are returned by the 'groupby' methods of
+    TabFile, ColumnTabFile and TabFileIterator, e.g.
+
+    >>> groups = data.groupby('chr')
+
+    The 'aggregate' method computes values for each group in a
+    single pass over the lines using hash aggregation, keeping
+    only a running total (or similar) for each group, and returns
+    a new TabFile with one line per group:
+
+    >>> totals = groups.aggregate(('start','count'),('score','mean'))
+
+    Alternatively iterating over the GroupBy yields each key value
+    along with the list of lines in that group:
+
+    >>> for chrom,lines in groups:
+    ...   print "%s: %d lines" % (chrom,len(lines))
+
+    Groups are returned in the order that their keys first appear.
+    Note that if the lines come from a TabFileIterator then they
+    can only be read once.
+    """
+    def __init__(self,lines,column,header=None,delimiter='\t',
+                 tabfile_class=None):
+        """Create a new GroupBy object
 
         Arguments:
-          filen (optional): name of tab-delimited file to load data
+          lines: iterable yielding data lines
+          column: column name or index (or tuple of names and/or
+            indices) to group on
+          header: (optional) list of column names for the lines
+          delimiter: (optional) delimiter for the TabFile returned
+            by 'aggregate' (defaults to tab)
+          tabfile_class: (optional) class to use for the object
+            returned by 'aggregate' (defaults to TabFile)
+        """
+        self.__lines = lines
+        self.__column = column
+        self.__header = list(header or [])
+        self.__key = _key_indices(column,self.__header)
+        self.__delimiter = delimiter
+        if tabfile_class is None:
+            tabfile_class = TabFile
+        self.__tabfile_class = tabfile_class
+
+    def key_names(self):
+        """Return the names of the column(s) being grouped on
+        """
+        names = []
+        for i in self.__key:
+            try:
+                names.append(self.__header[i])
+            except IndexError:
+                names.append(str(i))
+        return names
+
+    def aggregate(self,*aggregations):
+        """Compute aggregated values for each group
+
+        Each aggregation is a tuple of the form (column,function)
+        or (column,function,name), where 'column' is the name or
+        index of the column to aggregate, 'function' is either the
+        name of one of the built-in aggregations:
+
+        - 'count': number of lines in the group
+        - 'sum', 'mean', 'min', 'max': sum, average, smallest and
+          largest values (ignoring blank values)
+        - 'first', 'last': first and last values in the group
+
+        or a function object which will be called with the list of
+        values for the group and which should return a single
+        value; and 'name' is the name for the new column (defaults
+        to '<column>_<function>').
+
+        For example:
+
+        >>> data.groupby('gene').aggregate(('exon','count'),
+        ...                                ('log2FC',max,'best'))
+
+        Only the built-in aggregations avoid holding the values for
+        each group in memory.
+
+        Returns:
+          New TabFile object (or object of the class specified by
+          'tabfile_class') with the key column(s) followed by one
+          column for each aggregation.
+        """
+        columns = []
+        names = self.key_names()
+        for aggregation in aggregations:
+            if len(aggregation) == 3:
+                column,func,name = aggregation
+            else:
+                column,func = aggregation
+                name = None
+            if isinstance(func,basestring):
+                try:
+                    factory = AGGREGATE_FUNCTIONS[func]
+                except KeyError:
+                    raise KeyError, "unknown aggregation function '%s'" % func
+                func_name = func
+            else:
+                factory = lambda f=func: _Apply(f)
+                func_name = getattr(func,'__name__','func')
+            if name is None:
+                name = "%s_%s" % (column,func_name)
+            columns.append((_key_indices(column,self.__header)[0],factory))
+            names.append(name)
+        # Single pass over the lines
+        groups = collections.OrderedDict()
+        key_indices = self.__key
+        for line in self.__lines:
+            data = line.data
+            key = _key_from_data(data,key_indices)
+            try:
+                aggregators = groups[key]
+            except KeyError:
+                aggregators = groups[key] = [factory()
+                                             for i,factory in columns]
+            for (i,factory),aggregator in zip(columns,aggregators):
+                aggregator.add(data[i])
+        # Build the output
+        result = self.__tabfile_class(column_names=names,
+                                      delimiter=self.__delimiter)
+        for key,aggregators in groups.iteritems():
+            if len(key_indices) == 1:
+                key = [key]
+            else:
+                key = list(key)
+            result.append(data=key+[a.result() for a in aggregators])
+        return result
+
+    def __iter__(self):
+        """Yield (key,lines) pairs for each group
+        """
+        groups = collections.OrderedDict()
+        for line in self.__lines:
+            key = _key_from_data(line.data,self.__key)
+            groups.setdefault(key,[]).append(line)
+        for key in groups:
+            yield (key,groups[key])
+
+class TabFileIterator:
+    """Class to iterate over the data lines in a tab-delimited file
+
+    Reads data from the specified file one line at a time, returning
+    a TabDataLine-like object for each line of data, so that the whole
+    file is never held in memory. Handling of headers, comments and
+    type conversions is the same as for the TabFile class.
+
+    Example usage:
+
+        lines = TabFileIterator('data.txt',first_line_is_header=True)
+        print lines.header()
+        for line in lines:
+            ...                    # do something with line
+
+    The header (if one is read from the file) is available as soon
+    as the TabFileIterator has been created. A TabFileIterator can
+    only be iterated over once; if it opened the file itself then
+    the file is closed when the iteration finishes.
+    """
+    def __init__(self,filen=None,fp=None,column_names=None,
+                 skip_first_line=False,first_line_is_header=False,
+                 tab_data_line=TabDataLine,delimiter='\t',convert=True,
+                 lazy=False,schema=None,infer_schema=False):
+        """Create a new TabFileIterator object
+
+        Arguments are the same as for TabFile, and one of 'filen' or
+        'fp' must be supplied.
+
+        Arguments:
+          filen (optional): name of tab-delimited file to read data
               from; ignored if fp is also specified
-          fp: (optional) a file-like object which data can be loaded
+          fp: (optional) a file-like object which data can be read
               from like a file; used in preference to filen.
               Note that the calling program must close the stream in
               these cases.
@@ -485,45 +1473,355 @@ class TabFile:
           skip_first_line: (optional) if True then ignore the first
               line of the input file
           first_line_is_header: (optional) if True then takes column
-              names from the first line of the file (over-riding
-              'column_names' argument if specified.
+              names from the first line of the file
           tab_data_line: (optional) class to use for creating data
               line objects (defaults to TabDataLine).
           delimiter: (optional) delimiter character (defaults to tab)
           convert: (optional) if True then convert input values to
               the appropriate types (e.g. integer, float etc); if
               False then convert everything to strings
+          lazy: (optional) if True then only convert values when
+              they are first accessed
+          schema: (optional) list or dictionary specifying types
+              or conversion functions for columns (see
+              'make_converters')
+          infer_schema: (optional) if True then infer the column
+              types from the first SCHEMA_SAMPLE_SIZE lines of data
+              (any explicit 'schema' takes precedence)
         """
-        # Initialise
         self.__filen = filen
-        self.__ncols = 0
-        self.__header = []
         self.__delimiter = delimiter
-        self.__data = []
         self.__convert = convert
-        # Class to use for data lines
         self.__tabdataline = tab_data_line
-        # Set up column names
+        self.__line_args = {}
+        if lazy:
+            self.__line_args['lazy'] = True
+        self.__header = []
         if column_names is not None:
-            self.__setHeader(column_names)
-        # Read in data
-        if fp is None and filen is not None:
-            # Open named file
-            fp = open(self.__filen,'rU')
-            close_fp = True
+            self.__header = [name for name in column_names]
+        self.__ncols = len(self.__header)
+        self.__line_no = 0
+        # Open the file
+        if fp is None:
+            self.__fp = open(filen,'rU')
+            self.__close_fp = True
         else:
-            close_fp = False
-        if fp:
-            self.__load(fp,skip_first_line=skip_first_line,
-                        first_line_is_header=first_line_is_header)
-        # Only close the stream if it was opened locally
-        if close_fp: fp.close()
+            self.__fp = fp
+            self.__close_fp = False
+        # Deal with leading lines
+        if skip_first_line:
+            self.__readline()
+        if first_line_is_header and not self.__header:
+            line = self.__readline()
+            if line:
+                self.__header = line.strip().strip('#').split(delimiter)
+                self.__ncols = len(self.__header)
+        # Column names shared by all lines
+        self.__names = ColumnNames(self.__header)
+        # Read ahead to infer types
+        self.__buffer = collections.deque()
+        if infer_schema:
+            self.__buffer.extend(self.__read_data_lines(SCHEMA_SAMPLE_SIZE))
+            types = infer_column_types(
+                [line.rstrip('\n').split(delimiter)
+                 for line_no,line in self.__buffer])
+            if schema is not None:
+                # Explicit types take precedence over inferred ones
+                if not isinstance(schema,dict):
+                    schema = dict(enumerate(schema))
+                types = dict(enumerate(types))
+                for key in schema:
+                    types[_schema_column_index(key,self.__header)] = schema[key]
+            schema = types
+        # Set up conversion functions
+        self.__converters = None
+        if schema is not None:
+            self.__converters = make_converters(schema,self.__header,
+                                                convert=convert)
+            self.__line_args['converters'] = self.__converters
+
+    def __read_data_lines(self,n):
+        """Internal: read up to n lines of data from the file
+
+        Returns a list of tuples (line_no,line); commented lines
+        are skipped.
+        """
+        lines = []
+        while len(lines) < n:
+            line = self.__readline()
+            if not line:
+                break
+            if line.lstrip().startswith('#'):
+                # Skip commented line
+                continue
+            lines.append((self.__line_no,line))
+        return lines
 
-    def __load(self,fp,skip_first_line=False,first_line_is_header=False):
-        """Load data into the object from file
+    def __readline(self):
+        """Internal: read the next line from the file
+        """
+        line = self.__fp.readline()
+        if line:
+            self.__line_no += 1
+        return line
 
-        Lines starting with '#' are ignored (unless the first_line_is_header
-        is set and the first line starts with '#').
+    def header(self):
+        """Return list of column names
+
+        If no column names were set then this will be an empty list.
+        """
+        return self.__header
+
+    def columnNames(self):
+        """Return the ColumnNames instance shared by the data lines
+        """
+        return self.__names
+
+    def nColumns(self):
+        """Return the number of columns
+
+        If there is no header then this will be zero until the first
+        line of data has been read.
+        """
+        return self.__ncols
+
+    def converters(self):
+        """Return the column conversion functions
+
+        Returns a tuple of functions for converting values in each
+        column if a schema was specified or inferred, or None if
+        the default conversion is being used.
+        """
+        return self.__converters
+
+    def filename(self):
+        """Return the file name associated with the TabFileIterator
+        """
+        return self.__filen
+
+    def close(self):
+        """Close the file, if it was opened by the TabFileIterator
+        """
+        if self.__close_fp:
+            self.__fp.close()
+            self.__close_fp = False
+
+    def sort(self,sort_func,reverse=False,buffer_size=SORT_BUFFER_SIZE,
+             tmp_dir=None):
+        """Iterate over the lines from the file in sorted order
+
+        Uses an external merge sort (see 'sort_lines') so that
+        files which are too large to fit into memory can be
+        sorted, e.g.
+
+        >>> lines = TabFile.iterate('data.txt',first_line_is_header=True)
+        >>> for line in lines.sort(lambda line: line['start']):
+        ...   print line
+
+        Arguments:
+          sort_func: function object taking a data line object as
+            input and returning the value to sort on
+          reverse: (optional) if True then sort into descending order
+          buffer_size: (optional) maximum number of lines to sort in
+            memory at one time
+          tmp_dir: (optional) directory to write temporary files to
+        """
+        return sort_lines(self,sort_func,reverse=reverse,
+                          buffer_size=buffer_size,tmp_dir=tmp_dir)
+
+    def groupby(self,column):
+        """Group the lines from the file on the values in a column
+
+        Aggregated values for each group can be computed while
+        streaming through the file, e.g.
+
+        >>> lines = TabFile.iterate('data.txt',first_line_is_header=True)
+        >>> counts = lines.groupby('chr').aggregate(('start','count'))
+
+        Arguments:
+          column: column name or index (or tuple of names and/or
+            indices) to group on
+
+        Returns:
+          GroupBy object.
+        """
+        return GroupBy(self,column,header=self.__header,
+                       delimiter=self.__delimiter)
+
+    def __iter__(self):
+        """Yield the data lines from the file
+
+        Lines starting with '#' are skipped. Lines with the wrong
+        number of data items raise an IndexError exception.
+        """
+        try:
+            while True:
+                if self.__buffer:
+                    line_no,line = self.__buffer.popleft()
+                else:
+                    line = self.__readline()
+                    if not line:
+                        break
+                    if line.lstrip().startswith('#'):
+                        # Skip commented line
+                        continue
+                    line_no = self.__line_no
+                data_line = self.__tabdataline(line,column_names=self.__names,
+                                               lineno=line_no,
+                                               delimiter=self.__delimiter,
+                                               convert=self.__convert,
+                                               **self.__line_args)
+                if self.__ncols > 0:
+                    if len(data_line) != self.__ncols:
+                        # Inconsistent lines are an error
+                        logging.error("Line %d has wrong number of data items" %
+                                      line_no)
+                        logging.error("Line: %s" % data_line)
+                        logging.error("Expected %d, got %d" % (self.__ncols,
+                                                               len(data_line)))
+                        raise IndexError, "wrong number of data items in line %d" \
+                            % line_no
+                else:
+                    # Set number of columns
+                    self.__ncols = len(data_line)
+                yield data_line
+        finally:
+            self.close()
+
+class TabFile:
+    """Class to get data from a tab-delimited file
+
+    Loads data from the specified file into a data structure than can
+    then be queried on a per line and per item basis.
+
+    Data lines are represented by data line objects which must be
+    TabDataLine-like.
+
+    Example usage:
+
+        data = TabFile(myfile)     # load initial data
+
+        print '%s' % len(data)     # report number of lines of data
+
+        print '%s' % data.header() # report header (i.e. column names)
+
+        for line in data:
+            ...                    # loop over lines of data
+
+        myline = data[0]           # fetch first line of data
+    """
+    def __init__(self,filen=None,fp=None,column_names=None,skip_first_line=False,
+                 first_line_is_header=False,tab_data_line=TabDataLine,
+                 delimiter='\t',convert=True,lazy=False,schema=None,
+                 infer_schema=False):
+        """Create a new TabFile object
+
+        If either of 'filen' or 'fp' arguments are given then the
+        TabFile object will be populated with data from the specified
+        file or stream. Otherwise an empty TabFile object is created.
+
+        Arguments:
+          filen (optional): name of tab-delimited file to load data
+              from; ignored if fp is also specified
+          fp: (optional) a file-like object which data can be loaded
+              from like a file; used in preference to filen.
+              Note that the calling program must close the stream in
+              these cases.
+          column_names: (optional) list of column names to assign to
+              columns in the file. Overrides column names in the file
+          skip_first_line: (optional) if True then ignore the first
+              line of the input file
+          first_line_is_header: (optional) if True then takes column
+              names from the first line of the file (over-riding
+              'column_names' argument if specified.
+          tab_data_line: (optional) class to use for creating data
+              line objects (defaults to TabDataLine).
+          delimiter: (optional) delimiter character (defaults to tab)
+          convert: (optional) if True then convert input values to
+              the appropriate types (e.g. integer, float etc); if
+              False then convert everything to strings
+          lazy: (optional) if True then values read from the file
+              are stored as strings and only converted when they are
+              first accessed
+          schema: (optional) list or dictionary specifying types
+              or conversion functions for columns (see
+              'make_converters'), which are used instead of the
+              default conversion
+          infer_schema: (optional) if True then infer the column
+              types from the first SCHEMA_SAMPLE_SIZE lines of data
+              in the file (any explicit 'schema' takes precedence)
+        """
+        # Initialise
+        self.__filen = filen
+        self.__ncols = 0
+        self.__header = []
+        self.__delimiter = delimiter
+        self.__data = []
+        self.__names = _NO_COLUMN_NAMES
+        self.__convert = convert
+        self.__lazy = lazy
+        self.__schema = schema
+        self.__converters = None
+        # Indexes for lookups
+        self.__indexes = {}
+        self.__indexes_stale = False
+        self.__lineno_index = None
+        # Class to use for data lines
+        self.__tabdataline = tab_data_line
+        # Set up column names
+        if column_names is not None:
+            self.__setHeader(column_names)
+        # Read in data
+        if fp is None and filen is not None:
+            # Open named file
+            fp = open(self.__filen,'rU')
+            close_fp = True
+        else:
+            close_fp = False
+        if fp:
+            self.__load(fp,skip_first_line=skip_first_line,
+                        first_line_is_header=first_line_is_header,
+                        infer_schema=infer_schema)
+        elif schema is not None:
+            self.__converters = make_converters(schema,self.__header,
+                                                convert=convert)
+        # Only close the stream if it was opened locally
+        if close_fp: fp.close()
+
+    @staticmethod
+    def iterate(filen=None,fp=None,column_names=None,skip_first_line=False,
+                first_line_is_header=False,tab_data_line=TabDataLine,
+                delimiter='\t',convert=True,lazy=False,schema=None,
+                infer_schema=False):
+        """Iterate over the lines in a file without loading it
+
+        Returns a TabFileIterator which yields a data line object
+        for each line of data in the specified file or stream, in
+        the same form as they would be stored by TabFile, but
+        without loading the whole file into memory, e.g.
+
+        >>> for line in TabFile.iterate('data.txt'):
+        ...   print line[0]
+
+        Arguments are the same as for creating a new TabFile.
+
+        Returns:
+          TabFileIterator object.
+        """
+        return TabFileIterator(filen=filen,fp=fp,column_names=column_names,
+                               skip_first_line=skip_first_line,
+                               first_line_is_header=first_line_is_header,
+                               tab_data_line=tab_data_line,
+                               delimiter=delimiter,convert=convert,
+                               lazy=lazy,schema=schema,
+                               infer_schema=infer_schema)
+
+    def __load(self,fp,skip_first_line=False,first_line_is_header=False,
+               infer_schema=False):
+        """Load data into the object from file
+
+        Lines starting with '#' are ignored (unless the first_line_is_header
+        is set and the first line starts with '#').
 
         If a header is set then lines with fewer data items than header
         items raise an IndexError exception.
@@ -534,37 +1832,51 @@ class TabFile:
               line of the input file
           first_line_is_header: (optional) if True then take column
               names from the first line of the file
+          infer_schema: (optional) if True then infer the column
+              types from the first lines of data
         """
-        line_no = 0
-        for line in fp:
-            line_no += 1
-            if skip_first_line:
-                # Skip first line
-                skip_first_line = False
-                continue
-            elif first_line_is_header and len(self.header()) == 0:
-                # Set up header from first line
-                self.__setHeader(line.strip().strip('#').split(self.__delimiter))
-                first_line_is_header = False
-                continue
-            if line.lstrip().startswith('#'):
-                # Skip commented line
-                continue
-            # Store data
-            data_line = self.__tabdataline(line,column_names=self.header(),lineno=line_no,
-                                           delimiter=self.__delimiter,
-                                           convert=self.__convert)
-            if self.__ncols > 0:
-                if len(data_line) != self.__ncols:
-                    # Inconsistent lines are an error
-                    logging.error("Line %d has wrong number of data items" % line_no)
-                    logging.error("Line: %s" % data_line)
-                    logging.error("Expected %d, got %d" % (self.__ncols,len(data_line)))
-                    raise IndexError, "wrong number of data items in line %d" % line_no
-            else:
-                # Set number of columns
-                self.__ncols = len(data_line)
+        lines = TabFileIterator(fp=fp,column_names=self.header(),
+                                skip_first_line=skip_first_line,
+                                first_line_is_header=first_line_is_header,
+                                tab_data_line=self.__tabdataline,
+                                delimiter=self.__delimiter,
+                                convert=self.__convert,
+                                lazy=self.__lazy,
+                                schema=self.__schema,
+                                infer_schema=infer_schema)
+        if lines.header() != self.header():
+            self.__setHeader(lines.header())
+        self.__names = lines.columnNames()
+        self.__converters = lines.converters()
+        for data_line in lines:
+            self.__data.append(data_line)
+        self.__ncols = lines.nColumns()
+
+    def __line_args(self):
+        """Internal: return extra arguments for creating new data lines
+        """
+        if self.__converters is not None:
+            return { 'converters': self.__converters }
+        return {}
+
+    def _append_rows(self,rows):
+        """Internal: append new data lines made from lists of values
+
+        The values should already have been converted to the
+        appropriate types; they are assigned directly to the new
+        lines without being formatted and re-parsed.
+        """
+        tabdataline = self.__tabdataline
+        names = self.__names
+        delimiter = self.__delimiter
+        convert = self.__convert
+        line_args = self.__line_args()
+        for values in rows:
+            data_line = tabdataline(column_names=names,delimiter=delimiter,
+                                    convert=convert,**line_args)
+            data_line.data = values
             self.__data.append(data_line)
+        self.__invalidate_indexes()
 
     def __setHeader(self,column_names):
         """Set the names for columns of data
@@ -577,6 +1889,7 @@ class TabFile:
             self.__header = []
         for name in column_names:
             self.__header.append(name)
+        self.__names = ColumnNames(self.__header)
         self.__ncols = len(self.__header)
 
     def header(self):
@@ -602,13 +1915,115 @@ class TabFile:
     
     def lookup(self,key,value):
         """Return lines where the key matches the specified value
+
+        'key' can be a single column name or index, or a tuple of
+        column names and/or indices; in the latter case 'value'
+        should be a tuple of the values to match for each column.
+
+        If an index has been created for 'key' (see 'create_index')
+        then it is used to find the matching lines, otherwise each
+        line is checked in turn.
         """
+        key,value = _normalise_lookup_key(key,value)
+        if key in self.__indexes:
+            if self.__indexes_stale:
+                self.__rebuild_indexes()
+            return list(self.__indexes[key].get(value,[]))
         result = []
         for line in self.__data:
-            if line[key] == value:
+            if _lookup_value(line,key) == value:
                 result.append(line)
         return result
 
+    def create_index(self,column):
+        """Create an index for looking up lines by column values
+
+        Creates a hash index for a column (or for a combination of
+        columns) which is then used by 'lookup' for that column,
+        so that looking up values takes constant time rather than
+        requiring a scan of all the lines.
+
+        To create a composite index on multiple columns, supply a
+        tuple of column names and/or indices e.g.
+
+        >>> data.create_index(('chr','start'))
+        >>> data.lookup(('chr','start'),('chr1',1234))
+
+        Indexes are kept up to date when lines are appended,
+        inserted or deleted, and when columns are updated by
+        'transformColumn' or 'computeColumn'. If values in an
+        indexed column are changed directly on the data lines
+        then 'create_index' should be called again to refresh
+        the index.
+
+        Arguments:
+          column: name or index of a column, or a tuple of column
+            names and/or indices
+        """
+        column,_ = _normalise_lookup_key(column,None)
+        index = {}
+        for line in self.__data:
+            index.setdefault(_lookup_value(line,column),[]).append(line)
+        self.__indexes[column] = index
+
+    def __rebuild_indexes(self):
+        """Internal: rebuild all the indexes from the data
+        """
+        for column in self.__indexes.keys():
+            self.create_index(column)
+        self.__indexes_stale = False
+
+    def __invalidate_indexes(self):
+        """Internal: mark the indexes as needing to be rebuilt
+        """
+        self.__indexes_stale = True
+        self.__lineno_index = None
+
+    def __add_to_indexes(self,line):
+        """Internal: add a line appended to the data to the indexes
+
+        Lines which are blank (and so are likely to have their
+        values set later) or which aren't at the end of the data
+        (so that the indexes would no longer be in line order)
+        cause the indexes to be marked as stale instead.
+
+        Arguments:
+          line: data line object being added
+        """
+        if self.__data[-1] is not line:
+            self.__invalidate_indexes()
+            return
+        if self.__lineno_index is not None:
+            self.__lineno_index.setdefault(line.lineno(),len(self.__data)-1)
+        if self.__indexes_stale:
+            return
+        if not line:
+            self.__indexes_stale = True
+            return
+        for column in self.__indexes:
+            self.__indexes[column].setdefault(_lookup_value(line,column),
+                                              []).append(line)
+
+    def __remove_from_indexes(self,line):
+        """Internal: remove a line from the indexes
+
+        If the line can't be found (e.g. because its values have
+        been changed since it was indexed) then the indexes are
+        marked as stale.
+        """
+        self.__lineno_index = None
+        if self.__indexes_stale:
+            return
+        for column in self.__indexes:
+            lines = self.__indexes[column].get(_lookup_value(line,column),[])
+            for i,l in enumerate(lines):
+                if l is line:
+                    del(lines[i])
+                    break
+            else:
+                self.__indexes_stale = True
+                return
+
     def indexByLineNumber(self,n):
         """Return index of a data line given the file line number
 
@@ -618,10 +2033,14 @@ class TabFile:
 
         If no matching line is found then raises an IndexError.
         """
-        for idx in range(len(self.__data)):
-            if self.__data[idx].lineno() == n:
-                return idx
-        raise IndexError,"No line number %d" % n
+        if self.__lineno_index is None:
+            self.__lineno_index = {}
+            for idx,line in enumerate(self.__data):
+                self.__lineno_index.setdefault(line.lineno(),idx)
+        try:
+            return self.__lineno_index[n]
+        except KeyError:
+            raise IndexError,"No line number %d" % n
 
     def append(self,data=None,tabdata=None,tabdataline=None):
         """Create and append a new data line
@@ -647,6 +2066,7 @@ class TabFile:
         """
         if tabdataline:
             self.__data.append(tabdataline)
+            self.__add_to_indexes(tabdataline)
             return tabdataline
         if data:
             line = self.__delimiter.join([str(x) for x in data])
@@ -654,10 +2074,12 @@ class TabFile:
             line = tabdata
         else:
             line = None
-        data_line = self.__tabdataline(line=line,column_names=self.header(),
+        data_line = self.__tabdataline(line=line,column_names=self.__names,
                                        delimiter=self.__delimiter,
-                                       convert=self.__convert)
+                                       convert=self.__convert,
+                                       **self.__line_args())
         self.__data.append(data_line)
+        self.__add_to_indexes(data_line)
         return data_line
 
     def insert(self,i,data=None,tabdata=None,tabdataline=None):
@@ -683,6 +2105,7 @@ class TabFile:
         """
         if tabdataline:
             self.__data.insert(i,tabdataline)
+            self.__add_to_indexes(tabdataline)
             return tabdataline
         if data:
             line = '\t'.join([str(x) for x in data])
@@ -690,8 +2113,10 @@ class TabFile:
             line = tabdata
         else:
             line = None
-        data_line = self.__tabdataline(line=line,column_names=self.header())
+        data_line = self.__tabdataline(line=line,column_names=self.__names,
+                                       **self.__line_args())
         self.__data.insert(i,data_line)
+        self.__add_to_indexes(data_line)
         return data_line
 
     def appendColumn(self,name):
@@ -703,6 +2128,7 @@ class TabFile:
         for data in self.__data:
             data.appendColumn(name,'')
         self.__header.append(name)
+        self.__names = self.__names.extended(name)
         self.__ncols = len(self.__header)
 
     def reorderColumns(self,new_columns):
@@ -717,8 +2143,15 @@ class TabFile:
         """
         reordered_tabfile = TabFile(column_names=new_columns,
                                     delimiter=self.__delimiter)
-        for data in self.__data:
-            reordered_tabfile.append(data.subset(*new_columns))
+        indices = _key_indices(new_columns,self.__header)
+        if len(indices) == 1:
+            i = indices[0]
+            project = lambda data: [data[i]]
+        else:
+            getter = operator.itemgetter(*indices)
+            project = lambda data: list(getter(data))
+        reordered_tabfile._append_rows([project(line.data)
+                                        for line in self.__data])
         return reordered_tabfile
 
     def transpose(self):
@@ -727,16 +2160,13 @@ class TabFile:
         Returns:
           New TabFile object
         """
-        transposed_tabfile = TabFile(delimiter=self.__delimiter)
-        first_column = True
-        for data in self.__data:
-            transposed_tabfile.appendColumn(None)
-            for i in range(len(data)):
-                try:
-                    transposed_tabfile[i][-1] = data[i]
-                except IndexError:
-                    transposed_tabfile.append()
-                    transposed_tabfile[i][-1] = data[i]
+        # Each line becomes an (unnamed) column
+        transposed_tabfile = TabFile(column_names=[None]*len(self.__data),
+                                     delimiter=self.__delimiter)
+        rows = [line.data for line in self.__data]
+        transposed_tabfile._append_rows(
+            [list(values) for values in itertools.izip_longest(*rows,
+                                                               fillvalue='')])
         return transposed_tabfile
 
     def transformColumn(self,column_name,transform_func):
@@ -753,6 +2183,7 @@ class TabFile:
         """
         for line in self:
             line[column_name] = transform_func(line[column_name])
+        self.__invalidate_indexes()
 
     def computeColumn(self,column_name,compute_func):
         """Compute and store values in a new column
@@ -776,8 +2207,94 @@ class TabFile:
                 self.appendColumn(column_name)
         for line in self:
             line[column_name] = compute_func(line)
+        self.__invalidate_indexes()
 
-    def sort(self,sort_func,reverse=False):
+    def column(self,key):
+        """Return the values from a column
+
+        If all the values are integers, or all are floats, then
+        they are returned as a NumPy array if NumPy is available
+        (or as an 'array' object if not); otherwise they are
+        returned as a list.
+
+        The returned values are a copy of the column data.
+
+        Arguments:
+          key: column name or integer index
+        """
+        return _column_array([line[key] for line in self.__data])
+
+    def transformColumnArray(self,column_name,transform_func):
+        """Apply a vectorised function to a column
+
+        Vectorised version of 'transformColumn': the function is
+        invoked once with all the values in the column (see the
+        'column' method) and should return a sequence (for example
+        a NumPy array) of the same length with the new values, e.g.
+
+        >>> data.transformColumnArray('data',numpy.log2)
+
+        The new values are stored without further type conversion.
+
+        Arguments:
+          column_name: name or index of column to transform
+          transform_func: callable object that will be invoked
+            with the column values to perform the transformation
+        """
+        values = _array_values(transform_func(self.column(column_name)),
+                               len(self.__data))
+        self.__store_column(column_name,values)
+
+    def computeColumnArray(self,column_name,compute_func,columns=()):
+        """Compute and store values in a column using a vectorised function
+
+        Vectorised version of 'computeColumn': the function is
+        invoked once, with the values from each of the columns
+        listed in 'columns' as arguments (see the 'column' method),
+        and should return a sequence (for example a NumPy array)
+        with the value for each line, e.g.
+
+        >>> data.computeColumnArray('log2FC',
+        ...                         lambda x,y: numpy.log2(x/y),
+        ...                         ('treat','control'))
+
+        The new values are stored without further type conversion.
+
+        Arguments:
+          column_name: name or index of column to write the results
+            to (a new column is created if there is no column with
+            this name)
+          compute_func: callable object that will be invoked to
+            perform the computation
+          columns: (optional) list of names or indices of the
+            columns to pass to 'compute_func'
+        """
+        result = compute_func(*[self.column(c) for c in columns])
+        values = _array_values(result,len(self.__data))
+        if column_name not in self.header():
+            try:
+                # Check to see if it's actually an integer index
+                column_name = int(column_name)
+            except ValueError:
+                # Neither existing column name nor integer index
+                self.appendColumn(column_name)
+        self.__store_column(column_name,values)
+
+    def __store_column(self,column_name,values):
+        """Internal: store a list of values in a column
+
+        The values are assigned directly, without type conversion
+        (unless the TabFile was created with 'convert' set to False,
+        in which case they are converted to strings).
+        """
+        i = _key_indices(column_name,self.__header)[0]
+        if not self.__convert:
+            values = map(str,values)
+        for line,value in itertools.izip(self.__data,values):
+            line.data[i] = value
+        self.__invalidate_indexes()
+
+    def sort(self,sort_func,reverse=False,buffer_size=None,tmp_dir=None):
         """Sort data using arbitrary function
 
         Performs an in-place sort based on the suppled sort_func.
@@ -796,8 +2313,94 @@ class TabFile:
             input and returning a single numerical value
           reverse: (optional) Boolean, either False (default) to sort
             in ascending order, or True to sort in descending order
+          buffer_size: (optional) if set then sort using an external
+            merge sort (see 'sort_lines'), holding at most this many
+            lines in memory at a time while sorting, rather than
+            making a sorted copy of all the data
+          tmp_dir: (optional) directory to write temporary files to
+            for external sorting
+
+        Note that when an external sort is performed the data lines
+        are replaced by copies of the original lines.
+        """
+        if buffer_size is None or len(self.__data) <= buffer_size:
+            self.__data = sorted(self.__data,key=sort_func,reverse=reverse)
+        else:
+            # Hand the lines over to the external sort one at a
+            # time, so the originals can be released once spilled
+            data = self.__data
+            data.reverse()
+            self.__data = []
+            def drain():
+                while data:
+                    yield data.pop()
+            for line in sort_lines(drain(),sort_func,reverse=reverse,
+                                   buffer_size=buffer_size,
+                                   tmp_dir=tmp_dir):
+                self.__data.append(line)
+        self.__invalidate_indexes()
+
+    def join(self,other,on,how='inner',other_on=None,suffix='_2'):
+        """Join with another set of data on matching key values
+
+        Performs a hash join (see 'join_lines') between the lines
+        in this TabFile (the left-hand side) and those in 'other'
+        (the right-hand side), for example:
+
+        >>> genes = TabFile('genes.txt',first_line_is_header=True)
+        >>> exprs = TabFile('exprs.txt',first_line_is_header=True)
+        >>> joined = genes.join(exprs,on='gene_id',how='left')
+
+        The resulting TabFile has the columns from this TabFile
+        followed by the columns from 'other' (apart from the key
+        columns); names already in use have 'suffix' appended.
+
+        Arguments:
+          other: TabFile, ColumnTabFile or TabFileIterator to join
+            with
+          on: column name or index (or tuple of names and/or
+            indices) to join on
+          how: (optional) type of join: 'inner' (the default),
+            'left', 'right' or 'outer'
+          other_on: (optional) key column(s) in 'other', if
+            different from 'on'
+          suffix: (optional) suffix to append to clashing column
+            names from 'other' (defaults to '_2')
+
+        Returns:
+          New TabFile object
+        """
+        if other_on is None:
+            other_on = on
+        names = join_column_names(self.header(),other.header(),other_on,
+                                  suffix=suffix)
+        joined_tabfile = TabFile(column_names=names,
+                                 delimiter=self.__delimiter)
+        for data in join_lines(self.__data,other,on,how=how,
+                               right_on=other_on,
+                               left_header=self.header(),
+                               right_header=other.header()):
+            joined_tabfile.append(data=data)
+        return joined_tabfile
+
+    def groupby(self,column):
+        """Group the data lines on the values in a column
+
+        For example to count the number of lines and get the mean
+        score for each chromosome:
+
+        >>> data.groupby('chr').aggregate(('start','count'),
+        ...                               ('score','mean'))
+
+        Arguments:
+          column: column name or index (or tuple of names and/or
+            indices) to group on
+
+        Returns:
+          GroupBy object.
         """
-        self.__data = sorted(self.__data,key=sort_func,reverse=reverse)
+        return GroupBy(self.__data,column,header=self.header(),
+                       delimiter=self.__delimiter)
 
     def write(self,filen=None,fp=None,include_header=False,no_hash=False,
               delimiter=None):
@@ -837,15 +2440,25 @@ class TabFile:
             else:
                 delim = str(delimiter)
             fp.write("%s%s\n" % (leading_hash,delim.join(self.header())))
-        # Update line delimiters for output if necessary
-        if delimiter is not None and delimiter != self.__delimiter:
-            for data in self.__data: data.delimiter(delimiter)
-        # Write the data
-        for data in self.__data:
-            fp.write("%s\n" % data)
-        # Reset line delimiters        
-        if delimiter is not None and delimiter != self.__delimiter:
-            for data in self.__data: data.delimiter(self.__delimiter)
+        if delimiter is None:
+            delimiter = self.__delimiter
+        else:
+            delimiter = str(delimiter)
+        # Write the data in batches of formatted lines
+        data = self.__data
+        for i in xrange(0,len(data),WRITE_BUFFER_SIZE):
+            lines = []
+            for line in data[i:i+WRITE_BUFFER_SIZE]:
+                if type(line) is TabDataLine:
+                    lines.append(delimiter.join(map(str,line.data)))
+                else:
+                    # Let other data line classes format themselves
+                    line_delimiter = line.delimiter()
+                    line.delimiter(delimiter)
+                    lines.append(str(line))
+                    line.delimiter(line_delimiter)
+            lines.append('')
+            fp.write('\n'.join(lines))
         # Only close the stream if it was opened locally
         if close_fp: fp.close()
 
@@ -853,6 +2466,11 @@ class TabFile:
         return self.__data[key]
 
     def __delitem__(self,key):
+        lines = self.__data[key]
+        if not isinstance(key,slice):
+            lines = [lines]
+        for line in lines:
+            self.__remove_from_indexes(line)
         del(self.__data[key])
 
     def __len__(self):
@@ -860,3 +2478,791 @@ class TabFile:
 
     def __repr__(self):
         return '\n'.join([str(x) for x in self.__data])
+
+# Array typecodes for storing integer and float columns
+_ARRAY_TYPECODES = { int: 'l', float: 'd' }
+_ARRAY_TYPES = { 'l': int, 'd': float }
+
+# Number of lines to buffer when loading a ColumnTabFile
+LOAD_CHUNK_SIZE = 10000
+
+def _typed_column(values):
+    """Internal: store a list of column values as compactly as possible
+
+    If all the values are integers, or all are floats, then
+    they are returned as a typed array; otherwise the list is
+    returned unchanged.
+    """
+    if not values:
+        return values
+    t = type(values[0])
+    if t not in _ARRAY_TYPECODES:
+        return values
+    for value in values:
+        if type(value) is not t:
+            return values
+    return array.array(_ARRAY_TYPECODES[t],values)
+
+def _column_array(values):
+    """Internal: return a list of column values as an array
+
+    If all the values are integers, or all are floats, then
+    they are returned as a NumPy array (if NumPy is available)
+    or as an 'array' object; otherwise they are returned as a
+    list.
+    """
+    values = _typed_column(values)
+    if isinstance(values,array.array) and numpy is not None:
+        if not len(values):
+            return numpy.array([],dtype=values.typecode)
+        return numpy.frombuffer(values,dtype=values.typecode)
+    return values
+
+def _array_values(result,n):
+    """Internal: return the values from a vectorised operation
+
+    'result' is the sequence returned from a function supplied to
+    'transformColumnArray' or 'computeColumnArray'; it is returned
+    as a list (converting NumPy values to the equivalent Python
+    types). Raises ValueError if it doesn't have 'n' values.
+    """
+    try:
+        values = result.tolist()
+    except AttributeError:
+        values = list(result)
+    if len(values) != n:
+        raise ValueError, "expected %d values, got %d" % (n,len(values))
+    return values
+
+class ColumnDataLine(object):
+    """Class providing a view of a line of data in a ColumnTabFile
+
+    ColumnDataLine objects don't hold any data themselves; instead
+    they reference a line within a ColumnTabFile, and provide
+    TabDataLine-like access to the values in that line, e.g.
+
+        line = data[0]
+        value = line['start']
+        line['end'] = value + 100
+
+    Views remain attached to the same line when lines are added,
+    removed or sorted within the parent ColumnTabFile.
+    """
+    __slots__ = ('_tabfile','_row')
+
+    def __init__(self,tabfile,row):
+        """Create a new ColumnDataLine
+
+        Arguments:
+          tabfile: parent ColumnTabFile object
+          row: internal row identifier of the line within the
+            parent
+        """
+        self._tabfile = tabfile
+        self._row = row
+
+    @property
+    def names(self):
+        """Column names (shared with the parent)
+        """
+        return self._tabfile._names
+
+    @property
+    def data(self):
+        """List of the data values in the line
+        """
+        row = self._row
+        return [col[row] for col in self._tabfile._columns]
+
+    def __getitem__(self,key):
+        """Implement value = ColumnDataLine[key]
+
+        'key' can be the name of a column or an integer index
+        (starting from zero). Column names are checked first.
+        """
+        return self._tabfile._columns[self._tabfile._column_index(key)][self._row]
+
+    def __setitem__(self,key,value):
+        """Implement ColumnDataLine[key] = value
+
+        'key' can be the name of a column or an integer index
+        (starting from zero). Column names are checked first.
+        """
+        tabfile = self._tabfile
+        tabfile._store(tabfile._column_index(key),self._row,
+                       tabfile._convert(value))
+
+    def __len__(self):
+        return len(self._tabfile._columns)
+
+    def __nonzero__(self):
+        for item in self.data:
+            if str(item).strip(): return True
+        return False
+
+    def __eq__(self,other):
+        return (isinstance(other,ColumnDataLine) and
+                self._tabfile is other._tabfile and
+                self._row == other._row)
+
+    def __ne__(self,other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self._tabfile),self._row))
+
+    def subset(self,*keys):
+        """Return a subset of data items
+
+        Returns a new TabDataLine instance with the values from
+        the specified columns (see TabDataLine.subset).
+
+        Arguments:
+          keys: one or more keys specifying columns to include in
+            the subset.
+        """
+        subset = TabDataLine()
+        for key in keys:
+            subset.appendColumn(key,self[key])
+        return subset
+
+    def delimiter(self):
+        """Return the delimiter for the line
+
+        The delimiter is shared by all lines in the parent
+        ColumnTabFile.
+        """
+        return self._tabfile._delimiter
+
+    def lineno(self):
+        """Return the line number associated with the line
+        """
+        lineno = self._tabfile._linenos[self._row]
+        if lineno < 0:
+            return None
+        return lineno
+
+    def __repr__(self):
+        return self._tabfile._delimiter.join([str(x) for x in self.data])
+
+class ColumnTabFile:
+    """Class to get data from a tab-delimited file using column storage
+
+    Provides the same interface as the TabFile class, but stores the
+    data as a set of columns rather than as a list of data line
+    objects. Columns which contain only integers or only floats are
+    held as typed arrays, so numeric tables take a fraction of the
+    memory that a TabFile would need.
+
+    Indexing and iterating return ColumnDataLine objects, which are
+    views onto lines within the ColumnTabFile.
+
+    Example usage:
+
+        data = ColumnTabFile(myfile,first_line_is_header=True)
+
+        for line in data:
+            ...                    # loop over lines of data
+
+        starts = data.column('start') # fetch all values in a column
+
+    Note that space used by deleted lines is not reclaimed.
+    """
+    def __init__(self,filen=None,fp=None,column_names=None,
+                 skip_first_line=False,first_line_is_header=False,
+                 delimiter='\t',convert=True):
+        """Create a new ColumnTabFile object
+
+        The arguments are the same as for TabFile, except that
+        there is no 'tab_data_line' argument.
+
+        Arguments:
+          filen (optional): name of tab-delimited file to load data
+              from; ignored if fp is also specified
+          fp: (optional) a file-like object which data can be loaded
+              from like a file; used in preference to filen.
+          column_names: (optional) list of column names to assign to
+              columns in the file. Overrides column names in the file
+          skip_first_line: (optional) if True then ignore the first
+              line of the input file
+          first_line_is_header: (optional) if True then takes column
+              names from the first line of the file
+          delimiter: (optional) delimiter character (defaults to tab)
+          convert: (optional) if True then convert input values to
+              the appropriate types (e.g. integer, float etc); if
+              False then convert everything to strings
+        """
+        # Initialise
+        self._filen = filen
+        self._header = []
+        self._names = _NO_COLUMN_NAMES
+        self._delimiter = delimiter
+        if convert:
+            self._convert = _convert_to_type
+        else:
+            self._convert = str
+        # Column data, line numbers and order of rows
+        self._columns = []
+        self._linenos = array.array('l')
+        self._order = array.array('l')
+        # Set up column names
+        if column_names is not None:
+            self.__setHeader(column_names)
+        # Read in data
+        if fp is None and filen is not None:
+            # Open named file
+            fp = open(self._filen,'rU')
+            close_fp = True
+        else:
+            close_fp = False
+        if fp:
+            self.__load(fp,skip_first_line=skip_first_line,
+                        first_line_is_header=first_line_is_header)
+        # Only close the stream if it was opened locally
+        if close_fp: fp.close()
+
+    def __load(self,fp,skip_first_line=False,first_line_is_header=False):
+        """Load data into the object from file
+
+        Handles comments, headers and inconsistent lines in the
+        same way as TabFile.
+
+        Arguments:
+          fp: file-like object to read data from
+          skip_first_line: (optional) if True then ignore the first
+              line of the input file
+          first_line_is_header: (optional) if True then take column
+              names from the first line of the file
+        """
+        convert = self._convert
+        delimiter = self._delimiter
+        columns = None
+        ncols = len(self._header)
+        linenos = self._linenos
+        line_no = 0
+        for line in fp:
+            line_no += 1
+            if skip_first_line:
+                # Skip first line
+                skip_first_line = False
+                continue
+            elif first_line_is_header and len(self._header) == 0:
+                # Set up header from first line
+                self.__setHeader(line.strip().strip('#').split(delimiter))
+                ncols = len(self._header)
+                first_line_is_header = False
+                continue
+            if line.lstrip().startswith('#'):
+                # Skip commented line
+                continue
+            values = line.rstrip('\n').split(delimiter)
+            if self._header:
+                # Pad to the length of the header
+                while len(values) < ncols:
+                    values.append('')
+            elif ncols == 0:
+                # Set number of columns
+                ncols = len(values)
+            if len(values) != ncols:
+                # Inconsistent lines are an error
+                logging.error("Line %d has wrong number of data items" % line_no)
+                logging.error("Line: %s" % line.rstrip('\n'))
+                logging.error("Expected %d, got %d" % (ncols,len(values)))
+                raise IndexError, "wrong number of data items in line %d" % line_no
+            if columns is None:
+                columns = [[] for i in range(ncols)]
+            # Store data
+            for col,value in zip(columns,values):
+                col.append(convert(value))
+            linenos.append(line_no)
+            if len(columns[0]) == LOAD_CHUNK_SIZE:
+                # Move buffered values into the column store
+                self.__store_chunk(columns)
+        if columns is not None:
+            self.__store_chunk(columns)
+            self._order = array.array('l',xrange(len(linenos)))
+
+    def __store_chunk(self,chunk):
+        """Internal: append buffered column values to the column store
+
+        The lists in 'chunk' are emptied on return.
+
+        Arguments:
+          chunk: list of lists of values for each column
+        """
+        if not self._columns:
+            self._columns = [[] for col in chunk]
+        for i,values in enumerate(chunk):
+            if not values:
+                continue
+            col = self._columns[i]
+            values = _typed_column(values)
+            if isinstance(values,array.array):
+                if not col:
+                    col = self._columns[i] = values
+                elif isinstance(col,array.array) and \
+                     col.typecode == values.typecode:
+                    col.extend(values)
+                else:
+                    # Column type has changed so store as a list
+                    if isinstance(col,array.array):
+                        col = self._columns[i] = col.tolist()
+                    col.extend(values.tolist())
+            else:
+                if isinstance(col,array.array):
+                    col = self._columns[i] = col.tolist()
+                col.extend(values)
+            chunk[i] = []
+
+    def __setHeader(self,column_names):
+        """Set the names for columns of data
+
+        Arguments:
+          column_names: a tuple or list with names for each column in order.
+        """
+        assert(len(self) == 0)
+        self._header = [name for name in column_names]
+        self._columns = [[] for name in self._header]
+        self._names = ColumnNames(self._header)
+
+    def _column_index(self,key):
+        """Internal: return the column index for a name or integer index
+
+        Raises KeyError if 'key' is neither a column name or an
+        integer, and IndexError if it is an out-of-range integer.
+        """
+        try:
+            return self._names.index(key)
+        except ValueError:
+            pass
+        try:
+            i = int(key)
+        except ValueError:
+            # Not an integer
+            raise KeyError, "column '%s' not found" % key
+        ncols = len(self._columns)
+        if i < -ncols or i >= ncols:
+            # Integer but out of range
+            raise IndexError, "integer index out of range for '%s'" % key
+        return i % ncols
+
+    def _store(self,i,row,value):
+        """Internal: store a value in column 'i' for row 'row'
+
+        Typed array columns are converted to lists if the new
+        value doesn't match the type of the array.
+        """
+        col = self._columns[i]
+        if isinstance(col,array.array):
+            if type(value) is _ARRAY_TYPES[col.typecode]:
+                col[row] = value
+                return
+            col = self._columns[i] = list(col)
+        col[row] = value
+
+    def __ordered(self,col,rows=None):
+        """Internal: return the values from a column for a set of rows
+
+        Returns a sequence of the values in 'col' for each of the
+        row identifiers in 'rows' (defaults to all the lines, in
+        order).
+        """
+        if rows is None:
+            rows = self._order
+        if len(rows) == 1:
+            return [col[rows[0]]]
+        elif not rows:
+            return []
+        return operator.itemgetter(*rows)(col)
+
+    def _line(self,row):
+        """Internal: return a ColumnDataLine view for a row
+        """
+        return ColumnDataLine(self,row)
+
+    def _new_row(self,values,lineno=None):
+        """Internal: add a new row of data and return its identifier
+
+        'values' should already have been type-converted. The
+        new row isn't added to the list of lines.
+        """
+        ncols = len(self._columns)
+        if len(values) > ncols:
+            if self._header:
+                raise IndexError, "wrong number of data items (expected %d, got %d)" % \
+                    (ncols,len(values))
+            # No header: extend with new empty columns
+            while len(self._columns) < len(values):
+                self._columns.append(['']*len(self._linenos))
+        row = len(self._linenos)
+        for i,col in enumerate(self._columns):
+            try:
+                value = values[i]
+            except IndexError:
+                value = ''
+            if isinstance(col,array.array):
+                if type(value) is _ARRAY_TYPES[col.typecode]:
+                    col.append(value)
+                    continue
+                col = self._columns[i] = list(col)
+            elif not col and type(value) in _ARRAY_TYPECODES:
+                col = self._columns[i] = _typed_column(col+[value])
+                continue
+            col.append(value)
+        if lineno is None:
+            lineno = -1
+        self._linenos.append(lineno)
+        return row
+
+    def __make_row(self,data=None,tabdata=None,tabdataline=None):
+        """Internal: create a row from one of the supplied arguments
+        """
+        lineno = None
+        if tabdataline:
+            values = [self._convert(x) for x in tabdataline.data]
+            lineno = tabdataline.lineno()
+        elif data:
+            values = [self._convert(x) for x in data]
+        elif tabdata:
+            values = [self._convert(x.rstrip('\n'))
+                      for x in tabdata.split(self._delimiter)]
+        else:
+            values = []
+        return self._new_row(values,lineno=lineno)
+
+    def header(self):
+        """Return list of column names
+
+        If no column names were set then this will be an empty list.
+        """
+        return self._header
+
+    def nColumns(self):
+        """Return the number of columns in the file
+        """
+        return len(self._columns)
+
+    def filename(self):
+        """Return the file name associated with the ColumnTabFile
+        """
+        return self._filen
+
+    def column(self,key):
+        """Return the values from a column in line order
+
+        If NumPy is available then integer and float columns are
+        returned as NumPy arrays; otherwise typed columns are
+        returned as 'array' objects. Other columns are returned
+        as lists.
+
+        The returned values are a copy of the column data.
+
+        Arguments:
+          key: column name or integer index
+        """
+        col = self._columns[self._column_index(key)]
+        order = self._order
+        if isinstance(col,array.array):
+            if numpy is not None:
+                if not len(order):
+                    return numpy.array([],dtype=col.typecode)
+                return numpy.frombuffer(col,dtype=col.typecode)[
+                    numpy.frombuffer(order,dtype=order.typecode)]
+            return array.array(col.typecode,[col[row] for row in order])
+        return [col[row] for row in order]
+
+    def lookup(self,key,value):
+        """Return lines where the key matches the specified value
+
+        'key' can be a single column name or index, or a tuple of
+        column names and/or indices (see TabFile.lookup).
+        """
+        key,value = _normalise_lookup_key(key,value)
+        if isinstance(key,tuple):
+            return [line for line in self if _lookup_value(line,key) == value]
+        col = self._columns[self._column_index(key)]
+        return [self._line(row) for row in self._order if col[row] == value]
+
+    def indexByLineNumber(self,n):
+        """Return index of a data line given the file line number
+
+        If no matching line is found then raises an IndexError.
+        """
+        linenos = self._linenos
+        for idx,row in enumerate(self._order):
+            if linenos[row] == n:
+                return idx
+        raise IndexError,"No line number %d" % n
+
+    def append(self,data=None,tabdata=None,tabdataline=None):
+        """Create and append a new data line
+
+        Arguments are the same as for TabFile.append; note that
+        if 'tabdataline' is given then its values are copied into
+        the ColumnTabFile.
+
+        Returns:
+          ColumnDataLine view of the appended line.
+        """
+        row = self.__make_row(data=data,tabdata=tabdata,
+                              tabdataline=tabdataline)
+        self._order.append(row)
+        return self._line(row)
+
+    def insert(self,i,data=None,tabdata=None,tabdataline=None):
+        """Create and insert a new data line at a specified index
+
+        Arguments are the same as for TabFile.insert.
+
+        Returns:
+          ColumnDataLine view of the inserted line.
+        """
+        row = self.__make_row(data=data,tabdata=tabdata,
+                              tabdataline=tabdataline)
+        self._order.insert(i,row)
+        return self._line(row)
+
+    def appendColumn(self,name):
+        """Append a new (empty) column
+
+        Arguments:
+          name: name for the new column
+        """
+        self._columns.append(['']*len(self._linenos))
+        self._header.append(name)
+        self._names = self._names.extended(name)
+
+    def reorderColumns(self,new_columns):
+        """Rearrange the columns in the file
+
+        Arguments:
+          new_columns: list of column names or indices in the
+            new order
+
+        Returns:
+          New ColumnTabFile object
+        """
+        reordered = ColumnTabFile(column_names=new_columns,
+                                  delimiter=self._delimiter)
+        order = self._order
+        for i,key in enumerate(new_columns):
+            col = self._columns[self._column_index(key)]
+            reordered._columns[i] = _typed_column(list(self.__ordered(col)))
+        reordered._linenos = array.array('l',[self._linenos[row]
+                                              for row in order])
+        reordered._order = array.array('l',xrange(len(order)))
+        return reordered
+
+    def transpose(self):
+        """Transpose the contents of the file
+
+        Returns:
+          New ColumnTabFile object
+        """
+        transposed = ColumnTabFile(delimiter=self._delimiter)
+        # Each line becomes a column
+        columns = [self.__ordered(col) for col in self._columns]
+        transposed._columns = [_typed_column(list(values))
+                               for values in itertools.izip(*columns)]
+        transposed._linenos = array.array('l',[-1]*len(columns))
+        transposed._order = array.array('l',xrange(len(columns)))
+        return transposed
+
+    def transformColumn(self,column_name,transform_func):
+        """Apply arbitrary function to a column
+
+        See TabFile.transformColumn.
+
+        Arguments:
+          column_name: name of column to write transformation result to
+          transform_func: callable object that will be invoked to perform
+            the transformation
+        """
+        i = self._column_index(column_name)
+        for row in self._order:
+            self._store(i,row,
+                        self._convert(transform_func(self._columns[i][row])))
+
+    def computeColumn(self,column_name,compute_func):
+        """Compute and store values in a new column
+
+        See TabFile.computeColumn.
+
+        Arguments:
+          column_name: name or index of column to write transformation
+             result to
+          compute_func: callable object that will be invoked to perform
+            the computation
+        """
+        if column_name not in self._names:
+            try:
+                # Check to see if it's actually an integer index
+                column_name = int(column_name)
+            except ValueError:
+                # Neither existing column name nor integer index
+                self.appendColumn(column_name)
+        i = self._column_index(column_name)
+        for row in self._order:
+            self._store(i,row,self._convert(compute_func(self._line(row))))
+
+    def transformColumnArray(self,column_name,transform_func):
+        """Apply a vectorised function to a column
+
+        See TabFile.transformColumnArray.
+
+        Arguments:
+          column_name: name or index of column to transform
+          transform_func: callable object that will be invoked
+            with the column values to perform the transformation
+        """
+        i = self._column_index(column_name)
+        self.__store_column(i,transform_func(self.column(i)))
+
+    def computeColumnArray(self,column_name,compute_func,columns=()):
+        """Compute and store values in a column using a vectorised function
+
+        See TabFile.computeColumnArray.
+
+        Arguments:
+          column_name: name or index of column to write the results
+            to (a new column is created if there is no column with
+            this name)
+          compute_func: callable object that will be invoked to
+            perform the computation
+          columns: (optional) list of names or indices of the
+            columns to pass to 'compute_func'
+        """
+        result = compute_func(*[self.column(c) for c in columns])
+        values = _array_values(result,len(self._order))
+        if column_name not in self._names:
+            try:
+                # Check to see if it's actually an integer index
+                column_name = int(column_name)
+            except ValueError:
+                # Neither existing column name nor integer index
+                self.appendColumn(column_name)
+        self.__store_column(self._column_index(column_name),values)
+
+    def __store_column(self,i,values):
+        """Internal: store the values for each line in column 'i'
+
+        'values' is a sequence (e.g. a NumPy array) with a value
+        for each line, in line order.
+        """
+        values = _array_values(values,len(self._order))
+        if self._convert is str:
+            values = map(str,values)
+        col = list(self._columns[i])
+        for row,value in itertools.izip(self._order,values):
+            col[row] = value
+        self._columns[i] = _typed_column(col)
+
+    def sort(self,sort_func,reverse=False):
+        """Sort data using arbitrary function
+
+        Performs an in-place sort based on the supplied sort_func,
+        which is invoked with a ColumnDataLine (see TabFile.sort).
+        Only the order of the lines is changed, the column data is
+        not moved.
+
+        Arguments:
+          sort_func: function object taking a data line object as
+            input and returning a single numerical value
+          reverse: (optional) Boolean, either False (default) to sort
+            in ascending order, or True to sort in descending order
+        """
+        line = self._line
+        self._order = array.array('l',
+                                  sorted(self._order,
+                                         key=lambda row: sort_func(line(row)),
+                                         reverse=reverse))
+
+    def join(self,other,on,how='inner',other_on=None,suffix='_2'):
+        """Join with another set of data on matching key values
+
+        Arguments are the same as for TabFile.join.
+
+        Returns:
+          New ColumnTabFile object
+        """
+        if other_on is None:
+            other_on = on
+        names = join_column_names(self._header,other.header(),other_on,
+                                  suffix=suffix)
+        joined_tabfile = ColumnTabFile(column_names=names,
+                                       delimiter=self._delimiter)
+        for data in join_lines(self,other,on,how=how,right_on=other_on,
+                               left_header=self._header,
+                               right_header=other.header()):
+            joined_tabfile.append(data=data)
+        return joined_tabfile
+
+    def groupby(self,column):
+        """Group the data lines on the values in a column
+
+        Arguments are the same as for TabFile.groupby; the
+        'aggregate' method of the returned GroupBy object
+        returns a ColumnTabFile.
+
+        Returns:
+          GroupBy object.
+        """
+        return GroupBy(self,column,header=self._header,
+                       delimiter=self._delimiter,
+                       tabfile_class=ColumnTabFile)
+
+    def write(self,filen=None,fp=None,include_header=False,no_hash=False,
+              delimiter=None):
+        """Write the ColumnTabFile data to an output file
+
+        Arguments are the same as for TabFile.write.
+        """
+        if fp is None and filen is not None:
+            # Open named file for writing
+            fp = open(filen,'w')
+            close_fp = True
+        else:
+            close_fp = False
+        if delimiter is None:
+            delim = self._delimiter
+        else:
+            delim = str(delimiter)
+        if include_header:
+            if not no_hash:
+                leading_hash = '#'
+            else:
+                leading_hash = ''
+            fp.write("%s%s\n" % (leading_hash,delim.join(self.header())))
+        # Write the data in batches, formatting the values a column
+        # at a time
+        order = self._order
+        for i in xrange(0,len(order),WRITE_BUFFER_SIZE):
+            rows = order[i:i+WRITE_BUFFER_SIZE]
+            columns = [map(str,self.__ordered(col,rows))
+                       for col in self._columns]
+            if columns:
+                lines = map(delim.join,itertools.izip(*columns))
+            else:
+                lines = ['']*len(rows)
+            lines.append('')
+            fp.write('\n'.join(lines))
+        # Only close the stream if it was opened locally
+        if close_fp: fp.close()
+
+    def __getitem__(self,key):
+        if isinstance(key,slice):
+            return [self._line(row) for row in self._order[key]]
+        return self._line(self._order[key])
+
+    def __delitem__(self,key):
+        del(self._order[key])
+
+    def __iter__(self):
+        for row in self._order:
+            yield self._line(row)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __repr__(self):
+        return '\n'.join([str(x) for x in self])
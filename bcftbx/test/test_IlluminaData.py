@@ -753,6 +753,117 @@ class TestCasavaSampleSheet(unittest.TestCase):
         # Check for duplicated names
         self.assertEqual(len(sample_sheet.duplicated_names),0)
 
+class TestSampleSheetBarcodes(unittest.TestCase):
+    def setUp(self):
+        self.hiseq_sample_sheet_content = """[Header]
+IEMFileVersion,4
+Date,06/03/2014
+Workflow,GenerateFASTQ
+Application,HiSeq FASTQ Only
+Assay,Nextera
+Description,
+Chemistry,Amplicon
+
+[Reads]
+101
+101
+
+[Settings]
+ReverseComplement,0
+Adapter,CTGTCTCTTATACACATCT
+
+[Data]
+Lane,Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,I5_Index_ID,index2,Sample_Project,Description
+1,PJB1-1579,PJB1-1579,,,N701,CGATGTAT,N501,TCTTTCCC,PeterBriggs,
+1,PJB2-1580,PJB2-1580,,,N702,TGACCAAT,N502,TCTTTCCC,PeterBriggs,
+1,PJB3-1581,PJB3-1581,,,N703,CGATGTAA,N502,TCTTTCCC,PeterBriggs,
+2,PJB1-1579,PJB1-1579,,,N701,CGATGTAT,N501,TCTTTCCC,PeterBriggs,
+2,PJB2-1580,PJB2-1580,,,N702,CGATGTAT,N502,TCTTTCCC,PeterBriggs,
+3,PJB1-1579,PJB1-1579,,,N701,CGATGTAT,N501,TCTTTCCC,PeterBriggs,
+"""
+        self.miseq_sample_sheet_content = """[Header]
+IEMFileVersion,4
+Date,4/11/2014
+Workflow,Metagenomics
+Application,Metagenomics 16S rRNA
+Assay,Nextera XT
+Description,
+Chemistry,Amplicon
+
+[Reads]
+150
+150
+
+[Settings]
+Adapter,CTGTCTCTTATACACATCT
+
+[Data]
+Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,I5_Index_ID,index2,Sample_Project,Description
+A8,A8,,,N701,TAAGGCGA,S501,TAGATCGC,PJB,
+B8,B8,,,N702,CGTACTAG,S501,TAGATCGC,PJB,
+C8,C8,,,N703,AGGCAGAA,S502,CTCTCTAT,PJB,
+"""
+    def test_samplesheet_barcodes_with_lanes(self):
+        barcodes = SampleSheetBarcodes(sample_sheet=SampleSheet(
+            fp=cStringIO.StringIO(self.hiseq_sample_sheet_content)))
+        self.assertEqual(barcodes.lanes,[1,2,3])
+        self.assertEqual(barcodes.sample_ids(1),
+                         ['PJB1-1579','PJB2-1580','PJB3-1581'])
+        self.assertEqual(barcodes.barcodes(1),
+                         ['CGATGTATTCTTTCCC',
+                          'TGACCAATTCTTTCCC',
+                          'CGATGTAATCTTTCCC'])
+        self.assertEqual([list(r) for r in barcodes.distance_matrix(1)],
+                         [[0,4,1],[4,0,5],[1,5,0]])
+        self.assertEqual(barcodes.min_distance(1),1)
+        self.assertEqual(barcodes.max_mismatches(1),0)
+        self.assertEqual(barcodes.collisions(1),[])
+        self.assertEqual(barcodes.collisions(1,max_distance=1),
+                         [('PJB1-1579','CGATGTATTCTTTCCC',
+                           'PJB3-1581','CGATGTAATCTTTCCC',1)])
+        self.assertEqual(barcodes.min_distance(2),0)
+        self.assertEqual(barcodes.collisions(2),
+                         [('PJB1-1579','CGATGTATTCTTTCCC',
+                           'PJB2-1580','CGATGTATTCTTTCCC',0)])
+        self.assertEqual(barcodes.min_distance(3),None)
+        self.assertEqual(barcodes.max_mismatches(3),None)
+        self.assertEqual(barcodes.collisions(3),[])
+    def test_samplesheet_barcodes_no_lanes(self):
+        barcodes = SampleSheetBarcodes(sample_sheet=SampleSheet(
+            fp=cStringIO.StringIO(self.miseq_sample_sheet_content)))
+        self.assertEqual(barcodes.lanes,[None])
+        self.assertEqual(barcodes.sample_ids(),['A8','B8','C8'])
+        self.assertEqual(barcodes.min_distance(),8)
+        self.assertEqual(barcodes.max_mismatches(),3)
+        self.assertEqual(barcodes.collisions(),[])
+
+class TestBarcodeDistanceMatrix(unittest.TestCase):
+    def _check_distance_matrix(self):
+        self.assertEqual(
+            [list(r) for r in barcode_distance_matrix(['CGATGT',
+                                                       'CGATGT',
+                                                       'TGACCA',
+                                                       'CGTTGA'])],
+            [[0,0,4,2],[0,0,4,2],[4,4,0,4],[2,2,4,0]])
+        # Barcodes of different lengths
+        self.assertEqual(
+            [list(r) for r in barcode_distance_matrix(['CGATGT',
+                                                       'CGAT',
+                                                       'TGACCAAT'])],
+            [[0,0,4],[0,0,2],[4,2,0]])
+        # Empty list
+        self.assertEqual(len(barcode_distance_matrix([])),0)
+    def test_barcode_distance_matrix(self):
+        self._check_distance_matrix()
+    def test_barcode_distance_matrix_no_numpy(self):
+        import bcftbx.IlluminaData
+        numpy = bcftbx.IlluminaData.numpy
+        try:
+            bcftbx.IlluminaData.numpy = None
+            self._check_distance_matrix()
+        finally:
+            bcftbx.IlluminaData.numpy = numpy
+
 class TestIlluminaFastq(unittest.TestCase):
 
     def test_illumina_fastq(self):
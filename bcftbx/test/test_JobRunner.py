@@ -2,11 +2,14 @@
 # Tests for JobRunner.py module
 #######################################################################
 from bcftbx.JobRunner import *
+import bcftbx.JobRunner
 import bcftbx.utils
 import unittest
 import tempfile
 import time
 import shutil
+import subprocess
+import cStringIO
 
 class TestSimpleJobRunner(unittest.TestCase):
 
@@ -96,6 +99,38 @@ class TestSimpleJobRunner(unittest.TestCase):
         self.assertFalse(runner.isRunning(jobid))
         self.assertNotEqual(runner.exit_status(jobid),0)
 
+    def test_simple_job_runner_terminate_finished_job(self):
+        """Test SimpleJobRunner can 'terminate' a job which has finished
+
+        """
+        runner = SimpleJobRunner()
+        jobid = self.run_job(runner,'test',self.working_dir,'sleep',('0.3',))
+        # Wait for job to finish without checking on it
+        time.sleep(0.8)
+        self.assertTrue(runner.terminate(jobid))
+        self.assertFalse(runner.isRunning(jobid))
+        self.assertEqual(runner.exit_status(jobid),0)
+
+    def test_simple_job_runner_wait_for_completion(self):
+        """Test SimpleJobRunner reports jobs as they complete
+        """
+        # Create a runner and execute commands which finish at
+        # different times
+        runner = SimpleJobRunner()
+        jobid_slow = self.run_job(runner,'test_slow',self.working_dir,
+                                  'sleep',('1',))
+        jobid_fast = self.run_job(runner,'test_fast',self.working_dir,
+                                  'echo',('this is a test',))
+        # Check completed jobs are reported in order
+        self.assertEqual(runner.wait_for_completion(10),jobid_fast)
+        self.assertFalse(runner.isRunning(jobid_fast))
+        self.assertTrue(runner.isRunning(jobid_slow))
+        self.assertEqual(runner.wait_for_completion(10),jobid_slow)
+        self.assertEqual(runner.list(),[])
+        self.assertEqual(runner.exit_status(jobid_slow),0)
+        # No more jobs to complete
+        self.assertEqual(runner.wait_for_completion(0.01),None)
+
     def test_simple_job_runner_join_logs(self):
         """Test SimpleJobRunner joining stderr to stdout
 
@@ -249,6 +284,71 @@ class TestGEJobRunner(unittest.TestCase):
         self.assertEqual(runner.exit_status(jobid_ok),0)
         self.assertEqual(runner.exit_status(jobid_error),1)
 
+    def test_ge_job_runner_poll_exit_status(self):
+        """Test GEJobRunner returns exit status without waiting
+        """
+        # Create a runner and execute commands with known exit codes
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobid_ok = self.run_job(runner,'test_ok',self.working_dir,
+                                       '/bin/bash',('-c','\'exit 0\'',))
+        jobid_error = self.run_job(runner,'test_error',self.working_dir,
+                                   '/bin/bash',('-c','\'exit 1\'',))
+        self.wait_for_jobs(runner,jobid_ok,jobid_error)
+        # Poll until exit codes are available
+        exit_status = {}
+        ntries = 0
+        while len(exit_status) < 2 and ntries < 100:
+            for jobid in (jobid_ok,jobid_error):
+                status = runner.poll_exit_status(jobid)
+                if status is not None:
+                    exit_status[jobid] = status
+            time.sleep(0.5)
+            ntries += 1
+        self.assertEqual(exit_status[jobid_ok],0)
+        self.assertEqual(exit_status[jobid_error],1)
+
+    def test_ge_job_runner_array_job(self):
+        """Test GEJobRunner runs an array job and reports on each task
+        """
+        # Create a runner and submit commands with known exit codes
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        try:
+            task_ids = runner.run_array('test_array',self.working_dir,
+                                        '/bin/bash',
+                                        (('-c','\'exit 0\''),
+                                         ('-c','\'exit 1\''),
+                                         ('-c','\'exit 0\'')))
+        except OSError:
+            self.fail("Unable to run GE array job")
+        self.assertEqual(len(task_ids),3)
+        self.wait_for_jobs(runner,*task_ids)
+        # Check exit codes and log files for each task
+        self.assertEqual(runner.exit_status(task_ids[0]),0)
+        self.assertEqual(runner.exit_status(task_ids[1]),1)
+        self.assertEqual(runner.exit_status(task_ids[2]),0)
+        for task_id in task_ids:
+            self.assertTrue(os.path.exists(runner.logFile(task_id)))
+
+    def test_ge_job_runner_wait_for(self):
+        """Test GEJobRunner holds a job until another job has finished
+        """
+        # Second job fails unless the first has already finished
+        flag_file = os.path.join(self.working_dir,'flag')
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobid1 = self.run_job(runner,'test_first',self.working_dir,
+                              '/bin/bash',('-c','\'sleep 5; touch %s\'' %
+                                           flag_file,))
+        try:
+            jobid2 = runner.run('test_second',self.working_dir,
+                                '/bin/bash',('-c','\'test -e %s\'' %
+                                             flag_file,),
+                                wait_for=[jobid1])
+        except OSError:
+            self.fail("Unable to run GE job")
+        self.assertTrue(runner.isRunning(jobid2))
+        self.wait_for_jobs(runner,jobid1,jobid2)
+        self.assertEqual(runner.exit_status(jobid2),0)
+
     def test_ge_job_runner_termination(self):
         """Test GEJobRunner can terminate a running job
 
@@ -268,6 +368,21 @@ class TestGEJobRunner(unittest.TestCase):
         self.assertFalse(runner.isRunning(jobid))
         self.assertNotEqual(runner.exit_status(jobid),0)
 
+    def test_ge_job_runner_cached_qstat(self):
+        """Test GEJobRunner refreshes cached qstat after submission and deletion
+
+        """
+        # Create a runner which caches qstat output for a long time
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             qstat_interval=3600)
+        jobid = self.run_job(runner,'test',self.working_dir,'sleep',('60s',))
+        # New job should be visible despite caching
+        self.assertTrue(runner.isRunning(jobid))
+        self.assertTrue(jobid in runner.list())
+        # Terminated job should also be updated
+        runner.terminate(jobid)
+        self.assertFalse(runner.isRunning(jobid))
+
     def test_ge_job_runner_join_logs(self):
         """Test GEJobRunner with '-j y' option (i.e. join stderr and stdout)
 
@@ -341,6 +456,459 @@ class TestGEJobRunner(unittest.TestCase):
         self.assertEqual(os.path.dirname(runner.logFile(jobid3)),self.log_dir)
         self.assertEqual(os.path.dirname(runner.errFile(jobid3)),self.log_dir)
 
+class MockPopen(object):
+    """Stand-in for subprocess.Popen returning canned output
+    """
+    def __init__(self,returncode,stdout,stderr):
+        self.returncode = returncode
+        self.stdout = cStringIO.StringIO(stdout)
+        self.stderr = cStringIO.StringIO(stderr)
+
+    def communicate(self):
+        return (self.stdout.read(),self.stderr.read())
+
+    def wait(self):
+        return self.returncode
+
+class MockQacct(object):
+    """Stand-in for the subprocess module which fakes 'qacct'
+
+    'qacct -b ... -j' (i.e. for all recent jobs) returns the output
+    in 'all_jobs' (or fails if this is None), and 'qacct -j JOB_ID'
+    returns the output in the 'jobs' dictionary for that job (or
+    fails if the job isn't present). The commands are recorded in
+    the 'commands' list.
+    """
+    PIPE = subprocess.PIPE
+
+    def __init__(self,all_jobs=None,jobs=None):
+        self.all_jobs = all_jobs
+        self.jobs = jobs or {}
+        self.commands = []
+
+    def Popen(self,cmd,stdout=None,stderr=None):
+        self.commands.append(cmd)
+        if '-b' in cmd:
+            if self.all_jobs is None:
+                return MockPopen(1,"","error: unable to read accounting\n")
+            return MockPopen(0,self.all_jobs,"")
+        job_id = cmd[cmd.index('-j')+1]
+        if job_id in self.jobs:
+            return MockPopen(0,self.jobs[job_id],"")
+        return MockPopen(1,"","error: job id %s not found\n" % job_id)
+
+def qacct_record(jobnumber,exit_status,taskid='undefined'):
+    """Return fake 'qacct -j' output for a single job
+    """
+    return "%s\nqname        serial.q\njobnumber    %s\ntaskid       %s\n" \
+        "exit_status  %s\n" % ('='*62,jobnumber,taskid,exit_status)
+
+class TestGEJobRunnerExitStatuses(unittest.TestCase):
+    """Tests for fetching exit statuses in GEJobRunner using mock 'qacct'
+    """
+
+    def setUp(self):
+        self.subprocess = bcftbx.JobRunner.subprocess
+
+    def tearDown(self):
+        bcftbx.JobRunner.subprocess = self.subprocess
+
+    def mock_qacct(self,all_jobs=None,jobs=None):
+        qacct = MockQacct(all_jobs=all_jobs,jobs=jobs)
+        bcftbx.JobRunner.subprocess = qacct
+        return qacct
+
+    def make_runner(self,pending,poll_interval=60.0,timeout=30.0):
+        runner = GEJobRunner(poll_interval=poll_interval,timeout=timeout)
+        now = time.time()
+        for job_id in pending:
+            runner._GEJobRunner__submit_times[job_id] = now
+            runner._GEJobRunner__qacct_pending[job_id] = now
+        return runner
+
+    def update_exit_statuses(self,runner,force=False):
+        runner._GEJobRunner__update_exit_statuses(force=force)
+
+    def test_update_exit_statuses_single_qacct(self):
+        """GEJobRunner fetches exit statuses for all pending jobs together
+        """
+        qacct = self.mock_qacct(all_jobs=qacct_record('99',0) +
+                                qacct_record('101',0) +
+                                qacct_record('102',1))
+        runner = self.make_runner(('101','102'))
+        self.update_exit_statuses(runner,force=True)
+        self.assertEqual(len(qacct.commands),1)
+        self.assertTrue('-b' in qacct.commands[0])
+        self.assertTrue(runner.has_exit_status('101'))
+        self.assertEqual(runner.poll_exit_status('101'),0)
+        self.assertEqual(runner.poll_exit_status('102'),1)
+        self.assertFalse(runner.has_exit_status('99'))
+
+    def test_update_exit_statuses_array_tasks(self):
+        """GEJobRunner fetches exit statuses for tasks in array jobs
+        """
+        self.mock_qacct(all_jobs=qacct_record('200',0,taskid='1') +
+                        qacct_record('200',1,taskid='2'))
+        runner = self.make_runner(('200.1','200.2'))
+        runner._GEJobRunner__arrays['200'] = 2
+        self.update_exit_statuses(runner,force=True)
+        self.assertEqual(runner.poll_exit_status('200.1'),0)
+        self.assertEqual(runner.poll_exit_status('200.2'),1)
+
+    def test_update_exit_statuses_polling_interval(self):
+        """GEJobRunner only runs qacct once per polling interval
+        """
+        qacct = self.mock_qacct(all_jobs="")
+        runner = self.make_runner(('101',))
+        self.update_exit_statuses(runner)
+        self.assertEqual(len(qacct.commands),1)
+        self.update_exit_statuses(runner)
+        self.assertEqual(len(qacct.commands),1)
+        self.assertFalse(runner.has_exit_status('101'))
+        self.update_exit_statuses(runner,force=True)
+        self.assertEqual(len(qacct.commands),2)
+        self.assertFalse(runner.has_exit_status('101'))
+
+    def test_update_exit_statuses_fallback_to_single_jobs(self):
+        """GEJobRunner runs qacct for each job if it fails for all jobs
+        """
+        qacct = self.mock_qacct(all_jobs=None,
+                                jobs={ '101': qacct_record('101',2) })
+        runner = self.make_runner(('101','102'))
+        self.update_exit_statuses(runner,force=True)
+        self.assertEqual(len(qacct.commands),3)
+        self.assertTrue('-b' in qacct.commands[0])
+        self.assertEqual(sorted([cmd[-1] for cmd in qacct.commands[1:]]),
+                         ['101','102'])
+        self.assertTrue(runner.has_exit_status('101'))
+        self.assertEqual(runner.poll_exit_status('101'),2)
+        self.assertFalse(runner.has_exit_status('102'))
+
+    def test_update_exit_statuses_timeout(self):
+        """GEJobRunner gives up on exit statuses after the timeout
+        """
+        self.mock_qacct(all_jobs=qacct_record('101',0))
+        runner = self.make_runner(('101','102'),timeout=5.0)
+        runner._GEJobRunner__qacct_pending['102'] = time.time() - 10.0
+        self.update_exit_statuses(runner,force=True)
+        self.assertEqual(runner.poll_exit_status('101'),0)
+        self.assertTrue(runner.has_exit_status('102'))
+        self.assertEqual(runner.poll_exit_status('102'),None)
+        self.assertEqual(runner.exit_status('102'),None)
+
+class MockGridEngine(object):
+    """Stand-in for the subprocess module which fakes Grid Engine
+
+    'qsub' assigns successive job ids starting from 'job_id' (or
+    fails if 'qsub_fails' is True), 'qstat' returns the lines in
+    the 'qstat_lines' list (see 'qstat_line'), 'qdel' always
+    succeeds and 'qacct' always fails. The commands are recorded
+    in the 'commands' list.
+    """
+    PIPE = subprocess.PIPE
+
+    def __init__(self,job_id=12345,qsub_fails=False):
+        self.job_id = job_id
+        self.qsub_fails = qsub_fails
+        self.qstat_lines = []
+        self.commands = []
+
+    def Popen(self,cmd,cwd=None,stdout=None,stderr=None):
+        self.commands.append(cmd)
+        if cmd[0] == 'qsub':
+            if self.qsub_fails:
+                return MockPopen(1,"","Unable to run job: denied\n")
+            job_id = self.job_id
+            self.job_id += 1
+            name = cmd[cmd.index('-N')+1]
+            if '-t' in cmd:
+                return MockPopen(0,"Your job-array %s.%s:1 (\"%s\") has "
+                                 "been submitted\n" %
+                                 (job_id,cmd[cmd.index('-t')+1],name),"")
+            return MockPopen(0,"Your job %s (\"%s\") has been "
+                             "submitted\n" % (job_id,name),"")
+        elif cmd[0] == 'qstat':
+            return MockPopen(0,"job-ID  prior   name       user  state "
+                             "submit/start at     queue  slots ja-task-ID\n"
+                             "%s\n%s" % ('-'*72,''.join(self.qstat_lines)),
+                             "")
+        elif cmd[0] == 'qdel':
+            return MockPopen(0,"has deleted job %s\n" % cmd[1],"")
+        return MockPopen(1,"","error: %s not available\n" % cmd[0])
+
+    def count(self,program):
+        """Return the number of times a program was run
+        """
+        return len([cmd for cmd in self.commands if cmd[0] == program])
+
+def qstat_line(job_id,state,task_id=None):
+    """Return fake 'qstat -g d' output for a single job or task
+    """
+    line = "%s 0.50500 test       myname       %s 10/18/2026 10:00:00 " \
+           "all.q@node01 1" % (job_id,state)
+    if task_id is not None:
+        line += " %s" % task_id
+    return line + "\n"
+
+class TestGEJobRunnerCachedQstat(unittest.TestCase):
+    """Tests for caching of 'qstat' output in GEJobRunner
+    """
+
+    def setUp(self):
+        self.subprocess = bcftbx.JobRunner.subprocess
+        self.ge = MockGridEngine()
+        self.ge.qstat_lines = [qstat_line('101','r'),
+                               qstat_line('102','qw')]
+        bcftbx.JobRunner.subprocess = self.ge
+        self.working_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        bcftbx.JobRunner.subprocess = self.subprocess
+        shutil.rmtree(self.working_dir)
+
+    def query(self,runner):
+        runner.list()
+        runner.isRunning('101')
+        runner.errorState('102')
+        runner.queue('101')
+
+    def test_qstat_cached_within_interval(self):
+        """GEJobRunner runs qstat once for queries within the interval
+        """
+        runner = GEJobRunner(qstat_interval=3600)
+        self.query(runner)
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),1)
+        self.assertEqual(sorted(runner.list()),['101','102'])
+
+    def test_qstat_refreshed_after_interval(self):
+        """GEJobRunner runs qstat again once the cached output expires
+        """
+        runner = GEJobRunner(qstat_interval=3600)
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),1)
+        # Age the cached output beyond the interval
+        runner._GEJobRunner__qstat_time -= 3601
+        self.ge.qstat_lines = [qstat_line('102','r')]
+        self.assertFalse(runner.isRunning('101'))
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),2)
+
+    def test_qstat_not_cached_for_zero_interval(self):
+        """GEJobRunner runs qstat for every query if the interval is zero
+        """
+        runner = GEJobRunner(qstat_interval=0)
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),4)
+
+    def test_qstat_refreshed_after_submit_and_qdel(self):
+        """GEJobRunner runs qstat again after submitting or deleting jobs
+        """
+        runner = GEJobRunner(qstat_interval=3600)
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),1)
+        # Submitted job is visible at the next query
+        job_id = runner.run('test',self.working_dir,'/bin/echo',('hello',))
+        self.assertEqual(job_id,'12345')
+        self.ge.qstat_lines.append(qstat_line(job_id,'qw'))
+        self.assertTrue(runner.isRunning(job_id))
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),2)
+        # Deleted job is gone at the next query
+        runner.terminate(job_id)
+        self.ge.qstat_lines.pop()
+        self.assertFalse(runner.isRunning(job_id))
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),3)
+        # Submitting an array also refreshes the output
+        runner.run_array('test',self.working_dir,'/bin/echo',(('hello',),))
+        self.query(runner)
+        self.assertEqual(self.ge.count('qstat'),4)
+
+class TestGEJobRunnerArrayJobs(unittest.TestCase):
+    """Tests for array jobs in GEJobRunner using mock Grid Engine
+    """
+
+    def setUp(self):
+        self.subprocess = bcftbx.JobRunner.subprocess
+        self.ge = MockGridEngine()
+        bcftbx.JobRunner.subprocess = self.ge
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        bcftbx.JobRunner.subprocess = self.subprocess
+        shutil.rmtree(self.log_dir)
+
+    def run_array(self,runner):
+        return runner.run_array('test',self.log_dir,'/bin/echo',
+                                (('hello',),('goodbye','world'),()))
+
+    def array_files(self):
+        # Argument file (.args) is returned before task script (.sh)
+        return sorted([os.path.join(self.log_dir,f)
+                       for f in os.listdir(self.log_dir)],
+                      key=lambda f: os.path.splitext(f)[1])
+
+    def test_run_array_qsub_command(self):
+        """GEJobRunner.run_array submits a single 'qsub -t' job
+        """
+        runner = GEJobRunner(log_dir=self.log_dir)
+        self.run_array(runner)
+        self.assertEqual(self.ge.count('qsub'),1)
+        qsub = self.ge.commands[0]
+        self.assertEqual(qsub[qsub.index('-N')+1],'test')
+        self.assertEqual(qsub[qsub.index('-t')+1],'1-3')
+        args_file,task_script = self.array_files()
+        self.assertEqual(qsub[-1],"/bin/bash %s" % task_script)
+
+    def test_run_array_args_file(self):
+        """GEJobRunner.run_array writes one command per task
+        """
+        runner = GEJobRunner(log_dir=self.log_dir)
+        self.run_array(runner)
+        args_file,task_script = self.array_files()
+        self.assertTrue(args_file.endswith(".args"))
+        self.assertEqual(open(args_file).read(),
+                         "/bin/echo hello\n"
+                         "/bin/echo goodbye world\n"
+                         "/bin/echo\n")
+        self.assertTrue(task_script.endswith(".sh"))
+        self.assertEqual(open(task_script).read(),
+                         "#!/bin/bash\n"
+                         "eval \"$(sed -n \"${SGE_TASK_ID}p\" %s)\"\n" %
+                         args_file)
+
+    def test_run_array_quotes_file_names(self):
+        """GEJobRunner.run_array quotes the argument file name
+        """
+        runner = GEJobRunner()
+        log_dir = os.path.join(self.log_dir,"log dir")
+        os.mkdir(log_dir)
+        runner.run_array('test',log_dir,'/bin/echo',(('hello',),))
+        args_file = [os.path.join(log_dir,f) for f in os.listdir(log_dir)
+                     if f.endswith(".args")][0]
+        task_script = [os.path.join(log_dir,f) for f in os.listdir(log_dir)
+                       if f.endswith(".sh")][0]
+        self.assertTrue(("'%s'" % args_file) in open(task_script).read())
+        self.assertEqual(self.ge.commands[0][-1],
+                         "/bin/bash '%s'" % task_script)
+
+    def test_run_array_task_ids(self):
+        """GEJobRunner.run_array returns ids for each task in the array
+        """
+        runner = GEJobRunner(log_dir=self.log_dir)
+        task_ids = self.run_array(runner)
+        self.assertEqual(task_ids,['12345.1','12345.2','12345.3'])
+        self.assertEqual(runner.name('12345.2'),'test')
+        self.assertEqual(runner.logFile('12345.2'),
+                         os.path.join(self.log_dir,"test.o12345.2"))
+
+    def test_run_array_no_tasks(self):
+        """GEJobRunner.run_array doesn't submit an empty array
+        """
+        runner = GEJobRunner(log_dir=self.log_dir)
+        self.assertEqual(runner.run_array('test',self.log_dir,'/bin/echo',
+                                          ()),[])
+        self.assertEqual(self.ge.commands,[])
+
+    def test_run_array_qsub_fails(self):
+        """GEJobRunner.run_array removes its files if qsub fails
+        """
+        self.ge.qsub_fails = True
+        runner = GEJobRunner(log_dir=self.log_dir)
+        self.assertEqual(self.run_array(runner),None)
+        self.assertEqual(self.array_files(),[])
+
+    def test_qstat_array_tasks(self):
+        """GEJobRunner reports tasks from 'qstat -g d' individually
+        """
+        runner = GEJobRunner(log_dir=self.log_dir,qstat_interval=0)
+        self.run_array(runner)
+        job_id = runner.run('single',self.log_dir,'/bin/echo',('hello',))
+        self.ge.qstat_lines = [qstat_line('12345','r',task_id='1'),
+                               qstat_line('12345','Eqw',task_id='2'),
+                               qstat_line(job_id,'r')]
+        self.assertEqual(sorted(runner.list()),['12345.1','12346'])
+        self.assertTrue('-g' in self.ge.commands[-1])
+        self.assertTrue(runner.isRunning('12345.1'))
+        self.assertFalse(runner.isRunning('12345.2'))
+        self.assertTrue(runner.errorState('12345.2'))
+        self.assertFalse(runner.isRunning('12345.3'))
+        self.assertEqual(runner.queue('12345.1'),'all.q@node01')
+
+    def test_terminate_array_task(self):
+        """GEJobRunner.terminate only deletes a single task from an array
+        """
+        runner = GEJobRunner(log_dir=self.log_dir)
+        self.run_array(runner)
+        runner.terminate('12345.2')
+        self.assertEqual(self.ge.commands[-1],('qdel','12345','-t','2'))
+
+    def test_run_array_removes_files_when_tasks_finish(self):
+        """GEJobRunner removes array files once all the tasks have finished
+        """
+        runner = GEJobRunner(log_dir=self.log_dir,qstat_interval=0)
+        self.run_array(runner)
+        self.ge.qstat_lines = [qstat_line('12345','r',task_id='1'),
+                               qstat_line('12345','qw',task_id='3')]
+        runner.list()
+        self.assertEqual(len(self.array_files()),2)
+        self.ge.qstat_lines = [qstat_line('12345','r',task_id='3')]
+        runner.list()
+        self.assertEqual(len(self.array_files()),2)
+        self.ge.qstat_lines = []
+        runner.list()
+        self.assertEqual(self.array_files(),[])
+
+class TestParseQacctOutput(unittest.TestCase):
+    """Tests for the parse_qacct_output function
+    """
+
+    def test_parse_qacct_output_single_job(self):
+        """parse_qacct_output handles output for a single job
+        """
+        output = """==============================================================
+qname        serial.q
+hostname     node015.prv.cluster
+jobname      copy.MH
+jobnumber    9859
+taskid       undefined
+qsub_time    Thu Aug 18 11:28:50 2016
+failed       0
+exit_status  0
+"""
+        records = parse_qacct_output(output)
+        self.assertEqual(len(records),1)
+        self.assertEqual(records[0]['jobnumber'],'9859')
+        self.assertEqual(records[0]['qsub_time'],'Thu Aug 18 11:28:50 2016')
+        self.assertEqual(records[0]['exit_status'],'0')
+
+    def test_parse_qacct_output_multiple_jobs(self):
+        """parse_qacct_output handles output for multiple jobs
+        """
+        output = """==============================================================
+qname        serial.q
+jobnumber    9859
+taskid       undefined
+exit_status  0
+==============================================================
+qname        serial.q
+jobnumber    9860
+taskid       undefined
+exit_status  1
+"""
+        records = parse_qacct_output(output)
+        self.assertEqual(len(records),2)
+        self.assertEqual(records[0]['jobnumber'],'9859')
+        self.assertEqual(records[0]['exit_status'],'0')
+        self.assertEqual(records[1]['jobnumber'],'9860')
+        self.assertEqual(records[1]['exit_status'],'1')
+
+    def test_parse_qacct_output_no_jobs(self):
+        """parse_qacct_output handles empty output
+        """
+        self.assertEqual(parse_qacct_output(""),[])
+
 class TestFetchRunnerFunction(unittest.TestCase):
     """Tests for the fetch_runner function
     """
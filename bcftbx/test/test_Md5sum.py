@@ -6,6 +6,8 @@ from bcftbx.test.mock_data import ExampleDirSpiders,ExampleDirLanguages
 import unittest
 import os
 import tempfile
+import shutil
+import pickle
 import cStringIO
 
 test_text = """Md5sum is a Python module with functions for generating
@@ -155,6 +157,116 @@ class TestMd5CheckerMd5cmpFiles(unittest.TestCase):
                          Md5Checker.md5cmp_files(self.example_dir.dirn,
                                                  self.example_dir.path('spider.txt')))
 
+class TestMd5CheckerCmpFiles(unittest.TestCase):
+    """Tests for the 'cmp_files' method of the Md5Checker class
+
+    """
+    def setUp(self):
+        """Build directory with test data
+        """
+        self.example_dir = ExampleDirSpiders()
+        self.wd = self.example_dir.create_directory()
+
+    def tearDown(self):
+        """Remove directory with test data
+        """
+        self.example_dir.delete_directory()
+
+    def test_cmp_identical_files(self):
+        """Md5Checker.cmp_files compare identical files
+        """
+        self.assertEqual(Md5Checker.MD5_OK,
+                         Md5Checker.cmp_files(self.example_dir.path('spider.txt'),
+                                              self.example_dir.path('spider2.txt')))
+
+    def test_cmp_different_files(self):
+        """Md5Checker.cmp_files compare different files
+        """
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(self.example_dir.path('spider.txt'),
+                                              self.example_dir.path('fly.txt')))
+        # Same size but different contents
+        self.example_dir.add_file("spider3.txt",
+                                  "The itsy-bitsy spider\nClimbed up the chimney SPOUT")
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(self.example_dir.path('spider.txt'),
+                                              self.example_dir.path('spider3.txt')))
+
+    def test_cmp_files_n_bytes(self):
+        """Md5Checker.cmp_files_n_bytes counts the bytes actually read
+        """
+        data = "a"*(BLOCKSIZE*3)
+        self.example_dir.add_file("big1",data)
+        self.example_dir.add_file("big2",data)
+        self.example_dir.add_file("big3","b"+data[1:])
+        big1 = self.example_dir.path('big1')
+        self.assertEqual(Md5Checker.cmp_files_n_bytes(
+            big1,self.example_dir.path('big2')),
+                         (Md5Checker.MD5_OK,2*len(data)))
+        # Stops at the first block which differs
+        self.assertEqual(Md5Checker.cmp_files_n_bytes(
+            big1,self.example_dir.path('big3')),
+                         (Md5Checker.MD5_FAILED,2*BLOCKSIZE))
+        # Different sizes so nothing is read
+        self.assertEqual(Md5Checker.cmp_files_n_bytes(
+            big1,self.example_dir.path('spider.txt')),
+                         (Md5Checker.MD5_FAILED,0))
+
+    def test_cmp_missing_files(self):
+        """Md5Checker.cmp_files with missing reference or target file
+        """
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(self.example_dir.path('missing.txt'),
+                                              self.example_dir.path('spider.txt')))
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(self.example_dir.path('spider.txt'),
+                                              self.example_dir.path('missing.txt')))
+
+    def test_cmp_file_and_link(self):
+        """Md5Checker.cmp_files with a file against a symlink
+        """
+        self.assertEqual(Md5Checker.MD5_OK,
+                         Md5Checker.cmp_files(self.example_dir.path('spider2.txt'),
+                                              self.example_dir.path('itsy-bitsy.txt')))
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(self.example_dir.path('fly.txt'),
+                                              self.example_dir.path('itsy-bitsy.txt')))
+
+    def test_cmp_broken_link(self):
+        """Md5Checker.cmp_files with a broken symlink
+        """
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(self.example_dir.path('broken.txt'),
+                                              self.example_dir.path('broken2.txt')))
+
+    def test_cmp_file_and_directory(self):
+        """Md5Checker.cmp_files when one 'file' is a directory
+        """
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(self.example_dir.path('spider.txt'),
+                                              self.example_dir.dirn))
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(self.example_dir.dirn,
+                                              self.example_dir.path('spider.txt')))
+
+    def test_md5cmp_files_checks_sizes_first(self):
+        """Md5Checker.md5cmp_files reports different sizes without MD5 sums
+        """
+        wd = tempfile.mkdtemp()
+        try:
+            # Put identical bogus MD5 sums into a cache
+            cache = Md5sumCache(os.path.join(wd,"md5sums.db"))
+            cache.store(self.example_dir.path('spider.txt'),"bogus")
+            cache.store(self.example_dir.path('fly.txt'),"bogus")
+            self.assertEqual(Md5Checker.MD5_FAILED,
+                             Md5Checker.md5cmp_files(
+                                 self.example_dir.path('spider.txt'),
+                                 self.example_dir.path('fly.txt'),
+                                 cache=cache))
+            cache.close()
+        finally:
+            shutil.rmtree(wd)
+
 class TestMd5CheckerWalk(unittest.TestCase):
     """Tests for the 'walk' method of the Md5Checker class
 
@@ -302,6 +414,24 @@ class TestMd5CheckerMd5cmpDirs(unittest.TestCase):
             else:
                 self.assertEqual(Md5Checker.MD5_OK,status)
 
+    def test_cmp_different_dirs_compare_bytes(self):
+        """Md5Checker.md5cmp_dirs comparing file contents directly
+        """
+        self.dir1.add_file("portuguese/ola","Hello!")
+        self.dir2.add_file("goodbye","Goooooodbyeeee!")
+        self.dir2.add_file("hello","Hello?")
+        for f,status in Md5Checker.md5cmp_dirs(self.dir1.dirn,
+                                               self.dir2.dirn,
+                                               compare=Md5Checker.COMPARE_BYTES):
+            if f == "portuguese/ola":
+                self.assertEqual(Md5Checker.MISSING_TARGET,status)
+            elif f in ("goodbye","bye","hello","hi"):
+                self.assertEqual(Md5Checker.MD5_FAILED,status,
+                                 "Failed for %s (status %d)" % (f,status))
+            else:
+                self.assertEqual(Md5Checker.MD5_OK,status,
+                                 "Failed for %s (status %d)" % (f,status))
+
 class TestMd5CheckerComputeMd5sms(unittest.TestCase):
     """Tests for the 'compute_md5sums' method of the Md5Checker class
 
@@ -377,6 +507,730 @@ class TestMd5CheckerVerifyMd5sms(unittest.TestCase):
         # Check no files were missed
         self.assertEqual(len(files),0)
 
+class TestMd5CheckerWithWorkers(unittest.TestCase):
+    """Tests for the Md5Checker methods using multiple threads
+
+    """
+    def setUp(self):
+        self.dir1 = ExampleDirLanguages()
+        self.dir1.create_directory()
+        self.dir2 = ExampleDirLanguages()
+        self.dir2.create_directory()
+
+    def tearDown(self):
+        self.dir1.delete_directory()
+        self.dir2.delete_directory()
+
+    def test_walk_with_workers(self):
+        """Md5Checker.walk with workers returns same results as serial
+        """
+        for links in (Md5Checker.FOLLOW_LINKS,Md5Checker.IGNORE_LINKS):
+            self.assertEqual(list(Md5Checker.walk(self.dir1.dirn,links,
+                                                  workers=4)),
+                             list(Md5Checker.walk(self.dir1.dirn,links)))
+
+    def test_compute_md5sums_with_workers(self):
+        """Md5Checker.compute_md5sums with workers returns same results as serial
+
+        """
+        serial = list(Md5Checker.compute_md5sums(self.dir1.dirn))
+        self.assertNotEqual(len(serial),0)
+        self.assertEqual(list(Md5Checker.compute_md5sums(self.dir1.dirn,
+                                                         workers=4)),
+                         serial)
+        self.assertEqual(sorted(Md5Checker.compute_md5sums(self.dir1.dirn,
+                                                           workers=4,
+                                                           ordered=False)),
+                         sorted(serial))
+
+    def test_md5cmp_dirs_with_workers(self):
+        """Md5Checker.md5cmp_dirs with workers returns same results as serial
+
+        """
+        self.dir1.add_file("portuguese/ola","Hello!")
+        self.dir2.add_file("goodbye","Goooooodbyeeee!")
+        serial = list(Md5Checker.md5cmp_dirs(self.dir1.dirn,
+                                             self.dir2.dirn))
+        self.assertTrue(("portuguese/ola",Md5Checker.MISSING_TARGET)
+                        in serial)
+        self.assertTrue(("goodbye",Md5Checker.MD5_FAILED) in serial)
+        self.assertEqual(list(Md5Checker.md5cmp_dirs(self.dir1.dirn,
+                                                     self.dir2.dirn,
+                                                     workers=4)),
+                         serial)
+        self.assertEqual(sorted(Md5Checker.md5cmp_dirs(self.dir1.dirn,
+                                                       self.dir2.dirn,
+                                                       workers=4,
+                                                       ordered=False)),
+                         sorted(serial))
+
+    def test_verify_md5sums_with_workers(self):
+        """Md5Checker.verify_md5sums with workers returns same results as serial
+
+        """
+        md5sums = []
+        for f in self.dir1.filelist(full_path=True):
+            md5sums.append("%s  %s" % (md5sum(f),f))
+        md5sums.append("%s  %s" % ('d41d8cd98f00b204e9800998ecf8427e',
+                                   self.dir1.path("missing")))
+        md5sums = '\n'.join(md5sums)
+        serial = list(Md5Checker.verify_md5sums(
+            fp=cStringIO.StringIO(md5sums)))
+        self.assertEqual(serial[-1],(self.dir1.path("missing"),
+                                     Md5Checker.MISSING_TARGET))
+        self.assertEqual(list(Md5Checker.verify_md5sums(
+            fp=cStringIO.StringIO(md5sums),workers=4)),serial)
+        self.assertEqual(sorted(Md5Checker.verify_md5sums(
+            fp=cStringIO.StringIO(md5sums),workers=4,ordered=False)),
+                         sorted(serial))
+
+    def test_verify_md5sums_bad_line_with_workers(self):
+        """Md5Checker.verify_md5sums with workers raises exception for bad line
+
+        """
+        md5sums = "%s  %s\nbad_line\n" % (md5sum(self.dir1.path("hello")),
+                                          self.dir1.path("hello"))
+        self.assertRaises(IndexError,list,
+                          Md5Checker.verify_md5sums(
+                              fp=cStringIO.StringIO(md5sums),workers=2))
+
+class TestMd5sumCache(unittest.TestCase):
+    """Tests for the Md5sumCache class
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLanguages()
+        self.example_dir.create_directory()
+        self.wd = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.wd,"md5sums.db")
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+        shutil.rmtree(self.wd)
+
+    def test_md5sumcache_stores_md5sums(self):
+        """Md5sumCache computes and stores MD5 sums
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(cache.lookup(f),None)
+        self.assertEqual(cache.md5sum(f),md5sum(f))
+        self.assertEqual(cache.lookup(f),md5sum(f))
+        cache.close()
+        # Reopen and check the MD5 sum persists
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(cache.lookup(f),md5sum(f))
+        cache.close()
+
+    def test_md5sumcache_uses_stored_md5sums(self):
+        """Md5sumCache returns stored MD5 sum for unchanged file
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file)
+        # Store a bogus value to check the file isn't reread
+        cache.store(f,"bogus")
+        self.assertEqual(cache.md5sum(f),"bogus")
+        cache.close()
+
+    def test_md5sumcache_recompute(self):
+        """Md5sumCache with trust=False recomputes and updates MD5 sums
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file,trust=False)
+        cache.store(f,"bogus")
+        self.assertEqual(cache.md5sum(f),md5sum(f))
+        self.assertEqual(cache.lookup(f),md5sum(f))
+        cache.close()
+
+    def test_md5sumcache_detects_changed_file(self):
+        """Md5sumCache ignores stored MD5 sum when file has changed
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file)
+        cache.store(f,"bogus")
+        with open(f,'a') as fp:
+            fp.write("More text")
+        self.assertEqual(cache.lookup(f),None)
+        self.assertEqual(cache.md5sum(f),md5sum(f))
+        cache.close()
+
+    def test_md5sumcache_missing_file(self):
+        """Md5sumCache raises IOError for missing file
+        """
+        cache = Md5sumCache(self.cache_file)
+        self.assertRaises(IOError,cache.md5sum,
+                          self.example_dir.path("missing"))
+        cache.close()
+
+    def test_md5sumcache_buffers_stores(self):
+        """Md5sumCache writes stored MD5 sums on commit
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file,commit_interval=10)
+        cache.store(f,"bogus")
+        # Visible to this instance before the commit...
+        self.assertEqual(cache.md5sum(f),"bogus")
+        # ...but not to another connection
+        cache2 = Md5sumCache(self.cache_file)
+        self.assertEqual(cache2.lookup(f),None)
+        cache.commit()
+        self.assertEqual(cache2.lookup(f),"bogus")
+        cache.close()
+        cache2.close()
+
+    def test_md5sumcache_pickle(self):
+        """Md5sumCache can be pickled and unpickled
+        """
+        f = self.example_dir.path("hello")
+        cache = Md5sumCache(self.cache_file)
+        cache.store(f,"bogus")
+        cache.commit()
+        cache2 = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(cache2.md5sum(f),"bogus")
+        self.assertTrue(cache2.trust)
+        cache.close()
+        cache2.close()
+
+    def test_md5checker_methods_with_cache(self):
+        """Md5Checker methods use the Md5sumCache
+        """
+        cache = Md5sumCache(self.cache_file)
+        files = self.example_dir.filelist(full_path=False)
+        for f,md5 in Md5Checker.compute_md5sums(self.example_dir.dirn,
+                                                cache=cache):
+            self.assertEqual(md5,self.example_dir.checksum_for_file(f))
+        for f in files:
+            self.assertEqual(cache.lookup(self.example_dir.path(f)),
+                             self.example_dir.checksum_for_file(f))
+        # Store a bogus value and check it's picked up
+        cache.store(self.example_dir.path("hello"),"bogus")
+        self.assertEqual(Md5Checker.md5cmp_files(
+            self.example_dir.path("hello"),
+            self.example_dir.path("spanish/hola"),
+            cache=cache),Md5Checker.MD5_FAILED)
+        self.assertEqual(dict(Md5Checker.compute_md5sums(
+            self.example_dir.dirn,cache=cache,workers=4))["hello"],"bogus")
+        cache.close()
+
+class TestChecksums(unittest.TestCase):
+    """Tests for the 'checksums' function
+
+    """
+    def setUp(self):
+        fd,self.filen = tempfile.mkstemp()
+        os.close(fd)
+        fp = open(self.filen,'w')
+        fp.write(test_text)
+        fp.close()
+
+    def tearDown(self):
+        os.remove(self.filen)
+
+    def test_checksums_md5_only(self):
+        """checksums returns MD5 sum by default
+        """
+        self.assertEqual(checksums(self.filen),
+                         { 'md5': md5sum(self.filen) })
+
+    def test_checksums_multiple_algorithms(self):
+        """checksums returns MD5, SHA256 and CRC32 in a single pass
+        """
+        import hashlib
+        import zlib
+        digests = checksums(self.filen,('md5','sha256','crc32'))
+        self.assertEqual(digests['md5'],md5sum(self.filen))
+        self.assertEqual(digests['sha256'],
+                         hashlib.sha256(test_text).hexdigest())
+        self.assertEqual(digests['crc32'],
+                         "%08x" % (zlib.crc32(test_text) & 0xffffffff))
+
+    def test_checksums_stream(self):
+        """checksums works for file-like object
+        """
+        fp = cStringIO.StringIO(test_text)
+        self.assertEqual(checksums(fp,('md5',))['md5'],
+                         '08a6facee51e5435b9ef3744bd4dd5dc')
+
+    def test_checksums_bad_algorithm(self):
+        """checksums raises ValueError for unknown algorithm
+        """
+        self.assertRaises(ValueError,checksums,self.filen,('md5','md99'))
+
+class TestReadManifest(unittest.TestCase):
+    """Tests for the 'read_manifest' function
+
+    """
+    def test_read_manifest_with_header(self):
+        """read_manifest reads multi-column manifest
+        """
+        fp = cStringIO.StringIO("""# md5 crc32
+0123  abcd  test.txt
+4567  ef01  dir/file with spaces.txt
+""")
+        self.assertEqual(list(read_manifest(fp)),
+                         [('test.txt',{'md5':'0123','crc32':'abcd'}),
+                          ('dir/file with spaces.txt',
+                           {'md5':'4567','crc32':'ef01'})])
+
+    def test_read_manifest_no_header(self):
+        """read_manifest reads 'md5sum'-format file
+        """
+        fp = cStringIO.StringIO("0123  test.txt\n")
+        self.assertEqual(list(read_manifest(fp)),
+                         [('test.txt',{'md5':'0123'})])
+
+    def test_read_manifest_bad_line(self):
+        """read_manifest raises IndexError for line with missing column
+        """
+        fp = cStringIO.StringIO("# md5 crc32\n0123  test.txt\n")
+        self.assertRaises(IndexError,list,read_manifest(fp))
+
+class TestMd5CheckerChecksums(unittest.TestCase):
+    """Tests for the 'compute_checksums' and 'verify_checksums' methods
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLanguages()
+        self.example_dir.create_directory()
+        self.algorithms = ('md5','sha256','crc32')
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+
+    def make_manifest(self):
+        manifest = [manifest_header(self.algorithms)]
+        for f,digests in Md5Checker.compute_checksums(self.example_dir.dirn,
+                                                      self.algorithms):
+            manifest.append(
+                manifest_line(os.path.join(self.example_dir.dirn,f),digests))
+        return '\n'.join(manifest)
+
+    def test_compute_checksums(self):
+        """Md5Checker.compute_checksums returns checksums for all files
+        """
+        files = self.example_dir.filelist(full_path=False)
+        for f,digests in Md5Checker.compute_checksums(self.example_dir.dirn,
+                                                      self.algorithms,
+                                                      workers=2):
+            self.assertTrue(f in files,"%s not in %s" % (f,files))
+            self.assertEqual(len(digests),3)
+            self.assertEqual(digests[0],self.example_dir.checksum_for_file(f))
+            files.remove(f)
+        self.assertEqual(len(files),0)
+
+    def test_verify_checksums(self):
+        """Md5Checker.verify_checksums checks all and subsets of algorithms
+        """
+        manifest = self.make_manifest()
+        files = self.example_dir.filelist(full_path=True)
+        for algorithms in (None,('sha256',),('crc32','md5')):
+            fp = cStringIO.StringIO(manifest)
+            results = list(Md5Checker.verify_checksums(fp=fp,
+                                                       algorithms=algorithms,
+                                                       workers=2))
+            self.assertEqual(sorted([f for f,status in results]),
+                             sorted(files))
+            for f,status in results:
+                self.assertEqual(status,Md5Checker.MD5_OK)
+
+    def test_verify_checksums_detects_failure(self):
+        """Md5Checker.verify_checksums detects modified and missing files
+        """
+        manifest = self.make_manifest()
+        changed = os.path.join(self.example_dir.dirn,'hello')
+        missing = os.path.join(self.example_dir.dirn,'goodbye')
+        open(changed,'w').write("Changed!")
+        os.remove(missing)
+        for f,status in Md5Checker.verify_checksums(
+                fp=cStringIO.StringIO(manifest),algorithms=('crc32',)):
+            # Links to the files (e.g. 'hi') should give the same
+            # results as the files themselves
+            f = os.path.realpath(f)
+            if f == os.path.realpath(changed):
+                self.assertEqual(status,Md5Checker.MD5_FAILED)
+            elif f == os.path.realpath(missing):
+                self.assertEqual(status,Md5Checker.MISSING_TARGET)
+            else:
+                self.assertEqual(status,Md5Checker.MD5_OK)
+
+    def test_verify_checksums_algorithm_not_in_manifest(self):
+        """Md5Checker.verify_checksums raises KeyError for missing algorithm
+        """
+        fp = cStringIO.StringIO("# md5\n0123  test.txt\n")
+        self.assertRaises(KeyError,list,
+                          Md5Checker.verify_checksums(fp=fp,
+                                                      algorithms=('sha1',)))
+
+class TestBlockChecksums(unittest.TestCase):
+    """Tests for the block checksum functions and Md5Checker methods
+
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.filen = os.path.join(self.wd,"test.txt")
+        fp = open(self.filen,'w')
+        fp.write(test_text)
+        fp.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def make_manifest(self,block_size=16):
+        manifest = [block_manifest_header('md5',block_size)]
+        for f,chksum,size,blocks in \
+            Md5Checker.compute_block_checksums([self.filen],block_size):
+            manifest.extend(block_manifest_lines(f,chksum,size,blocks))
+        return '\n'.join(manifest)
+
+    def test_block_checksums(self):
+        """block_checksums returns whole-file and block checksums
+        """
+        chksum,size,blocks = block_checksums(self.filen,16)
+        self.assertEqual(chksum,md5sum(self.filen))
+        self.assertEqual(size,len(test_text))
+        self.assertEqual(len(blocks),(len(test_text)+15)/16)
+        for offset,length,block_chksum in blocks:
+            self.assertEqual(block_chksum,
+                             md5sum(cStringIO.StringIO(
+                                 test_text[offset:offset+length])))
+            self.assertEqual(block_checksum(self.filen,offset,length),
+                             block_chksum)
+
+    def test_read_block_manifest(self):
+        """read_block_manifest reads back block manifest
+        """
+        fp = cStringIO.StringIO(self.make_manifest())
+        chksum,size,blocks = block_checksums(self.filen,16)
+        self.assertEqual(list(read_block_manifest(fp)),
+                         [(self.filen,'md5',chksum,size,blocks)])
+
+    def test_read_block_manifest_bad_header(self):
+        """read_block_manifest raises ValueError for bad header
+        """
+        fp = cStringIO.StringIO("# md5\n0123  test.txt\n")
+        self.assertRaises(ValueError,list,read_block_manifest(fp))
+
+    def test_verify_block_checksums(self):
+        """Md5Checker.verify_block_checksums checks all blocks and whole file
+        """
+        manifest = self.make_manifest()
+        results = list(Md5Checker.verify_block_checksums(
+            fp=cStringIO.StringIO(manifest),workers=4))
+        self.assertEqual(len(results),(len(test_text)+15)/16+1)
+        for f,start,end,status in results:
+            self.assertEqual(f,self.filen)
+            self.assertEqual(status,Md5Checker.MD5_OK)
+        self.assertEqual(results[-1][1:3],(None,None))
+
+    def test_verify_block_checksums_whole_file(self):
+        """Md5Checker.verify_block_checksums checks whole-file checksum
+        """
+        # Manifest with a bad whole-file checksum but good blocks
+        lines = self.make_manifest().split('\n')
+        lines[1] = "file  %s  %d  %s" % ('0'*32,len(test_text),self.filen)
+        results = list(Md5Checker.verify_block_checksums(
+            fp=cStringIO.StringIO('\n'.join(lines))))
+        self.assertEqual([r for r in results if r[3] != Md5Checker.MD5_OK],
+                         [(self.filen,None,None,Md5Checker.MD5_FAILED)])
+
+    def test_verify_block_checksums_locates_corruption(self):
+        """Md5Checker.verify_block_checksums identifies corrupted ranges
+        """
+        manifest = self.make_manifest()
+        # Corrupt a byte in the third block and extend the file
+        fp = open(self.filen,'r+b')
+        fp.seek(40)
+        fp.write('X')
+        fp.seek(0,2)
+        fp.write('extra')
+        fp.close()
+        failed = [(start,end) for f,start,end,status in
+                  Md5Checker.verify_block_checksums(
+                      fp=cStringIO.StringIO(manifest),workers=2)
+                  if status != Md5Checker.MD5_OK]
+        self.assertEqual(failed,[(32,48),(len(test_text),len(test_text)+5),
+                                 (None,None)])
+
+    def test_verify_block_checksums_missing_file(self):
+        """Md5Checker.verify_block_checksums reports missing file
+        """
+        manifest = self.make_manifest()
+        os.remove(self.filen)
+        self.assertEqual(list(Md5Checker.verify_block_checksums(
+            fp=cStringIO.StringIO(manifest))),
+                         [(self.filen,0,len(test_text),
+                           Md5Checker.MISSING_TARGET)])
+
+    def test_verify_block_checksums_skip_file(self):
+        """Md5Checker.verify_block_checksums skips files named in 'skip'
+        """
+        manifest = self.make_manifest()
+        self.assertEqual(list(Md5Checker.verify_block_checksums(
+            fp=cStringIO.StringIO(manifest),skip=set((self.filen,)))),[])
+
+class TestMd5CheckJournal(unittest.TestCase):
+    """Tests for the Md5CheckJournal class
+
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.wd,"journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def test_journal_records_results(self):
+        """Md5CheckJournal records results which can be resumed
+        """
+        journal = Md5CheckJournal(self.journal_file,sync_interval=1)
+        self.assertEqual(journal.results(),[])
+        journal.record("file1",Md5Checker.MD5_OK)
+        journal.record("file with spaces",Md5Checker.MD5_FAILED)
+        journal.close()
+        journal = Md5CheckJournal(self.journal_file)
+        self.assertEqual(journal.results(),
+                         [("file1",Md5Checker.MD5_OK),
+                          ("file with spaces",Md5Checker.MD5_FAILED)])
+        self.assertEqual(journal.completed,
+                         set(("file1","file with spaces")))
+        journal.record("file2",Md5Checker.MISSING_TARGET)
+        journal.close()
+        self.assertEqual(len(Md5CheckJournal(self.journal_file).results()),3)
+
+    def test_journal_no_resume_overwrites(self):
+        """Md5CheckJournal overwrites existing journal if not resuming
+        """
+        journal = Md5CheckJournal(self.journal_file)
+        journal.record("file1",Md5Checker.MD5_OK)
+        journal.close()
+        journal = Md5CheckJournal(self.journal_file,resume=False)
+        self.assertEqual(journal.results(),[])
+        journal.close()
+        self.assertEqual(open(self.journal_file).read(),"")
+
+    def test_journal_discards_partial_entry(self):
+        """Md5CheckJournal discards partially written last entry
+        """
+        open(self.journal_file,'w').write("0\tfile1\n1\tfil")
+        journal = Md5CheckJournal(self.journal_file)
+        self.assertEqual(journal.results(),[("file1",Md5Checker.MD5_OK)])
+        journal.record("file2",Md5Checker.MD5_OK)
+        journal.close()
+        self.assertEqual(open(self.journal_file).read(),
+                         "0\tfile1\n0\tfile2\n")
+
+    def test_reporter_with_journal(self):
+        """Md5CheckReporter merges and records results using journal
+        """
+        journal = Md5CheckJournal(self.journal_file)
+        journal.record("file1",Md5Checker.MD5_FAILED)
+        journal.close()
+        journal = Md5CheckJournal(self.journal_file)
+        fp = cStringIO.StringIO()
+        reporter = Md5CheckReporter((("file2",Md5Checker.MD5_OK),),
+                                    fp=fp,journal=journal)
+        journal.close()
+        self.assertEqual(reporter.n_files,2)
+        self.assertEqual(reporter.n_failed,1)
+        self.assertEqual(reporter.n_ok,1)
+        self.assertEqual(fp.getvalue(),"file1: FAILED\n")
+        self.assertEqual(Md5CheckJournal(self.journal_file).results(),
+                         [("file1",Md5Checker.MD5_FAILED),
+                          ("file2",Md5Checker.MD5_OK)])
+
+    def test_reporter_with_journal_repeated_file(self):
+        """Md5CheckReporter with journal keeps results for repeated files
+        """
+        journal = Md5CheckJournal(self.journal_file)
+        fp = cStringIO.StringIO()
+        reporter = Md5CheckReporter((("file1",Md5Checker.MD5_OK),
+                                     ("file1",Md5Checker.MD5_FAILED)),
+                                    fp=fp,journal=journal)
+        journal.close()
+        self.assertEqual(reporter.n_files,2)
+        self.assertEqual(reporter.n_failed,1)
+        self.assertEqual(reporter.n_ok,1)
+
+    def test_verify_md5sums_resume(self):
+        """Md5Checker.verify_md5sums skips entries already in journal
+        """
+        example_dir = ExampleDirLanguages()
+        example_dir.create_directory()
+        try:
+            md5sums = []
+            for f in example_dir.filelist(full_path=True):
+                md5sums.append("%s  %s" % (md5sum(f),f))
+            md5sums = '\n'.join(md5sums)
+            files = example_dir.filelist(full_path=True)
+            # Simulate an interrupted run
+            journal = Md5CheckJournal(self.journal_file)
+            for f in files[:3]:
+                journal.record(f,Md5Checker.MD5_OK)
+            journal.close()
+            # Resume
+            journal = Md5CheckJournal(self.journal_file)
+            checked = [f for f,status in Md5Checker.verify_md5sums(
+                fp=cStringIO.StringIO(md5sums),skip=journal.completed)]
+            self.assertEqual(sorted(checked),sorted(files[3:]))
+            journal.close()
+        finally:
+            example_dir.delete_directory()
+
+class TestMd5Stats(unittest.TestCase):
+    """Tests for the Md5Stats class
+
+    """
+    def test_md5stats_record(self):
+        """Md5Stats records files and bytes for each worker
+        """
+        stats = Md5Stats(total_files=4)
+        self.assertEqual(stats.eta,None)
+        stats.record(100,0.5,worker="worker1")
+        stats.record(200,0.5,worker="worker1")
+        stats.record(1000,2.0,worker="worker2")
+        self.assertEqual(stats.n_files,3)
+        self.assertEqual(stats.n_bytes,1300)
+        self.assertNotEqual(stats.eta,None)
+        workers = stats.workers()
+        self.assertEqual(sorted(workers.keys()),["worker1","worker2"])
+        self.assertEqual(workers["worker1"]['n_files'],2)
+        self.assertEqual(workers["worker1"]['n_bytes'],300)
+        self.assertEqual(workers["worker1"]['bytes_per_second'],300.0)
+        self.assertEqual(workers["worker2"]['bytes_per_second'],500.0)
+
+    def test_md5stats_wrap(self):
+        """Md5Stats.wrap instruments a function
+        """
+        stats = Md5Stats()
+        func = stats.wrap(lambda x: x*2,size=lambda x: x)
+        self.assertEqual(list(imap_threaded(func,xrange(10),workers=2)),
+                         [x*2 for x in xrange(10)])
+        self.assertEqual(stats.n_files,10)
+        self.assertEqual(stats.n_bytes,45)
+
+    def test_md5stats_progress(self):
+        """Md5Stats writes progress line to stream
+        """
+        fp = cStringIO.StringIO()
+        stats = Md5Stats(total_bytes=2048,progress=fp,interval=60.0)
+        stats.start()
+        stats.record(1024)
+        stats.stop()
+        self.assertTrue(fp.getvalue().startswith("[progress] 1 files, 1.0K ("))
+        self.assertTrue("ETA" in fp.getvalue())
+
+    def test_md5stats_dump(self):
+        """Md5Stats dumps statistics as JSON
+        """
+        import json
+        stats = Md5Stats()
+        stats.record(1024,worker="worker1")
+        stats.stop()
+        fp = cStringIO.StringIO()
+        stats.dump(fp=fp)
+        report = json.loads(fp.getvalue())
+        self.assertEqual(report['n_files'],1)
+        self.assertEqual(report['n_bytes'],1024)
+        self.assertEqual(report['workers']['worker1']['n_bytes'],1024)
+
+    def test_md5checker_methods_with_stats(self):
+        """Md5Checker methods record statistics with and without workers
+        """
+        example_dir = ExampleDirLanguages()
+        example_dir.create_directory()
+        try:
+            nfiles = len(example_dir.filelist())
+            for workers in (1,4):
+                stats = Md5Stats()
+                md5sums = list(Md5Checker.compute_md5sums(example_dir.dirn,
+                                                          workers=workers,
+                                                          stats=stats))
+                self.assertEqual(stats.n_files,nfiles)
+                self.assertEqual(stats.n_bytes,
+                                 sum([os.path.getsize(
+                                     os.path.join(example_dir.dirn,f))
+                                      for f,chksum in md5sums]))
+                stats = Md5Stats()
+                list(Md5Checker.md5cmp_dirs(example_dir.dirn,
+                                            example_dir.dirn,
+                                            workers=workers,
+                                            stats=stats))
+                self.assertEqual(stats.n_files,nfiles)
+                self.assertEqual(stats.n_bytes,
+                                 2*sum([os.path.getsize(
+                                     os.path.join(example_dir.dirn,f))
+                                        for f,chksum in md5sums]))
+        finally:
+            example_dir.delete_directory()
+
+    def test_md5checker_stats_count_bytes_read(self):
+        """Md5Checker methods only record bytes which are actually read
+        """
+        example_dir = ExampleDirLanguages()
+        example_dir.create_directory()
+        empty_dir = tempfile.mkdtemp()
+        cache_file = os.path.join(empty_dir,"md5sums.db")
+        try:
+            nfiles = len(example_dir.filelist())
+            # Missing targets aren't read
+            stats = Md5Stats()
+            list(Md5Checker.md5cmp_dirs(example_dir.dirn,empty_dir,
+                                        stats=stats))
+            self.assertEqual(stats.n_files,nfiles)
+            self.assertEqual(stats.n_bytes,0)
+            # Cached MD5 sums aren't read
+            cache = Md5sumCache(cache_file)
+            list(Md5Checker.compute_md5sums(example_dir.dirn,cache=cache))
+            stats = Md5Stats()
+            list(Md5Checker.compute_md5sums(example_dir.dirn,cache=cache,
+                                            stats=stats))
+            self.assertEqual(stats.n_files,nfiles)
+            self.assertEqual(stats.n_bytes,0)
+            stats = Md5Stats()
+            list(Md5Checker.md5cmp_dirs(example_dir.dirn,example_dir.dirn,
+                                        cache=cache,stats=stats))
+            self.assertEqual(stats.n_bytes,0)
+            cache.close()
+        finally:
+            example_dir.delete_directory()
+            shutil.rmtree(empty_dir)
+
+class TestImapThreaded(unittest.TestCase):
+    """Tests for the imap_threaded function
+
+    """
+    def test_imap_threaded_serial(self):
+        """imap_threaded with single worker
+        """
+        self.assertEqual(list(imap_threaded(lambda x: x*2,xrange(10))),
+                         [x*2 for x in xrange(10)])
+
+    def test_imap_threaded_ordered(self):
+        """imap_threaded with multiple workers preserves order
+        """
+        self.assertEqual(list(imap_threaded(lambda x: x*2,xrange(100),
+                                            workers=4)),
+                         [x*2 for x in xrange(100)])
+
+    def test_imap_threaded_unordered(self):
+        """imap_threaded with multiple workers returns all results unordered
+        """
+        self.assertEqual(sorted(imap_threaded(lambda x: x*2,xrange(100),
+                                              workers=4,ordered=False)),
+                         [x*2 for x in xrange(100)])
+
+    def test_imap_threaded_raises_exception(self):
+        """imap_threaded re-raises exceptions from function
+        """
+        def func(x):
+            if x == 50:
+                raise ValueError("Bad value: %s" % x)
+            return x
+        for ordered in (True,False):
+            self.assertRaises(ValueError,list,
+                              imap_threaded(func,xrange(100),
+                                            workers=4,ordered=ordered))
+
 class TestMd5CheckReporter(unittest.TestCase):
     """Test the Md5CheckReporter class
 
@@ -520,6 +1374,21 @@ Summary:
 \t2 not found
 \t1 'bad' files (MD5 computation errors)
 """)
+
+    def test_md5reporter_summary_output_with_stats(self):
+        """Md5CheckReporter summary output includes throughput statistics
+
+        """
+        fp = cStringIO.StringIO()
+        stats = Md5Stats()
+        stats.record(2048)
+        stats.stop()
+        reporter = Md5CheckReporter((('hello.txt',Md5Checker.MD5_OK),),
+                                    fp=fp,stats=stats)
+        reporter.summary()
+        lines = fp.getvalue().split('\n')
+        self.assertEqual(lines[-2][:len("\t2.0K processed in ")],
+                         "\t2.0K processed in ")
         
 ########################################################################
 # Main: test runner
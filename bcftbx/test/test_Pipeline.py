@@ -10,6 +10,7 @@ import bcftbx.utils
 from bcftbx.JobRunner import SimpleJobRunner
 from bcftbx.JobRunner import GEJobRunner
 from bcftbx.Pipeline import Job
+from bcftbx.Pipeline import PipelineRunner
 from bcftbx.Pipeline import GetSolidDataFiles
 from bcftbx.Pipeline import GetSolidPairedEndFiles
 from bcftbx.Pipeline import GetFastqFiles
@@ -239,6 +240,228 @@ class TestJobWithGEJobRunner(unittest.TestCase):
         self.assertFalse(job.errorState())
         self.assertEqual(job.status(),"Finished")
 
+class DelayedExitStatusJobRunner(SimpleJobRunner):
+    """SimpleJobRunner where exit statuses are only available after polling
+
+    Emulates a runner like GEJobRunner, where the exit status for
+    a finished job is only available after 'npolls' calls to
+    'poll_exit_status'; calling 'exit_status' before then (which
+    would block for a real runner) raises an exception.
+    """
+    def __init__(self,npolls=3):
+        SimpleJobRunner.__init__(self)
+        self.__npolls = npolls
+        self.__polls = {}
+
+    def poll_exit_status(self,job_id):
+        if self.isRunning(job_id):
+            return None
+        self.__polls[job_id] = self.__polls.get(job_id,0) + 1
+        if not self.has_exit_status(job_id):
+            return None
+        return SimpleJobRunner.exit_status(self,job_id)
+
+    def has_exit_status(self,job_id):
+        return self.__polls.get(job_id,0) >= self.__npolls
+
+    def exit_status(self,job_id):
+        if not self.has_exit_status(job_id):
+            raise Exception("exit_status called before it's available "
+                            "for job %s" % job_id)
+        return SimpleJobRunner.exit_status(self,job_id)
+
+class ArrayJobRunner(SimpleJobRunner):
+    """SimpleJobRunner which emulates support for array jobs
+
+    'run_array' runs each task as a separate job, and records the
+    number of tasks for each array in the 'arrays' list.
+    """
+    def __init__(self,log_dir=None):
+        SimpleJobRunner.__init__(self,log_dir=log_dir)
+        self.arrays = []
+
+    def run_array(self,name,working_dir,script,args_list,wait_for=None):
+        self.arrays.append(len(args_list))
+        return [self.run(name,working_dir,script,args)
+                for args in args_list]
+
+class TestPipelineRunnerWithSimpleJobRunner(unittest.TestCase):
+    """Unit tests for the PipelineRunner class using SimpleJobRunner
+
+    """
+    def setUp(self):
+        # Create a temporary directory to work in
+        self.working_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_pipeline_runner_starts_jobs_when_slots_free(self):
+        """Test PipelineRunner starts waiting jobs as soon as others complete
+        """
+        # Long poll interval: pipeline should still finish quickly
+        pipeline = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                                  poll_interval=30)
+        for i in range(3):
+            pipeline.queueJob(self.working_dir,'sleep',('0.1',),label=i)
+        start_time = time.time()
+        pipeline.run()
+        self.assertTrue(time.time() - start_time < 10)
+        self.assertEqual(pipeline.nWaiting(),0)
+        self.assertEqual(pipeline.nRunning(),0)
+        self.assertEqual(pipeline.nCompleted(),3)
+        for job in pipeline.completed:
+            self.assertEqual(job.exit_status,0)
+
+    def test_pipeline_runner_job_array(self):
+        """Test PipelineRunner runs jobs queued as an array
+        """
+        # SimpleJobRunner doesn't support arrays so jobs should be
+        # run individually
+        completed_groups = []
+        pipeline = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=2,
+                                  poll_interval=30,
+                                  groupCompletionHandler=lambda group,jobs:
+                                  completed_groups.append((group,len(jobs))))
+        pipeline.queueJobArray(self.working_dir,'/bin/bash',
+                               (('-c','exit 0'),
+                                ('-c','exit 1'),
+                                ('-c','exit 0')),
+                               labels=('ok1','error','ok2'),
+                               group='test')
+        self.assertEqual(pipeline.nWaiting(),3)
+        pipeline.run()
+        self.assertEqual(pipeline.nWaiting(),0)
+        self.assertEqual(pipeline.nRunning(),0)
+        self.assertEqual(pipeline.nCompleted(),3)
+        exit_status = dict([(job.label,job.exit_status)
+                            for job in pipeline.completed])
+        self.assertEqual(exit_status,{'ok1':0,'error':1,'ok2':0})
+        self.assertEqual(completed_groups,[('test',3)])
+
+    def test_pipeline_runner_job_array_takes_one_slot(self):
+        """Test PipelineRunner runs an array in a single job slot
+        """
+        runner = ArrayJobRunner(log_dir=self.working_dir)
+        pipeline = PipelineRunner(runner,max_concurrent_jobs=2,
+                                  poll_interval=0.1)
+        pipeline.queueJobArray(self.working_dir,'sleep',
+                               (('0.5',),('0.5',),('0.5',)),
+                               group='array')
+        pipeline.queueJob(self.working_dir,'sleep',('0.5',),label='single1')
+        pipeline.queueJob(self.working_dir,'sleep',('0.5',),label='single2')
+        self.assertEqual(pipeline.nWaiting(),5)
+        pipeline.run(blocking=False)
+        # Array and first single job fill the two slots
+        self.assertEqual(runner.arrays,[3])
+        self.assertEqual(pipeline.nRunning(),4)
+        self.assertEqual(pipeline.nWaiting(),1)
+        self.assertEqual(pipeline._PipelineRunner__nSlotsInUse(),2)
+        while pipeline.isRunning():
+            time.sleep(0.1)
+        self.assertEqual(runner.arrays,[3])
+        self.assertEqual(pipeline.nCompleted(),5)
+        for job in pipeline.completed:
+            self.assertEqual(job.exit_status,0)
+
+    def test_pipeline_runner_waits_for_exit_status(self):
+        """Test PipelineRunner only reports jobs once exit status is available
+        """
+        completed_jobs = []
+        completed_groups = []
+        pipeline = PipelineRunner(DelayedExitStatusJobRunner(),
+                                  poll_interval=0.1,
+                                  jobCompletionHandler=lambda job:
+                                  completed_jobs.append((job.label,
+                                                         job.exit_status)),
+                                  groupCompletionHandler=lambda group,jobs:
+                                  completed_groups.append(
+                                      (group,sorted([job.exit_status
+                                                     for job in jobs]))))
+        pipeline.queueJob(self.working_dir,'/bin/bash',('-c','exit 0'),
+                          label='ok',group='test')
+        pipeline.queueJob(self.working_dir,'/bin/bash',('-c','exit 1'),
+                          label='error',group='test')
+        pipeline.run()
+        self.assertEqual(sorted(completed_jobs),[('error',1),('ok',0)])
+        self.assertEqual(completed_groups,[('test',[0,1])])
+
+    def test_pipeline_runner_job_depends_on_job(self):
+        """Test PipelineRunner waits for a job's dependencies to complete
+        """
+        # Second job fails unless the first has already finished
+        flag_file = os.path.join(self.working_dir,'flag')
+        pipeline = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=4,
+                                  poll_interval=30)
+        job1 = pipeline.queueJob(self.working_dir,'/bin/bash',
+                                 ('-c','sleep 0.5; touch %s' % flag_file),
+                                 label='first')
+        job2 = pipeline.queueJob(self.working_dir,'/bin/bash',
+                                 ('-c','test -e %s' % flag_file),
+                                 label='second',depends_on=[job1])
+        self.assertEqual(pipeline.nWaiting(),2)
+        pipeline.run()
+        self.assertEqual(pipeline.nCompleted(),2)
+        self.assertEqual(pipeline.completed,[job1,job2])
+        self.assertEqual(job2.exit_status,0)
+
+    def test_pipeline_runner_job_depends_on_group(self):
+        """Test PipelineRunner waits for all jobs in a group to complete
+        """
+        # Final job fails unless both jobs in the group have finished
+        flag_files = [os.path.join(self.working_dir,'flag%d' % i)
+                      for i in range(2)]
+        pipeline = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=4,
+                                  poll_interval=30)
+        pipeline.queueJob(self.working_dir,'/bin/bash',
+                          ('-c','test -e %s' % ' -a -e '.join(flag_files)),
+                          label='final',depends_on=['stage1'])
+        for i,flag_file in enumerate(flag_files):
+            pipeline.queueJob(self.working_dir,'/bin/bash',
+                              ('-c','sleep 0.%d; touch %s' % (i+2,flag_file)),
+                              label=i,group='stage1')
+        pipeline.run()
+        self.assertEqual(pipeline.nCompleted(),3)
+        final_job = pipeline.completed[-1]
+        self.assertEqual(final_job.label,'final')
+        self.assertEqual(final_job.exit_status,0)
+
+    def test_pipeline_runner_job_cant_depend_on_own_group(self):
+        """Test PipelineRunner rejects a job depending on its own group
+        """
+        pipeline = PipelineRunner(SimpleJobRunner())
+        self.assertRaises(Exception,pipeline.queueJob,
+                          self.working_dir,'sleep',('0.1',),
+                          group='stage1',depends_on=['stage1'])
+
+    def test_pipeline_runner_unknown_group_dependency(self):
+        """Test PipelineRunner raises exception for dependency on unknown group
+        """
+        pipeline = PipelineRunner(SimpleJobRunner(),poll_interval=30)
+        pipeline.queueJob(self.working_dir,'sleep',('0.1',),
+                          group='stage1')
+        pipeline.queueJob(self.working_dir,'sleep',('0.1',),
+                          group='stage2',depends_on=['stage_1'])
+        self.assertRaises(Exception,pipeline.run)
+        self.assertEqual(pipeline.nRunning(),0)
+
+    def test_pipeline_runner_hold_jobs_not_supported(self):
+        """Test PipelineRunner rejects hold_jobs for runner without 'wait_for'
+        """
+        self.assertRaises(Exception,PipelineRunner,SimpleJobRunner(),
+                          hold_jobs=True)
+        PipelineRunner(GEJobRunner(),hold_jobs=True)
+
+    def test_pipeline_runner_unsatisfiable_dependencies(self):
+        """Test PipelineRunner raises exception for circular dependencies
+        """
+        pipeline = PipelineRunner(SimpleJobRunner(),poll_interval=30)
+        pipeline.queueJob(self.working_dir,'sleep',('0.1',),
+                          group='stage1',depends_on=['stage2'])
+        pipeline.queueJob(self.working_dir,'sleep',('0.1',),
+                          group='stage2',depends_on=['stage1'])
+        self.assertRaises(Exception,pipeline.run)
+
 class TestGetSolidDataFiles(unittest.TestCase):
     """Unit tests for GetSolidDataFiles function
 
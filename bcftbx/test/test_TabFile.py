@@ -2,7 +2,16 @@
 # Tests for TabFile.py module
 #########################################################################
 from bcftbx.TabFile import *
+from bcftbx.TabFile import _convert_to_type
+import bcftbx.TabFile
 import unittest
+import tempfile
+import random
+import os
+try:
+    import numpy
+except ImportError:
+    numpy = None
 import cStringIO
 
 class TestTabFile(unittest.TestCase):
@@ -195,6 +204,445 @@ chr2\t1234\t5678\t6.8
         self.assertEqual(tabfile.header()[4],'new')
         self.assertEqual(tabfile[0]['new'],'')
 
+class TestTabFileLazyConversion(unittest.TestCase):
+    """Tests for lazy type conversion in TabFiles
+    """
+    def setUp(self):
+        # Make file-like object to read data in
+        self.data = \
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.60
+chr1\t567\t890\t5.7
+chr2\t1234\tNA\t6.8
+"""
+
+    def test_lazy_values_match_eager_values(self):
+        """Lazily converted values are the same as eager ones
+        """
+        eager = TabFile(fp=cStringIO.StringIO(self.data),
+                        first_line_is_header=True)
+        lazy = TabFile(fp=cStringIO.StringIO(self.data),
+                       first_line_is_header=True,lazy=True)
+        for line1,line2 in zip(eager,lazy):
+            for key in ('chr','start','end','data'):
+                self.assertEqual(line1[key],line2[key])
+                self.assertEqual(type(line1[key]),type(line2[key]))
+        lazy = TabFile(fp=cStringIO.StringIO(self.data),
+                       first_line_is_header=True,lazy=True)
+        for line1,line2 in zip(eager,lazy):
+            self.assertEqual(str(line1),str(line2))
+            self.assertEqual(line1.data,line2.data)
+
+    def test_lazy_get_and_set_values(self):
+        """Get and set values in lazily converted lines
+        """
+        line = TabDataLine("chr1\t1\t234\t4.60",lazy=True)
+        self.assertEqual(line[-1],4.6)
+        line[1] = '12'
+        self.assertEqual(line[1],12)
+        self.assertEqual(line[2],234)
+        self.assertEqual(line.data,['chr1',12,234,4.6])
+        self.assertEqual(str(line),"chr1\t12\t234\t4.6")
+
+    def test_lazy_no_conversion(self):
+        """Lazy lines without type conversion keep strings
+        """
+        line = TabDataLine("chr1\t1\t234\t4.60",lazy=True,convert=False)
+        self.assertEqual(line.data,['chr1','1','234','4.60'])
+
+class TestTabFileSchemas(unittest.TestCase):
+    """Tests for schema-driven type conversion in TabFiles
+    """
+    def setUp(self):
+        # Make file-like object to read data in
+        self.data = \
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.60
+chr1\t567\t890\t5.7
+12\t1234\tNA\t6
+"""
+
+    def test_infer_column_types(self):
+        """Infer column types from a sample of values
+        """
+        rows = [['chr1','1','2.5','','NA'],
+                ['chr2','','3','','1'],
+                ['chr3','2','1','','2']]
+        self.assertEqual(infer_column_types(rows),[str,int,float,int,int])
+        self.assertEqual(infer_column_types([]),[])
+
+    def test_make_converters(self):
+        """Make conversion functions from a schema
+        """
+        converters = make_converters((str,int,float,len))
+        self.assertEqual([f('12') for f in converters],['12',12,12.0,2])
+        converters = make_converters({ 'start': int, 3: str },
+                                     column_names=('chr','start','end'))
+        self.assertEqual(len(converters),4)
+        self.assertEqual([f('7') for f in converters],[7,7,7,'7'])
+        self.assertEqual(converters[1]('NA'),'NA')
+        converters = make_converters({ 'start': int },
+                                     column_names=('chr','start'),
+                                     convert=False)
+        self.assertEqual([f('7') for f in converters],['7',7])
+        self.assertRaises(KeyError,make_converters,{ 'missing': int },
+                          ('chr','start'))
+
+    def test_explicit_schema(self):
+        """Load TabFile with an explicit schema
+        """
+        tabfile = TabFile(fp=cStringIO.StringIO(self.data),
+                          first_line_is_header=True,
+                          schema={ 'chr': str, 'data': float })
+        self.assertEqual(tabfile[2].data,['12',1234,'NA',6.0])
+        self.assertEqual(type(tabfile[2]['data']),float)
+        tabfile[0]['chr'] = 1
+        self.assertEqual(tabfile[0]['chr'],'1')
+        line = tabfile.append(data=[2,3,4,5])
+        self.assertEqual(line.data,['2',3,4,5.0])
+
+    def test_inferred_schema(self):
+        """Load TabFile inferring the schema from the data
+        """
+        tabfile = TabFile(fp=cStringIO.StringIO(self.data),
+                          first_line_is_header=True,infer_schema=True)
+        self.assertEqual(tabfile[0].data,['chr1',1,234,4.6])
+        self.assertEqual(tabfile[1].data,['chr1',567,890,5.7])
+        self.assertEqual(tabfile[2].data,['12',1234,'NA',6.0])
+        # Explicit schema overrides inferred types
+        tabfile = TabFile(fp=cStringIO.StringIO(self.data),
+                          first_line_is_header=True,infer_schema=True,
+                          schema={ 'chr': _convert_to_type })
+        self.assertEqual(tabfile[2].data,[12,1234,'NA',6.0])
+
+    def test_inferred_schema_larger_than_sample(self):
+        """Infer schema from a sample of a larger file
+        """
+        data = "#x\ty\n" + \
+               ''.join(["%d\t%d\n" % (i,i) for i in range(SCHEMA_SAMPLE_SIZE)]) + \
+               "a\t1.5\n"
+        lines = TabFile.iterate(fp=cStringIO.StringIO(data),
+                                first_line_is_header=True,
+                                infer_schema=True,lazy=True)
+        lines = [line for line in lines]
+        self.assertEqual(len(lines),SCHEMA_SAMPLE_SIZE+1)
+        self.assertEqual(lines[0].lineno(),2)
+        self.assertEqual(lines[-1].lineno(),SCHEMA_SAMPLE_SIZE+2)
+        self.assertEqual(lines[1].data,[1,1])
+        self.assertEqual(lines[-1].data,['a',1.5])
+
+class TestTabFileIndexes(unittest.TestCase):
+    """Tests for lookups using indexes in TabFiles
+    """
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.6
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+chr1\t1234\t5678\t7.9
+""")
+        self.tabfile = TabFile('test',self.fp,first_line_is_header=True)
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def assertLookup(self,key,value,expected):
+        # Check lookup returns expected lines (in order)
+        matching = self.tabfile.lookup(key,value)
+        self.assertEqual(len(matching),len(expected))
+        for line,i in zip(matching,expected):
+            self.assertTrue(line is self.tabfile[i])
+
+    def test_lookup_with_index(self):
+        """Lookup using an index on a single column
+        """
+        self.tabfile.create_index('chr')
+        self.assertLookup('chr','chr1',(0,1,3))
+        self.assertLookup('chr','chr2',(2,))
+        self.assertLookup('chr','chr3',())
+
+    def test_lookup_multiple_columns(self):
+        """Lookup on multiple columns with and without an index
+        """
+        self.assertLookup(('chr','start'),('chr1',1234),(3,))
+        self.assertLookup(['chr','start'],['chr2',1234],(2,))
+        self.tabfile.create_index(('chr','start'))
+        self.assertLookup(('chr','start'),('chr1',1234),(3,))
+        self.assertLookup(['chr','start'],['chr2',1234],(2,))
+        self.assertLookup(('chr','start'),('chr2',1),())
+
+    def test_index_updated_on_append_insert_and_delete(self):
+        """Indexes are updated when lines are added and removed
+        """
+        self.tabfile.create_index('chr')
+        self.tabfile.append(data=['chr2',10,20,1.0])
+        self.assertLookup('chr','chr2',(2,4))
+        self.tabfile.insert(0,data=['chr2',10,20,1.0])
+        self.assertLookup('chr','chr2',(0,3,5))
+        del(self.tabfile[0])
+        self.assertLookup('chr','chr2',(2,4))
+        del(self.tabfile[:2])
+        self.assertLookup('chr','chr1',(1,))
+        self.assertLookup('chr','chr2',(0,2))
+        line = self.tabfile.append()
+        line['chr'] = 'chr3'
+        self.assertLookup('chr','chr3',(3,))
+
+    def test_index_updated_on_sort_and_compute(self):
+        """Indexes are updated after sorting and computing columns
+        """
+        self.tabfile.create_index('start')
+        self.tabfile.sort(lambda line: line['data'],reverse=True)
+        self.assertLookup('start',1234,(0,1))
+        self.tabfile.transformColumn('start',lambda x: x+1)
+        self.assertLookup('start',1234,())
+        self.assertLookup('start',1235,(0,1))
+        self.tabfile.computeColumn('start',lambda line: line['end'])
+        self.assertLookup('start',5678,(0,1))
+
+    def test_index_by_line_number(self):
+        """Look up line numbers using an index
+        """
+        self.assertEqual(self.tabfile.indexByLineNumber(3),1)
+        self.tabfile.append(data=['chr2',10,20,1.0])
+        self.assertRaises(IndexError,self.tabfile.indexByLineNumber,6)
+        del(self.tabfile[0])
+        self.assertEqual(self.tabfile.indexByLineNumber(3),0)
+        self.assertEqual(self.tabfile.indexByLineNumber(5),2)
+        self.tabfile.sort(lambda line: line['data'],reverse=True)
+        self.assertEqual(self.tabfile.indexByLineNumber(5),0)
+        self.assertRaises(IndexError,self.tabfile.indexByLineNumber,2)
+
+class TestTabFileJoin(unittest.TestCase):
+    """Tests for joining TabFiles
+    """
+    def setUp(self):
+        self.genes = TabFile(fp=cStringIO.StringIO(
+"""#gene_id\tname
+1\talpha
+2\tbeta
+3\tgamma
+"""),first_line_is_header=True)
+        self.exprs_data = """#gene_id\tname\tlog2FC
+2\tB\t0.5
+4\tD\t1.5
+2\tBB\t2.5
+"""
+        self.exprs = TabFile(fp=cStringIO.StringIO(self.exprs_data),
+                             first_line_is_header=True)
+
+    def assertJoin(self,joined,expected):
+        # Check joined lines match expected values
+        self.assertEqual(len(joined),len(expected))
+        for line,values in zip(joined,expected):
+            self.assertEqual(line.data,values)
+
+    def test_join_header(self):
+        """Check column names for joined TabFile
+        """
+        joined = self.genes.join(self.exprs,on='gene_id')
+        self.assertEqual(joined.header(),['gene_id','name','name_2','log2FC'])
+        joined = self.genes.join(self.exprs,on='gene_id',suffix='_expr')
+        self.assertEqual(joined.header(),
+                         ['gene_id','name','name_expr','log2FC'])
+
+    def test_inner_join(self):
+        """Check inner join of TabFiles
+        """
+        expected = [[2,'beta','B',0.5],[2,'beta','BB',2.5]]
+        self.assertJoin(self.genes.join(self.exprs,on='gene_id'),expected)
+
+    def test_left_join(self):
+        """Check left join of TabFiles
+        """
+        expected = [[1,'alpha','',''],
+                    [2,'beta','B',0.5],
+                    [2,'beta','BB',2.5],
+                    [3,'gamma','','']]
+        self.assertJoin(self.genes.join(self.exprs,on='gene_id',how='left'),
+                        expected)
+
+    def test_right_join(self):
+        """Check right join of TabFiles
+        """
+        expected = [[2,'beta','B',0.5],
+                    [2,'beta','BB',2.5],
+                    [4,'','D',1.5]]
+        self.assertJoin(self.genes.join(self.exprs,on='gene_id',how='right'),
+                        expected)
+
+    def test_outer_join(self):
+        """Check outer join of TabFiles
+        """
+        expected = [[1,'alpha','',''],
+                    [2,'beta','B',0.5],
+                    [2,'beta','BB',2.5],
+                    [3,'gamma','',''],
+                    [4,'','D',1.5]]
+        self.assertJoin(self.genes.join(self.exprs,on='gene_id',how='outer'),
+                        expected)
+
+    def test_join_hashing_larger_side(self):
+        """Check join gives the same results whichever side is hashed
+        """
+        # Right-hand side is larger than left
+        self.exprs.append(data=[5,'E',0.1])
+        self.exprs.append(data=[6,'F',0.2])
+        expected = [[1,'alpha','',''],
+                    [2,'beta','B',0.5],
+                    [2,'beta','BB',2.5],
+                    [3,'gamma','',''],
+                    [4,'','D',1.5],
+                    [5,'','E',0.1],
+                    [6,'','F',0.2]]
+        self.assertJoin(self.genes.join(self.exprs,on='gene_id',how='outer'),
+                        expected)
+
+    def test_join_on_different_columns(self):
+        """Check joining on differently named key columns
+        """
+        names = TabFile(fp=cStringIO.StringIO(
+"""#name\tsymbol
+beta\tBET
+gamma\tGAM
+"""),first_line_is_header=True)
+        joined = self.genes.join(names,on='name',other_on=0)
+        self.assertEqual(joined.header(),['gene_id','name','symbol'])
+        self.assertJoin(joined,[[2,'beta','BET'],[3,'gamma','GAM']])
+
+    def test_join_on_multiple_columns(self):
+        """Check joining on a tuple of key columns
+        """
+        other = TabFile(fp=cStringIO.StringIO(
+"""#gene_id\tname\tscore
+2\tbeta\t10
+2\tB\t20
+"""),first_line_is_header=True)
+        joined = self.genes.join(other,on=('gene_id','name'))
+        self.assertEqual(joined.header(),['gene_id','name','score'])
+        self.assertJoin(joined,[[2,'beta',10]])
+
+    def test_join_with_tabfile_iterator(self):
+        """Check joining with a streamed TabFileIterator
+        """
+        exprs = TabFile.iterate(fp=cStringIO.StringIO(self.exprs_data),
+                                first_line_is_header=True)
+        expected = [[1,'alpha','',''],
+                    [2,'beta','B',0.5],
+                    [2,'beta','BB',2.5],
+                    [3,'gamma','',''],
+                    [4,'','D',1.5]]
+        self.assertJoin(self.genes.join(exprs,on='gene_id',how='outer'),
+                        expected)
+
+    def test_join_column_tabfiles(self):
+        """Check joining ColumnTabFiles
+        """
+        exprs = ColumnTabFile(fp=cStringIO.StringIO(self.exprs_data),
+                              first_line_is_header=True)
+        joined = exprs.join(self.genes,on='gene_id',how='left')
+        self.assertTrue(isinstance(joined,ColumnTabFile))
+        self.assertEqual(joined.header(),['gene_id','name','log2FC','name_2'])
+        self.assertJoin(joined,[[2,'B',0.5,'beta'],
+                                [4,'D',1.5,''],
+                                [2,'BB',2.5,'beta']])
+
+    def test_bad_join_type(self):
+        """Check that an unrecognised join type raises ValueError
+        """
+        self.assertRaises(ValueError,self.genes.join,self.exprs,
+                          'gene_id','sideways')
+
+class TestTabFileGroupBy(unittest.TestCase):
+    """Tests for grouping and aggregating TabFile data
+    """
+    def setUp(self):
+        self.data = """#chr\tstart\tscore
+chr1\t1\t4.5
+chr2\t100\t1.5
+chr1\t200\t2.5
+chr1\t300\t
+chr2\t400\t6.0
+"""
+        self.tabfile = TabFile(fp=cStringIO.StringIO(self.data),
+                               first_line_is_header=True)
+
+    def test_aggregate(self):
+        """Check aggregating with built-in functions
+        """
+        result = self.tabfile.groupby('chr').aggregate(('start','count'),
+                                                       ('score','sum'),
+                                                       ('score','mean'),
+                                                       ('start','min'),
+                                                       ('start','max'),
+                                                       ('score','first'),
+                                                       ('start','last'))
+        self.assertEqual(result.header(),['chr','start_count','score_sum',
+                                          'score_mean','start_min',
+                                          'start_max','score_first',
+                                          'start_last'])
+        self.assertEqual(len(result),2)
+        self.assertEqual(result[0].data,['chr1',3,7.0,3.5,1,300,4.5,300])
+        self.assertEqual(result[1].data,['chr2',2,7.5,3.75,100,400,1.5,400])
+
+    def test_aggregate_with_function(self):
+        """Check aggregating with a user-supplied function
+        """
+        result = self.tabfile.groupby('chr').aggregate(
+            ('start',lambda x: max(x)-min(x),'span'),
+            ('start',len))
+        self.assertEqual(result.header(),['chr','span','start_len'])
+        self.assertEqual(result[0].data,['chr1',299,3])
+        self.assertEqual(result[1].data,['chr2',300,2])
+
+    def test_aggregate_unknown_function(self):
+        """Check unknown aggregation function raises KeyError
+        """
+        self.assertRaises(KeyError,
+                          self.tabfile.groupby('chr').aggregate,
+                          ('start','median'))
+
+    def test_iterate_over_groups(self):
+        """Check iterating over groups of lines
+        """
+        groups = [(key,lines) for key,lines in self.tabfile.groupby('chr')]
+        self.assertEqual([key for key,lines in groups],['chr1','chr2'])
+        self.assertEqual([line['start'] for line in groups[0][1]],[1,200,300])
+        self.assertEqual([line['start'] for line in groups[1][1]],[100,400])
+
+    def test_groupby_multiple_columns(self):
+        """Check grouping on a tuple of columns
+        """
+        self.tabfile.append(data=['chr1',1,0.5])
+        result = self.tabfile.groupby(('chr','start')).aggregate(
+            ('score','count'))
+        self.assertEqual(result.header(),['chr','start','score_count'])
+        self.assertEqual(len(result),5)
+        self.assertEqual(result[0].data,['chr1',1,2])
+
+    def test_groupby_streaming(self):
+        """Check aggregating lines from a TabFileIterator
+        """
+        lines = TabFile.iterate(fp=cStringIO.StringIO(self.data),
+                                first_line_is_header=True)
+        result = lines.groupby('chr').aggregate(('score','max'))
+        self.assertEqual(result.header(),['chr','score_max'])
+        self.assertEqual(result[0].data,['chr1',4.5])
+        self.assertEqual(result[1].data,['chr2',6.0])
+
+    def test_groupby_column_tabfile(self):
+        """Check aggregating a ColumnTabFile
+        """
+        data = ColumnTabFile(fp=cStringIO.StringIO(self.data),
+                             first_line_is_header=True)
+        result = data.groupby('chr').aggregate(('start','sum'))
+        self.assertTrue(isinstance(result,ColumnTabFile))
+        self.assertEqual(result[0].data,['chr1',501])
+        self.assertEqual(result[1].data,['chr2',500])
+
 class TestWhiteSpaceHandlingTabFile(unittest.TestCase):
 
     def setUp(self):
@@ -370,6 +818,32 @@ chr2\t1234\t5678\t6.8
         self.assertEqual(fp.getvalue(),self.data.replace('\t',','))
         fp.close()
 
+    def test_write_data_in_batches(self):
+        """Write data out in multiple batches
+        """
+        tabfile = TabFile('test',self.fp,delimiter=',')
+        write_buffer_size = bcftbx.TabFile.WRITE_BUFFER_SIZE
+        try:
+            bcftbx.TabFile.WRITE_BUFFER_SIZE = 2
+            fp = cStringIO.StringIO()
+            tabfile.write(fp=fp,delimiter='\t')
+        finally:
+            bcftbx.TabFile.WRITE_BUFFER_SIZE = write_buffer_size
+        self.assertEqual(fp.getvalue(),self.data)
+
+    def test_write_data_with_custom_data_lines(self):
+        """Write data using a TabDataLine subclass
+        """
+        class UpperCaseDataLine(TabDataLine):
+            def __repr__(self):
+                return TabDataLine.__repr__(self).upper()
+        tabfile = TabFile('test',self.fp,delimiter=',',
+                          tab_data_line=UpperCaseDataLine)
+        fp = cStringIO.StringIO()
+        tabfile.write(fp=fp,delimiter='\t')
+        self.assertEqual(fp.getvalue(),self.data.upper())
+        self.assertEqual(tabfile[0].delimiter(),',')
+
 class TestTabFileValueConversions(unittest.TestCase):
     """Test that appropriate conversions are performed on input values
     """
@@ -521,6 +995,23 @@ chr2\t1234\t5678\t6.8
         self.assertEqual(str(tabfile[1]),"chr1\t5.7\t567\t890")
         self.assertEqual(str(tabfile[2]),"\t6.8\t1234\t5678")
 
+    def test_reorder_columns_by_index(self):
+        """Reorder and select columns in a TabFile using indices
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile = tabfile.reorderColumns([3,0])
+        self.assertEqual(tabfile.nColumns(),2)
+        self.assertEqual(tabfile[0].data,[4.6,'chr1'])
+        self.assertEqual(tabfile[2].data,[6.8,'chr2'])
+        tabfile = tabfile.reorderColumns([1])
+        self.assertEqual(tabfile[1].data,['chr1'])
+
+    def test_reorder_bad_column(self):
+        """Reordering with a non-existent column raises KeyError
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        self.assertRaises(KeyError,tabfile.reorderColumns,['chr','strand'])
+
 class TestTransposeTabFile(unittest.TestCase):
     """Test transposing the contents of a TabFile
     """
@@ -545,6 +1036,17 @@ chr2\t1234\t5678\t6.8
         self.assertEqual(len(tabfile1),tabfile2.nColumns())
         self.assertEqual(len(tabfile2),tabfile1.nColumns())
 
+    def test_transpose_tab_file_contents(self):
+        """Test values in transposed TabFile
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile = tabfile.transpose()
+        self.assertEqual(len(tabfile),4)
+        self.assertEqual(tabfile[0].data,['chr1','chr1','chr2'])
+        self.assertEqual(tabfile[1].data,[1,567,1234])
+        self.assertEqual(tabfile[3].data,[4.6,5.7,6.8])
+        self.assertEqual(str(tabfile[2]),"234\t890\t5678")
+
 class TestWholeColumnOperations(unittest.TestCase):
     """Test the transformColumn and computeColumn methods
     """
@@ -636,6 +1138,98 @@ chr2\t1234\t5678\t6.8
         for i in range(len(tabfile)):
             self.assertEqual(tabfile[i]['data'],results[i])
 
+class TestWholeColumnArrayOperations(unittest.TestCase):
+    """Test the vectorised transformColumnArray and computeColumnArray methods
+    """
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.data = """#chr\tstart\tend\tdata
+chr1\t1\t234\t4.6
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+"""
+
+    def load(self,tabfile_class=TabFile):
+        # Load the test data
+        return tabfile_class(fp=cStringIO.StringIO(self.data),
+                             first_line_is_header=True)
+
+    def test_column(self):
+        """Fetch all the values in a column
+        """
+        tabfile = self.load()
+        self.assertEqual(list(tabfile.column('start')),[1,567,1234])
+        self.assertEqual(list(tabfile.column(3)),[4.6,5.7,6.8])
+        self.assertEqual(tabfile.column('chr'),['chr1','chr1','chr2'])
+        if numpy is not None:
+            self.assertTrue(isinstance(tabfile.column('end'),numpy.ndarray))
+
+    def test_transform_column_array(self):
+        """Transform a column using a vectorised function
+        """
+        for tabfile_class in (TabFile,ColumnTabFile):
+            tabfile = self.load(tabfile_class)
+            tabfile.transformColumnArray('start',lambda x: [v+1 for v in x])
+            self.assertEqual(list(tabfile.column('start')),[2,568,1235])
+            self.assertEqual(str(tabfile[1]),"chr1\t568\t890\t5.7")
+
+    def test_compute_column_array(self):
+        """Compute a new column using a vectorised function
+        """
+        for tabfile_class in (TabFile,ColumnTabFile):
+            tabfile = self.load(tabfile_class)
+            tabfile.computeColumnArray('length',
+                                       lambda s,e: [y-x for x,y in zip(s,e)],
+                                       ('start','end'))
+            self.assertEqual(tabfile.header(),['chr','start','end','data',
+                                               'length'])
+            self.assertEqual(tabfile[0]['length'],233)
+            self.assertEqual(tabfile[2]['length'],4444)
+
+    def test_compute_column_array_overwrite_existing_column(self):
+        """Compute and overwrite an existing column using a vectorised function
+        """
+        for tabfile_class in (TabFile,ColumnTabFile):
+            tabfile = self.load(tabfile_class)
+            tabfile.computeColumnArray(0,lambda c: [x.upper() for x in c],
+                                       ('chr',))
+            self.assertEqual(tabfile.nColumns(),4)
+            self.assertEqual([line[0] for line in tabfile],
+                             ['CHR1','CHR1','CHR2'])
+
+    def test_compute_column_array_sorted_column_tabfile(self):
+        """Compute a column using a vectorised function after sorting
+        """
+        tabfile = self.load(ColumnTabFile)
+        tabfile.sort(lambda line: line['start'],reverse=True)
+        del(tabfile[1])
+        tabfile.computeColumnArray('data',lambda x: [v*10 for v in x],
+                                   ('start',))
+        self.assertEqual([line['data'] for line in tabfile],[12340,10])
+
+    def test_array_operation_wrong_number_of_values(self):
+        """Vectorised function returning wrong number of values raises ValueError
+        """
+        for tabfile_class in (TabFile,ColumnTabFile):
+            tabfile = self.load(tabfile_class)
+            self.assertRaises(ValueError,tabfile.transformColumnArray,
+                              'start',lambda x: [1])
+
+    @unittest.skipIf(numpy is None,"NumPy not available")
+    def test_numpy_operations(self):
+        """Transform and compute columns using NumPy functions
+        """
+        for tabfile_class in (TabFile,ColumnTabFile):
+            tabfile = self.load(tabfile_class)
+            tabfile.computeColumnArray('ratio',
+                                       lambda s,e: numpy.log2(e/(1.0*s)),
+                                       ('start','end'))
+            self.assertAlmostEqual(tabfile[1]['ratio'],0.650457,places=6)
+            self.assertTrue(type(tabfile[1]['ratio']) is float)
+            tabfile.transformColumnArray('data',numpy.round)
+            self.assertEqual(list(tabfile.column('data')),[5.0,6.0,7.0])
+
 class TestSortTabFile(unittest.TestCase):
 
     def setUp(self):
@@ -669,6 +1263,136 @@ chr2\t1234\t5678\t3.4
         for i in range(len(tabfile)):
             self.assertEqual(tabfile[i]['data'],sorted_data[i])
         
+class TestColumnNames(unittest.TestCase):
+    """Tests for the ColumnNames class
+    """
+    def test_column_names(self):
+        """ColumnNames behaves like a tuple with fast index lookups
+        """
+        names = ColumnNames(['chr','start','end','start'])
+        self.assertEqual(names,('chr','start','end','start'))
+        self.assertEqual(len(names),4)
+        self.assertEqual(names.index('chr'),0)
+        self.assertEqual(names.index('start'),1)
+        self.assertEqual(names.index('end'),2)
+        self.assertRaises(ValueError,names.index,'missing')
+        self.assertRaises(ValueError,names.index,['unhashable'])
+
+    def test_extended_column_names(self):
+        """ColumnNames.extended returns shared instances
+        """
+        names = ColumnNames(['chr','start'])
+        new_names = names.extended('end')
+        self.assertEqual(names,('chr','start'))
+        self.assertEqual(new_names,('chr','start','end'))
+        self.assertEqual(new_names.index('end'),2)
+        self.assertTrue(names.extended('end') is new_names)
+
+    def test_tabfile_lines_share_column_names(self):
+        """Lines in a TabFile share the same ColumnNames instance
+        """
+        tabfile = TabFile(fp=cStringIO.StringIO("#a\tb\n1\t2\n3\t4\n"),
+                          first_line_is_header=True)
+        line = tabfile.append(data=[5,6])
+        self.assertTrue(isinstance(tabfile[0].names,ColumnNames))
+        self.assertTrue(tabfile[0].names is tabfile[1].names)
+        self.assertTrue(tabfile[0].names is line.names)
+        tabfile.appendColumn('c')
+        self.assertEqual(tabfile[0].names,('a','b','c'))
+        self.assertTrue(tabfile[0].names is tabfile[2].names)
+        self.assertTrue(tabfile.append().names is tabfile[0].names)
+        self.assertEqual(tabfile[1]['c'],'')
+
+    def test_tabdataline_assign_list_of_names(self):
+        """TabDataLine converts a list assigned to 'names'
+        """
+        line = TabDataLine("1\t2",column_names=('a','b'))
+        line.names = list(line.names) + ['c']
+        self.assertTrue(isinstance(line.names,ColumnNames))
+        self.assertEqual(line.names,('a','b','c'))
+        self.assertEqual(line['b'],2)
+        line.names = None
+        self.assertEqual(line.names,())
+
+    def test_tabdataline_has_no_dict(self):
+        """TabDataLine uses slots rather than a per-instance dictionary
+        """
+        line = TabDataLine("1\t2",column_names=('a','b'))
+        self.assertFalse(hasattr(line,'__dict__'))
+        self.assertRaises(AttributeError,setattr,line,'extra',1)
+
+class TestExternalSort(unittest.TestCase):
+    """Tests for sorting using an external merge sort
+    """
+    def setUp(self):
+        # Make data with lots of repeated values
+        random.seed(12345)
+        lines = ["#name\tgroup\tvalue"]
+        for i in range(250):
+            lines.append("item%d\t%s\t%.2f" % (i,
+                                                random.choice('ABCDE'),
+                                                random.random()))
+        self.data = '\n'.join(lines) + '\n'
+
+    def tabfile(self):
+        return TabFile(fp=cStringIO.StringIO(self.data),
+                       first_line_is_header=True)
+
+    def assertSameLines(self,lines1,lines2):
+        self.assertEqual([(str(x),x.lineno()) for x in lines1],
+                         [(str(x),x.lineno()) for x in lines2])
+
+    def test_sort_lines_matches_in_memory_sort(self):
+        """sort_lines gives the same results as an in-memory sort
+        """
+        for sort_func in (lambda line: line['group'],
+                          lambda line: line['value'],
+                          lambda line: (line['group'],line['value'])):
+            for reverse in (False,True):
+                expected = self.tabfile()
+                expected.sort(sort_func,reverse=reverse)
+                for buffer_size in (7,100,1000):
+                    lines = sort_lines(self.tabfile(),sort_func,
+                                       reverse=reverse,
+                                       buffer_size=buffer_size)
+                    self.assertSameLines(lines,expected)
+
+    def test_sorted_lines_behave_like_originals(self):
+        """Lines from an external sort have the same names and settings
+        """
+        lines = [line for line in sort_lines(self.tabfile(),
+                                             lambda line: line['value'],
+                                             buffer_size=10)]
+        self.assertEqual(len(lines),250)
+        self.assertEqual(lines[0].names,('name','group','value'))
+        self.assertTrue(lines[0].names is lines[-1].names)
+        lines[0]['value'] = '1.5'
+        self.assertEqual(lines[0]['value'],1.5)
+
+    def test_sort_tabfile_with_buffer_size(self):
+        """TabFile.sort with buffer_size uses external sort
+        """
+        expected = self.tabfile()
+        expected.sort(lambda line: line['group'],reverse=True)
+        tabfile = self.tabfile()
+        tabfile.create_index('group')
+        tabfile.sort(lambda line: line['group'],reverse=True,buffer_size=16)
+        self.assertEqual(len(tabfile),250)
+        self.assertSameLines(tabfile,expected)
+        self.assertSameLines(tabfile.lookup('group','C'),
+                             expected.lookup('group','C'))
+
+    def test_sort_streamed_lines(self):
+        """Sort lines from TabFile.iterate
+        """
+        expected = self.tabfile()
+        expected.sort(lambda line: line['value'])
+        lines = TabFile.iterate(fp=cStringIO.StringIO(self.data),
+                                first_line_is_header=True)
+        self.assertSameLines(lines.sort(lambda line: line['value'],
+                                        buffer_size=20),
+                             expected)
+
 class TestTabDataLine(unittest.TestCase):
 
     def test_new_line_no_data(self):
@@ -882,6 +1606,345 @@ class TestTabDataLineDelimiters(unittest.TestCase):
         for i in range(len(input_data)):
             self.assertEqual(input_data[i],line[i])
         
+class TestTabFileIterator(unittest.TestCase):
+    """Tests for streaming data using TabFile.iterate
+    """
+    def setUp(self):
+        # Make file-like object to read data in
+        self.data = \
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.6
+# Comment
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+"""
+        self.fp = cStringIO.StringIO(self.data)
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def test_iterate_lines(self):
+        """Iterate over lines in a file without a header
+        """
+        lines = TabFile.iterate(fp=self.fp)
+        self.assertTrue(isinstance(lines,TabFileIterator))
+        self.assertEqual(lines.header(),[])
+        lines = [line for line in lines]
+        self.assertEqual(len(lines),3)
+        self.assertEqual(str(lines[0]),"chr1\t1\t234\t4.6")
+        self.assertEqual(lines[1][1],567)
+        self.assertEqual(lines[2].data,['chr2',1234,5678,6.8])
+        self.assertEqual([line.lineno() for line in lines],[2,4,5])
+
+    def test_iterate_lines_with_header(self):
+        """Iterate over lines in a file taking header from first line
+        """
+        lines = TabFile.iterate(fp=self.fp,first_line_is_header=True)
+        self.assertEqual(lines.header(),['chr','start','end','data'])
+        self.assertEqual(lines.nColumns(),4)
+        self.assertEqual([line['end'] for line in lines],[234,890,5678])
+
+    def test_iterate_lines_no_conversion(self):
+        """Iterate over lines without type conversion
+        """
+        lines = TabFile.iterate(fp=self.fp,first_line_is_header=True,
+                                column_names=('CHR','START','END','DATA'),
+                                convert=False)
+        self.assertEqual(lines.header(),['CHR','START','END','DATA'])
+        self.assertEqual([line['START'] for line in lines],['1','567','1234'])
+
+    def test_iterate_same_as_tabfile(self):
+        """Lines from iterating match those loaded by TabFile
+        """
+        tabfile = TabFile(fp=cStringIO.StringIO(self.data),
+                          first_line_is_header=True)
+        lines = TabFile.iterate(fp=self.fp,first_line_is_header=True)
+        for line1,line2 in zip(tabfile,lines):
+            self.assertEqual(line1.data,line2.data)
+            self.assertEqual(line1.lineno(),line2.lineno())
+
+    def test_iterate_ragged_file(self):
+        """Iterating over a ragged file raises IndexError
+        """
+        fp = cStringIO.StringIO("chr1\t1\t234\nchr1\t567\t890\t5.7\n")
+        lines = TabFile.iterate(fp=fp)
+        self.assertRaises(IndexError,list,lines)
+
+    def test_iterate_named_file(self):
+        """Iterate over lines from a named file
+        """
+        fd,filen = tempfile.mkstemp()
+        try:
+            fp = os.fdopen(fd,'w')
+            fp.write(self.data)
+            fp.close()
+            lines = TabFile.iterate(filen,skip_first_line=True)
+            self.assertEqual(lines.filename(),filen)
+            self.assertEqual(len([line for line in lines]),3)
+        finally:
+            os.remove(filen)
+
+class TestColumnTabFile(unittest.TestCase):
+    """Tests for the ColumnTabFile class
+    """
+    def setUp(self):
+        # Make file-like object to read data in
+        self.header = "#chr\tstart\tend\tdata\n"
+        self.data = \
+"""chr1\t1\t234\t4.6
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+"""
+        self.fp = cStringIO.StringIO(self.header+self.data)
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def test_load_data(self):
+        """ColumnTabFile: load data without header
+        """
+        tabfile = ColumnTabFile('test',self.fp)
+        self.assertEqual(len(tabfile),3)
+        self.assertEqual(tabfile.header(),[])
+        self.assertEqual(tabfile.nColumns(),4)
+        self.assertEqual(tabfile.filename(),'test')
+        self.assertEqual(str(tabfile[0]),"chr1\t1\t234\t4.6")
+        self.assertEqual(tabfile[2][0],'chr2')
+        self.assertEqual(tabfile[-1][-1],6.8)
+        self.assertEqual(tabfile[0].lineno(),2)
+
+    def test_load_data_with_header(self):
+        """ColumnTabFile: load data using first line as header
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        self.assertEqual(tabfile.header(),['chr','start','end','data'])
+        self.assertEqual(tabfile[2]['chr'],'chr2')
+        self.assertEqual(tabfile[1]['start'],567)
+        self.assertEqual(tabfile[1]['data'],5.7)
+        self.assertEqual(tabfile[1].names,('chr','start','end','data'))
+        self.assertEqual(tabfile[1].data,['chr1',567,890,5.7])
+        self.assertRaises(KeyError,tabfile[0].__getitem__,'missing')
+        self.assertRaises(IndexError,tabfile[0].__getitem__,4)
+
+    def test_same_values_as_tabfile(self):
+        """ColumnTabFile: values and types match those from TabFile
+        """
+        data = "a\t1\t\t2.5\t007\nb\t-2\t3\tx\t1e3\n"
+        tabfile = TabFile(fp=cStringIO.StringIO(data))
+        coltabfile = ColumnTabFile(fp=cStringIO.StringIO(data))
+        for line1,line2 in zip(tabfile,coltabfile):
+            self.assertEqual(line1.data,line2.data)
+            self.assertEqual([type(x) for x in line1.data],
+                             [type(x) for x in line2.data])
+        coltabfile = ColumnTabFile(fp=cStringIO.StringIO(data),convert=False)
+        self.assertEqual(coltabfile[0].data,['a','1','','2.5','007'])
+
+    def test_typed_columns(self):
+        """ColumnTabFile: numeric columns are stored as typed arrays
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        start = tabfile.column('start')
+        data = tabfile.column('data')
+        self.assertEqual(list(start),[1,567,1234])
+        self.assertEqual(list(data),[4.6,5.7,6.8])
+        self.assertEqual(tabfile.column('chr'),['chr1','chr1','chr2'])
+        if numpy is not None:
+            self.assertTrue(isinstance(start,numpy.ndarray))
+            self.assertEqual(list(start*2),[2,1134,2468])
+        # Setting a value of a different type
+        tabfile[1]['start'] = 'unknown'
+        self.assertEqual(tabfile.column('start'),[1,'unknown',1234])
+        self.assertEqual(str(tabfile[1]),"chr1\tunknown\t890\t5.7")
+
+    def test_load_data_in_chunks(self):
+        """ColumnTabFile: column types are correct when loading in chunks
+        """
+        lines = ["%d\t%d" % (i,i) for i in range(LOAD_CHUNK_SIZE+5)]
+        lines.append("x\t1.5")
+        tabfile = ColumnTabFile(fp=cStringIO.StringIO('\n'.join(lines)))
+        self.assertEqual(len(tabfile),LOAD_CHUNK_SIZE+6)
+        self.assertEqual(tabfile[LOAD_CHUNK_SIZE+1][0],LOAD_CHUNK_SIZE+1)
+        self.assertEqual(tabfile[-1].data,['x',1.5])
+        self.assertEqual(tabfile[-2].data,[LOAD_CHUNK_SIZE+4,LOAD_CHUNK_SIZE+4])
+
+    def test_load_mixed_types_in_chunks(self):
+        """ColumnTabFile: mixed int/float columns are correct across chunks
+        """
+        # Integers followed by a float in the next chunk
+        lines = ["%d" % i for i in range(LOAD_CHUNK_SIZE)]
+        lines.append("0.5")
+        tabfile = ColumnTabFile(fp=cStringIO.StringIO('\n'.join(lines)))
+        self.assertEqual(len(tabfile),LOAD_CHUNK_SIZE+1)
+        self.assertEqual(tabfile[-1][0],0.5)
+        self.assertTrue(isinstance(tabfile[-2][0],int))
+        # Floats followed by integers in the next chunk
+        lines = ["1.5"]*LOAD_CHUNK_SIZE + ["3","4"]
+        tabfile = ColumnTabFile(fp=cStringIO.StringIO('\n'.join(lines)))
+        self.assertEqual(tabfile[0][0],1.5)
+        self.assertEqual([line[0] for line in tabfile][-2:],[3,4])
+        self.assertTrue(isinstance(tabfile[-1][0],int))
+        # Same values as TabFile
+        for data in (lines,["1","2.5"]*LOAD_CHUNK_SIZE):
+            data = '\n'.join(data)
+            self.assertEqual(
+                [line.data for line in
+                 ColumnTabFile(fp=cStringIO.StringIO(data))],
+                [line.data for line in TabFile(fp=cStringIO.StringIO(data))])
+
+    def test_write_data(self):
+        """ColumnTabFile: write data to file-like object
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        fp = cStringIO.StringIO()
+        tabfile.write(fp=fp,include_header=True)
+        self.assertEqual(fp.getvalue(),self.header+self.data)
+        fp = cStringIO.StringIO()
+        tabfile.write(fp=fp,delimiter=',')
+        self.assertEqual(fp.getvalue(),self.data.replace('\t',','))
+
+    def test_write_data_in_batches(self):
+        """ColumnTabFile: write data in multiple batches
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        tabfile.sort(lambda line: line['start'],reverse=True)
+        write_buffer_size = bcftbx.TabFile.WRITE_BUFFER_SIZE
+        try:
+            bcftbx.TabFile.WRITE_BUFFER_SIZE = 2
+            fp = cStringIO.StringIO()
+            tabfile.write(fp=fp)
+        finally:
+            bcftbx.TabFile.WRITE_BUFFER_SIZE = write_buffer_size
+        self.assertEqual(fp.getvalue(),
+                         ''.join(reversed(self.data.splitlines(True))))
+
+    def test_lookup(self):
+        """ColumnTabFile: look up data
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        matching = tabfile.lookup('chr','chr1')
+        self.assertEqual(len(matching),2)
+        self.assertEqual(matching[0],tabfile[0])
+        self.assertEqual(matching[1],tabfile[1])
+        self.assertNotEqual(matching[0],matching[1])
+        self.assertEqual(tabfile.lookup('end',5678),[tabfile[2]])
+        self.assertEqual(tabfile.lookup('chr','chr3'),[])
+        self.assertEqual(tabfile.lookup(('chr','start'),('chr1',567)),
+                         [tabfile[1]])
+
+    def test_get_index_for_line_number(self):
+        """ColumnTabFile: look up line numbers
+        """
+        tabfile = ColumnTabFile('test',self.fp)
+        self.assertEqual(tabfile.indexByLineNumber(2),0)
+        self.assertEqual(tabfile.indexByLineNumber(4),2)
+        self.assertRaises(IndexError,tabfile.indexByLineNumber,1)
+
+    def test_append_and_insert(self):
+        """ColumnTabFile: append and insert lines
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        line = tabfile.append(data=['chr1',678,901,6.1])
+        self.assertEqual(line.data,['chr1',678,901,6.1])
+        self.assertEqual(line.lineno(),None)
+        line = tabfile.insert(1,tabdata='chr3\t10\t20\t0.5')
+        self.assertEqual(len(tabfile),5)
+        self.assertEqual(tabfile[1],line)
+        self.assertEqual(str(tabfile[1]),'chr3\t10\t20\t0.5')
+        line = tabfile.append(tabdataline=TabDataLine('chrX\t1\t2\t3'))
+        self.assertEqual(str(tabfile[-1]),'chrX\t1\t2\t3')
+        line = tabfile.append()
+        self.assertEqual(str(line),'\t\t\t')
+        self.assertFalse(line)
+        self.assertRaises(IndexError,tabfile.append,data=[1,2,3,4,5])
+
+    def test_add_data_to_new_columntabfile(self):
+        """ColumnTabFile: add data to an empty ColumnTabFile
+        """
+        tabfile = ColumnTabFile(column_names=['one','two','three'])
+        self.assertEqual(tabfile.nColumns(),3)
+        tabfile.append(data=[1,2,3])
+        tabfile.append(data=[4,5,6])
+        self.assertEqual(list(tabfile.column('two')),[2,5])
+        tabfile = ColumnTabFile()
+        tabfile.append(tabdata='1\t2')
+        tabfile.append(data=['a','b','c'])
+        self.assertEqual(tabfile.nColumns(),3)
+        self.assertEqual(str(tabfile),"1\t2\t\na\tb\tc")
+
+    def test_delete_line(self):
+        """ColumnTabFile: delete lines
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        line = tabfile[2]
+        del(tabfile[0])
+        self.assertEqual(len(tabfile),2)
+        self.assertEqual(tabfile[0]['start'],567)
+        self.assertEqual(tabfile[1],line)
+
+    def test_append_column(self):
+        """ColumnTabFile: append new column
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        tabfile.appendColumn('new')
+        self.assertEqual(tabfile.header(),['chr','start','end','data','new'])
+        self.assertEqual(tabfile[0]['new'],'')
+        tabfile[0]['new'] = '2'
+        self.assertEqual(tabfile[0]['new'],2)
+
+    def test_sort(self):
+        """ColumnTabFile: sort on a column
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        line = tabfile[0]
+        tabfile.sort(lambda line: line['end'],reverse=True)
+        self.assertEqual(list(tabfile.column('end')),[5678,890,234])
+        self.assertEqual(tabfile[2],line)
+        tabfile.sort(lambda line: line['end'])
+        self.assertEqual(list(tabfile.column('end')),[234,890,5678])
+
+    def test_reorder_columns(self):
+        """ColumnTabFile: reorder columns
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        tabfile[0]['chr'] = ''
+        tabfile = tabfile.reorderColumns(['chr','data','start'])
+        self.assertEqual(tabfile.header(),['chr','data','start'])
+        self.assertEqual(str(tabfile[0]),"\t4.6\t1")
+        self.assertEqual(str(tabfile[2]),"chr2\t6.8\t1234")
+
+    def test_transpose(self):
+        """ColumnTabFile: transpose
+        """
+        tabfile = ColumnTabFile('test',self.fp).transpose()
+        self.assertEqual(len(tabfile),4)
+        self.assertEqual(tabfile.nColumns(),3)
+        self.assertEqual(str(tabfile[0]),"chr1\tchr1\tchr2")
+        self.assertEqual(str(tabfile[1]),"1\t567\t1234")
+
+    def test_whole_column_operations(self):
+        """ColumnTabFile: transformColumn and computeColumn
+        """
+        tabfile = ColumnTabFile('test',self.fp,first_line_is_header=True)
+        tabfile.transformColumn('data',lambda x: x/10)
+        self.assertEqual(list(tabfile.column('data')),[0.46,0.57,0.68])
+        tabfile.computeColumn('midpoint',
+                              lambda line: (line['end'] + line['start'])/2.0)
+        self.assertEqual(list(tabfile.column('midpoint')),[117.5,728.5,3456])
+        tabfile.computeColumn(3,lambda line: line['end'] - line['start'])
+        self.assertEqual(list(tabfile.column('data')),[233,323,4444])
+
+    def test_ragged_input_file(self):
+        """ColumnTabFile: deal with mismatched numbers of items
+        """
+        data = "#chr\tstart\tend\tdata\nchr1\t1\t234\nchr1\t567\t890\t5.7\t4.6\n"
+        self.assertRaises(IndexError,ColumnTabFile,
+                          fp=cStringIO.StringIO(data),
+                          first_line_is_header=True)
+        self.assertRaises(IndexError,ColumnTabFile,
+                          fp=cStringIO.StringIO(data))
+
 ########################################################################
 # Main: test runner
 #########################################################################
@@ -469,6 +469,103 @@ class TestWalkFunction(unittest.TestCase):
         self.assertEqual(len(filelist),0,"Items not returned: %s" %
                          ','.join(filelist))
 
+    def test_walk_with_pattern_and_workers(self):
+        """'walk' filters by pattern using multiple threads
+
+        """
+        pattern = os.path.join(self.wd,"welsh")
+        expected = [f for f in self.example_dir.filelist(include_dirs=True)
+                    if f.startswith(pattern)]
+        self.assertEqual(sorted(walk(self.wd,pattern=pattern,workers=4)),
+                         sorted(expected))
+
+class TestScandirWalkFunction(unittest.TestCase):
+    """Unit tests for the 'scandir_walk' function and DirEntry class
+
+    """
+    def setUp(self):
+        # Make a test data directory structure
+        self.example_dir = mock_data.ExampleDirLanguages()
+        self.wd = self.example_dir.create_directory()
+
+    def tearDown(self):
+        # Remove the test data directory
+        self.example_dir.delete_directory()
+
+    def _walk(self,**kws):
+        # Convert scandir_walk output to os.walk-style names
+        return [(dirpath,
+                 sorted([d.name for d in dirs]),
+                 sorted([f.name for f in files]))
+                for dirpath,dirs,files in scandir_walk(self.wd,**kws)]
+
+    def _os_walk(self,**kws):
+        return [(dirpath,sorted(dirs),sorted(files))
+                for dirpath,dirs,files in os.walk(self.wd,**kws)]
+
+    def test_scandir_walk_matches_os_walk(self):
+        """'scandir_walk' gives same results as 'os.walk'
+
+        """
+        self.example_dir.add_link("broken","missing")
+        self.assertEqual(sorted(self._walk()),sorted(self._os_walk()))
+        self.assertEqual(sorted(self._walk(followlinks=True)),
+                         sorted(self._os_walk(followlinks=True)))
+
+    def test_scandir_walk_with_workers(self):
+        """'scandir_walk' gives same results in same order with workers
+
+        """
+        self.assertEqual(self._walk(workers=4),self._walk())
+        self.assertEqual(self._walk(followlinks=True,workers=4),
+                         self._walk(followlinks=True))
+
+    def test_scandir_walk_prune_dirs(self):
+        """'scandir_walk' doesn't descend into removed subdirectories
+
+        """
+        for workers in (1,4):
+            dirpaths = []
+            for dirpath,dirs,files in scandir_walk(self.wd,workers=workers):
+                dirpaths.append(dirpath)
+                dirs[:] = [d for d in dirs if d.name != "welsh"]
+            self.assertFalse(os.path.join(self.wd,"welsh") in dirpaths)
+            self.assertTrue(os.path.join(self.wd,"spanish") in dirpaths)
+
+    def test_scandir_walk_without_scandir(self):
+        """'scandir_walk' falls back to listdir when scandir not available
+
+        """
+        import bcftbx.utils
+        expected = self._walk(followlinks=True)
+        saved_scandir = bcftbx.utils.scandir
+        try:
+            bcftbx.utils.scandir = None
+            self.assertEqual(self._walk(followlinks=True),expected)
+        finally:
+            bcftbx.utils.scandir = saved_scandir
+
+    def test_direntry(self):
+        """DirEntry reports types of files, directories and links
+
+        """
+        self.example_dir.add_link("broken","missing")
+        entries = dict([(name,DirEntry(self.wd,name))
+                        for name in ("hello","hi","spanish","countries",
+                                     "broken")])
+        self.assertEqual(entries["hello"].path,
+                         os.path.join(self.wd,"hello"))
+        self.assertTrue(entries["hello"].is_file())
+        self.assertFalse(entries["hello"].is_symlink())
+        self.assertTrue(entries["hi"].is_file())
+        self.assertTrue(entries["hi"].is_symlink())
+        self.assertFalse(entries["hi"].is_file(follow_symlinks=False))
+        self.assertTrue(entries["spanish"].is_dir())
+        self.assertFalse(entries["broken"].is_file())
+        self.assertFalse(entries["broken"].is_dir())
+        self.assertTrue(entries["broken"].is_symlink())
+        self.assertEqual(entries["hello"].stat().st_size,6)
+
 class TestListDirsFunction(unittest.TestCase):
     """Tests for the list_dirs function
 
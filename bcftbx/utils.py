@@ -7,7 +7,7 @@
 #
 #########################################################################
 
-__version__ = "1.5.2"
+__version__ = "1.6.0"
 
 """utils
 
@@ -36,6 +36,8 @@ File system wrappers and utilities:
   get_group_from_gid
   get_gid_from_group
   get_hostname
+  DirEntry
+  scandir_walk
   walk
   list_dirs
   strip_ext
@@ -80,6 +82,14 @@ import grp
 import datetime
 import re
 import socket
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 #######################################################################
 # General utility classes
@@ -771,11 +781,178 @@ def get_hostname():
     """
     return socket.getfqdn()
 
-def walk(dirn,include_dirs=True,pattern=None):
+class DirEntry(object):
+    """Minimal substitute for the DirEntry objects returned by 'scandir'
+
+    Provides the 'name' and 'path' attributes and the 'is_dir',
+    'is_file', 'is_symlink' and 'stat' methods of the DirEntry
+    class, for use when the 'scandir' function isn't available
+    (i.e. it is not in the 'os' module and the 'scandir' package
+    is not installed). The results of the underlying 'lstat' and
+    'stat' calls are cached so each is performed at most once
+    per entry.
+
+    """
+    def __init__(self,dirpath,name):
+        """Create a new DirEntry instance
+
+        Arguments:
+          dirpath: path of the directory containing the entry
+          name: name of the entry within the directory
+
+        """
+        self.name = name
+        self.path = os.path.join(dirpath,name)
+        self._lstat = None
+        self._stat = None
+
+    def stat(self,follow_symlinks=True):
+        """Return the stat information for the entry
+        """
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        if not follow_symlinks or not stat.S_ISLNK(self._lstat.st_mode):
+            return self._lstat
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_symlink(self):
+        """Return True if the entry is a symbolic link
+        """
+        try:
+            return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+        except OSError:
+            return False
+
+    def is_dir(self,follow_symlinks=True):
+        """Return True if the entry is (or points to) a directory
+        """
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self,follow_symlinks=True):
+        """Return True if the entry is (or points to) a regular file
+        """
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def __repr__(self):
+        return "<DirEntry '%s'>" % self.name
+
+def _scan_dir(dirn):
+    """Internal: list a directory's subdirectories and files
+
+    Returns a tuple (dirs,files) where 'dirs' is a list of
+    DirEntry objects for the subdirectories (including links
+    to directories) and 'files' is a list for everything else,
+    or None if the directory can't be listed.
+
+    """
+    dirs = []
+    files = []
+    try:
+        if scandir is not None:
+            entries = scandir(dirn)
+        else:
+            entries = [DirEntry(dirn,name) for name in os.listdir(dirn)]
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry)
+            else:
+                files.append(entry)
+    except OSError:
+        return None
+    return (dirs,files)
+
+# Maximum number of directory listings to fetch ahead per thread
+SCANDIR_PREFETCH_PER_WORKER = 4
+
+def scandir_walk(dirn,followlinks=False,workers=1):
+    """Traverse a directory structure using 'scandir'
+
+    Equivalent to 'os.walk' (top-down, and ignoring directories
+    which can't be read) except that the subdirectories and files
+    are returned as lists of DirEntry objects rather than names.
+    The type information from the directory listing is reused by
+    the DirEntry methods ('is_dir', 'is_symlink' etc), so there
+    are far fewer 'stat' calls than when using 'os.walk' and then
+    checking each path (which makes a large difference on network
+    and parallel filesystems).
+
+    As for 'os.walk', subdirectories which are removed from the
+    list of DirEntry objects before the walk continues are not
+    traversed.
+
+    The 'scandir' function is taken from the 'os' module if
+    available, or else the 'scandir' package; if neither is
+    available then the listings are done with 'os.listdir' and
+    'os.lstat' instead.
+
+    If 'workers' is more than one then the listings of the
+    subdirectories are fetched ahead in parallel threads; the
+    results are still returned in the same order as for a
+    single thread.
+
+    Arguments:
+      dirn: top-level directory to start traversal from
+      followlinks: if True then also traverse symbolic links
+        to directories (default is not to traverse them)
+      workers: (optional) number of threads to use for
+        listing directories (default is 1 i.e. no threading)
+
+    Returns:
+      Yields a tuple (dirpath,dirs,files) for each directory,
+      where dirpath is the path to the directory and dirs and
+      files are lists of DirEntry objects.
+
+    """
+    if workers is None or workers <= 1:
+        pool = None
+    else:
+        pool = ThreadPool(workers)
+        max_pending = workers*SCANDIR_PREFETCH_PER_WORKER
+    # Stack of directories still to visit, in reverse order,
+    # with any prefetched listings
+    stack = [[dirn,None]]
+    try:
+        while stack:
+            if pool is not None:
+                # Prefetch listings for the next directories
+                for item in stack[-max_pending:]:
+                    if item[1] is None:
+                        item[1] = pool.apply_async(_scan_dir,(item[0],))
+            dirpath,listing = stack.pop()
+            if listing is None:
+                listing = _scan_dir(dirpath)
+            else:
+                listing = listing.get()
+            if listing is None:
+                continue
+            dirs,files = listing
+            yield (dirpath,dirs,files)
+            for d in reversed(dirs):
+                if followlinks or not d.is_symlink():
+                    stack.append([d.path,None])
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+
+def walk(dirn,include_dirs=True,pattern=None,workers=1):
     """Traverse the directory, subdirectories and files
 
     Essentially this 'walk' function is a convenience wrapper
-    for the 'os.walk' function.
+    for the 'scandir_walk' function.
 
     Arguments:
       dirn: top-level directory to start traversal from
@@ -785,6 +962,8 @@ def walk(dirn,include_dirs=True,pattern=None):
         pattern which restricts the set of yielded files and
         directories to a subset of those which match the
         pattern
+      workers: (optional) number of threads to use for
+        listing directories (see 'scandir_walk')
         
     """
     if pattern is not None:
@@ -792,16 +971,14 @@ def walk(dirn,include_dirs=True,pattern=None):
     if include_dirs:
         if pattern is None or matcher.match(dirn):
             yield dirn
-    for dirpath,dirnames,filenames in os.walk(dirn):
+    for dirpath,dirs,files in scandir_walk(dirn,workers=workers):
         if include_dirs:
-            for d in dirnames:
-                d1 = os.path.join(dirpath,d)
-                if pattern is None or matcher.match(d1):
-                    yield d1
-        for f in filenames:
-            f1 = os.path.join(dirpath,f)
-            if pattern is None or matcher.match(f1):
-                yield f1
+            for d in dirs:
+                if pattern is None or matcher.match(d.path):
+                    yield d.path
+        for f in files:
+            if pattern is None or matcher.match(f.path):
+                yield f.path
 
 def list_dirs(parent,matches=None,startswith=None):
     """Return list of subdirectories relative to 'parent'
@@ -967,7 +1144,7 @@ class Symlink:
         """
         return self._path
 
-def links(dirn):
+def links(dirn,workers=1):
     """Traverse and return all symbolic links in under a directory
 
     Given a starting directory, traverses the structure underneath
@@ -975,22 +1152,22 @@ def links(dirn):
 
     Arguments:
       dirn: name of the top-level directory
+      workers: (optional) number of threads to use for
+        listing directories (see 'scandir_walk')
 
     Returns:
       Yields the name and full path for each symbolic link under 'dirn'.
 
     """
-    for d in os.walk(dirn):
-        if os.path.islink(d[0]):
-            yield d[0]
-        for sd in d[1]:
-            path = os.path.join(d[0],sd)
-            if os.path.islink(path):
-                yield path
-        for f in d[2]:
-            path = os.path.join(d[0],f)
-            if os.path.islink(path):
-                yield path
+    if os.path.islink(dirn):
+        yield dirn
+    for dirpath,dirs,files in scandir_walk(dirn,workers=workers):
+        for entry in dirs:
+            if entry.is_symlink():
+                yield entry.path
+        for entry in files:
+            if entry.is_symlink():
+                yield entry.path
 
 #######################################################################
 # Sample/library name utilities
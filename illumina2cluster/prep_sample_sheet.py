@@ -15,7 +15,7 @@ Prepare sample sheet file for Illumina sequencers.
 
 """
 
-__version__ = "0.4.0"
+__version__ = "0.4.1"
 
 #######################################################################
 # Imports
@@ -217,6 +217,12 @@ if __name__ == "__main__":
                  default=None,
                  help="set the adapter sequence for read 2 in the 'Settings'"
                  "section to ADAPTER_READ2")
+    p.add_option('--check-barcodes',action="store_true",dest="check_barcodes",
+                 default=False,
+                 help="report the minimum Hamming distance between index "
+                 "sequences in each lane, and the maximum number of mismatches "
+                 "that can safely be allowed when demultiplexing; identical "
+                 "index sequences within a lane are treated as errors")
     deprecated_options = optparse.OptionGroup(p,"Deprecated options")
     deprecated_options.add_option('--truncate-barcodes',action="store",dest="barcode_len",
                                   default=None,type='int',
@@ -355,6 +361,30 @@ if __name__ == "__main__":
                             line,
                             data.sample_id_column,
                             data.sample_project_column)
+    # Check barcodes
+    if options.check_barcodes:
+        barcodes = IlluminaData.SampleSheetBarcodes(sample_sheet=data)
+        print "Barcode distances:"
+        for lane in barcodes.lanes:
+            if lane is None:
+                lane_name = "All samples"
+            else:
+                lane_name = "Lane %s" % lane
+            nsamples = len(barcodes.barcodes(lane))
+            min_distance = barcodes.min_distance(lane)
+            if min_distance is None:
+                print "%s: %d sample" % (lane_name,nsamples)
+                continue
+            print "%s: %d samples, minimum distance %d " \
+                "(safe mismatches: %d)" % (lane_name,nsamples,min_distance,
+                                           barcodes.max_mismatches(lane))
+            for collision in barcodes.collisions(lane):
+                check_status = 1
+                logging.warning("%s: samples '%s' and '%s' have the same "
+                                "index sequence '%s'" % (lane_name,
+                                                         collision[0],
+                                                         collision[2],
+                                                         collision[1]))
     # Predict outputs
     if check_status == 0 or options.ignore_warnings or options.view:
         # Generate prediction
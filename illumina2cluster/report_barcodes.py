@@ -20,10 +20,11 @@ Fastq file from an Illumina sequencer.
 # Import modules that this module depends on
 #######################################################################
 
-__version__ = "0.0.2"
+__version__ = "0.0.3"
 
 import sys
 import optparse
+import heapq
 import bcftbx.FASTQFile as FASTQFile
 
 #######################################################################
@@ -106,6 +107,164 @@ class Barcodes:
         grp.sort()
         return grp
 
+class TopBarcodes(Barcodes):
+    """Class for approximate counting of the most common index sequences
+
+    Uses the 'Space-Saving' heavy-hitter algorithm (Metwally et al
+    2005) to track at most 'k' index sequences at any time, so that
+    memory use is fixed regardless of how many distinct (e.g.
+    erroneous) sequences are present in the input.
+
+    The count reported for each monitored sequence is an upper
+    bound on the true count, and 'error_for' returns the maximum
+    overestimate. Any sequence which occurs more than N/k times
+    (where N is the total number of reads) is guaranteed to be
+    monitored.
+
+    Exact counts for the monitored sequences can be obtained by
+    calling 'verify' on a second pass through the same data.
+
+    """
+    def __init__(self,k=1000):
+        """Create a new TopBarcodes instance
+
+        Arguments:
+          k: maximum number of index sequences to monitor
+            (default: 1000)
+
+        """
+        Barcodes.__init__(self)
+        if k < 1:
+            raise ValueError("Number of sequences to monitor must be "
+                             "positive (got %s)" % k)
+        self._k = k
+        self._errors = {}
+        self._heap = []
+        self._nreads = 0
+        self._verified = False
+
+    @property
+    def k(self):
+        """Return maximum number of monitored sequences
+        """
+        return self._k
+
+    @property
+    def nreads(self):
+        """Return total number of reads processed
+        """
+        return self._nreads
+
+    @property
+    def max_error(self):
+        """Return upper limit on the error for any count
+
+        This is N/k (where N is the total number of reads),
+        or zero if the counts have been verified.
+
+        """
+        if self._verified:
+            return 0
+        return self._nreads/self._k
+
+    @property
+    def verified(self):
+        """Return True if counts have been verified
+        """
+        return self._verified
+
+    def add(self,seq):
+        """Add a single occurance of an index sequence
+
+        Arguments:
+          seq: index sequence to count
+
+        """
+        self._nreads += 1
+        counts = self._counts
+        if seq in counts:
+            counts[seq] += 1
+            return
+        if len(counts) < self._k:
+            counts[seq] = 1
+            self._errors[seq] = 0
+            heapq.heappush(self._heap,(1,seq))
+            return
+        # Evict the sequence with the lowest count: heap
+        # entries are lower bounds so refresh any stale ones
+        # until the true minimum is found
+        heap = self._heap
+        while True:
+            count,min_seq = heap[0]
+            if counts[min_seq] == count:
+                break
+            heapq.heapreplace(heap,(counts[min_seq],min_seq))
+        del counts[min_seq]
+        del self._errors[min_seq]
+        counts[seq] = count + 1
+        self._errors[seq] = count
+        heapq.heapreplace(heap,(count+1,seq))
+
+    def load(self,fastq=None,fp=None):
+        """Read in fastq data and collect index sequence info
+
+        The input FASTQ can be either a text file or a compressed (gzipped)
+        FASTQ, specified via a file name (using the 'fastq' argument), or a
+        file-like object opened for line reading (using the 'fp' argument).
+
+        Arguments:
+           fastq_file: name of the FASTQ file to iterate through
+           fp: file-like object opened for reading
+
+        """
+        if self._verified:
+            raise Exception("Can't load more data after verification")
+        for read in FASTQFile.FastqIterator(fastq_file=fastq,fp=fp):
+            self.add(read.seqid.index_sequence)
+
+    def verify(self,fastq=None,fp=None):
+        """Recount the monitored sequences exactly
+
+        Reads the fastq data and counts the exact number of
+        occurances of each of the currently monitored index
+        sequences. The first call discards the approximate
+        counts; subsequent calls add to the exact counts (so
+        that data from multiple files can be verified).
+
+        Arguments:
+           fastq_file: name of the FASTQ file to iterate through
+           fp: file-like object opened for reading
+
+        """
+        counts = self._counts
+        if not self._verified:
+            for seq in counts:
+                counts[seq] = 0
+                self._errors[seq] = 0
+            self._heap = []
+            self._verified = True
+        for read in FASTQFile.FastqIterator(fastq_file=fastq,fp=fp):
+            seq = read.seqid.index_sequence
+            if seq in counts:
+                counts[seq] += 1
+
+    def error_for(self,*seqs):
+        """Return maximum overestimate of count for sequences
+
+        If a single sequence is supplied then return the maximum
+        amount by which the count for that sequence could
+        exceed the true count; if more than one sequence is
+        supplied then return the sum of the errors.
+
+        """
+        error = 0
+        for s in seqs:
+            try:
+                error += self._errors[s]
+            except KeyError:
+                pass
+        return error
+
 #######################################################################
 # Functions
 #######################################################################
@@ -135,20 +294,39 @@ def sequences_match(seq1,seq2,max_mismatches=0):
                 return False
     return True
 
-def main(fastqs,cutoff):
+def main(fastqs,cutoff,top_k=None,verify=False):
     """Main program
 
     Arguments:
       fastqs: list of FASTQ files to read sequences from
       cutoff: set the minimum number of reads that a barcode must appear in
         before it is reported
+      top_k: if set then use approximate counting in fixed memory,
+        monitoring at most this number of sequences
+      verify: if True and 'top_k' is set then make a second pass
+        through the FASTQs to get exact counts for the top sequences
 
     """
-    barcodes = Barcodes()
+    if top_k is not None:
+        barcodes = TopBarcodes(top_k)
+    else:
+        barcodes = Barcodes()
     for fastq_file in fastqs:
         print "Reading in data from %s" % fastq_file
         barcodes.load(fastq=fastq_file)
-    print "Total # barcode sequences: %d" % len(barcodes.sequences())
+    if top_k is not None:
+        print "Total # reads: %d" % barcodes.nreads
+        print "# monitored barcode sequences: %d (maximum %d)" % \
+            (len(barcodes.sequences()),barcodes.k)
+        if verify:
+            for fastq_file in fastqs:
+                print "Verifying counts using data from %s" % fastq_file
+                barcodes.verify(fastq=fastq_file)
+        else:
+            print "Counts are approximate: maximum overestimate is %d" % \
+                barcodes.max_error
+    else:
+        print "Total # barcode sequences: %d" % len(barcodes.sequences())
     print "Determining top barcode sequences"
     ordered_seqs = sorted(barcodes.sequences(),
                           cmp=lambda x,y: cmp(barcodes.count_for(y),
@@ -159,7 +337,11 @@ def main(fastqs,cutoff):
     print "1 mismatch = number of reads which match this index when allowing 1 mismatch"
     print "2 mismatches = number of reads which match this index allowing 2 mismatches"
     print "Matching indices = list of higher ranked sequences matching this one (if any)"
-    print "Rank\tIndex sequence\tCount\t1 mismatch\t2 mismatches\tMatching indices"
+    if top_k is not None and not verify:
+        print "Error = maximum overestimate of the count"
+        print "Rank\tIndex sequence\tCount\tError\t1 mismatch\t2 mismatches\tMatching indices"
+    else:
+        print "Rank\tIndex sequence\tCount\t1 mismatch\t2 mismatches\tMatching indices"
     for i,seq in enumerate(ordered_seqs):
         n_exact = barcodes.count_for(seq)
         n_1mismatch = barcodes.count_for(*barcodes.group(seq,1))
@@ -168,9 +350,16 @@ def main(fastqs,cutoff):
         for i1,seq1 in enumerate(ordered_seqs[:i]):
             if sequences_match(seq,seq1,2):
                 match_seqs.append("%d:'%s'" % (i1+1,seq1))
-        print "%d\t%s\t%d\t%d\t%d\t[%s]" % (i+1,seq,
-                                          n_exact,n_1mismatch,n_2mismatch,
-                                          ','.join(match_seqs))
+        if top_k is not None and not verify:
+            print "%d\t%s\t%d\t%d\t%d\t%d\t[%s]" % (i+1,seq,
+                                                  n_exact,
+                                                  barcodes.error_for(seq),
+                                                  n_1mismatch,n_2mismatch,
+                                                  ','.join(match_seqs))
+        else:
+            print "%d\t%s\t%d\t%d\t%d\t[%s]" % (i+1,seq,
+                                              n_exact,n_1mismatch,n_2mismatch,
+                                              ','.join(match_seqs))
         if n_exact < cutoff:
             print "...remainder occur less than %d times (set by --cutoff)" % cutoff
             break
@@ -212,6 +401,68 @@ GAAACGCGGCACAGA
         group = b.group('CCGTCCAT')
         self.assertEqual(b.count_for(*group),2)
 
+class TestTopBarcodes(unittest.TestCase):
+    def test_top_barcodes_exact_when_not_full(self):
+        b = TopBarcodes(k=10)
+        for seq in ('AAAA','CCCC','AAAA','GGGG','AAAA','CCCC'):
+            b.add(seq)
+        self.assertEqual(b.nreads,6)
+        self.assertEqual(b.sequences(),['AAAA','CCCC','GGGG'])
+        self.assertEqual(b.count_for('AAAA'),3)
+        self.assertEqual(b.count_for('CCCC'),2)
+        self.assertEqual(b.count_for('GGGG'),1)
+        self.assertEqual(b.error_for('AAAA','CCCC','GGGG'),0)
+    def test_top_barcodes_fixed_memory(self):
+        b = TopBarcodes(k=3)
+        seqs = ['AAAA']*50 + ['CCCC']*30 + \
+               ['GT%02d' % i for i in range(20)] + ['AAAA']*10
+        for seq in seqs:
+            b.add(seq)
+        self.assertEqual(b.nreads,110)
+        self.assertEqual(len(b.sequences()),3)
+        self.assertTrue('AAAA' in b.sequences())
+        self.assertTrue('CCCC' in b.sequences())
+        # Counts are upper bounds and errors bound the overestimate
+        for seq,true_count in (('AAAA',60),('CCCC',30)):
+            self.assertTrue(b.count_for(seq) >= true_count)
+            self.assertTrue(b.count_for(seq) - b.error_for(seq)
+                            <= true_count)
+            self.assertTrue(b.error_for(seq) <= b.max_error)
+        self.assertEqual(b.max_error,36)
+    def test_top_barcodes_verify(self):
+        fastq_data = \
+"""@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CCGTCCAT
+GAAACGCGGCACAGA
++
+<BBFFBFFBBFFF7B
+@HWI-700511R:233:C446JACXX:6:1101:1280:2080 1:N:0:GTCNNCAT
+CGAGCTCGAATTCAT
++
+<0<<BFF<0BFFFII
+@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CCGTGCAT
+GAAACGCGGCACAGA
++
+<BBFFBFFBBFFF7B
+@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CCGTCCAT
+GAAACGCGGCACAGA
++
+<BBFFBFFBBFFF7B
+"""
+        b = TopBarcodes(k=2)
+        b.load(fp=cStringIO.StringIO(fastq_data))
+        self.assertEqual(b.sequences(),['CCGTCCAT','CCGTGCAT'])
+        self.assertEqual(b.count_for('CCGTCCAT'),2)
+        self.assertEqual(b.count_for('CCGTGCAT'),2)
+        self.assertEqual(b.error_for('CCGTGCAT'),1)
+        self.assertFalse(b.verified)
+        b.verify(fp=cStringIO.StringIO(fastq_data))
+        self.assertTrue(b.verified)
+        self.assertEqual(b.sequences(),['CCGTCCAT','CCGTGCAT'])
+        self.assertEqual(b.count_for('CCGTCCAT'),2)
+        self.assertEqual(b.count_for('CCGTGCAT'),1)
+        self.assertEqual(b.error_for('CCGTGCAT'),0)
+        self.assertEqual(b.max_error,0)
+
 class TestSequencesMatchFunction(unittest.TestCase):
     def test_sequences_match_exact(self):
         self.assertTrue(sequences_match('AGGTCTA','AGGTCTA'))
@@ -248,11 +499,22 @@ if __name__ == "__main__":
     p.add_option('--cutoff',action='store',dest='cutoff',default=1000000,type='int',
                  help="Minimum number of times a barcode sequence must appear to be "
                  "reported (default is 1000000)")
+    p.add_option('--top',action='store',dest='top_k',default=None,type='int',
+                 help="Approximate mode: use fixed memory to estimate counts "
+                 "for the most prevalent barcodes, by monitoring at most TOP_K "
+                 "sequences. Reported counts are upper bounds on the true counts")
+    p.add_option('--verify',action='store_true',dest='verify',default=False,
+                 help="Approximate mode only: make a second pass through the "
+                 "Fastqs to get exact counts for the monitored sequences")
     options,args = p.parse_args()
     if len(args) == 0:
         p.error("Must supply at least one Fastq file")
+    if options.top_k is not None and options.top_k < 1:
+        p.error("--top must be a positive integer")
+    if options.verify and options.top_k is None:
+        p.error("--verify can only be used with --top")
     try:
-        main(args,options.cutoff)
+        main(args,options.cutoff,top_k=options.top_k,verify=options.verify)
     except KeyboardInterrupt:
         print "Terminating following Ctrl-C"
         pass
@@ -19,7 +19,7 @@ Compare the contents of two directories.
 # Module metadata
 #######################################################################
 
-__version__ = '0.0.3'
+__version__ = '0.0.7'
 
 #######################################################################
 # Import modules that this module depends on
@@ -30,6 +30,10 @@ import os
 import optparse
 import logging
 import itertools
+import functools
+import time
+import multiprocessing
+import multiprocessing.util
 from multiprocessing import Pool
 
 # Put .. onto Python search path for modules
@@ -38,6 +42,11 @@ SHARE_DIR = os.path.abspath(
         os.path.join(os.path.dirname(sys.argv[0]),'..')))
 sys.path.append(SHARE_DIR)
 import bcftbx.Md5sum as Md5sum
+from bcftbx.utils import format_file_size
+from bcftbx.utils import scandir_walk
+
+# MD5 sum cache for the current worker process (see 'init_worker')
+_worker_cache = None
 
 #######################################################################
 # Classes
@@ -57,18 +66,27 @@ class CmpResult:
         Md5sum.Md5Checker.LINKS_DIFFER: 'FAILED: symlink targets don\'t match',
         Md5sum.Md5Checker.TYPES_DIFFER: 'FAILED: different types'
     }
-    def __init__(self,path,path2,status):
+    def __init__(self,path,path2,status,n_bytes=0,elapsed=0.0,worker=None):
         """Create a new CmpResult
 
         Arguments:
           path  : first path being compared
           path2 : second path being compared
           status: result code from Md5sum.Md5Checker 
+          n_bytes: (optional) number of bytes processed for the
+                  comparison
+          elapsed: (optional) time in seconds taken to perform
+                  the comparison
+          worker: (optional) name of the process which performed
+                  the comparison
 
         """
         self.path = path
         self.path2 = path2
         self.status = status
+        self.n_bytes = n_bytes
+        self.elapsed = elapsed
+        self.worker = worker
     def relpath(self,dir_path):
         """Return 'path' relative to 'dir_path'
 
@@ -85,7 +103,7 @@ class CmpResult:
 # Functions
 #######################################################################
 
-def yield_filepairs(dir1,dir2,include_dirs=False):
+def yield_filepairs(dir1,dir2,include_dirs=False,workers=1):
     """Return pairs of equivalent files under two directories
  
     Walk directory structure under dir1 and iteratively yield
@@ -96,25 +114,36 @@ def yield_filepairs(dir1,dir2,include_dirs=False):
     but the second may not. Also additional files may exist
     under dir2 but these will not be returned.
 
+    'workers' specifies the number of threads to use for listing
+    directories (see bcftbx.utils.scandir_walk).
+
     """
     dir1 = os.path.abspath(dir1)
     dir2 = os.path.abspath(dir2)
-    for d in os.walk(dir1,followlinks=True):
-        d1 = os.path.normpath(d[0])
-        if os.path.islink(d1):
-            yield (d1,os.path.normpath(
-                os.path.join(dir2,os.path.relpath(d1,dir1))))
+    # Directories which are symlinks (determined from the
+    # directory listings of their parents)
+    linked_dirs = set()
+    if os.path.islink(dir1):
+        linked_dirs.add(os.path.normpath(dir1))
+    for dirpath,dirs,files in scandir_walk(dir1,followlinks=True,
+                                           workers=workers):
+        d1 = os.path.normpath(dirpath)
+        d2 = os.path.normpath(os.path.join(dir2,os.path.relpath(d1,dir1)))
+        for d in dirs:
+            if d.is_symlink():
+                linked_dirs.add(os.path.normpath(d.path))
+        if d1 in linked_dirs:
+            linked_dirs.remove(d1)
+            yield (d1,d2)
         else:
             if include_dirs:
-                yield (d1,os.path.normpath(
-                    os.path.join(dir2,os.path.relpath(d1,dir1))))
-            for f in d[2]:
+                yield (d1,d2)
+            for f in files:
                 # File in dir1
-                f1 = os.path.join(d1,f)
-                f2 = os.path.join(dir2,os.path.relpath(f1,dir1))
-                yield (f1,f2)
+                yield (os.path.join(d1,f.name),os.path.join(d2,f.name))
 
-def cmp_filepair(file_pair):
+def cmp_filepair(file_pair,cache=None,
+                 compare=Md5sum.Md5Checker.COMPARE_MD5):
     """Compare a pair of files
 
     'file_pair' is a tuple consisting of a pair of file paths
@@ -125,9 +154,17 @@ def cmp_filepair(file_pair):
 
     Arguments:
       file_pair: tuple 
+      cache: (optional) Md5sum.Md5sumCache instance to look up
+        and store MD5 sums
+      compare: (optional) how to compare files: either
+        Md5Checker.COMPARE_MD5 (compare MD5 sums, the default)
+        or Md5Checker.COMPARE_BYTES (compare sizes and then
+        contents, stopping at the first difference)
 
     """
     f1,f2 = file_pair
+    start = time.time()
+    n_bytes = 0
     if not os.path.lexists(f1):
         # Missing reference file
         result = Md5sum.Md5Checker.MISSING_SOURCE
@@ -154,17 +191,256 @@ def cmp_filepair(file_pair):
                 result = Md5sum.Md5Checker.TYPES_DIFFER
         else:
             # Compare files
-            result = Md5sum.Md5Checker.md5cmp_files(f1,f2)
-    return CmpResult(f1,f2,result)
+            if compare == Md5sum.Md5Checker.COMPARE_BYTES:
+                result,n_bytes = Md5sum.Md5Checker.cmp_files_n_bytes(f1,f2)
+            else:
+                n_bytes = Md5sum.bytes_to_read(f1,f2,cache=cache)
+                result = Md5sum.Md5Checker.md5cmp_files(f1,f2,cache=cache)
+    return CmpResult(f1,f2,result,n_bytes=n_bytes,
+                     elapsed=time.time()-start,
+                     worker=multiprocessing.current_process().name)
+
+def inventory(dirn,workers=1):
+    """Return an inventory of the files and links under a directory
+
+    Walks the directory structure under 'dirn' and records each
+    file and symbolic link. Directories themselves are not
+    included.
+
+    Symbolic links to directories are handled in the same way as
+    by 'yield_filepairs': the link is recorded (and is compared
+    as a link, in place of the files it contains), and then any
+    subdirectories of the target directory are also walked.
+
+    Arguments:
+      dirn: top-level directory to make the inventory of
+      workers: (optional) number of threads to use for listing
+        directories (see bcftbx.utils.scandir_walk)
+
+    Returns:
+      Dictionary where keys are paths relative to 'dirn' and
+      values are file sizes in bytes (or None for symbolic links).
+
+    """
+    dirn = os.path.abspath(dirn)
+    entries = {}
+    # Directories which are symlinks (determined from the
+    # directory listings of their parents)
+    linked_dirs = set()
+    for dirpath,dirs,files in scandir_walk(dirn,followlinks=True,
+                                           workers=workers):
+        reldir = os.path.normpath(os.path.relpath(dirpath,dirn))
+        for d in dirs:
+            if d.is_symlink():
+                d = os.path.normpath(os.path.join(reldir,d.name))
+                entries[d] = None
+                linked_dirs.add(d)
+        if reldir in linked_dirs:
+            linked_dirs.remove(reldir)
+            continue
+        for f in files:
+            if f.is_symlink():
+                size = None
+            else:
+                try:
+                    size = f.stat(follow_symlinks=False).st_size
+                except OSError:
+                    size = None
+            entries[os.path.normpath(os.path.join(reldir,f.name))] = size
+    return entries
+
+def cmp_filepairs(file_pairs,cache=None,
+                  compare=Md5sum.Md5Checker.COMPARE_MD5):
+    """Compare a list of file pairs
+
+    Wrapper for 'cmp_filepair' which compares each of the pairs
+    in turn (allowing several comparisons to be dispatched to a
+    worker process as a single task).
+
+    Returns:
+      List of CmpResult objects.
+
+    """
+    return [cmp_filepair(file_pair,cache=cache,compare=compare)
+            for file_pair in file_pairs]
+
+def init_worker(cache_file=None,trust=True):
+    """Initialise a worker process in the comparison pool
+
+    Opens a single Md5sum.Md5sumCache for the lifetime of the
+    worker process (rather than passing the cache with each
+    task), which is committed and closed when the worker
+    exits.
+
+    Arguments:
+      cache_file: (optional) path to the MD5 sum cache database
+        (no cache is used if this is None)
+      trust: (optional) whether to use MD5 sums from the cache
+        (see Md5sum.Md5sumCache)
+
+    """
+    global _worker_cache
+    if cache_file is None:
+        _worker_cache = None
+        return
+    _worker_cache = Md5sum.Md5sumCache(cache_file,trust=trust)
+    multiprocessing.util.Finalize(_worker_cache,_worker_cache.close,
+                                  exitpriority=10)
+
+def worker_pool(n,cache=None):
+    """Create a pool of worker processes for comparing files
+
+    Arguments:
+      n: number of worker processes
+      cache: (optional) Md5sum.Md5sumCache instance; each worker
+        opens its own connection to the same database (see
+        'init_worker')
+
+    Returns:
+      multiprocessing Pool instance.
+
+    """
+    if cache is None:
+        return Pool(n,initializer=init_worker)
+    # Make the stored MD5 sums visible to the workers
+    cache.commit()
+    return Pool(n,initializer=init_worker,
+                initargs=(cache.filen,cache.trust))
+
+def cmp_filepair_worker(file_pair,compare=Md5sum.Md5Checker.COMPARE_MD5):
+    """Compare a file pair in a worker process
 
-def cmp_dirs(dir1,dir2,n=1):
+    Wrapper for 'cmp_filepair' which uses the worker's own
+    MD5 sum cache (see 'init_worker').
+
+    """
+    return cmp_filepair(file_pair,cache=_worker_cache,compare=compare)
+
+def cmp_filepairs_worker(file_pairs,compare=Md5sum.Md5Checker.COMPARE_MD5):
+    """Compare a list of file pairs in a worker process
+
+    Wrapper for 'cmp_filepairs' which uses the worker's own
+    MD5 sum cache (see 'init_worker').
+
+    """
+    return cmp_filepairs(file_pairs,cache=_worker_cache,compare=compare)
+
+def chunk_filepairs(file_pairs,n=1,chunks_per_process=4,max_chunk_size=100):
+    """Group file pairs into chunks, largest files first
+
+    'file_pairs' is a list of tuples (f1,f2,size). The pairs are
+    sorted by size (largest first) and grouped into chunks, where
+    each chunk is closed once its total size reaches the total
+    size of all files divided by 'n*chunks_per_process', or when it
+    contains 'max_chunk_size' pairs. This means that the largest
+    files end up in chunks on their own and are started first,
+    while large numbers of small files are batched together.
+
+    Returns:
+      Yields lists of (f1,f2) tuples.
+
+    """
+    file_pairs = sorted(file_pairs,key=lambda x: x[2],reverse=True)
+    total_size = sum([x[2] for x in file_pairs])
+    target_size = max(total_size/(max(n,1)*chunks_per_process),1)
+    chunk = []
+    chunk_size = 0
+    for f1,f2,size in file_pairs:
+        chunk.append((f1,f2))
+        chunk_size += size
+        if chunk_size >= target_size or len(chunk) >= max_chunk_size:
+            yield chunk
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        yield chunk
+
+def yield_cmp_results(dir1,dir2,pool=None,cache=None,
+                      compare=Md5sum.Md5Checker.COMPARE_MD5,workers=1):
+    """Compare both directories against each other
+
+    Makes an inventory of the files and links in each directory
+    (see 'inventory') and yields comparison results as follows:
+
+    - entries which are only present under dir1 (MISSING_TARGET)
+      and entries which are only present under dir2
+      (MISSING_SOURCE);
+    - comparisons of symbolic links and other entries which don't
+      require file contents to be read;
+    - comparisons of regular files, which are sent to the pool
+      in chunks with the largest files first (see
+      'chunk_filepairs'), and are yielded as they complete.
+
+    Arguments:
+      dir1: 'reference' directory for comparison
+      dir2: directory to compare against reference
+      pool: (optional) multiprocessing Pool to use for comparing
+        regular files (otherwise files are compared serially);
+        this should be created by 'worker_pool'
+      cache: (optional) Md5sum.Md5sumCache instance to look up
+        and store MD5 sums (pool workers use their own cache,
+        see 'worker_pool')
+      compare: (optional) how to compare files (see
+        'cmp_filepair')
+      workers: (optional) number of threads to use for listing
+        directories, and the number of processes in the pool
+        (used for chunking)
+
+    Returns:
+      Yields CmpResult objects.
+
+    """
+    dir1 = os.path.abspath(dir1)
+    dir2 = os.path.abspath(dir2)
+    entries1 = inventory(dir1,workers=workers)
+    entries2 = inventory(dir2,workers=workers)
+    file_pairs = []
+    other_pairs = []
+    for path in sorted(set(entries1.keys()).union(entries2.keys())):
+        f1 = os.path.join(dir1,path)
+        f2 = os.path.join(dir2,path)
+        if path not in entries2 and not os.path.lexists(f2):
+            yield CmpResult(f1,f2,Md5sum.Md5Checker.MISSING_TARGET)
+        elif path not in entries1 and not os.path.lexists(f1):
+            yield CmpResult(f1,f2,Md5sum.Md5Checker.MISSING_SOURCE)
+        elif entries1.get(path) is not None and \
+             entries2.get(path) is not None:
+            file_pairs.append((f1,f2,entries1[path]))
+        else:
+            other_pairs.append((f1,f2))
+    for file_pair in other_pairs:
+        yield cmp_filepair(file_pair,cache=cache,compare=compare)
+    if pool is not None:
+        mapper = pool.imap_unordered
+        cmp_func = functools.partial(cmp_filepairs_worker,compare=compare)
+    else:
+        mapper = itertools.imap
+        cmp_func = functools.partial(cmp_filepairs,cache=cache,
+                                     compare=compare)
+    for results in mapper(cmp_func,chunk_filepairs(file_pairs,n=workers)):
+        for result in results:
+            yield result
+
+def cmp_dirs(dir1,dir2,n=1,cache=None,
+             compare=Md5sum.Md5Checker.COMPARE_MD5,stats=None,
+             bidirectional=False):
     """Compare the contents of a pair of directories
 
     Arguments:
       dir1: 'reference' directory for comparison
       dir2: directory to compare against reference
       n:    number of processors to use (defaults to 1
-            i.e. single core)
+            i.e. single core); also used as the number of
+            threads for listing directories
+      cache: (optional) Md5sum.Md5sumCache instance to look
+            up and store MD5 sums
+      compare: (optional) how to compare files (see
+            'cmp_filepair')
+      stats: (optional) Md5sum.Md5Stats instance to collect
+            throughput statistics (recorded per worker process)
+      bidirectional: (optional) if True then also report
+            entries in dir2 which are missing from dir1, and
+            compare files largest first (see 'yield_cmp_results')
 
     Returns:
       Dictionary where keys are comparison result codes
@@ -175,11 +451,23 @@ def cmp_dirs(dir1,dir2,n=1):
     counts = {}
     if n == 1:
         mapper = itertools.imap
+        cmp_func = functools.partial(cmp_filepair,cache=cache,
+                                     compare=compare)
     else:
-        pool = Pool(n)
+        # Workers open their own connections to the cache
+        pool = worker_pool(n,cache=cache)
         mapper = pool.imap
-    for result in mapper(cmp_filepair,yield_filepairs(dir1,dir2)):
+        cmp_func = functools.partial(cmp_filepair_worker,compare=compare)
+    if bidirectional:
+        results = yield_cmp_results(dir1,dir2,
+                                    pool=(pool if n > 1 else None),
+                                    cache=cache,compare=compare,workers=n)
+    else:
+        results = mapper(cmp_func,yield_filepairs(dir1,dir2,workers=n))
+    for result in results:
         print "%s: %s" % (result.relpath(dir1),result.status_message)
+        if stats is not None:
+            stats.record(result.n_bytes,result.elapsed,worker=result.worker)
         try:
             counts[result.status] += 1
         except KeyError:
@@ -203,10 +491,69 @@ if __name__ == '__main__':
     p.add_option('-n',action='store',dest='n_processors',
                  default=1,type='int',
                  help="specify number of cores to use")
+    p.add_option('--cache',action='store',dest='cache_file',default=None,
+                 help="use CACHE_FILE as a persistent cache of MD5 sums; "
+                 "files whose device, inode, size and modification time "
+                 "are unchanged since their MD5 sums were cached are not "
+                 "read again (the cache file is created if it doesn't "
+                 "exist)")
+    p.add_option('--trust-cache',action='store_true',dest='trust_cache',
+                 default=True,
+                 help="use MD5 sums from the cache for unchanged files "
+                 "(the default when --cache is specified)")
+    p.add_option('--recompute',action='store_false',dest='trust_cache',
+                 help="recompute all MD5 sums rather than using values "
+                 "from the cache (the cache is updated with the new "
+                 "values)")
+    p.add_option('--quick',action='store_true',dest='quick',default=False,
+                 help="compare files by size and then contents, stopping "
+                 "at the first difference, rather than by computing MD5 "
+                 "sums (faster when only equality is needed)")
+    p.add_option('--bidirectional',action='store_true',dest='bidirectional',
+                 default=False,
+                 help="make an inventory of both directories first and "
+                 "also report files and links in DIR2 which are missing "
+                 "from DIR1; files are compared largest first")
+    p.add_option('--progress',action='store_true',dest='progress',
+                 default=False,
+                 help="periodically write a progress line to stderr with "
+                 "the number of files and bytes processed and the "
+                 "throughput")
+    p.add_option('--progress-interval',action='store',
+                 dest='progress_interval',default=10.0,type='float',
+                 help="number of seconds between progress lines "
+                 "(default: 10)")
+    p.add_option('--stats',action='store',dest='stats_file',default=None,
+                 help="write throughput statistics (overall and for each "
+                 "worker process) to STATS_FILE in JSON format on "
+                 "completion")
     options,args = p.parse_args()
     if len(args) != 2:
         p.error("supply two directories to compare")
-    counts = cmp_dirs(args[0],args[1],n=options.n_processors)
+    if options.cache_file:
+        cache = Md5sum.Md5sumCache(options.cache_file,
+                                   trust=options.trust_cache)
+    else:
+        cache = None
+    if options.quick:
+        compare = Md5sum.Md5Checker.COMPARE_BYTES
+    else:
+        compare = Md5sum.Md5Checker.COMPARE_MD5
+    if options.progress:
+        progress = sys.stderr
+    else:
+        progress = None
+    stats = Md5sum.Md5Stats(progress=progress,
+                            interval=options.progress_interval)
+    stats.start()
+    counts = cmp_dirs(args[0],args[1],n=options.n_processors,cache=cache,
+                      compare=compare,stats=stats,
+                      bidirectional=options.bidirectional)
+    stats.stop()
+    if options.stats_file:
+        stats.dump(options.stats_file)
+    if cache is not None:
+        cache.close()
     if counts:
         total = sum([counts[x] for x in counts])
     else:
@@ -218,5 +565,9 @@ if __name__ == '__main__':
         except KeyError:
             pass
     print "Verified %d out of total %d examined" % (verified,total)
+    if options.progress or options.stats_file:
+        print "Processed %s in %.1fs (%s/s)" % \
+            (format_file_size(stats.n_bytes),stats.elapsed,
+             format_file_size(stats.bytes_per_second))
     sys.exit(0 if total == verified else 1)
 
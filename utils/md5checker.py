@@ -22,7 +22,7 @@ to perform the underlying operations.
 # Module metadata
 #######################################################################
 
-__version__ = "0.3.2"
+__version__ = "0.10.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -43,7 +43,8 @@ import bcftbx.Md5sum as Md5sum
 # Functions
 #######################################################################
 
-def compute_md5sums(dirn,output_file=None,relative=False):
+def compute_md5sums(dirn,output_file=None,relative=False,workers=1,
+                    ordered=True,cache=None,algorithms=None,stats=None):
     """Compute and write MD5 sums for all files in a directory
 
     Walks the directory tree under the specified directory and
@@ -59,6 +60,19 @@ def compute_md5sums(dirn,output_file=None,relative=False):
       output_file: (optional) name of file to write MD5 sums to
       relative: if True then output file paths relative to
         the supplied directory (otherwise write absolute paths)
+      workers: (optional) number of threads to use for computing
+        the MD5 sums
+      ordered: (optional) if False then write the MD5 sums in the
+        order they are computed, rather than the order the files
+        are found
+      cache: (optional) Md5sumCache instance to look up and store
+        MD5 sums
+      algorithms: (optional) list of checksum algorithms to compute
+        (e.g. 'md5','sha256','crc32'); if anything other than just
+        'md5' is specified then a multi-column manifest is written
+        (and the cache is not used)
+      stats: (optional) Md5sum.Md5Stats instance to collect
+        throughput statistics
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -68,15 +82,29 @@ def compute_md5sums(dirn,output_file=None,relative=False):
         fp = open(output_file,'w')
     else:
         fp = sys.stdout
-    for filen,chksum in Md5sum.Md5Checker.compute_md5sums(dirn):
-        if not relative:
-            filen = os.path.join(dirn,filen)
-        fp.write("%s  %s\n" % (chksum,filen))
+    if is_md5_only(algorithms):
+        for filen,chksum in Md5sum.Md5Checker.compute_md5sums(dirn,
+                                                              workers=workers,
+                                                              ordered=ordered,
+                                                              cache=cache,
+                                                              stats=stats):
+            if not relative:
+                filen = os.path.join(dirn,filen)
+            fp.write("%s  %s\n" % (chksum,filen))
+    else:
+        fp.write("%s\n" % Md5sum.manifest_header(algorithms))
+        for filen,digests in Md5sum.Md5Checker.compute_checksums(
+                dirn,algorithms=algorithms,workers=workers,ordered=ordered,
+                stats=stats):
+            if not relative:
+                filen = os.path.join(dirn,filen)
+            fp.write("%s\n" % Md5sum.manifest_line(filen,digests))
     if output_file:
         fp.close()
     return retval
 
-def compute_md5sum_for_file(filen,output_file=None):
+def compute_md5sum_for_file(filen,output_file=None,cache=None,
+                            algorithms=None):
     """Compute and write MD5 sum for specifed file
 
     Computes the MD5 sum for a file, and writes the sum and the file
@@ -88,6 +116,12 @@ def compute_md5sum_for_file(filen,output_file=None):
     Arguments:
       filen: file to compute the MD5 sum for
       output_file: (optional) name of file to write MD5 sum to
+      cache: (optional) Md5sumCache instance to look up and store
+        MD5 sums
+      algorithms: (optional) list of checksum algorithms to compute
+        (e.g. 'md5','sha256','crc32'); if anything other than just
+        'md5' is specified then a multi-column manifest is written
+        (and the cache is not used)
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -99,8 +133,19 @@ def compute_md5sum_for_file(filen,output_file=None):
     else:
         fp = sys.stdout
     try:
-        chksum = Md5sum.md5sum(filen)
-        fp.write("%s  %s\n" % (chksum,filen))
+        if not is_md5_only(algorithms):
+            digests = Md5sum.checksums(filen,algorithms)
+            fp.write("%s\n%s\n" %
+                     (Md5sum.manifest_header(algorithms),
+                      Md5sum.manifest_line(filen,
+                                           [digests[a.lower()]
+                                            for a in algorithms])))
+        elif cache is not None:
+            chksum = cache.md5sum(filen)
+            fp.write("%s  %s\n" % (chksum,filen))
+        else:
+            chksum = Md5sum.md5sum(filen)
+            fp.write("%s  %s\n" % (chksum,filen))
     except IOError, ex:
         # Error accessing file, report and skip
         logging.error("%s: error while generating MD5 sum: '%s'" % (filen,ex))
@@ -109,7 +154,155 @@ def compute_md5sum_for_file(filen,output_file=None):
         fp.close()
     return retval
 
-def verify_md5sums(chksum_file,verbose=False):
+def compute_block_manifest(target,output_file=None,relative=False,
+                           block_size=Md5sum.DEFAULT_MANIFEST_BLOCK_SIZE,
+                           algorithm='md5',workers=1,ordered=True,
+                           stats=None):
+    """Compute and write a block manifest for a file or directory
+
+    Computes the checksums for each file and for each block of
+    'block_size' bytes within each file, and writes these as a
+    block manifest either to stdout or to the specified file.
+    The blocks can subsequently be verified in parallel using
+    'verify_md5sums'.
+
+    Arguments:
+      target: file or directory to compute the block manifest for
+      output_file: (optional) name of file to write manifest to
+      relative: if True and target is a directory then output file
+        paths relative to the directory (otherwise write paths
+        including the directory)
+      block_size: (optional) size of each block in bytes
+      algorithm: (optional) checksum algorithm (default 'md5')
+      workers: (optional) number of threads to use (files are
+        processed in parallel)
+      ordered: (optional) if False then write the entries in the
+        order they are computed, rather than the order the files
+        are found
+      stats: (optional) Md5sum.Md5Stats instance to collect
+        throughput statistics
+
+    Returns:
+      Zero on success, 1 if errors were encountered (e.g. if any
+      files couldn't be read)
+    """
+    retval = 0
+    if os.path.isdir(target):
+        files = Md5sum.Md5Checker.walk(target)
+    else:
+        files = [target]
+    # Count the files so that any which are skipped can be detected
+    nfiles = [0]
+    def count_files(files):
+        for f in files:
+            nfiles[0] += 1
+            yield f
+    nwritten = 0
+    if output_file:
+        fp = open(output_file,'w')
+    else:
+        fp = sys.stdout
+    fp.write("%s\n" % Md5sum.block_manifest_header(algorithm,block_size))
+    for filen,chksum,size,blocks in \
+        Md5sum.Md5Checker.compute_block_checksums(count_files(files),
+                                                  block_size=block_size,
+                                                  algorithm=algorithm,
+                                                  workers=workers,
+                                                  ordered=ordered,
+                                                  stats=stats):
+        if relative and filen != target:
+            filen = os.path.relpath(filen,target)
+        for line in Md5sum.block_manifest_lines(filen,chksum,size,blocks):
+            fp.write("%s\n" % line)
+        nwritten += 1
+    if output_file:
+        fp.close()
+    if nwritten < nfiles[0]:
+        # Some files were unreadable
+        retval = 1
+    return retval
+
+def verify_block_manifest(chksum_file,verbose=False,workers=1,ordered=True,
+                          journal=None,stats=None):
+    """Check the blocks of all files specified in a block manifest
+
+    For all files in the supplied block manifest, check the
+    checksum for each block and for the whole file, and report
+    whether they match or are different. The blocks are checked
+    independently so those from a single large file can be
+    verified in parallel.
+
+    The byte ranges of any blocks that fail are reported at the
+    end, merged where they are contiguous. The results for the
+    whole-file checksums and for missing files are reported (and
+    recorded in the journal) by file name rather than as byte
+    ranges.
+
+    Arguments:
+      chksum_file: name of the block manifest file
+      verbose: (optional) if True then report status for all
+        blocks checked, plus a summary; otherwise only report
+        failures
+      workers: (optional) number of threads to use for verifying
+        blocks
+      ordered: (optional) if False then report the results in the
+        order they are completed
+      journal: (optional) Md5CheckJournal instance; blocks already
+        recorded in the journal are not checked again, and the
+        results for new blocks are added to the journal
+      stats: (optional) Md5sum.Md5Stats instance to collect
+        throughput statistics
+
+    Returns:
+      Zero on success, 1 if errors were encountered
+
+    """
+    bad_ranges = {}
+    if journal is not None:
+        # Snapshot, since the journal is updated during the checks
+        skip = frozenset(journal.completed)
+        # Include failures from the journal
+        for name,status in journal.results():
+            if status == Md5sum.Md5Checker.MD5_OK or \
+               status == Md5sum.Md5Checker.MISSING_TARGET:
+                continue
+            try:
+                f,byte_range = name[:-1].rsplit('[',1)
+                start,end = [int(x) for x in byte_range.split('-')]
+            except ValueError:
+                # Result for a whole file
+                continue
+            bad_ranges.setdefault(f,[]).append((start,end))
+    else:
+        skip = None
+    def results():
+        for f,start,end,status in \
+            Md5sum.Md5Checker.verify_block_checksums(chksum_file,
+                                                     workers=workers,
+                                                     ordered=ordered,
+                                                     skip=skip,
+                                                     stats=stats):
+            if start is None or status == Md5sum.Md5Checker.MISSING_TARGET:
+                # Result for the whole file
+                yield (f,status)
+                continue
+            if status != Md5sum.Md5Checker.MD5_OK:
+                bad_ranges.setdefault(f,[]).append((start,end))
+            yield (Md5sum.block_name(f,start,end),status)
+    # Set up reporter object
+    reporter = Md5sum.Md5CheckReporter(results(),verbose=verbose,
+                                       journal=journal,stats=stats)
+    # Report the bad byte ranges
+    for f in sorted(bad_ranges.keys()):
+        ranges = merge_ranges(bad_ranges[f])
+        print "%s: bad byte ranges: %s" % \
+            (f,', '.join(["%d-%d" % r for r in ranges]))
+    # Summarise
+    if verbose: reporter.summary()
+    return reporter.status
+
+def verify_md5sums(chksum_file,verbose=False,workers=1,ordered=True,
+                   cache=None,algorithms=None,journal=None,stats=None):
     """Check the MD5 sums for all entries specified in a file
 
     For all entries in the supplied file, check the MD5 sum is
@@ -117,26 +310,88 @@ def verify_md5sums(chksum_file,verbose=False):
     whether they match or are different.
 
     The input file can either be output from this program or
-    from the Linux 'md5sum' program.
+    from the Linux 'md5sum' program. If the file is a block
+    manifest then it is verified via 'verify_block_manifest';
+    if the file is a multi-column
+    manifest (i.e. starts with a header line listing the checksum
+    algorithms) then all the listed checksums are verified, unless
+    a subset is specified via 'algorithms'.
 
     Arguments:
       chksum_file: name of the file containing the MD5 sums
       verbose: (optional) if True then report status for all
         files checked, plus a summary; otherwise only report
         failures
+      workers: (optional) number of threads to use for computing
+        the MD5 sums
+      ordered: (optional) if False then report the results in the
+        order they are completed, rather than the order of the
+        entries in the input file
+      cache: (optional) Md5sumCache instance to look up and store
+        MD5 sums (only used for files containing just MD5 sums)
+      algorithms: (optional) subset of the checksum algorithms in
+        the file to verify
+      journal: (optional) Md5CheckJournal instance; entries already
+        recorded in the journal are not checked again (but their
+        results are included in the report), and the results for
+        new entries are added to the journal
+      stats: (optional) Md5sum.Md5Stats instance to collect
+        throughput statistics
 
     Returns:
-      Zero on success, 1 if errors were encountered
+      Zero on success, 1 if errors were encountered (including
+      if any of the requested 'algorithms' aren't in the file)
 
     """
+    # Check for a manifest header
+    fp = open(chksum_file,'rU')
+    header = fp.readline()
+    fp.close()
+    if header.split()[:2] == ['#','blocks']:
+        return verify_block_manifest(chksum_file,verbose=verbose,
+                                     workers=workers,ordered=ordered,
+                                     journal=journal,stats=stats)
+    is_manifest = header.startswith('#')
+    # Check that the requested algorithms are available
+    if is_manifest:
+        available = header[1:].lower().split()
+    else:
+        available = list(Md5sum.DEFAULT_ALGORITHMS)
+    if algorithms is not None:
+        missing = [a for a in algorithms if a.lower() not in available]
+        if missing:
+            logging.error("%s: checksums not available for %s (file has %s)"
+                          % (chksum_file,', '.join(missing),
+                             ', '.join(available)))
+            return 1
+    if journal is not None:
+        # Snapshot, since the journal is updated during the checks
+        skip = frozenset(journal.completed)
+    else:
+        skip = None
+    if is_manifest or not is_md5_only(algorithms):
+        results = Md5sum.Md5Checker.verify_checksums(chksum_file,
+                                                     algorithms=algorithms,
+                                                     workers=workers,
+                                                     ordered=ordered,
+                                                     skip=skip,
+                                                     stats=stats)
+    else:
+        results = Md5sum.Md5Checker.verify_md5sums(chksum_file,
+                                                   workers=workers,
+                                                   ordered=ordered,
+                                                   cache=cache,
+                                                   skip=skip,
+                                                   stats=stats)
     # Set up reporter object
-    reporter = Md5sum.Md5CheckReporter(Md5sum.Md5Checker.verify_md5sums(chksum_file),
-                                       verbose=verbose)
+    reporter = Md5sum.Md5CheckReporter(results,verbose=verbose,
+                                       journal=journal,stats=stats)
     # Summarise
     if verbose: reporter.summary()
     return reporter.status
 
-def diff_directories(dirn1,dirn2,verbose=False):
+def diff_directories(dirn1,dirn2,verbose=False,workers=1,ordered=True,
+                     cache=None,quick=False,stats=None):
     """Check one directory against another using MD5 sums
 
     This compares one directory against another by computing the
@@ -157,19 +412,41 @@ def diff_directories(dirn1,dirn2,verbose=False):
       dirn2: "target" directory to be compared to dirn1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      workers: (optional) number of threads to use for computing
+        the MD5 sums
+      ordered: (optional) if False then report the results in the
+        order they are completed, rather than the order the files
+        are found
+      cache: (optional) Md5sumCache instance to look up and store
+        MD5 sums
+      quick: (optional) if True then compare files by size and
+        contents (stopping at the first difference) rather than
+        by computing MD5 sums
+      stats: (optional) Md5sum.Md5Stats instance to collect
+        throughput statistics
 
     Returns:
       Zero on success, 1 if errors were encountered
 
     """
+    if quick:
+        compare = Md5sum.Md5Checker.COMPARE_BYTES
+    else:
+        compare = Md5sum.Md5Checker.COMPARE_MD5
     # Set up reporter object
-    reporter = Md5sum.Md5CheckReporter(Md5sum.Md5Checker.md5cmp_dirs(dirn1,dirn2),
-                                       verbose=verbose)
+    reporter = Md5sum.Md5CheckReporter(
+        Md5sum.Md5Checker.md5cmp_dirs(dirn1,dirn2,
+                                      workers=workers,
+                                      ordered=ordered,
+                                      cache=cache,
+                                      compare=compare,
+                                      stats=stats),
+        verbose=verbose,stats=stats)
     # Summarise
     if verbose: reporter.summary()
     return reporter.status
 
-def diff_files(filen1,filen2,verbose=False):
+def diff_files(filen1,filen2,verbose=False,cache=None,quick=False):
     """Check that the MD5 sums of two files match
 
     This compares two files by computing the MD5 sums for each.
@@ -179,6 +456,11 @@ def diff_files(filen1,filen2,verbose=False):
       filen2: "target" file to be compared with filen1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      cache: (optional) Md5sumCache instance to look up and store
+        MD5 sums
+      quick: (optional) if True then compare the files by size and
+        contents (stopping at the first difference) rather than by
+        computing MD5 sums
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -187,7 +469,11 @@ def diff_files(filen1,filen2,verbose=False):
     # Set up reporter object
     reporter = Md5sum.Md5CheckReporter()
     # Compare files
-    reporter.add_result(filen1,Md5sum.Md5Checker.md5cmp_files(filen1,filen2))
+    if quick:
+        status = Md5sum.Md5Checker.cmp_files(filen1,filen2)
+    else:
+        status = Md5sum.Md5Checker.md5cmp_files(filen1,filen2,cache=cache)
+    reporter.add_result(filen1,status)
     if verbose:
         if reporter.n_ok:
             print "OK: MD5 sums match"
@@ -197,6 +483,66 @@ def diff_files(filen1,filen2,verbose=False):
             print "ERROR: unable to compute one or both MD5 sums"
     return reporter.status
 
+def is_md5_only(algorithms):
+    """Check if a list of checksum algorithms is just MD5
+
+    Returns True if 'algorithms' is None or only contains 'md5',
+    False otherwise.
+
+    """
+    if algorithms is None:
+        return True
+    return [a.lower() for a in algorithms] == ['md5']
+
+def merge_ranges(ranges):
+    """Merge overlapping or contiguous (start,end) ranges
+
+    For example:
+
+    >>> merge_ranges([(10,20),(0,10),(30,40)])
+    [(0, 20), (30, 40)]
+
+    """
+    merged = []
+    for start,end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0],max(end,merged[-1][1]))
+        else:
+            merged.append((start,end))
+    return merged
+
+def parse_size(size):
+    """Convert a size string (e.g. '64M') into a number of bytes
+
+    The size can be an integer number of bytes, optionally with
+    one of the suffixes 'K', 'M' or 'G' (case insensitive).
+
+    Raises ValueError if the size can't be converted.
+
+    """
+    multipliers = { 'K': 1024, 'M': 1024*1024, 'G': 1024*1024*1024 }
+    size = str(size).strip().upper()
+    if size and size[-1] in multipliers:
+        return int(size[:-1])*multipliers[size[-1]]
+    return int(size)
+
+def count_entries(chksum_file):
+    """Count the number of entries in a checksum file
+
+    Counts the non-blank lines which aren't comments or headers;
+    for block manifests, counts the blocks and the files (which
+    each have a whole-file check).
+
+    """
+    n = 0
+    fp = open(chksum_file,'rU')
+    for line in fp:
+        if not line.strip() or line.startswith('#'):
+            continue
+        n += 1
+    fp.close()
+    return n
+
 def report(msg,verbose=False):
     """Write text to stdout
 
@@ -231,12 +577,58 @@ if __name__ == "__main__":
                  help="read MD5 sums from the specified file and check them")
     p.add_option('-q','--quiet',action="store_false",dest="verbose",default=True,
                  help="suppress output messages and only report failures")
+    p.add_option('-n','--workers',action="store",dest="workers",default=1,
+                 type='int',
+                 help="number of threads to use for computing MD5 sums "
+                 "(default: 1)")
+    p.add_option('--unordered',action="store_false",dest="ordered",default=True,
+                 help="when using multiple threads, report results as soon as "
+                 "they are available rather than in the order that the files "
+                 "were found")
+    p.add_option('--cache',action="store",dest="cache_file",default=None,
+                 help="use CACHE_FILE as a persistent cache of MD5 sums; files "
+                 "whose device, inode, size and modification time are unchanged "
+                 "since their MD5 sums were cached are not read again (the cache "
+                 "file is created if it doesn't exist)")
+    p.add_option('--trust-cache',action="store_true",dest="trust_cache",
+                 default=True,
+                 help="use MD5 sums from the cache for unchanged files (the "
+                 "default when --cache is specified)")
+    p.add_option('--recompute',action="store_false",dest="trust_cache",
+                 help="recompute all MD5 sums rather than using values from "
+                 "the cache (the cache is updated with the new values)")
+    p.add_option('--progress',action="store_true",dest="progress",
+                 default=False,
+                 help="periodically write a progress line to stderr with "
+                 "the number of files and bytes processed, the throughput "
+                 "and (when verifying) the estimated time remaining")
+    p.add_option('--progress-interval',action="store",
+                 dest="progress_interval",default=10.0,type='float',
+                 help="number of seconds between progress lines (default: "
+                 "10)")
+    p.add_option('--stats',action="store",dest="stats_file",default=None,
+                 help="write throughput statistics (overall and for each "
+                 "worker thread) to STATS_FILE in JSON format on completion")
+    p.add_option('-a','--algorithms',action="store",dest="algorithms",
+                 default=None,
+                 help="comma-separated list of checksum algorithms (e.g. "
+                 "'md5,sha256,crc32'); when generating checksums, all the "
+                 "checksums are computed from a single read of each file and "
+                 "written as a multi-column manifest; when verifying a "
+                 "manifest, only the specified checksums are checked "
+                 "(default is MD5 only when generating, and all checksums "
+                 "in the manifest when verifying)")
 
     # Directory differencing
     group = optparse.OptionGroup(p,"Directory comparison (-d, --diff)",
                                  "Check that the contents of SOURCE_DIR are present in "
                                  "TARGET_DIR and have matching MD5 sums. Note that files that "
                                  "are only present in TARGET_DIR are not reported.")
+    group.add_option('--quick',action="store_true",dest="quick",default=False,
+                     help="compare files by size and then contents, stopping at "
+                     "the first difference, rather than by computing MD5 sums "
+                     "(faster when only equality is needed; also applies to "
+                     "file comparison)")
     p.add_option_group(group)
 
     # File differencing
@@ -252,6 +644,11 @@ if __name__ == "__main__":
                      help="optionally write computed MD5 sums to CHKSUM_FILE (otherwise the "
                      "sums are written to stdout). The output format is the same as that used "
                      "by the Linux 'md5sum' tool.")
+    group.add_option('--blocks',action="store",dest="block_size",default=None,
+                     help="write a block manifest with checksums for each "
+                     "BLOCK_SIZE bytes of each file (e.g. '64M') as well as for "
+                     "the whole file; the blocks can be verified in parallel "
+                     "with -c, and failures report the corrupted byte ranges")
     p.add_option_group(group)
 
     # Checksum verification
@@ -259,6 +656,19 @@ if __name__ == "__main__":
                                  "Check MD5 sums for each of the files listed in the "
                                  "specified CHKSUM_FILE relative to the current directory. "
                                  "This option behaves the same as the Linux 'md5sum' tool.")
+    group.add_option('--journal',action="store",dest="journal_file",
+                     default=None,
+                     help="record the results of each check in JOURNAL_FILE "
+                     "as they are completed (synced to disk periodically), "
+                     "so that an interrupted verification can be resumed "
+                     "using --resume (default journal file is "
+                     "CHKSUM_FILE.journal when --resume is specified)")
+    group.add_option('--resume',action="store_true",dest="resume",
+                     default=False,
+                     help="resume an interrupted verification: entries "
+                     "already recorded in the journal are not checked "
+                     "again, and their results are merged with those of "
+                     "the remaining entries")
     p.add_option_group(group)
 
     # Process the command line
@@ -267,6 +677,36 @@ if __name__ == "__main__":
     # Set up logging output
     logging.basicConfig(format='%(message)s')
 
+    # Checksum algorithms
+    if options.algorithms:
+        algorithms = [a.strip().lower()
+                      for a in options.algorithms.split(',') if a.strip()]
+        for a in algorithms:
+            try:
+                Md5sum.new_digest(a)
+            except ValueError:
+                p.error("Unsupported checksum algorithm: '%s'" % a)
+    else:
+        algorithms = None
+
+    # Set up throughput statistics
+    if options.progress or options.stats_file:
+        if options.progress:
+            progress = sys.stderr
+        else:
+            progress = None
+        stats = Md5sum.Md5Stats(progress=progress,
+                                interval=options.progress_interval)
+    else:
+        stats = None
+
+    # Set up the cache
+    if options.cache_file:
+        cache = Md5sum.Md5sumCache(options.cache_file,
+                                   trust=options.trust_cache)
+    else:
+        cache = None
+
     # Figure out mode of operation
     if options.check:
         # Running in "check" mode
@@ -275,8 +715,34 @@ if __name__ == "__main__":
         chksum_file = arguments[0]
         if not os.path.isfile(chksum_file):
             p.error("Checksum '%s' file not found (or is not a file)" % chksum_file)
+        # Set up the journal
+        journal_file = options.journal_file
+        if options.resume and not journal_file:
+            journal_file = "%s.journal" % chksum_file
+        if journal_file:
+            journal = Md5sum.Md5CheckJournal(journal_file,
+                                             resume=options.resume)
+        else:
+            journal = None
         # Do the verification
-        status = verify_md5sums(chksum_file,verbose=options.verbose)
+        if stats is not None:
+            stats.total_files = count_entries(chksum_file)
+            if journal is not None:
+                # Exclude entries already checked in a previous run
+                stats.total_files = max(0,stats.total_files -
+                                        len(journal.completed))
+            stats.start()
+        try:
+            status = verify_md5sums(chksum_file,verbose=options.verbose,
+                                    workers=options.workers,
+                                    ordered=options.ordered,
+                                    cache=cache,
+                                    algorithms=algorithms,
+                                    journal=journal,
+                                    stats=stats)
+        finally:
+            if journal is not None:
+                journal.close()
     elif options.diff:
         # Running in "diff" mode
         if len(arguments) != 2:
@@ -288,16 +754,24 @@ if __name__ == "__main__":
         for arg in (source,target):
             if not os.path.exists(arg):
                 p.error("%s: not found" % arg)
+        if stats is not None:
+            stats.start()
         if os.path.isdir(source) and os.path.isdir(target):
             # Compare two directories
             report("Recursively check copies of files in %s against originals in %s" %
                    (target,source),
                    options.verbose)
-            status = diff_directories(source,target,verbose=options.verbose)
+            status = diff_directories(source,target,verbose=options.verbose,
+                                      workers=options.workers,
+                                      ordered=options.ordered,
+                                      cache=cache,
+                                      quick=options.quick,
+                                      stats=stats)
         elif os.path.isfile(source) and os.path.isfile(target):
             # Compare two files
             report("Checking MD5 sums for %s and %s" % (source,target),options.verbose)
-            status = diff_files(source,target,verbose=options.verbose)
+            status = diff_files(source,target,verbose=options.verbose,
+                                cache=cache,quick=options.quick)
         else:
             p.error("Supplied arguments must be a pair of directories or a pair of files")
     else:
@@ -309,11 +783,49 @@ if __name__ == "__main__":
         if options.chksum_file:
             output_file = options.chksum_file
         # Generate the checksums
-        if os.path.isdir(arguments[0]):
-            status = compute_md5sums(arguments[0],output_file)
+        if stats is not None:
+            stats.start()
+        if options.block_size:
+            try:
+                block_size = parse_size(options.block_size)
+                if block_size < 1:
+                    raise ValueError
+            except ValueError:
+                p.error("--blocks: bad block size '%s'" % options.block_size)
+            if algorithms is None:
+                algorithm = 'md5'
+            elif len(algorithms) == 1:
+                algorithm = algorithms[0]
+            else:
+                p.error("--blocks: only a single checksum algorithm can be "
+                        "used")
+            if not os.path.exists(arguments[0]):
+                p.error("Cannot generate checksums for '%s': not found" %
+                        arguments[0])
+            status = compute_block_manifest(arguments[0],output_file,
+                                            block_size=block_size,
+                                            algorithm=algorithm,
+                                            workers=options.workers,
+                                            ordered=options.ordered,
+                                            stats=stats)
+        elif os.path.isdir(arguments[0]):
+            status = compute_md5sums(arguments[0],output_file,
+                                     workers=options.workers,
+                                     ordered=options.ordered,
+                                     cache=cache,
+                                     algorithms=algorithms,
+                                     stats=stats)
         elif os.path.isfile(arguments[0]):
-            status = compute_md5sum_for_file(arguments[0],output_file)
+            status = compute_md5sum_for_file(arguments[0],output_file,
+                                             cache=cache,
+                                             algorithms=algorithms)
         else:
             p.error("Cannot generate checksums for '%s': not a directory or file" % arguments[0])
     # Finish
+    if stats is not None:
+        stats.stop()
+        if options.stats_file:
+            stats.dump(options.stats_file)
+    if cache is not None:
+        cache.close()
     sys.exit(status)
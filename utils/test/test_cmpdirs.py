@@ -7,10 +7,20 @@ import os
 import tempfile
 import shutil
 from bcftbx.Md5sum import Md5Checker
+from bcftbx.Md5sum import Md5sumCache
+from bcftbx.Md5sum import Md5Stats
 from bcftbx.test.mock_data import TestUtils,ExampleDirLanguages
 from cmpdirs import yield_filepairs
 from cmpdirs import cmp_filepair
 from cmpdirs import cmp_dirs
+from cmpdirs import inventory
+from cmpdirs import chunk_filepairs
+from cmpdirs import worker_pool
+import cmpdirs
+
+def _worker_cache_filen(i):
+    # Report the cache file used in a worker process
+    return cmpdirs._worker_cache.filen
 
 class TestYieldFilepairs(unittest.TestCase):
     def setUp(self):
@@ -45,6 +55,70 @@ class TestYieldFilepairs(unittest.TestCase):
         # List should be empty at the end
         self.assertEqual(len(expected),0,
                          "Some paths not returned: %s" % expected)
+    def test_yield_filepairs_with_workers(self):
+        """yield_filepairs returns same pairs in same order with workers
+        """
+        for include_dirs in (False,True):
+            self.assertEqual(list(yield_filepairs(self.d.dirn,'/dummy/dir',
+                                                  include_dirs=include_dirs,
+                                                  workers=4)),
+                             list(yield_filepairs(self.d.dirn,'/dummy/dir',
+                                                  include_dirs=include_dirs)))
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        # Create example directory structure which
+        # includes files and links
+        self.d = ExampleDirLanguages()
+        self.d.create_directory()
+    def tearDown(self):
+        # Delete example directory structure
+        self.d.delete_directory()
+    def test_inventory(self):
+        """inventory returns files and links with sizes
+        """
+        entries = inventory(self.d.dirn,workers=2)
+        expected = self.d.filelist(full_path=False)
+        expected.extend(["countries/spain","countries/north_wales",
+                         "countries/south_wales","countries/iceland"])
+        self.assertEqual(sorted(entries.keys()),sorted(expected))
+        self.assertEqual(entries["hello"],6)
+        self.assertEqual(entries["hi"],None)
+        self.assertEqual(entries["countries/spain"],None)
+    def test_inventory_follows_linked_dirs(self):
+        """inventory handles links to directories like yield_filepairs
+        """
+        self.d.add_link("countries/wales","../welsh")
+        entries = inventory(self.d.dirn)
+        self.assertEqual(entries["countries/wales"],None)
+        self.assertTrue("countries/wales/north_wales/maen_ddrwg_gen_i"
+                        in entries)
+        expected = [os.path.relpath(p1,self.d.dirn) for p1,p2 in
+                    yield_filepairs(self.d.dirn,'/dummy/dir')]
+        self.assertEqual(sorted(entries.keys()),sorted(expected))
+
+class TestChunkFilepairs(unittest.TestCase):
+    def test_chunk_filepairs_largest_first(self):
+        """chunk_filepairs puts largest files first and batches small ones
+        """
+        pairs = [("small%d" % i,"small%d" % i,1) for i in xrange(10)]
+        pairs.append(("big","big",1000))
+        pairs.append(("bigger","bigger",2000))
+        chunks = list(chunk_filepairs(pairs,n=2))
+        self.assertEqual(chunks[0],[("bigger","bigger")])
+        self.assertEqual(chunks[1],[("big","big")])
+        self.assertEqual(sum([len(c) for c in chunks]),12)
+        self.assertEqual(len(chunks),3)
+    def test_chunk_filepairs_max_chunk_size(self):
+        """chunk_filepairs limits number of pairs per chunk
+        """
+        pairs = [("f%d" % i,"f%d" % i,0) for i in xrange(25)]
+        chunks = list(chunk_filepairs(pairs,max_chunk_size=10))
+        self.assertEqual([len(c) for c in chunks],[10,10,5])
+    def test_chunk_filepairs_empty(self):
+        """chunk_filepairs handles empty list
+        """
+        self.assertEqual(list(chunk_filepairs([])),[])
 
 class TestCmpFilepair(unittest.TestCase):
     def setUp(self):
@@ -69,6 +143,37 @@ class TestCmpFilepair(unittest.TestCase):
         f2 = TestUtils.make_file('test_file2',"lorum ipsum",basedir=self.wd)
         result = cmp_filepair((f1,f2))
         self.assertEqual(result.status,Md5Checker.MD5_FAILED)
+    def test_cmp_filepair_compare_bytes(self):
+        """cmp_filepair compares file contents directly
+        """
+        f1 = TestUtils.make_file('test_file1',"Lorum ipsum",basedir=self.wd)
+        f2 = TestUtils.make_file('test_file2',"Lorum ipsum",basedir=self.wd)
+        f3 = TestUtils.make_file('test_file3',"lorum ipsum",basedir=self.wd)
+        f4 = TestUtils.make_file('test_file4',"Lorum ipsum dolor",
+                                 basedir=self.wd)
+        for f,status in ((f2,Md5Checker.MD5_OK),
+                         (f3,Md5Checker.MD5_FAILED),
+                         (f4,Md5Checker.MD5_FAILED)):
+            result = cmp_filepair((f1,f),
+                                  compare=Md5Checker.COMPARE_BYTES)
+            self.assertEqual(result.status,status)
+    def test_cmp_filepair_n_bytes(self):
+        """cmp_filepair only counts bytes which are read
+        """
+        f1 = TestUtils.make_file('test_file1',"Lorum ipsum",basedir=self.wd)
+        f2 = TestUtils.make_file('test_file2',"Lorum ipsum",basedir=self.wd)
+        f3 = TestUtils.make_file('test_file3',"Lorum ipsum dolor",
+                                 basedir=self.wd)
+        self.assertEqual(cmp_filepair((f1,f2)).n_bytes,22)
+        # Sizes differ so nothing is read
+        self.assertEqual(cmp_filepair((f1,f3)).n_bytes,0)
+        # Cached MD5 sums aren't read
+        cache = Md5sumCache(os.path.join(self.wd,"md5sums.db"))
+        try:
+            self.assertEqual(cmp_filepair((f1,f2),cache=cache).n_bytes,22)
+            self.assertEqual(cmp_filepair((f1,f2),cache=cache).n_bytes,0)
+        finally:
+            cache.close()
     def test_cmp_filepair_identical_links(self):
         """cmp_filepair matches identical links
         """
@@ -139,4 +244,104 @@ class TestCmpDirs(unittest.TestCase):
         self.assertEqual(count[Md5Checker.LINKS_SAME],6)
         self.assertEqual(count[Md5Checker.MD5_FAILED],1)
         self.assertEqual(count[Md5Checker.LINKS_DIFFER],1)
-
+    def test_cmp_dirs_with_cache(self):
+        """cmp_dirs uses MD5 sum cache
+        """
+        cache_dir = TestUtils.make_dir()
+        try:
+            cache_file = os.path.join(cache_dir,"md5sums.db")
+            # Populate the cache using multiple processes
+            cache = Md5sumCache(cache_file)
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=2,cache=cache)
+            self.assertEqual(count[Md5Checker.MD5_OK],7)
+            self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+            hello = os.path.join(self.dref.dirn,"hello")
+            self.assertNotEqual(cache.lookup(hello),None)
+            # Store a bogus value and check it's used
+            cache.store(hello,"bogus")
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,cache=cache)
+            self.assertEqual(count[Md5Checker.MD5_OK],6)
+            self.assertEqual(count[Md5Checker.MD5_FAILED],1)
+            cache.close()
+        finally:
+            TestUtils.remove_dir(cache_dir)
+    def test_cmp_dirs_bidirectional_with_cache(self):
+        """cmp_dirs in bidirectional mode populates MD5 sum cache
+        """
+        cache_dir = TestUtils.make_dir()
+        try:
+            cache_file = os.path.join(cache_dir,"md5sums.db")
+            cache = Md5sumCache(cache_file)
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=2,cache=cache,
+                             bidirectional=True)
+            self.assertEqual(count[Md5Checker.MD5_OK],7)
+            hello = os.path.join(self.dcpy.dirn,"hello")
+            self.assertNotEqual(cache.lookup(hello),None)
+            cache.close()
+        finally:
+            TestUtils.remove_dir(cache_dir)
+    def test_worker_pool_opens_one_cache_per_worker(self):
+        """worker_pool gives each worker a cache for the same database
+        """
+        cache_dir = TestUtils.make_dir()
+        try:
+            cache_file = os.path.join(cache_dir,"md5sums.db")
+            cache = Md5sumCache(cache_file)
+            pool = worker_pool(2,cache=cache)
+            filens = pool.map(_worker_cache_filen,range(4))
+            pool.close()
+            pool.join()
+            self.assertEqual(filens,[cache_file]*4)
+            # Parent process doesn't get a worker cache
+            self.assertEqual(cmpdirs._worker_cache,None)
+            cache.close()
+        finally:
+            TestUtils.remove_dir(cache_dir)
+    def test_cmp_dirs_compare_bytes(self):
+        """cmp_dirs comparing file contents directly
+        """
+        self.dref.add_file("more","Yet another file")
+        self.dcpy.add_file("more","Yet another file, again")
+        count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=2,
+                         compare=Md5Checker.COMPARE_BYTES)
+        self.assertEqual(count[Md5Checker.MD5_OK],7)
+        self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+        self.assertEqual(count[Md5Checker.MD5_FAILED],1)
+    def test_cmp_dirs_with_stats(self):
+        """cmp_dirs records throughput statistics for each process
+        """
+        for n in (1,2):
+            stats = Md5Stats()
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=n,stats=stats)
+            self.assertEqual(stats.n_files,13)
+            self.assertTrue(stats.n_bytes > 0)
+            workers = stats.workers()
+            self.assertTrue(len(workers) >= 1)
+            self.assertEqual(sum([workers[w]['n_files'] for w in workers]),13)
+            if n == 1:
+                self.assertEqual(workers.keys(),['MainProcess'])
+    def test_cmp_dirs_bidirectional_identical_dirs(self):
+        """cmp_dirs in bidirectional mode gives same counts as default
+        """
+        for n in (1,2):
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=n,
+                             bidirectional=True)
+            self.assertEqual(count,cmp_dirs(self.dref.dirn,self.dcpy.dirn))
+            self.assertEqual(count[Md5Checker.MD5_OK],7)
+            self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+    def test_cmp_dirs_bidirectional_different_dirs(self):
+        """cmp_dirs in bidirectional mode reports extra files in both
+        """
+        self.dref.add_file("extra","Additional file")
+        self.dcpy.add_file("extra2","Additional file in copy")
+        self.dcpy.add_link("extra_link","somewhere")
+        self.dref.add_file("more","Yet another file")
+        self.dcpy.add_file("more","Yet another file, again")
+        for n in (1,2):
+            count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=n,
+                             bidirectional=True)
+            self.assertEqual(count[Md5Checker.MD5_OK],7)
+            self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+            self.assertEqual(count[Md5Checker.MD5_FAILED],1)
+            self.assertEqual(count[Md5Checker.MISSING_TARGET],1)
+            self.assertEqual(count[Md5Checker.MISSING_SOURCE],2)
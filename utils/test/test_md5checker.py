@@ -12,6 +12,9 @@ from md5checker import diff_files
 from md5checker import compute_md5sum_for_file
 from md5checker import compute_md5sums
 from md5checker import verify_md5sums
+from md5checker import compute_block_manifest
+from md5checker import merge_ranges
+from md5checker import parse_size
 
 class TestMd5sums(unittest.TestCase):
     """Test computing and verifying MD5 sums via files
@@ -61,6 +64,187 @@ class TestMd5sums(unittest.TestCase):
         fp.close()
         self.assertEqual(verify_md5sums(self.checksum_file),0)
 
+    def test_compute_md5sums_with_workers(self):
+        """compute_md5sums make md5sum file using multiple threads
+        """
+        compute_md5sums('.',output_file=self.checksum_file,relative=True,
+                        workers=4,ordered=False)
+        checksums = open(self.checksum_file,'r').read().split('\n')
+        checksums.sort()
+        reference_checksums = self.reference_checksums.split('\n')
+        reference_checksums.sort()
+        self.assertEqual(checksums,reference_checksums)
+
+    def test_compute_md5sums_with_stats(self):
+        """compute_md5sums records throughput statistics
+        """
+        from bcftbx.Md5sum import Md5Stats
+        stats = Md5Stats()
+        compute_md5sums('.',output_file=self.checksum_file,relative=True,
+                        workers=2,stats=stats)
+        self.assertEqual(stats.n_files,
+                         len(self.reference_checksums.strip().split('\n')))
+        self.assertTrue(stats.n_bytes > 0)
+
+    def test_verify_md5sums_with_workers(self):
+        # Verify md5sums for test directory using multiple threads
+        fp = open(self.checksum_file,'w')
+        fp.write(self.reference_checksums)
+        fp.close()
+        self.assertEqual(verify_md5sums(self.checksum_file,workers=4),0)
+
+    def test_compute_and_verify_multiple_checksums(self):
+        """compute_md5sums/verify_md5sums with multiple checksum algorithms
+        """
+        compute_md5sums('.',output_file=self.checksum_file,relative=True,
+                        algorithms=('md5','sha256','crc32'))
+        checksums = open(self.checksum_file,'r').read().split('\n')
+        self.assertEqual(checksums[0],"# md5 sha256 crc32")
+        reference_checksums = self.reference_checksums.split('\n')
+        for line in checksums[1:]:
+            if not line:
+                continue
+            items = line.split()
+            self.assertEqual(len(items),4)
+            self.assertTrue("%s  %s" % (items[0],items[3])
+                            in reference_checksums)
+        # Verify all and subsets of checksums
+        self.assertEqual(verify_md5sums(self.checksum_file),0)
+        self.assertEqual(verify_md5sums(self.checksum_file,
+                                        algorithms=('crc32',)),0)
+        self.assertEqual(verify_md5sums(self.checksum_file,
+                                        algorithms=('sha256','md5'),
+                                        workers=4),0)
+
+    def test_verify_md5sums_algorithm_not_in_file(self):
+        """verify_md5sums fails for algorithms not in the checksum file
+        """
+        fp = open(self.checksum_file,'w')
+        fp.write(self.reference_checksums)
+        fp.close()
+        self.assertEqual(verify_md5sums(self.checksum_file,
+                                        algorithms=('sha256',)),1)
+        compute_md5sums('.',output_file=self.checksum_file,relative=True,
+                        algorithms=('md5','crc32'))
+        self.assertEqual(verify_md5sums(self.checksum_file,
+                                        algorithms=('crc32','sha256')),1)
+
+    def test_compute_and_verify_block_manifest(self):
+        """compute_block_manifest/verify_md5sums with block manifest
+        """
+        compute_block_manifest('.',output_file=self.checksum_file,
+                               relative=True,block_size=4,workers=2)
+        lines = open(self.checksum_file,'r').read().split('\n')
+        self.assertEqual(lines[0],"# blocks md5 4")
+        self.assertEqual(verify_md5sums(self.checksum_file,workers=4),0)
+        # Corrupt a file
+        fp = open('test.txt','r+b')
+        fp.seek(5)
+        fp.write('X')
+        fp.close()
+        self.assertEqual(verify_md5sums(self.checksum_file,workers=4),1)
+
+    def test_verify_block_manifest_resume_missing_file(self):
+        """verify_md5sums resumes block manifest with missing file
+        """
+        from bcftbx.Md5sum import Md5CheckJournal,Md5Checker
+        compute_block_manifest('.',output_file=self.checksum_file,
+                               relative=True,block_size=4)
+        journal_file = os.path.join(self.md5sum_dir,"journal")
+        # Missing file is recorded in the journal by name
+        os.rename('test.txt','test.txt.bak')
+        journal = Md5CheckJournal(journal_file)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),1)
+        journal.close()
+        self.assertTrue(("test.txt",Md5Checker.MISSING_TARGET) in
+                        Md5CheckJournal(journal_file).results())
+        # Restoring the file doesn't add new results on resume
+        os.rename('test.txt.bak','test.txt')
+        nresults = len(Md5CheckJournal(journal_file).results())
+        journal = Md5CheckJournal(journal_file,resume=True)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),1)
+        journal.close()
+        self.assertEqual(len(Md5CheckJournal(journal_file).results()),
+                         nresults)
+
+    def test_verify_block_manifest_resume_failed_file(self):
+        """verify_md5sums resumes block manifest with failed whole-file check
+        """
+        from bcftbx.Md5sum import Md5CheckJournal,Md5Checker
+        compute_block_manifest('.',output_file=self.checksum_file,
+                               relative=True,block_size=4)
+        self.assertTrue("file  0b26e313ed4a7ca6904b0e9369e5b957  "
+                        in open(self.checksum_file).read())
+        # Corrupt a file
+        fp = open('test.txt','r+b')
+        fp.seek(5)
+        fp.write('X')
+        fp.close()
+        journal_file = os.path.join(self.md5sum_dir,"journal")
+        journal = Md5CheckJournal(journal_file)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),1)
+        journal.close()
+        results = Md5CheckJournal(journal_file).results()
+        self.assertTrue(("test.txt",Md5Checker.MD5_FAILED) in results)
+        self.assertTrue(("test.txt[4-8]",Md5Checker.MD5_FAILED) in results)
+        # Resuming reports the failures from the journal
+        journal = Md5CheckJournal(journal_file,resume=True)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),1)
+        journal.close()
+        self.assertEqual(len(Md5CheckJournal(journal_file).results()),
+                         len(results))
+
+    def test_compute_block_manifest_unreadable_file(self):
+        """compute_block_manifest returns non-zero for unreadable files
+        """
+        self.assertEqual(compute_block_manifest(
+            '.',output_file=self.checksum_file,relative=True),0)
+        # Add broken link to test dir
+        self.dir.add_link("broken","missing.txt")
+        self.assertEqual(compute_block_manifest(
+            '.',output_file=self.checksum_file,relative=True),1)
+
+    def test_verify_md5sums_resume(self):
+        """verify_md5sums resumes from journal
+        """
+        from bcftbx.Md5sum import Md5CheckJournal
+        fp = open(self.checksum_file,'w')
+        fp.write(self.reference_checksums)
+        fp.close()
+        journal_file = os.path.join(self.md5sum_dir,"journal")
+        # Simulate an interrupted run with a failure recorded
+        journal = Md5CheckJournal(journal_file)
+        journal.record('test.txt',1)
+        journal.close()
+        journal = Md5CheckJournal(journal_file,resume=True)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),1)
+        journal.close()
+        journal = Md5CheckJournal(journal_file,resume=True)
+        self.assertEqual(len(journal.results()),
+                         len(self.reference_checksums.strip().split('\n')))
+        journal.close()
+        # Starting again gives success
+        journal = Md5CheckJournal(journal_file,resume=False)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),0)
+        journal.close()
+
+    def test_verify_md5sums_journal_repeated_entries(self):
+        """verify_md5sums with journal checks repeated entries
+        """
+        from bcftbx.Md5sum import Md5CheckJournal
+        entries = self.reference_checksums.strip().split('\n')
+        fp = open(self.checksum_file,'w')
+        fp.write('\n'.join(entries + entries[:1]) + '\n')
+        fp.close()
+        journal_file = os.path.join(self.md5sum_dir,"journal")
+        journal = Md5CheckJournal(journal_file)
+        self.assertEqual(verify_md5sums(self.checksum_file,journal=journal),0)
+        journal.close()
+        results = Md5CheckJournal(journal_file).results()
+        self.assertEqual(len(results),len(entries)+1)
+        repeated = entries[0].split(None,1)[1]
+        self.assertEqual(len([r for r in results if r[0] == repeated]),2)
+
     def test_compute_md5sum_for_file(self):
         # Compute md5sum for a single file
         compute_md5sum_for_file('test.txt',output_file=self.checksum_file)
@@ -74,6 +258,30 @@ class TestMd5sums(unittest.TestCase):
         self.dir.add_link("broken","missing.txt")
         compute_md5sums('.',output_file=self.checksum_file,relative=True)
 
+class TestMergeRanges(unittest.TestCase):
+    """Test merging byte ranges (merge_ranges)
+
+    """
+    def test_merge_ranges(self):
+        """merge_ranges merges contiguous and overlapping ranges
+        """
+        self.assertEqual(merge_ranges([]),[])
+        self.assertEqual(merge_ranges([(10,20),(0,10),(30,40),(35,50)]),
+                         [(0,20),(30,50)])
+
+class TestParseSize(unittest.TestCase):
+    """Test converting size strings (parse_size)
+
+    """
+    def test_parse_size(self):
+        """parse_size handles bytes and K/M/G suffixes
+        """
+        self.assertEqual(parse_size('1000'),1000)
+        self.assertEqual(parse_size('4k'),4096)
+        self.assertEqual(parse_size('64M'),64*1024*1024)
+        self.assertEqual(parse_size('1G'),1024*1024*1024)
+        self.assertRaises(ValueError,parse_size,'lots')
+
 class TestDiffFilesFunction(unittest.TestCase):
     """Test checking pairs of files (diff_files)
 
@@ -102,6 +310,13 @@ class TestDiffFilesFunction(unittest.TestCase):
         """
         self.assertNotEqual(diff_files(self.file1,self.file3),0)
 
+    def test_diff_files_quick(self):
+        """diff_files: compare files directly in quick mode
+
+        """
+        self.assertEqual(diff_files(self.file1,self.file2,quick=True),0)
+        self.assertNotEqual(diff_files(self.file1,self.file3,quick=True),0)
+
 class TestDiffDirectoriesFunction(unittest.TestCase):
     """Test checking pairs of directories (diff_directories)
 
@@ -151,6 +366,30 @@ class TestDiffDirectoriesFunction(unittest.TestCase):
         self.assertNotEqual(diff_directories(self.dir2.dirn,
                                              self.dir1.dirn),0)
 
+    def test_different_file_with_workers(self):
+        """diff_directories: file differs between directories (multiple threads)
+
+        """
+        self.dir1.add_file("diff.txt","This is one version of the file")
+        self.dir2.add_file("diff.txt","This is another version of the file")
+        self.assertEqual(diff_directories(self.dir1.dirn,self.dir1.dirn,
+                                          workers=4),0)
+        self.assertNotEqual(diff_directories(self.dir1.dirn,
+                                             self.dir2.dirn,
+                                             workers=4),0)
+
+    def test_different_file_quick(self):
+        """diff_directories: file differs between directories (quick mode)
+
+        """
+        self.dir1.add_file("diff.txt","This is one version of the file")
+        self.dir2.add_file("diff.txt","This is another version of the file")
+        self.assertEqual(diff_directories(self.dir1.dirn,self.dir1.dirn,
+                                          quick=True),0)
+        self.assertNotEqual(diff_directories(self.dir1.dirn,
+                                             self.dir2.dirn,
+                                             quick=True),0)
+
     def test_broken_links(self):
         """diff_directories: handle broken links
 